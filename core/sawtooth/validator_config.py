@@ -26,7 +26,8 @@ from sawtooth.config import AggregateConfig
 from sawtooth.config import load_config_files
 
 
-ListenListEntry = namedtuple('ListenListEntry', ['host', 'port', 'protocol'])
+ListenListEntry = namedtuple('ListenListEntry',
+                             ['host', 'port', 'transport', 'protocol'])
 ListenData = namedtuple('ListenData', ['host', 'port'])
 
 
@@ -178,7 +179,7 @@ def _parse_listen_directive(value):
          "[IP_OR_HOST_NAME:]PORT[/TRANSPORT] PROTOCOL"
 
     Returns:
-        A named tuple of (host, port, protocol)
+        A named tuple of (host, port, transport, protocol)
     """
 
     # Beat the string senseless using a regex.  If there is not a match, then
@@ -198,12 +199,12 @@ def _parse_listen_directive(value):
     transport = match.group('transport')
     protocol = match.group('protocol')
 
-    # Make sure that if there is a transport that it matches the protocol
-    if transport is not None:
-        if protocol == 'gossip' and transport != 'UDP':
-            raise Exception('gossip listen directive requires UDP')
-        if protocol == 'http' and transport != 'TCP':
-            raise Exception('http listen directive requires TCP')
+    # Make sure that if there is a transport that it matches the protocol,
+    # gossip uses UDP and optionally a TCP stream transport as well
+    if transport is None:
+        transport = 'TCP' if protocol == 'http' else 'UDP'
+    if protocol == 'http' and transport != 'TCP':
+        raise Exception('http listen directive requires TCP')
 
     # For HTTP, we don't allow listening on an ephemeral port
     if protocol == 'http' and port == 0:
@@ -212,6 +213,7 @@ def _parse_listen_directive(value):
     return ListenListEntry(
         host=host,
         port=port,
+        transport=transport,
         protocol=protocol)
 
 
@@ -226,6 +228,9 @@ def parse_listen_directives(listen_info):
 
     Returns:
         A dictionary mapping a protocol name to a ListenData named tuple.
+        A gossip directive with the TCP transport, which accepts stream
+        connections from the peers that support them, is mapped as
+        'gossip/TCP'.
     """
 
     listen_mapping = {}
@@ -234,14 +239,17 @@ def parse_listen_directives(listen_info):
     if listen_info is not None:
         for value in listen_info:
             directive = _parse_listen_directive(value)
+            key = directive.protocol
+            if key == 'gossip' and directive.transport == 'TCP':
+                key = 'gossip/TCP'
 
             # No duplicates for protocols allowed
-            if directive.protocol in listen_mapping:
+            if key in listen_mapping:
                 raise Exception(
                     'configuration has more than one {0} listen '
-                    'directive'.format(directive.protocol))
+                    'directive'.format(key))
 
-            listen_mapping[directive.protocol] = \
+            listen_mapping[key] = \
                 ListenData(host=directive.host, port=directive.port)
 
         # If there was no gossip listen directive, then flag an error
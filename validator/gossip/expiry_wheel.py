@@ -0,0 +1,321 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+"""
+This module defines the ExpiryWheel, BloomFilter and HandledMessageCache
+classes, which expire keys in time proportional to the number of keys
+expired and bound the memory used to remember the messages handled.
+"""
+
+import hashlib
+import heapq
+import logging
+import math
+import struct
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryWheel(object):
+    """Groups keys into slots of Resolution seconds by their expiration
+    time, so that expiring keys only visits the slots that expired.
+
+    A key expires once the slot its expiration time falls in is over, at
+    most Resolution seconds after its expiration time.
+
+    Attributes:
+        Resolution (float): The number of seconds covered by a slot.
+    """
+
+    def __init__(self, resolution=1.0):
+        """Constructor for the ExpiryWheel class.
+
+        Args:
+            resolution (float): The number of seconds covered by a slot.
+        """
+        self.Resolution = resolution
+
+        # the keys of each slot, the slots ordered by time and the slot
+        # of each key; slots emptied by discard are kept until they expire
+        # so that each slot is in the heap once
+        self._slots = {}
+        self._heap = []
+        self._keyslots = {}
+
+    def __len__(self):
+        return len(self._keyslots)
+
+    def __contains__(self, key):
+        return key in self._keyslots
+
+    def add(self, key, expiration):
+        """Adds a key, or moves it to a new expiration time.
+
+        Args:
+            key (object): The key.
+            expiration (float): The time the key expires.
+        """
+        slot = int(expiration // self.Resolution)
+        current = self._keyslots.get(key)
+        if current == slot:
+            return
+        if current is not None:
+            self._slots[current].discard(key)
+
+        self._keyslots[key] = slot
+        keys = self._slots.get(slot)
+        if keys is None:
+            keys = set()
+            self._slots[slot] = keys
+            heapq.heappush(self._heap, slot)
+        keys.add(key)
+
+    def discard(self, key):
+        """Removes a key if it is present.
+
+        Args:
+            key (object): The key.
+        """
+        slot = self._keyslots.pop(key, None)
+        if slot is not None:
+            self._slots[slot].discard(key)
+
+    def expire(self, now):
+        """Removes the keys of the slots that are over.
+
+        Args:
+            now (float): The current time.
+
+        Returns:
+            list: The keys removed.
+        """
+        current = int(now // self.Resolution)
+        expired = []
+        while self._heap and self._heap[0] < current:
+            expired.extend(self._pop_slot()[1])
+        return expired
+
+    def pop_oldest(self):
+        """Removes the keys of the first slot to expire that holds keys.
+
+        Returns:
+            tuple: The time the slot is over, None if the wheel is empty,
+                and the keys removed.
+        """
+        while self._heap:
+            (expiration, keys) = self._pop_slot()
+            if keys:
+                return (expiration, keys)
+        return (None, [])
+
+    def _pop_slot(self):
+        slot = heapq.heappop(self._heap)
+        keys = self._slots.pop(slot)
+        for key in keys:
+            del self._keyslots[key]
+        return ((slot + 1) * self.Resolution, list(keys))
+
+
+class BloomFilter(object):
+    """A set of strings that answers membership queries in fixed memory,
+    with a bounded probability of reporting strings that were never added.
+
+    Attributes:
+        Capacity (int): The number of strings the filter is sized for.
+        Count (int): The number of strings added.
+    """
+
+    def __init__(self, capacity, error_rate):
+        """Constructor for the BloomFilter class.
+
+        Args:
+            capacity (int): The number of strings the filter is sized for.
+            error_rate (float): The probability of a false positive once
+                the filter holds capacity strings.
+        """
+        self.Capacity = capacity
+        self.Count = 0
+
+        self._bits = int(math.ceil(
+            -capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self._hashes = max(1, int(round(
+            float(self._bits) / capacity * math.log(2))))
+        self._array = bytearray((self._bits + 7) // 8)
+
+    def _positions(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        (first, second) = struct.unpack(
+            '!QQ', hashlib.sha256(key).digest()[:16])
+        return [(first + i * second) % self._bits
+                for i in xrange(self._hashes)]
+
+    def __contains__(self, key):
+        for position in self._positions(key):
+            if not self._array[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, key):
+        """Adds a string to the filter.
+
+        Args:
+            key (str): The string.
+        """
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+        self.Count += 1
+
+    @property
+    def FalsePositiveRate(self):
+        """Returns the estimated probability that a string that was never
+        added is reported as present.
+        """
+        return (1.0 - math.exp(-float(self._hashes) * self.Count /
+                               self._bits)) ** self._hashes
+
+
+class HandledMessageCache(object):
+    """Remembers the identifiers of the messages handled until they
+    expire, so that copies of a message received later are dropped.
+
+    At most MaximumEntries identifiers are kept exactly. Beyond that, the
+    identifiers that expire first are moved to Bloom filters of
+    MaximumEntries identifiers each, which may report a message that was
+    never handled with probability FilterErrorRate. The oldest filter is
+    dropped when there are more than MaximumFilters of them.
+
+    MaximumEntries bounds each filter as well as the exact identifiers,
+    so the cache remembers up to (MaximumFilters + 1) * MaximumEntries
+    identifiers. A filter only takes about 1.44 * log2(1 / FilterErrorRate)
+    bits per identifier, under 2 bytes with the default rate, so the
+    filters use a small fraction of the memory of the exact identifiers.
+
+    Attributes:
+        MaximumEntries (int): The maximum number of identifiers kept
+            exactly, and in each filter.
+        FilterErrorRate (float): The false positive rate of a full filter.
+        MaximumFilters (int): The maximum number of filters.
+        FilterHits (int): The number of received messages found only in
+            the filters by seen, which includes the false positives.
+    """
+
+    MaximumEntries = 100000
+    FilterErrorRate = 0.001
+    MaximumFilters = 8
+
+    def __init__(self, resolution=1.0):
+        """Constructor for the HandledMessageCache class.
+
+        Args:
+            resolution (float): The number of seconds an identifier may be
+                kept after its expiration time.
+        """
+        self.FilterHits = 0
+
+        self._wheel = ExpiryWheel(resolution)
+        # the filters as [filter, expiration time of the latest
+        # identifier added], from oldest to newest
+        self._filters = []
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._wheel)
+
+    def __contains__(self, msgid):
+        with self._lock:
+            return self._contains(msgid) is not None
+
+    def _contains(self, msgid):
+        # returns None when the identifier is unknown, and whether it was
+        # found in the filters otherwise
+        if msgid in self._wheel:
+            return False
+        for (bloom, _) in self._filters:
+            if msgid in bloom:
+                return True
+        return None
+
+    def seen(self, msgid):
+        """Returns whether a received message was handled, and counts it
+        in FilterHits when it is only found in the filters. Further checks
+        of the same message use the in operator, which does not count.
+
+        Args:
+            msgid (str): The identifier of the message.
+        """
+        with self._lock:
+            found = self._contains(msgid)
+            if found:
+                self.FilterHits += 1
+        return found is not None
+
+    @property
+    def FilterCount(self):
+        """Returns the number of identifiers held in filters.
+        """
+        return sum(f[0].Count for f in self._filters)
+
+    @property
+    def FalsePositiveRate(self):
+        """Returns the estimated probability that a message that was
+        never handled is reported as handled.
+        """
+        rate = 1.0
+        for (bloom, _) in self._filters:
+            rate *= 1.0 - bloom.FalsePositiveRate
+        return 1.0 - rate
+
+    def add(self, msgid, expiration):
+        """Records a handled message.
+
+        Args:
+            msgid (str): The identifier of the message.
+            expiration (float): The time the identifier is forgotten.
+        """
+        with self._lock:
+            self._wheel.add(msgid, expiration)
+            while len(self._wheel) > self.MaximumEntries:
+                (oldest, msgids) = self._wheel.pop_oldest()
+                self._add_to_filters(msgids, oldest)
+
+    def _add_to_filters(self, msgids, expiration):
+        for msgid in msgids:
+            if not self._filters or \
+                    self._filters[-1][0].Count >= self.MaximumEntries:
+                if len(self._filters) >= self.MaximumFilters:
+                    logger.info('dropping filter of %d handled messages',
+                                self._filters[0][0].Count)
+                    self._filters.pop(0)
+                self._filters.append(
+                    [BloomFilter(self.MaximumEntries, self.FilterErrorRate),
+                     expiration])
+            entry = self._filters[-1]
+            entry[0].add(msgid)
+            entry[1] = max(entry[1], expiration)
+
+    def expire(self, now):
+        """Forgets the identifiers that expired.
+
+        Args:
+            now (float): The current time.
+
+        Returns:
+            int: The number of identifiers forgotten.
+        """
+        with self._lock:
+            expired = len(self._wheel.expire(now))
+            self._filters = [f for f in self._filters if f[1] >= now]
+        return expired
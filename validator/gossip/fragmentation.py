@@ -0,0 +1,255 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+"""
+This module defines the OutgoingMessage and Reassembler classes, which
+split messages larger than a packet into fragments and put the fragments
+received from peers back together.
+"""
+
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class OutgoingMessage(object):
+    """Tracks the fragments of a message sent to a peer.
+
+    Fragments are sent in order, at most a window of them waiting for
+    an acknowledgement at a time, and a dropped fragment is sent again
+    without sending the other fragments again.
+
+    Attributes:
+        Message (message.Message): The fragmented message.
+        FragmentID (int): The identifier of the message in its fragments.
+        Length (int): The length of the encoded message.
+        Unacknowledged (set): The indexes of the fragments sent and not
+            acknowledged.
+    """
+
+    def __init__(self, msg, fragid, fragsize):
+        """Constructor for the OutgoingMessage class.
+
+        Args:
+            msg (message.Message): The message.
+            fragid (int): The identifier of the message in its fragments.
+            fragsize (int): The maximum number of bytes of the message in
+                a fragment.
+        """
+        self.Message = msg
+        self.FragmentID = fragid
+        self.Unacknowledged = set()
+
+        self._data = repr(msg)
+        self._fragsize = fragsize
+        self._acknowledged = set()
+        self._pending = deque(xrange(len(self)))
+
+        self.Length = len(self._data)
+
+    def __len__(self):
+        return (len(self._data) + self._fragsize - 1) // self._fragsize
+
+    @property
+    def Complete(self):
+        """Returns whether every fragment was acknowledged.
+        """
+        return len(self._acknowledged) == len(self)
+
+    def fragment(self, index):
+        """Returns the data of a fragment.
+
+        Args:
+            index (int): The index of the fragment.
+        """
+        start = index * self._fragsize
+        return self._data[start:start + self._fragsize]
+
+    def peek_fragment(self):
+        """Returns the index of the next fragment to send without taking
+        it, None when every fragment was sent.
+        """
+        if not self._pending:
+            return None
+        return self._pending[0]
+
+    def next_fragment(self):
+        """Returns the index of the next fragment to send, None when every
+        fragment was sent.
+        """
+        if not self._pending:
+            return None
+        index = self._pending.popleft()
+        self.Unacknowledged.add(index)
+        return index
+
+    def acknowledged(self, index):
+        """Records the acknowledgement of a fragment.
+
+        Args:
+            index (int): The index of the fragment.
+        """
+        self.Unacknowledged.discard(index)
+        self._acknowledged.add(index)
+
+    def requeue(self, index):
+        """Queues a fragment that was dropped, or could not be sent, to be
+        sent again ahead of the fragments not sent yet.
+
+        Args:
+            index (int): The index of the fragment.
+        """
+        if index in self.Unacknowledged:
+            self.Unacknowledged.discard(index)
+            self._pending.appendleft(index)
+
+
+class Reassembler(object):
+    """Puts the fragments of messages received from peers back together.
+
+    The memory used by partial messages is bounded: the length of a
+    message is reserved when its first fragment arrives, and fragments
+    of new messages are refused while the reservations exceed
+    MaximumMemory, or MaximumSenderMemory for the sender of the message
+    so that a single peer cannot take the memory of every peer. A
+    refused fragment is not acknowledged so the peer sends it again
+    later. Partial messages that receive no fragment for Timeout seconds
+    are discarded.
+
+    Attributes:
+        MaximumMemory (int): The maximum number of bytes reserved for
+            partial messages.
+        MaximumSenderMemory (int): The maximum number of bytes reserved
+            for the partial messages of a sender.
+        MaximumMessageSize (int): The maximum length of a reassembled
+            message.
+        Timeout (float): The number of seconds to wait for the next
+            fragment of a partial message.
+        Reserved (int): The number of bytes reserved for partial messages.
+    """
+
+    MaximumMemory = 64 * 1024 * 1024
+    MaximumMessageSize = 16 * 1024 * 1024
+    MaximumSenderMemory = 2 * MaximumMessageSize
+    Timeout = 30.0
+
+    def __init__(self):
+        """Constructor for the Reassembler class.
+        """
+        self.Reserved = 0
+
+        # the partial messages as [number of fragments, length, fragments,
+        # bytes received, deadline], the bytes reserved for the messages
+        # of a sender, and the expiration times of the completed messages
+        self._partial = {}
+        self._reserved = {}
+        self._completed = {}
+
+    def __len__(self):
+        return len(self._partial)
+
+    def add(self, key, index, count, length, data, now):
+        """Adds a fragment to the partial message it belongs to.
+
+        Args:
+            key (tuple): The identifier of the sender and the identifier
+                the sender assigned to the message.
+            index (int): The index of the fragment.
+            count (int): The number of fragments of the message.
+            length (int): The length of the message.
+            data (str): The data of the fragment.
+            now (float): The current time.
+
+        Returns:
+            tuple: Whether the fragment was accepted, and the data of the
+                message if the fragment completed it or None.
+        """
+        if key in self._completed:
+            return (True, None)
+
+        if index >= count:
+            return (False, None)
+
+        entry = self._partial.get(key)
+        if entry is None:
+            if not 0 < count <= length or \
+                    length > self.MaximumMessageSize:
+                logger.warn('refused fragment of a message with length %d '
+                            'in %d fragments', length, count)
+                return (False, None)
+            if self.Reserved + length > self.MaximumMemory:
+                logger.debug('refused fragment, %d bytes reserved',
+                             self.Reserved)
+                return (False, None)
+            reserved = self._reserved.get(key[0], 0)
+            if reserved + length > self.MaximumSenderMemory:
+                logger.debug('refused fragment, %d bytes reserved for '
+                             'sender', reserved)
+                return (False, None)
+            entry = [count, length, {}, 0, now + self.Timeout]
+            self._partial[key] = entry
+            self._reserved[key[0]] = reserved + length
+            self.Reserved += length
+        elif entry[0] != count or entry[1] != length:
+            logger.warn('fragment does not match message with length %d '
+                        'in %d fragments', entry[1], entry[0])
+            return (False, None)
+
+        fragments = entry[2]
+        if index not in fragments:
+            if entry[3] + len(data) > length:
+                logger.warn('fragments exceed message with length %d',
+                            length)
+                self._release(key)
+                return (False, None)
+            fragments[index] = data
+            entry[3] += len(data)
+            entry[4] = now + self.Timeout
+        if len(fragments) < count:
+            return (True, None)
+
+        self._release(key)
+        self._completed[key] = now + self.Timeout
+        if entry[3] != length:
+            logger.warn('reassembled %d bytes of a message with length %d',
+                        entry[3], length)
+            return (True, None)
+        return (True, ''.join(fragments[i] for i in xrange(count)))
+
+    def _release(self, key):
+        entry = self._partial.pop(key)
+        self.Reserved -= entry[1]
+        reserved = self._reserved.pop(key[0]) - entry[1]
+        if reserved > 0:
+            self._reserved[key[0]] = reserved
+        return entry
+
+    def expire(self, now):
+        """Discards the partial messages that timed out.
+
+        Args:
+            now (float): The current time.
+
+        Returns:
+            int: The number of partial messages discarded.
+        """
+        expired = [k for k, e in self._partial.iteritems() if e[4] < now]
+        for key in expired:
+            self._release(key)
+
+        for key in [k for k, t in self._completed.iteritems() if t < now]:
+            del self._completed[key]
+
+        return len(expired)
@@ -25,6 +25,9 @@ from twisted.internet import reactor
 from twisted.internet.protocol import DatagramProtocol
 
 from gossip import event_handler
+from gossip.expiry_wheel import ExpiryWheel
+from gossip.expiry_wheel import HandledMessageCache
+from gossip import fragmentation
 from gossip import message
 from gossip.message_dispatcher import MessageDispatcher
 from gossip import stats
@@ -34,6 +37,10 @@ from gossip.messages import random_walk_message
 from gossip.messages import shutdown_message
 from gossip.messages import topology_message
 from gossip.message_queue import MessageQueue
+from gossip.signature_verifier import SignatureVerifier
+from gossip.signature_verifier import signed_objects
+from gossip.stream import StreamFactory
+from gossip.transmit_scheduler import TransmitScheduler
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +60,15 @@ class Gossip(object, DatagramProtocol):
         ExpireMessageTime (int): Time in seconds to hold message to test
             for duplicates.
         MaximumPacketSize (int): The maximum size of a packet.
+        PacketBatching (bool): Whether the queued messages for a peer that
+            accepts batches are coalesced into packets of up to
+            MaximumPacketSize bytes.
+        PacketFragmentation (bool): Whether messages larger than a packet
+            are sent in fragments to the peers that accept them.
+        FragmentWindow (int): The maximum number of unacknowledged
+            fragments sent to a peer.
+        TransmitScheduling (bool): Whether queued messages are sent as
+            soon as they are due rather than on the next heartbeat.
         CleanupInterval (float): The number of seconds between cleanups.
         KeepAliveInterval (float): The number of seconds between keep
             alive messages.
@@ -64,8 +80,14 @@ class Gossip(object, DatagramProtocol):
             with.
         PendingAckMap (dict): A map of incoming messages that require
             acknowledgement.
-        MessageHandledMap (dict): A map of handled messages where keys are
-            message identifiers and values are message expiration times.
+        OutgoingFragments (dict): A map of peer identifiers to the list of
+            fragmented messages being sent to the peer.
+        Reassembler (fragmentation.Reassembler): The partial messages
+            received in fragments.
+        TransmitScheduler (TransmitScheduler): The timer that sends the
+            queued messages when the earliest of them is due.
+        MessageHandledMap (HandledMessageCache): The identifiers of the
+            handled messages, kept for ExpireMessageTime seconds.
         SequenceNumber (int): The next sequence number to be used for
             messages from the local node.
         NextCleanup (float): The time of the next cleanup event.
@@ -76,11 +98,21 @@ class Gossip(object, DatagramProtocol):
         ProcessIncomingMessages (bool): Whether or not to process incoming
             messages.
         Listener (Reactor.listenUDP): The UDP listener.
+        StreamListener (Reactor.listenTCP): The listener for the stream
+            connections of peers, None when the local node has no
+            StreamPort.
+        SignatureVerifier (SignatureVerifier): The process pool used to
+            recover the keys of incoming signed messages, None when they
+            are recovered on the reactor thread.
     """
 
     # time in seconds to hold message to test for duplicates
     ExpireMessageTime = 300
     MaximumPacketSize = 8192 * 6 - 128
+    PacketBatching = True
+    PacketFragmentation = True
+    FragmentWindow = 32
+    TransmitScheduling = True
     CleanupInterval = 1.00
     KeepAliveInterval = 10.0
 
@@ -88,7 +120,8 @@ class Gossip(object, DatagramProtocol):
                  node,
                  minimum_retries=None,
                  retry_interval=None,
-                 stat_domains=None):
+                 stat_domains=None,
+                 verification_processes=None):
         """Constructor for the Gossip class.
 
         Args:
@@ -96,6 +129,9 @@ class Gossip(object, DatagramProtocol):
             MinimumRetries (int): The minimum number of retries on message
                 transmission.
             RetryInterval (float): The time between retries, in seconds.
+            verification_processes (int): The number of processes used to
+                verify the signatures of incoming messages, signatures are
+                verified on the reactor thread when it is not set.
         """
         super(Gossip, self).__init__()
 
@@ -111,12 +147,25 @@ class Gossip(object, DatagramProtocol):
         self.NodeMap = {}
 
         self.PendingAckMap = {}
-        self.MessageHandledMap = {}
+        self.MessageHandledMap = HandledMessageCache()
+
+        # the sequence numbers of the packets waiting for an ack by the
+        # time they are treated as dropped
+        self._ackexpirations = ExpiryWheel(0.1)
+
+        self.OutgoingFragments = {}
+        self.Reassembler = fragmentation.Reassembler()
+        self.TransmitScheduler = TransmitScheduler(self._scheduled_transmit)
 
         self.SequenceNumber = 0
         self.NextCleanup = time.time() + self.CleanupInterval
         self.NextKeepAlive = time.time() + self.KeepAliveInterval
 
+        self.SignatureVerifier = None
+        if verification_processes:
+            self.SignatureVerifier = SignatureVerifier(
+                int(verification_processes), self.LocalNode.Name)
+
         self._init_gossip_stats(stat_domains)
 
         self.dispatcher = MessageDispatcher(self)
@@ -131,7 +180,7 @@ class Gossip(object, DatagramProtocol):
         self.onNodeDisconnect = event_handler.EventHandler('onNodeDisconnect')
 
         # setup the timer events
-        self.dispatcher.on_heartbeat += self._timer_transmit
+        self.dispatcher.on_heartbeat += self._heartbeat_transmit
         self.dispatcher.on_heartbeat += self._timer_cleanup
         self.dispatcher.on_heartbeat += self._keep_alive
 
@@ -140,6 +189,12 @@ class Gossip(object, DatagramProtocol):
             self.ProcessIncomingMessages = True
             self.Listener = reactor.listenUDP(self.LocalNode.NetPort,
                                               self)
+            self.StreamListener = None
+            if self.LocalNode.StreamPort is not None:
+                self.StreamListener = reactor.listenTCP(
+                    self.LocalNode.StreamPort, StreamFactory(self))
+                self.LocalNode.StreamPort = \
+                    self.StreamListener.getHost().port
             reactor.callInThread(self._dispatcher)
         except Exception as e:
             logger.critical(
@@ -158,14 +213,32 @@ class Gossip(object, DatagramProtocol):
         self.PacketStats.add_metric(stats.Counter('DroppedPackets'))
         self.PacketStats.add_metric(stats.Counter('AcksReceived'))
         self.PacketStats.add_metric(stats.Counter('MessagesHandled'))
+        self.PacketStats.add_metric(stats.Average('MessagesPerPacket'))
+        self.PacketStats.add_metric(stats.Counter('FragmentsSent'))
+        self.PacketStats.add_metric(stats.Counter('FragmentsRefused'))
+        self.PacketStats.add_metric(stats.Counter('MessagesReassembled'))
+        self.PacketStats.add_metric(stats.Sample(
+            'ReassemblyBytes', lambda: self.Reassembler.Reserved))
+        self.PacketStats.add_metric(stats.Counter('MessagesStreamed'))
         self.PacketStats.add_metric(stats.Sample(
             'UnackedPacketCount', lambda: len(self.PendingAckMap)))
+        self.PacketStats.add_metric(stats.Sample(
+            'HandledMessageCount', lambda: len(self.MessageHandledMap)))
+        self.PacketStats.add_metric(stats.Sample(
+            'HandledFilterCount', lambda: self.MessageHandledMap.FilterCount))
+        self.PacketStats.add_metric(stats.Sample(
+            'HandledFilterHits', lambda: self.MessageHandledMap.FilterHits))
+        self.PacketStats.add_metric(stats.Sample(
+            'HandledFalsePositiveRate',
+            lambda: self.MessageHandledMap.FalsePositiveRate))
 
         self.MessageStats = stats.Stats(self.LocalNode.Name, 'message')
         self.MessageStats.add_metric(stats.MapCounter('MessageType'))
         if stat_domains is not None:
             stat_domains['packet'] = self.PacketStats
             stat_domains['message'] = self.MessageStats
+            if self.SignatureVerifier is not None:
+                stat_domains['signature'] = self.SignatureVerifier.Stats
 
     def peer_list(self, allflag=False, exceptions=None):
         """Returns a list of peer nodes.
@@ -266,6 +339,13 @@ class Gossip(object, DatagramProtocol):
                 self._handle_ack(packet)
             return
 
+        # fragments are acknowledged once the reassembler accepts them so
+        # that the peer sends refused fragments again
+        if packet.IsFragment:
+            if srcpeer:
+                self._handle_fragment(packet, srcpeer)
+            return
+
         # first thing to do with the message is to send an ACK, all
         # retransmissions will be handled by the sending node, if the
         # IsReliable flag is set then this is not a system message & we know
@@ -274,9 +354,78 @@ class Gossip(object, DatagramProtocol):
             if srcpeer:
                 self._send_ack(packet, srcpeer)
 
+        if packet.IsBatch:
+            try:
+                entries = packet.unpack_batch()
+            except:
+                logger.exception('unable to unpack batch with length %d',
+                                 len(data))
+                return
+            for (ttl, msgdata) in entries:
+                self._handle_message_data(msgdata, ttl, srcpeer,
+                                          packet.SenderID)
+            return
+
+        self._handle_message_data(packet.Data, packet.TimeToLive, srcpeer,
+                                  packet.SenderID)
+
+    def _handle_fragment(self, packet, srcpeer):
+        """Adds a received fragment to its partial message, and handles
+        the message once the fragment completes it.
+
+        Args:
+            packet (Packet): The packet carrying the fragment.
+            srcpeer (Node): The peer that sent the packet.
+        """
+        try:
+            (fragid, index, count, length, data) = packet.unpack_fragment()
+        except:
+            logger.exception('unable to unpack fragment from %s', srcpeer)
+            return
+
+        (accepted, msgdata) = self.Reassembler.add(
+            (packet.SenderID, fragid), index, count, length, data,
+            time.time())
+        if not accepted:
+            self.PacketStats.FragmentsRefused.increment()
+            return
+
+        self._send_ack(packet, srcpeer)
+        if msgdata is not None:
+            self.PacketStats.MessagesReassembled.increment()
+            self._handle_message_data(msgdata, packet.TimeToLive, srcpeer,
+                                      packet.SenderID)
+
+    def stream_message_received(self, data, ttl, peer):
+        """Handles a message received from a peer over a stream
+        connection.
+
+        Args:
+            data (str): The CBOR encoded message.
+            ttl (int): The time to live of the message.
+            peer (Node): The peer.
+        """
+        if not self.ProcessIncomingMessages:
+            return
+
+        peer.reset_ticks()
+        self.PacketStats.BytesReceived.add_value(len(data))
+        self._handle_message_data(data, ttl, peer, peer.Identifier)
+
+    def _handle_message_data(self, data, ttl, srcpeer, senderid):
+        """Decodes and handles a message received in a packet or over a
+        stream connection.
+
+        Args:
+            data (str): The CBOR encoded message.
+            ttl (int): The time to live of the message.
+            srcpeer (Node): The peer that sent the message, if it is known.
+            senderid (str): The identifier of the node that sent the
+                message.
+        """
         # now unpack the rest of the message
         try:
-            minfo = message.unpack_message_data(packet.Data)
+            minfo = message.unpack_message_data(data)
         except:
             logger.exception('unable to decode message with length %d',
                              len(data))
@@ -289,24 +438,24 @@ class Gossip(object, DatagramProtocol):
 
         if not self.dispatcher.has_message_handler(typename):
             logger.info('no handler found for message type %s from %s',
-                        minfo['__TYPE__'], srcpeer or packet.SenderID[:8])
+                        minfo['__TYPE__'], srcpeer or senderid[:8])
             return
 
         try:
             msg = self.dispatcher.unpack_message(typename, minfo)
-            msg.TimeToLive = packet.TimeToLive - 1
-            msg.SenderID = packet.SenderID
+            msg.TimeToLive = ttl - 1
+            msg.SenderID = senderid
         except:
             logger.exception(
                 'unable to deserialize message of type %s from %s',
                 typename,
-                packet.SenderID[:8])
+                senderid[:8])
             return
 
         # if we have seen this message before then just ignore it
-        if msg.Identifier in self.MessageHandledMap:
+        if self.MessageHandledMap.seen(msg.Identifier):
             logger.debug('duplicate message %s received from %s', msg,
-                         packet.SenderID[:8])
+                         senderid[:8])
             self.PacketStats.DuplicatePackets.increment()
 
             # if we have received a particular message from a node then we dont
@@ -320,6 +469,27 @@ class Gossip(object, DatagramProtocol):
 
             return
 
+        # recover the signing keys of the message and the objects it
+        # carries in the verifier processes, the message is handled once
+        # they are available
+        if not msg.IsSystemMessage and self.SignatureVerifier is not None:
+            self.SignatureVerifier.submit(
+                signed_objects(msg),
+                lambda: self._handle_verified_message(msg, srcpeer, senderid))
+            return
+
+        self._handle_verified_message(msg, srcpeer, senderid)
+
+    def _handle_verified_message(self, msg, srcpeer, senderid):
+        if not self.ProcessIncomingMessages:
+            return
+
+        # a copy of the message may have been handled while its signature
+        # was being verified
+        if msg.Identifier in self.MessageHandledMap:
+            self.PacketStats.DuplicatePackets.increment()
+            return
+
         # verify the signature, this is a no-op for the gossiper, but
         # subclasses might override the function, system messages need not have
         # verified signatures
@@ -338,7 +508,7 @@ class Gossip(object, DatagramProtocol):
             return
 
         logger.warn('received message %s from an unknown peer %s', msg,
-                    packet.SenderID[:8])
+                    senderid[:8])
 
     def _do_write(self, msg, peer):
         """Put a message on the wire.
@@ -405,7 +575,18 @@ class Gossip(object, DatagramProtocol):
                     dstnodeid[:8])
                 continue
 
-            dstnode.enqueue_message(msg, now)
+            self.schedule_transmit(dstnode.enqueue_message(msg, now))
+
+    def schedule_transmit(self, when=0.0):
+        """Makes sure the queued messages are sent no later than a time,
+        when transmissions are scheduled.
+
+        Args:
+            when (float): The time a message is due, 0 for as soon as
+                possible.
+        """
+        if self.TransmitScheduling:
+            self.TransmitScheduler.schedule(when)
 
     def _send_ack(self, packet, peer):
         """Send an acknowledgement for a reliable packet.
@@ -454,11 +635,23 @@ class Gossip(object, DatagramProtocol):
         # Normal situation... update the RTT estimator to help with future
         # retranmission times and remove the message from the retranmission
         # queue
-        origdstnode.message_delivered(originalpkt.Message,
-                                      time.time() - originalpkt.TransmitTime)
+        rtt = time.time() - originalpkt.TransmitTime
+        for msg in originalpkt.Messages:
+            origdstnode.message_delivered(msg, rtt)
+
+        if originalpkt.Fragment is not None:
+            (outgoing, index) = originalpkt.Fragment
+            origdstnode.Estimator.update(rtt)
+            outgoing.acknowledged(index)
+            if outgoing.Complete:
+                self._fragments_sent(origdstnode.Identifier, outgoing)
+            else:
+                # the window of the peer has room for the next fragment
+                self.schedule_transmit()
 
         self.PacketStats.AcksReceived.increment()
         del self.PendingAckMap[incomingpkt.SequenceNumber]
+        self._ackexpirations.discard(incomingpkt.SequenceNumber)
 
     def _timer_transmit(self, now):
         """A periodic handler that iterates through the nodes and sends
@@ -468,31 +661,249 @@ class Gossip(object, DatagramProtocol):
             now (float): Current time.
         """
         srcnode = self.LocalNode
+        fragmentsize = self.MaximumPacketSize - \
+            message.Packet.batch_overhead(1)
+
+        self._transmit_fragments(now)
+
+        dstnodes = []
+        for dstnode in self.peer_list(True):
+            if dstnode.Stream is not None:
+                self._transmit_stream(dstnode, now)
+            else:
+                dstnodes.append(dstnode)
 
-        dstnodes = self.peer_list(True)
         while len(dstnodes) > 0:
             newnodes = []
             for dstnode in dstnodes:
-                msg = dstnode.get_next_message(now)
+                msg = dstnode.get_next_message(now, meteredsize=fragmentsize)
                 if msg:
-                    if dstnode.is_peer or msg.IsSystemMessage:
+                    if len(msg) > fragmentsize:
+                        newnodes.append(dstnode)
+                        self._fragment_message(msg, dstnode, now)
+                    elif dstnode.is_peer or msg.IsSystemMessage:
                         # basically we are looping through the nodes & as long
                         # as there are messages pending then come back around &
                         # try again
                         newnodes.append(dstnode)
 
                         packet = message.Packet()
-                        packet.add_message(msg, srcnode, dstnode,
-                                           self.next_sequence_number())
+                        msgs = [msg]
+                        if dstnode.is_peer and dstnode.SupportsBatching and \
+                                self.PacketBatching:
+                            msgs = self._next_batch(msg, dstnode, now)
+                        if len(msgs) > 1:
+                            packet.add_messages(msgs, srcnode, dstnode,
+                                                self.next_sequence_number())
+                        else:
+                            packet.add_message(msg, srcnode, dstnode,
+                                               self.next_sequence_number())
                         packet.TransmitTime = now
+                        self.PacketStats.MessagesPerPacket.add_value(
+                            len(msgs))
 
                         if packet.IsReliable:
-                            self.PendingAckMap[packet.SequenceNumber] = packet
+                            self._wait_for_ack(packet)
 
                         self._do_write(packet.pack(), dstnode)
 
             dstnodes = newnodes
 
+    def _heartbeat_transmit(self, now):
+        """Sends the queued messages on the heartbeat when transmissions
+        are not scheduled.
+
+        Args:
+            now (float): Current time.
+        """
+        if not self.TransmitScheduling:
+            self._timer_transmit(now)
+
+    def _scheduled_transmit(self, now):
+        """Sends the messages that are due and returns the time the next
+        queued message or fragment can be sent.
+
+        Args:
+            now (float): Current time.
+
+        Returns:
+            float: The time, None when nothing can be sent until a message
+                is queued, a fragment is acknowledged or a stream resumes.
+        """
+        self._timer_transmit(now)
+
+        fragmentsize = self.MaximumPacketSize - \
+            message.Packet.batch_overhead(1)
+
+        due = []
+        for dstnode in self.peer_list(True):
+            if dstnode.Stream is not None:
+                if not dstnode.Stream.Paused:
+                    due.append(dstnode.next_send_time(now, meteredsize=0))
+            else:
+                due.append(dstnode.next_send_time(
+                    now, meteredsize=fragmentsize))
+
+        for (peerid, outgoing) in self.OutgoingFragments.iteritems():
+            dstnode = self.NodeMap.get(peerid)
+            if dstnode is None or self.FragmentWindow <= \
+                    sum(len(o.Unacknowledged) for o in outgoing):
+                continue
+            for fragmented in outgoing:
+                index = fragmented.peek_fragment()
+                if index is not None:
+                    wait = dstnode.TokenBucket.wait_time(
+                        len(fragmented.fragment(index)))
+                    if wait is not None:
+                        due.append(now + wait)
+                    break
+
+        due = [t for t in due if t is not None]
+        return min(due) if due else None
+
+    def _transmit_stream(self, dstnode, now):
+        """Writes the sendable messages queued for a peer to its stream
+        connection, until the connection asks to pause.
+
+        Args:
+            dstnode (Node): The peer.
+            now (float): Current time.
+        """
+        stream = dstnode.Stream
+        while not stream.Paused:
+            msg = dstnode.get_next_message(now, meteredsize=0)
+            if msg is None:
+                return
+
+            if len(msg) > self.Reassembler.MaximumMessageSize:
+                logger.error('unable to send message %s with length %d '
+                             'beyond maximum message size', msg, len(msg))
+                continue
+
+            stream.send_message(msg)
+            self.PacketStats.MessagesStreamed.increment()
+            self.PacketStats.BytesSent.add_value(len(msg))
+
+    def _fragment_message(self, msg, dstnode, now):
+        """Queues a message larger than a packet to be sent in fragments.
+
+        Args:
+            msg (Message): The message.
+            dstnode (Node): The node the message is sent to.
+            now (float): Current time.
+        """
+        if not (dstnode.is_peer and dstnode.SupportsFragmentation and
+                self.PacketFragmentation):
+            logger.error('unable to send message %s with length %d to %s '
+                         'in one packet', msg, len(msg), dstnode)
+            return
+
+        if len(msg) > self.Reassembler.MaximumMessageSize:
+            logger.error('unable to send message %s with length %d beyond '
+                         'maximum message size', msg, len(msg))
+            return
+
+        fragsize = self.MaximumPacketSize - \
+            message.Packet.fragment_overhead()
+        outgoing = fragmentation.OutgoingMessage(
+            msg, self.next_sequence_number(), fragsize)
+        self.OutgoingFragments.setdefault(dstnode.Identifier, []).append(
+            outgoing)
+        self._transmit_fragments(now, dstnode)
+
+    def _transmit_fragments(self, now, dstnode=None):
+        """Sends the next fragments of the fragmented messages for peers,
+        keeping at most FragmentWindow fragments for a peer unacknowledged
+        and while the token bucket of the peer allows.
+
+        Args:
+            now (float): Current time.
+            dstnode (Node): The peer to send fragments to, None for every
+                peer.
+        """
+        if dstnode is None:
+            dstnodes = [self.NodeMap[i] for i in self.OutgoingFragments
+                        if i in self.NodeMap]
+        else:
+            dstnodes = [dstnode]
+
+        for peer in dstnodes:
+            outgoing = self.OutgoingFragments[peer.Identifier]
+            window = self.FragmentWindow - \
+                sum(len(o.Unacknowledged) for o in outgoing)
+            for fragmented in outgoing:
+                while window > 0:
+                    index = fragmented.next_fragment()
+                    if index is None:
+                        break
+                    if not peer.TokenBucket.consume(
+                            len(fragmented.fragment(index))):
+                        fragmented.requeue(index)
+                        window = 0
+                        break
+                    window -= 1
+
+                    packet = message.Packet()
+                    packet.add_fragment(fragmented, index, self.LocalNode,
+                                        peer, self.next_sequence_number())
+                    packet.TransmitTime = now
+                    self._wait_for_ack(packet)
+                    self.PacketStats.FragmentsSent.increment()
+                    self._do_write(packet.pack(), peer)
+
+    def _wait_for_ack(self, packet):
+        """Records a packet sent that is treated as dropped unless it is
+        acknowledged within its round trip estimate.
+
+        Args:
+            packet (Packet): The packet.
+        """
+        self.PendingAckMap[packet.SequenceNumber] = packet
+        self._ackexpirations.add(packet.SequenceNumber,
+                                 packet.TransmitTime +
+                                 packet.RoundTripEstimate)
+
+    def _fragments_sent(self, peerid, outgoing):
+        """Forgets a fragmented message once each fragment was
+        acknowledged.
+
+        Args:
+            peerid (str): The identifier of the peer.
+            outgoing (fragmentation.OutgoingMessage): The message.
+        """
+        fragmented = self.OutgoingFragments.get(peerid)
+        if fragmented is None or outgoing not in fragmented:
+            return
+
+        fragmented.remove(outgoing)
+        if not fragmented:
+            del self.OutgoingFragments[peerid]
+
+    def _next_batch(self, msg, dstnode, now):
+        """Removes the sendable messages queued for a node that fit in a
+        packet with a message.
+
+        Args:
+            msg (Message): The first message of the batch.
+            dstnode (Node): The node the messages are sent to.
+            now (float): Current time.
+
+        Returns:
+            list: The messages of the batch.
+        """
+        msgs = [msg]
+        size = len(msg)
+        while True:
+            available = self.MaximumPacketSize - size - \
+                message.Packet.batch_overhead(len(msgs) + 1)
+            if available <= 0:
+                return msgs
+            msg = dstnode.get_next_message(now, available)
+            if msg is None:
+                return msgs
+            msgs.append(msg)
+            size += len(msg)
+
     def _timer_cleanup(self, now):
         """A periodic handler that performs a variety of cleanup operations
         including checks for dropped packets.
@@ -510,12 +921,10 @@ class Gossip(object, DatagramProtocol):
         self.NextCleanup = now + self.CleanupInterval
 
         # Process packet retransmission
-        deleteq = []
-        for seqno, packet in self.PendingAckMap.iteritems():
-            if (packet.TransmitTime + packet.RoundTripEstimate) < now:
-                deleteq.append((seqno, packet))
-
-        for (seqno, packet) in deleteq:
+        for seqno in self._ackexpirations.expire(now):
+            packet = self.PendingAckMap.get(seqno)
+            if packet is None:
+                continue
             logger.debug('packet %d has been marked as dropped', seqno)
 
             self.PacketStats.DroppedPackets.increment()
@@ -525,23 +934,24 @@ class Gossip(object, DatagramProtocol):
             # connection so check that here
             if packet.DestinationID in self.NodeMap:
                 dstnode = self.NodeMap[packet.DestinationID]
-                dstnode.message_dropped(packet.Message, now)
+                for msg in packet.Messages:
+                    self.schedule_transmit(
+                        dstnode.message_dropped(msg, now))
+                if packet.Fragment is not None:
+                    dstnode.Estimator.backoff()
+                    packet.Fragment[0].requeue(packet.Fragment[1])
+                    self.schedule_transmit()
 
             # and remove it from our saved queue
             del self.PendingAckMap[seqno]
 
-        # Clean up information about old messages handled, this is a hack to
-        # reduce memory utilization and does create an opportunity for spurious
-        # duplicate messages to be processed. Should be fixed for production
-        # use
-        deleteq = []
-        for msgid in self.MessageHandledMap.keys():
-            exptime = self.MessageHandledMap[msgid]
-            if exptime < now:
-                deleteq.append(msgid)
+        # forget the messages handled before ExpireMessageTime, copies of
+        # them received later are handled again
+        self.MessageHandledMap.expire(now)
 
-        for msgid in deleteq:
-            del self.MessageHandledMap[msgid]
+        expired = self.Reassembler.expire(now)
+        if expired:
+            logger.info('discarded %d partially received messages', expired)
 
     def _keep_alive(self, now):
         """A periodic handler that sends a keep alive message to all peers.
@@ -555,6 +965,10 @@ class Gossip(object, DatagramProtocol):
         self.NextKeepAlive = now + self.KeepAliveInterval
         self.forward_message(connect_message.KeepAliveMessage())
 
+        # reopen the stream connections to peers that were closed
+        for node in self.peer_list():
+            self.connect_stream(node)
+
         # Check for nodes with excessive RTTs, for now just report.
         for node in self.peer_list(True):
             node.bump_ticks()
@@ -585,6 +999,9 @@ class Gossip(object, DatagramProtocol):
         self.ProcessIncomingMessages = False
         self.IncomingMessageQueue.appendleft(None)
 
+        if self.SignatureVerifier is not None:
+            self.SignatureVerifier.close()
+
     def add_node(self, peer):
         """Adds an endpoint to the list of peers known to this node.
 
@@ -600,12 +1017,37 @@ class Gossip(object, DatagramProtocol):
         Args
             peer (Node): The peer node to remove from the node map.
         """
+        self.OutgoingFragments.pop(peerid, None)
+        peer = self.NodeMap.get(peerid)
+        if peer is not None and peer.Stream is not None:
+            reactor.callFromThread(peer.Stream.close)
         try:
             del self.NodeMap[peerid]
             self.onNodeDisconnect.fire(peerid)
         except:
             pass
 
+    def connect_stream(self, peer):
+        """Opens a stream connection to a peer, which is used instead of
+        packets to send messages to the peer once it is open.
+
+        The connection is only opened when both nodes accept stream
+        connections and the local node has the lower identifier, so that
+        only one of the two nodes opens it.
+
+        Args:
+            peer (Node): The peer.
+        """
+        if self.LocalNode.StreamPort is None or peer.StreamPort is None or \
+                peer.Stream is not None or \
+                self.LocalNode.Identifier > peer.Identifier:
+            return
+
+        logger.info('open stream connection to %s at %s:%s', peer,
+                    peer.NetHost, peer.StreamPort)
+        reactor.callFromThread(reactor.connectTCP, peer.NetHost,
+                               peer.StreamPort, StreamFactory(self, peer))
+
     def forward_message(self, msg, exceptions=None, initialize=True):
         """Forward a previously received message on to our peers.
 
@@ -667,8 +1109,8 @@ class Gossip(object, DatagramProtocol):
         logger.debug('calling handler for message %s from %s of type %s',
                      msg.Identifier[:8], msg.SenderID[:8], msg.MessageType)
 
-        self.MessageHandledMap[msg.Identifier] = \
-            time.time() + self.ExpireMessageTime
+        self.MessageHandledMap.add(msg.Identifier,
+                                   time.time() + self.ExpireMessageTime)
         self.IncomingMessageQueue.appendleft(msg)
 
         # and now forward it on to the peers if it is marked for forwarding
@@ -32,9 +32,28 @@ class Packet(object):
     """The Packet class manages the data that goes onto and comes off of
     the wire.
 
+    A packet carries either a single message, or a batch of messages
+    for the same peer that is acknowledged as a whole. The data of a
+    batch starts with BatchMarker, which does not start a CBOR encoded
+    message, followed by each message prefixed with its time to live
+    and length packed with EntryFormat.
+
+    A message larger than a packet is sent as fragments, one per packet
+    and each acknowledged on its own. The data of a fragment starts with
+    FragmentMarker followed by the fragment header packed with
+    FragmentFormat: the identifier the sender assigned to the message,
+    the index of the fragment, the number of fragments and the length of
+    the message.
+
     Attributes:
         PackedFormat (str): A struct packed format string representing
             the packed structure of the header.
+        BatchMarker (str): The first byte of the data of a batch.
+        EntryFormat (str): A struct packed format string representing
+            the packed time to live and length of a message in a batch.
+        FragmentMarker (str): The first byte of the data of a fragment.
+        FragmentFormat (str): A struct packed format string representing
+            the packed header of a fragment.
         TimeToLive (int): The maximum number of hops to forward the
             message.
         SequenceNumber (int): A monotonically increasing counter used to
@@ -52,9 +71,16 @@ class Packet(object):
         DestinationID (str): The identifier for the node that is
             intended to receive this packet.
         Identifier (str): The message identifier.
+        Messages (list): The messages in the packet.
+        Fragment (tuple): The outgoing message and the index of the
+            fragment the packet carries, None for other packets.
     """
 
     PackedFormat = '!LL??36s'
+    BatchMarker = '\x00'
+    EntryFormat = '!LL'
+    FragmentMarker = '\x01'
+    FragmentFormat = '!LLLL'
 
     def __init__(self):
         """Constructor for the Packet class.
@@ -66,6 +92,7 @@ class Packet(object):
         self.SenderID = '========================'
 
         self.Message = None
+        self.Messages = []
         self.Data = ''
 
         # bookkeeping properties
@@ -73,6 +100,7 @@ class Packet(object):
         self.RoundTripEstimate = 0.0
         self.DestinationID = '========================'
         self.Identifier = None
+        self.Fragment = None
 
     def __str__(self):
         return "PKT:{0}:{1}".format(self.SenderID[:8], self.SequenceNumber)
@@ -120,8 +148,133 @@ class Packet(object):
         self.RoundTripEstimate = dst.Estimator.RTO
 
         self.Message = msg
+        self.Messages = [msg]
         self.Data = repr(msg)
 
+    def add_messages(self, msgs, src, dst, seqno):
+        """Resets the Packet with a batch of messages for the same
+        destination.
+
+        Args:
+            msgs (list): The messages to apply to the packet.
+            src (Node): The source node of the packet.
+            dst (Node): The destination node of the packet.
+            seqno (int): The sequence number of the packet.
+        """
+        self.IsAcknowledgement = False
+
+        self.Identifier = msgs[0].Identifier
+        self.TimeToLive = 0
+        self.IsReliable = any(msg.IsReliable for msg in msgs)
+        self.SequenceNumber = seqno
+
+        self.SenderID = src.Identifier
+        self.DestinationID = dst.Identifier
+        self.RoundTripEstimate = dst.Estimator.RTO
+
+        self.Message = None
+        self.Messages = list(msgs)
+
+        data = [self.BatchMarker]
+        for msg in msgs:
+            msgdata = repr(msg)
+            data.append(struct.pack(self.EntryFormat, msg.TimeToLive,
+                                    len(msgdata)))
+            data.append(msgdata)
+        self.Data = ''.join(data)
+
+    @property
+    def IsBatch(self):
+        """Returns whether the packet carries a batch of messages.
+        """
+        return self.Data[:1] == self.BatchMarker
+
+    def unpack_batch(self):
+        """Returns the messages in the data of a batch.
+
+        Returns:
+            list: The time to live and CBOR encoded data of each message.
+        """
+        entries = []
+        size = struct.calcsize(self.EntryFormat)
+        offset = len(self.BatchMarker)
+        while offset < len(self.Data):
+            (ttl, length) = struct.unpack(self.EntryFormat,
+                                          self.Data[offset:offset + size])
+            offset += size
+            entries.append((ttl, self.Data[offset:offset + length]))
+            offset += length
+        return entries
+
+    @classmethod
+    def batch_overhead(cls, count):
+        """Returns the number of bytes a batch of messages adds to the
+        header and the data of the messages.
+
+        Args:
+            count (int): The number of messages in the batch.
+        """
+        return struct.calcsize(cls.PackedFormat) + len(cls.BatchMarker) + \
+            count * struct.calcsize(cls.EntryFormat)
+
+    def add_fragment(self, outgoing, index, src, dst, seqno):
+        """Resets the Packet with a fragment of a message.
+
+        Args:
+            outgoing (fragmentation.OutgoingMessage): The fragmented
+                message.
+            index (int): The index of the fragment.
+            src (Node): The source node of the packet.
+            dst (Node): The destination node of the packet.
+            seqno (int): The sequence number of the packet.
+        """
+        self.IsAcknowledgement = False
+
+        self.Identifier = outgoing.Message.Identifier
+        self.TimeToLive = outgoing.Message.TimeToLive
+        self.IsReliable = True
+        self.SequenceNumber = seqno
+
+        self.SenderID = src.Identifier
+        self.DestinationID = dst.Identifier
+        self.RoundTripEstimate = dst.Estimator.RTO
+
+        self.Message = None
+        self.Messages = []
+        self.Fragment = (outgoing, index)
+        self.Data = self.FragmentMarker + \
+            struct.pack(self.FragmentFormat, outgoing.FragmentID, index,
+                        len(outgoing), outgoing.Length) + \
+            outgoing.fragment(index)
+
+    @property
+    def IsFragment(self):
+        """Returns whether the packet carries a fragment of a message.
+        """
+        return self.Data[:1] == self.FragmentMarker
+
+    def unpack_fragment(self):
+        """Returns the header and the data of a fragment.
+
+        Returns:
+            tuple: The message identifier assigned by the sender, the
+                index of the fragment, the number of fragments, the length
+                of the message and the data of the fragment.
+        """
+        offset = len(self.FragmentMarker)
+        size = struct.calcsize(self.FragmentFormat)
+        (fragid, index, count, length) = struct.unpack(
+            self.FragmentFormat, self.Data[offset:offset + size])
+        return (fragid, index, count, length, self.Data[offset + size:])
+
+    @classmethod
+    def fragment_overhead(cls):
+        """Returns the number of bytes a fragment adds to the header and
+        the data of the fragment.
+        """
+        return struct.calcsize(cls.PackedFormat) + \
+            len(cls.FragmentMarker) + struct.calcsize(cls.FragmentFormat)
+
     def unpack(self, databuf):
         """Resets the Packet with the contents of a packed object.
 
@@ -14,9 +14,9 @@
 # ------------------------------------------------------------------------------
 """
 This module implements classes derived from Message for representing
-connection requests, connection replies, disconnection requests, and
-keep alives. It also defines handler methods to be called when these
-message types arrive.
+connection requests, connection replies, disconnection requests, keep
+alives and the capabilities of the peers. It also defines handler methods
+to be called when these message types arrive.
 """
 
 import logging
@@ -67,6 +67,23 @@ def register_message_handlers(gossiper):
     gossiper.dispatcher.register_message_handler(
         KeepAliveMessage,
         keep_alive_handler)
+    gossiper.dispatcher.register_message_handler(
+        CapabilitiesMessage,
+        capabilities_handler)
+
+
+def send_capabilities(gossiper, peerid):
+    """Announces the capabilities of the local node to a peer, which
+    ignores the message if it does not know its type.
+
+    Args:
+        gossiper (Node): The local node.
+        peerid (str): The identifier of the peer.
+    """
+    announcement = CapabilitiesMessage()
+    announcement.Capabilities = list(CapabilitiesMessage.LocalCapabilities)
+    announcement.StreamPort = gossiper.LocalNode.StreamPort
+    gossiper.send_message(announcement, peerid)
 
 
 class ConnectSynMessage(message.Message):
@@ -163,6 +180,7 @@ def connect_syn_handler(msg, gossiper):
     reply = ConnectAckMessage()
     reply.InReplyTo = msg.Identifier
     gossiper.send_message(reply, msg.OriginatorID)
+    send_capabilities(gossiper, msg.OriginatorID)
 
 
 class ConnectAckMessage(message.Message):
@@ -234,6 +252,7 @@ def connect_ack_handler(msg, gossiper):
     reply = ConnectSynAckMessage()
     reply.InReplyTo = msg.Identifier
     gossiper.send_message(reply, msg.OriginatorID)
+    send_capabilities(gossiper, msg.OriginatorID)
 
 
 class ConnectSynAckMessage(message.Message):
@@ -403,3 +422,84 @@ def keep_alive_handler(msg, gossiper):
         gossiper (Node): The local node.
     """
     pass
+
+
+class CapabilitiesMessage(message.Message):
+    """Capabilities messages announce the optional protocol features a
+    node supports, and are sent to a peer once it connects. Nodes that
+    predate a capability neither announce it nor are sent packets that
+    rely on it. Nodes that accept stream connections also announce the
+    port they accept them on.
+
+    Attributes:
+        CapabilitiesMessage.MessageType (str): The class name of the
+            message.
+        LocalCapabilities (tuple): The capabilities of the local node,
+            'PacketBatching' for packets that carry several messages,
+            'PacketFragmentation' for messages sent in fragments and
+            'TransactionBatchRequest' for requests of several missing
+            transactions at once.
+        Capabilities (list): The capabilities of the sending node.
+        StreamPort (int): The port the sending node accepts stream
+            connections on, None if it does not accept them.
+        IsSystemMessage (bool): Whether or not this is a system message.
+            System messages have special delivery priority rules.
+        IsForward (bool): Whether the message should be automatically
+            forwarded.
+        IsReliable (bool): Whether reliable delivery is required.
+    """
+    MessageType = "/gossip.messages.ConnectMessage/Capabilities"
+    LocalCapabilities = ('PacketBatching', 'PacketFragmentation',
+                         'TransactionBatchRequest')
+
+    def __init__(self, minfo=None):
+        """Constructor for the CapabilitiesMessage class.
+
+        Args:
+            minfo (dict): Dictionary of values for message fields.
+        """
+        if minfo is None:
+            minfo = {}
+        super(CapabilitiesMessage, self).__init__(minfo)
+        self.Capabilities = minfo.get('Capabilities', [])
+        self.StreamPort = minfo.get('StreamPort')
+
+        self.IsSystemMessage = True
+        self.IsForward = False
+        self.IsReliable = True
+
+    def dump(self):
+        """Dumps a dict containing object attributes.
+
+        Returns:
+            dict: A mapping of object attribute names to values.
+        """
+        result = super(CapabilitiesMessage, self).dump()
+        result['Capabilities'] = self.Capabilities
+        if self.StreamPort is not None:
+            result['StreamPort'] = self.StreamPort
+        return result
+
+
+def capabilities_handler(msg, gossiper):
+    """Handles capabilities announcements.
+
+    Args:
+        msg (message.Message): The received capabilities message.
+        gossiper (Node): The local node.
+    """
+    if msg.SenderID != msg.OriginatorID:
+        logger.error('capabilities must originate from peer; %s not %s',
+                     msg.OriginatorID, msg.SenderID)
+        return
+
+    peer = gossiper.NodeMap.get(msg.OriginatorID)
+    if peer is None:
+        return
+
+    logger.info('node %s supports %s', peer, msg.Capabilities)
+    peer.Capabilities = frozenset(msg.Capabilities)
+    peer.SupportsBatching = 'PacketBatching' in msg.Capabilities
+    peer.SupportsFragmentation = 'PacketFragmentation' in msg.Capabilities
+    peer.StreamPort = msg.StreamPort
+    gossiper.connect_stream(peer)
@@ -43,19 +43,32 @@ class Node(object):
         Name (str): a short, human-readable name for the node.
         is_peer (bool): whether or not the node is treated as a peer.
             This is set from outside the Node class.
+        Capabilities (frozenset): the optional protocol features the node
+            announced, empty until it announces them.
+        SupportsBatching (bool): whether the node accepts packets carrying
+            a batch of messages, set when it announces the capability.
+        SupportsFragmentation (bool): whether the node accepts messages
+            larger than a packet in fragments, set when it announces the
+            capability.
+        StreamPort (int): the port the node accepts stream connections
+            on, None if it does not accept them.
+        Stream (StreamProtocol): the stream connection messages are sent
+            to the node over instead of packets, None for packets.
         Estimator (RoundTripEstimator): tracks network timing between nodes.
         MessageQ (TransmissionQueue): a transmission queue ordered by time
             to send.
         TokenBucket (token_bucket): limits the average rate of data flow.
         FixedRandomDelay (float): a random delay in the range of DelayRange.
-        Delay (float): a random delay for the node using either a uniform
-            or an exponential distribution depending on the value of the
-            UseFixedDelay boolean. By default, a uniform random distribution
-            is used.
+        Delay (float): a delay for the node chosen by DelayPolicy, by
+            default the uniform random value of FixedRandomDelay.
         Stats (stats): tracks statistics associated with node communication.
         MissedTicks (int): tracks the number of time slices where no messages
             are received from the node. If MissedTicks exceeds 10, the node
             is considered disconnected (see Gossip._keepalive()).
+        DelayPolicy (str): how messages are delayed before they are sent,
+            'fixed' for FixedRandomDelay, 'exponential' for an exponential
+            random delay and 'none' to send them as soon as they are
+            queued. When None, UseFixedDelay selects the policy.
         UseFixedDelay (bool): whether or not to use a uniform or exponential
             random distribution. If UseFixedDelay is True (default), a
             uniform distribution in DelayRange is used.
@@ -65,6 +78,7 @@ class Node(object):
             exponential random function if UsedFixedDelay is false.
 
     """
+    DelayPolicy = None
     UseFixedDelay = True
     DelayRange = [0.1, 0.4]
     DistributionLambda = 10.0
@@ -107,16 +121,28 @@ class Node(object):
 
         self.Name = name if name else self.Identifier[:8]
         self.is_peer = False
+        self.Capabilities = frozenset()
+        self.SupportsBatching = False
+        self.SupportsFragmentation = False
+        self.StreamPort = None
+        self.Stream = None
 
         self.Estimator = RoundTripEstimator()
         self.MessageQ = TransmissionQueue()
         self.TokenBucket = token_bucket.TokenBucket(rate, capacity)
 
         self.FixedRandomDelay = random.uniform(*self.DelayRange)
-        if self.UseFixedDelay:
+        policy = self.DelayPolicy
+        if policy is None:
+            policy = 'fixed' if self.UseFixedDelay else 'exponential'
+        if policy == 'fixed':
             self.Delay = self._fixeddelay
-        else:
+        elif policy == 'exponential':
             self.Delay = self._randomdelay
+        elif policy == 'none':
+            self.Delay = self._nodelay
+        else:
+            raise ValueError('unknown delay policy {0}'.format(policy))
         self.Stats = None
 
         self.MissedTicks = 0
@@ -168,6 +194,9 @@ class Node(object):
     def _fixeddelay(self):
         return self.FixedRandomDelay
 
+    def _nodelay(self):
+        return 0.0
+
     def initialize_stats(self, localnode):
         """Initializes statistics collection for the node.
 
@@ -197,9 +226,12 @@ class Node(object):
             msg (message): the message to enqueue.
             now (float): the current time.
 
+        Returns:
+            float: the time the message is due to be sent.
         """
         timetosend = 0 if msg.IsSystemMessage else now + self.Delay()
         self.MessageQ.enqueue_message(msg, timetosend)
+        return timetosend
 
     def dequeue_message(self, msg):
         """Remove a message from the transmission queue.
@@ -210,15 +242,22 @@ class Node(object):
         """
         return self.MessageQ.dequeue_message(msg)
 
-    def get_next_message(self, now):
+    def get_next_message(self, now, maxsize=None, meteredsize=None):
         """Removes the next sendable message from the queue and returns it.
 
         A message is sendable if it is a system message or if there are
         sufficient tokens in the token bucket to support the length of the
-        message.
+        message. Messages longer than meteredsize are always sendable,
+        they are sent in fragments that consume tokens as they are sent or
+        over a stream that is flow controlled.
 
         Args:
             now (float): the current time.
+            maxsize (int): the number of bytes the message must fit in,
+                None for no limit.
+            meteredsize (int): the length beyond which messages do not
+                consume tokens when they are removed, None if every message
+                consumes tokens.
 
         Returns:
             message: if a sendable message is found it is returned,
@@ -231,13 +270,46 @@ class Node(object):
                 return None
 
             (timetosend, msg) = info
-            if timetosend < now:
-                if msg.IsSystemMessage or self.TokenBucket.consume(len(msg)):
+            if maxsize is not None and len(msg) > maxsize:
+                return None
+            if timetosend <= now:
+                if msg.IsSystemMessage or \
+                        (meteredsize is not None and
+                         len(msg) > meteredsize) or \
+                        self.TokenBucket.consume(len(msg)):
                     self.MessageQ.dequeue_message(msg)
                     return msg
 
         return None
 
+    def next_send_time(self, now, meteredsize=None):
+        """Returns the time the next message in the queue becomes
+        sendable, when it is due and the token bucket holds enough tokens
+        for it.
+
+        Args:
+            now (float): the current time.
+            meteredsize (int): the length beyond which messages do not
+                consume tokens, as for get_next_message.
+
+        Returns:
+            float: the time, None if the queue is empty or the message
+                will never fit in the token bucket.
+        """
+        info = self.MessageQ.Head
+        if info is None:
+            return None
+
+        (timetosend, msg) = info
+        if msg.IsSystemMessage or \
+                (meteredsize is not None and len(msg) > meteredsize):
+            return timetosend
+
+        wait = self.TokenBucket.wait_time(len(msg))
+        if wait is None:
+            return None
+        return max(timetosend, now + wait)
+
     def message_delivered(self, msg, rtt):
         """Updates the RoundTripEstimator based on packet round trip
         time and dequeues the specified message.
@@ -258,12 +330,15 @@ class Node(object):
         Args:
             msg (message): the message to re-send.
             now (int): current time since the epoch in seconds.
+
+        Returns:
+            float: the time the message is due to be sent again.
         """
         if not now:
             now = time.time()
 
         self.Estimator.backoff()
-        self.enqueue_message(msg, now)
+        return self.enqueue_message(msg, now)
 
     def reset_ticks(self):
         """Resets the MissedTicks counter to zero.
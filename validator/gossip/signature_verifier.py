@@ -0,0 +1,231 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+"""
+This module defines the SignatureVerifier class which recovers the
+verifying keys of signed objects in a pool of worker processes so that
+the recovery does not hold the interpreter lock of the validator.
+"""
+
+import logging
+import multiprocessing
+import time
+from threading import Lock
+
+import pybitcointools
+from twisted.internet import reactor
+
+from gossip import signed_object
+from gossip import stats
+
+logger = logging.getLogger(__name__)
+
+
+def _recover(item):
+    """Recovers the public key and address of a signature, this runs in
+    the worker processes.
+
+    Args:
+        item (tuple): The signable serialization and the signature of a
+            signed object.
+
+    Returns:
+        tuple: The public key, address and signature cache key, or
+            (None, None, None) when the key cannot be recovered.
+    """
+    serialized, signature = item
+    try:
+        pubkey = signed_object.get_verifying_key(serialized, signature)
+        if pubkey:
+            return (pubkey, pybitcointools.pubtoaddr(pubkey),
+                    signed_object.signature_digest(serialized, signature))
+    except:
+        logger.exception('unable to recover verifying key')
+    return None, None, None
+
+
+def signed_objects(msg):
+    """Returns the signed objects carried by a message, the message
+    itself followed by the signed objects it holds, such as a
+    transaction or a transaction block.
+
+    Args:
+        msg (message.Message): The message.
+
+    Returns:
+        list: A list of signed objects.
+    """
+    objects = [msg]
+    for value in msg.__dict__.itervalues():
+        if isinstance(value, signed_object.SignedObject) and value.Signature:
+            objects.append(value)
+    return objects
+
+
+class SignatureVerifier(object):
+    """Recovers the verifying keys of signed objects in a process pool.
+
+    Objects submitted while the reactor is busy are batched and sent to
+    the pool together; once their keys are recovered the objects are
+    updated, the signature cache is filled and the callbacks are invoked
+    on the reactor thread, where verify_signature no longer needs to
+    recover anything.
+
+    Attributes:
+        BatchSize (int): The number of signatures that triggers a batch
+            to be sent without waiting for the reactor.
+        Stats (stats.Stats): The verifier metrics, QueueDepth is the
+            number of signatures waiting for or being recovered and
+            SignatureLatency the time in seconds between submission and
+            completion of each signature.
+    """
+
+    BatchSize = 64
+
+    def __init__(self, processes, nodename='verifier'):
+        """Constructor for the SignatureVerifier class.
+
+        Args:
+            processes (int): The number of worker processes.
+            nodename (str): The name of the node for the metrics.
+        """
+        self._pool = multiprocessing.Pool(processes)
+        self._lock = Lock()
+        self._pending = []
+        self._pendingcount = 0
+        self._queued = 0
+        self._flushscheduled = False
+
+        self.Stats = stats.Stats(nodename, 'signature')
+        self.Stats.add_metric(stats.Sample('QueueDepth',
+                                           lambda: self._queued))
+        self.Stats.add_metric(stats.Average('SignatureLatency'))
+        self.Stats.add_metric(stats.Counter('SignaturesRecovered'))
+
+    @staticmethod
+    def _unverified(objects):
+        """Returns the objects whose keys still need to be recovered,
+        filling those found in the signature cache.
+        """
+        unverified = []
+        for obj in objects:
+            if obj._originator_public_key is not None:
+                continue
+            recovered = obj.signature_cache.get(obj._signature_digest())
+            if recovered is not None:
+                obj._originator_id, obj._originator_public_key = recovered
+                continue
+            unverified.append(obj)
+        return unverified
+
+    @staticmethod
+    def _apply(obj, result):
+        pubkey, address, digest = result
+        if pubkey:
+            obj._originator_public_key = pubkey
+            obj._originator_id = address
+            obj.signature_cache[digest] = (address, pubkey)
+
+    def submit(self, objects, callback):
+        """Queues the recovery of the keys of signed objects.
+
+        Args:
+            objects (list): The signed objects.
+            callback (function): Called without arguments on the reactor
+                thread once the keys of all the objects are recovered.
+        """
+        objects = self._unverified(objects)
+        if not objects:
+            callback()
+            return
+
+        with self._lock:
+            self._pending.append((objects, callback, time.time()))
+            self._pendingcount += len(objects)
+            self._queued += len(objects)
+            if self._pendingcount >= self.BatchSize:
+                self._send()
+            elif not self._flushscheduled:
+                # wait for the datagrams already received by the reactor
+                self._flushscheduled = True
+                reactor.callLater(0, self.flush)
+
+    def flush(self):
+        """Sends the queued objects to the pool.
+        """
+        with self._lock:
+            self._flushscheduled = False
+            self._send()
+
+    def _send(self):
+        # called with the lock held
+        batch = self._pending
+        self._pending = []
+        self._pendingcount = 0
+        if not batch:
+            return
+
+        items = []
+        for objects, _, _ in batch:
+            for obj in objects:
+                items.append((obj.serialize(signable=True), obj.Signature))
+
+        self._pool.map_async(
+            _recover, items,
+            callback=lambda results: reactor.callFromThread(
+                self._complete, batch, results))
+
+    def _complete(self, batch, results):
+        now = time.time()
+        index = 0
+        for objects, callback, submitted in batch:
+            for obj in objects:
+                self._apply(obj, results[index])
+                index += 1
+                self.Stats.SignatureLatency.add_value(now - submitted)
+            self._queued -= len(objects)
+            self.Stats.SignaturesRecovered.increment(len(objects))
+
+            try:
+                callback()
+            except:
+                logger.exception('signature verification callback failed')
+
+    def verify(self, objects):
+        """Recovers the keys of signed objects in the pool, blocking the
+        calling thread until they are available. This must not be called
+        from the reactor thread.
+
+        Args:
+            objects (list): The signed objects.
+        """
+        objects = self._unverified(objects)
+        if not objects:
+            return
+
+        start = time.time()
+        results = self._pool.map(
+            _recover,
+            [(obj.serialize(signable=True), obj.Signature)
+             for obj in objects])
+        for obj, result in zip(objects, results):
+            self._apply(obj, result)
+        self.Stats.SignatureLatency.add_value(time.time() - start)
+        self.Stats.SignaturesRecovered.increment(len(objects))
+
+    def close(self):
+        """Stops the worker processes once the queued work is done.
+        """
+        self.flush()
+        self._pool.close()
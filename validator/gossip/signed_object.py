@@ -18,49 +18,69 @@ This module defines the SignedObject class which processes and validates
 objects signed by a signing key.
 """
 
-from collections import deque
+from collections import OrderedDict
 import hashlib
 import logging
 from threading import Lock
 import pybitcointools
 
 from gossip.ECDSA import ECDSARecoverModule as nativeECDSA
-from gossip.common import dict2cbor
+from gossip.common import cbor2dict, dict2cbor
 
 logger = logging.getLogger(__name__)
 
 
+_MISSING = object()
+
+
 class LruCache(object):
     """
     A simple thread-safe lru cache of the recovered public key and address.
     This prevents multiple key recoveries on signed objects during validation.
+
+    The values are kept from least to most recently used so that both
+    lookups and evictions take constant time.
     """
     def __init__(self, max_size=100):
         self.max_size = max_size
-        self.order = deque(maxlen=self.max_size)
-        self.values = {}
+        self.values = OrderedDict()
         self.lock = Lock()
 
+    def __len__(self):
+        return len(self.values)
+
     def __setitem__(self, key, value):
         with self.lock:
-            if key not in self.values:
-                while len(self.order) >= self.max_size:
-                    v = self.order.pop()
-                    del self.values[v]
-                self.values[key] = value
-                self.order.appendleft(key)
+            self.values.pop(key, None)
+            self.values[key] = value
+            self._trim()
 
     def __getitem__(self, key):
         return self.get(key)
 
+    def _trim(self):
+        while len(self.values) > self.max_size:
+            self.values.popitem(last=False)
+
     def get(self, key, default=None):
         with self.lock:
-            result = self.values.get(key, default)
-            if result is not default:
-                self.order.remove(key)
-                self.order.appendleft(key)
+            result = self.values.pop(key, _MISSING)
+            if result is _MISSING:
+                return default
+            self.values[key] = result
         return result
 
+    def resize(self, max_size):
+        """Changes the capacity of the cache, evicting the least recently
+        used entries beyond it.
+
+        Args:
+            max_size (int): The new capacity.
+        """
+        with self.lock:
+            self.max_size = max_size
+            self._trim()
+
 
 def generate_identifier(signingkey):
     """Generates encoded version of the public key associated with
@@ -124,6 +144,26 @@ def get_verifying_key(serialized_msg, serialized_sig):
     return pubkey
 
 
+def signature_digest(serialized_msg, serialized_sig):
+    """Returns the key of a signature in the signature cache.
+
+    The signed message is part of the digest so that a signature copied
+    onto a different message is not taken as verified.
+
+    Args:
+        serialized_msg (str): A serialized message.
+        serialized_sig (str): A serialized signature.
+
+    Returns:
+        str: The sha256 digest of the message and signature.
+    """
+    return hashlib.sha256(serialized_msg + serialized_sig).digest()
+
+
+# guards the construction of objects loaded from journal records
+_record_lock = Lock()
+
+
 class SignedObject(object):
     """Implements a base class for processing & validating signed objects.
 
@@ -131,9 +171,18 @@ class SignedObject(object):
         Signature (str): The signature used to sign the object.
         SignatureKey (str): The name of the key related to the signature.
             Used to build dict return types.
+        SignedObject.RecordAttributes (tuple): The attributes that are
+            stored alongside the signed serialization of the object when
+            it is saved as a journal record.
+        SignedObject.signature_cache (LruCache): The addresses and public
+            keys recovered from signatures, keyed by the digest of the
+            signature and the signed serialization.
 
     """
-    signature_cache = LruCache()
+    signature_cache = LruCache(10000)
+
+    RecordAttributes = ('Signature', '_identifier', '_originator_id',
+                        '_originator_public_key')
 
     def __init__(self, minfo=None, signkey='Signature'):
         """Constructor for the SignedObject class.
@@ -154,6 +203,27 @@ class SignedObject(object):
         self._originator_public_key = None
         self._data = None
 
+    def __getattr__(self, name):
+        # an object loaded from a journal record only holds its record
+        # attributes, it is constructed from the signed serialization
+        # the first time any other attribute is used; the construction
+        # is done on a separate object and its attributes added at once
+        # so other threads never see a partially constructed object
+        if name.startswith('__') or '_record_lazy' not in self.__dict__:
+            raise AttributeError(name)
+
+        with _record_lock:
+            if '_record_lazy' in self.__dict__:
+                cls = type(self)
+                obj = cls.__new__(cls)
+                cls.__init__(obj, cbor2dict(self.__dict__['_record_body']))
+                obj.__dict__.update(
+                    (a, self.__dict__[a]) for a in self.RecordAttributes
+                    if a in self.__dict__)
+                self.__dict__.update(obj.__dict__)
+                del self.__dict__['_record_lazy']
+        return getattr(self, name)
+
     def __repr__(self):
         if not self._data:
             self._data = self.serialize()
@@ -176,16 +246,22 @@ class SignedObject(object):
 
         return self._identifier[:16]
 
+    def _signature_digest(self):
+        return signature_digest(self.serialize(signable=True),
+                                self.Signature)
+
     def _recover_verifying_address(self):
         assert self.Signature
 
-        if not self._originator_id:
-            self._originator_id = \
-                self.signature_cache[self.Signature]
-            if not self._originator_id:
-                self._originator_id = \
-                    pybitcointools.pubtoaddr(self.originator_public_key)
-                self.signature_cache[self.Signature] = self._originator_id
+        serialized = self.serialize(signable=True)
+        digest = signature_digest(serialized, self.Signature)
+        recovered = self.signature_cache.get(digest)
+        if recovered is None:
+            pubkey = get_verifying_key(serialized, self.Signature)
+            recovered = (pybitcointools.pubtoaddr(pubkey), pubkey)
+            self.signature_cache[digest] = recovered
+
+        self._originator_id, self._originator_public_key = recovered
 
     @property
     def originator_public_key(self):
@@ -197,10 +273,7 @@ class SignedObject(object):
             Originator public key
         """
         if self._originator_public_key is None:
-            self._originator_public_key = \
-                get_verifying_key(
-                    self.serialize(signable=True),
-                    self.Signature)
+            self._recover_verifying_address()
 
         return self._originator_public_key
 
@@ -274,6 +347,7 @@ class SignedObject(object):
         """
 
         self._originator_id = None
+        self._originator_public_key = None
         serialized = self.serialize(signable=True)
         self.Signature = pybitcointools.ecdsa_sign(serialized, signingkey)
 
@@ -0,0 +1,264 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+"""
+This module defines the StreamProtocol and StreamFactory classes, which
+carry gossip messages to peers over persistent TCP connections instead
+of UDP packets.
+"""
+
+import logging
+import os
+import socket
+import struct
+import time
+from collections import deque
+
+import pybitcointools
+from twisted.internet.protocol import ClientFactory
+from twisted.internet.protocol import connectionDone
+from twisted.protocols.basic import Int32StringReceiver
+
+from gossip.signed_object import get_verifying_key
+
+logger = logging.getLogger(__name__)
+
+
+class StreamProtocol(Int32StringReceiver):
+    """Carries the messages exchanged with a peer over a TCP connection.
+
+    Every frame is prefixed with its length. The first frame sent in each
+    direction holds the identifier of the sending node and a random
+    nonce, and the second one the signature of the nonce received with
+    the signing key of the sending node. A node is only accepted as the
+    peer when it connects from the address of the peer and signs the
+    nonce with the key of the peer. Each frame that follows holds a frame
+    type and a value packed with HeaderFormat: the time to live of a
+    message followed by the CBOR encoded message, or the number of
+    messages received since the previous acknowledgement.
+
+    TCP delivers messages in order and the transport pauses the
+    connection while the kernel buffers are full, so that no messages
+    are taken from the queue of the peer until it resumes. Every
+    AcknowledgementInterval messages received are acknowledged, and the
+    reliable messages not acknowledged when the connection is lost are
+    queued again to be sent in packets or over the next connection.
+
+    Attributes:
+        HeaderFormat (str): A struct packed format string representing
+            the packed type and value of a frame.
+        MessageFrame (int): The type of frames that carry a message.
+        AcknowledgementFrame (int): The type of frames that acknowledge
+            messages.
+        AcknowledgementInterval (int): The number of messages received
+            before they are acknowledged.
+        Peer (Node): The peer, None until it identifies itself.
+        Paused (bool): Whether the transport asked to stop writing.
+    """
+
+    HeaderFormat = '!BL'
+    MessageFrame = 0
+    AcknowledgementFrame = 1
+    AcknowledgementInterval = 64
+
+    def __init__(self, gossiper, peer=None):
+        """Constructor for the StreamProtocol class.
+
+        Args:
+            gossiper (Gossip): The local gossip protocol.
+            peer (Node): The peer connected to, None for connections
+                accepted from peers.
+        """
+        self.Peer = None
+        self.Paused = False
+
+        self._gossiper = gossiper
+        self._expected = peer
+        self._nonce = os.urandom(16).encode('hex')
+        self._candidate = None
+
+        # the messages sent and not acknowledged, None for the ones that
+        # are not reliable, and the number of messages received and not
+        # acknowledged
+        self._unacknowledged = deque()
+        self._received = 0
+        self.MAX_LENGTH = gossiper.Reassembler.MaximumMessageSize + \
+            struct.calcsize(self.HeaderFormat)
+
+    def connectionMade(self):
+        self.transport.registerProducer(self, True)
+        self.sendString('{0} {1}'.format(
+            self._gossiper.LocalNode.Identifier, self._nonce))
+
+    def connectionLost(self, reason=connectionDone):
+        if self.Peer is None or self.Peer.Stream is not self:
+            return
+
+        logger.info('stream connection to %s closed', self.Peer)
+        self.Peer.Stream = None
+
+        messages = [m for m in self._unacknowledged if m is not None]
+        self._unacknowledged.clear()
+        if messages:
+            logger.info('queue %d unacknowledged messages for %s again',
+                        len(messages), self.Peer)
+            now = time.time()
+            for msg in messages:
+                self._gossiper.schedule_transmit(
+                    self.Peer.enqueue_message(msg, now))
+
+    def stringReceived(self, string):
+        if self.Peer is None:
+            if self._candidate is None:
+                self._identify(string)
+            else:
+                self._authenticate(string)
+            return
+
+        size = struct.calcsize(self.HeaderFormat)
+        if len(string) < size:
+            logger.warn('received truncated frame from %s', self.Peer)
+            return
+
+        (frametype, value) = struct.unpack(self.HeaderFormat, string[:size])
+        if frametype == self.AcknowledgementFrame:
+            for _ in xrange(min(value, len(self._unacknowledged))):
+                self._unacknowledged.popleft()
+            return
+
+        self._gossiper.stream_message_received(string[size:], value,
+                                               self.Peer)
+        self._received += 1
+        if self._received >= self.AcknowledgementInterval:
+            self.sendString(struct.pack(self.HeaderFormat,
+                                        self.AcknowledgementFrame,
+                                        self._received))
+            self._received = 0
+
+    def lengthLimitExceeded(self, length):
+        logger.warn('frame with length %d from %s beyond maximum message '
+                    'size, closing stream', length, self.Peer)
+        self.transport.loseConnection()
+
+    def _identify(self, hello):
+        (peerid, _, nonce) = hello.partition(' ')
+        peer = self._gossiper.NodeMap.get(peerid)
+        if peer is None or not peer.is_peer or not nonce or \
+                (self._expected is not None and peer is not self._expected):
+            logger.info('closing stream connection from unexpected node %s',
+                        peerid[:8])
+            self.transport.loseConnection()
+            return
+
+        host = self.transport.getPeer().host
+        if not _is_address_of(host, peer):
+            logger.warn('closing stream connection from %s, which is not '
+                        'the address of %s', host, peer)
+            self.transport.loseConnection()
+            return
+
+        self._candidate = peer
+        self.sendString(pybitcointools.ecdsa_sign(
+            nonce, self._gossiper.LocalNode.SigningKey))
+
+    def _authenticate(self, signature):
+        peer = self._candidate
+        try:
+            signer = pybitcointools.pubtoaddr(
+                get_verifying_key(self._nonce, signature))
+        except:
+            signer = None
+        if signer != peer.Identifier:
+            logger.warn('closing stream connection from node that is not '
+                        '%s', peer)
+            self.transport.loseConnection()
+            return
+
+        if peer.Stream is not None:
+            logger.info('closing duplicate stream connection to %s', peer)
+            self.transport.loseConnection()
+            return
+
+        logger.info('sending messages to %s over a stream connection', peer)
+        self.Peer = peer
+        peer.Stream = self
+
+    def send_message(self, msg):
+        """Writes a message to the connection.
+
+        Args:
+            msg (message.Message): The message.
+        """
+        self._unacknowledged.append(msg if msg.IsReliable else None)
+        self.sendString(struct.pack(self.HeaderFormat, self.MessageFrame,
+                                    msg.TimeToLive) + repr(msg))
+
+    def close(self):
+        """Closes the connection.
+        """
+        self.transport.loseConnection()
+
+    def pauseProducing(self):
+        self.Paused = True
+
+    def resumeProducing(self):
+        self.Paused = False
+        self._gossiper.schedule_transmit()
+
+    def stopProducing(self):
+        self.Paused = True
+
+
+def _is_address_of(host, peer):
+    """Returns whether a host address is an address of a peer.
+
+    Args:
+        host (str): The IP address.
+        peer (Node): The peer.
+    """
+    for name in set([peer.NetHost, peer.endpoint_host]):
+        if name is None:
+            continue
+        if name == host:
+            return True
+        try:
+            if socket.gethostbyname(name) == host:
+                return True
+        except socket.error:
+            pass
+    return False
+
+
+class StreamFactory(ClientFactory):
+    """Builds the protocol of the stream connections accepted from peers
+    and of those made to a peer.
+    """
+
+    def __init__(self, gossiper, peer=None):
+        """Constructor for the StreamFactory class.
+
+        Args:
+            gossiper (Gossip): The local gossip protocol.
+            peer (Node): The peer connected to, None for the connections
+                accepted from peers.
+        """
+        self._gossiper = gossiper
+        self._peer = peer
+
+    def buildProtocol(self, addr):
+        return StreamProtocol(self._gossiper, self._peer)
+
+    def clientConnectionFailed(self, connector, reason):
+        logger.info('unable to open stream connection to %s; %s',
+                    self._peer, reason.getErrorMessage())
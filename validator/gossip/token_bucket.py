@@ -66,10 +66,35 @@ class TokenBucket(object):
         per second, up to the capacity of the bucket.
         """
         now = time.time()
-        self.Tokens = min(self.Capacity,
-                          self.Tokens + int(self.DripRate *
-                                            (now - self.LastDrip)))
-        self.LastDrip = now
+        added = int(self.DripRate * (now - self.LastDrip))
+        if self.Tokens + added >= self.Capacity:
+            self.Tokens = self.Capacity
+            self.LastDrip = now
+        elif added > 0:
+            # only account for the time of the whole tokens added so
+            # frequent drips do not lose the fractions
+            self.Tokens += added
+            self.LastDrip += float(added) / self.DripRate
+
+    def wait_time(self, amount):
+        """Returns the number of seconds until the bucket holds enough
+        tokens to consume an amount.
+
+        Args:
+            amount (int): the number of tokens to consume from the bucket.
+
+        Returns:
+            float: the number of seconds, None if the amount exceeds the
+                capacity of the bucket.
+
+        """
+        if amount > self.Capacity:
+            return None
+
+        self.drip()
+        if amount <= self.Tokens:
+            return 0.0
+        return float(amount - self.Tokens) / self.DripRate
 
     def consume(self, amount):
         """Consumes tokens from the bucket.
@@ -0,0 +1,126 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+"""
+This module defines the TransmitScheduler class, which runs the
+transmission of queued messages when the earliest of them is due rather
+than on a polling timer.
+"""
+
+import logging
+import threading
+
+from twisted.python import threadable
+
+logger = logging.getLogger(__name__)
+
+
+class TransmitScheduler(object):
+    """Arms a single timer for the earliest time a queued message can be
+    sent, and moves it earlier as soon as a message that is due sooner is
+    queued.
+
+    The scheduler can be asked to transmit from any thread, the timer
+    itself is armed and fires in the reactor thread. A transmission that
+    fails is tried again after ErrorDelay seconds.
+
+    Attributes:
+        ErrorDelay (float): The number of seconds to wait before the next
+            transmission after one failed.
+    """
+
+    ErrorDelay = 1.0
+
+    def __init__(self, transmit, reactor=None):
+        """Constructor for the TransmitScheduler class.
+
+        Args:
+            transmit (function): Sends the messages that are due at the
+                time it is called with, and returns the time the next
+                message is due or None when no message is waiting.
+            reactor (IReactorTime): The reactor the timer is armed with,
+                the global reactor when None.
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+
+        self._transmit = transmit
+        self._reactor = reactor
+        self._lock = threading.Lock()
+
+        # the earliest time a transmission was asked for, and the timer
+        # armed for it
+        self._due = None
+        self._call = None
+
+    @property
+    def Due(self):
+        """Returns the time of the next transmission, None if no
+        transmission is scheduled.
+        """
+        return self._due
+
+    def schedule(self, when):
+        """Makes sure the messages are transmitted no later than a time.
+
+        Args:
+            when (float): The time the next message is due, 0 for as soon
+                as possible.
+        """
+        with self._lock:
+            if self._due is not None and self._due <= when:
+                return
+            self._due = when
+
+        if threadable.isInIOThread():
+            self._arm()
+        else:
+            self._reactor.callFromThread(self._arm)
+
+    def cancel(self):
+        """Cancels the next transmission.
+        """
+        with self._lock:
+            self._due = None
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+
+    def _arm(self):
+        with self._lock:
+            due = self._due
+        if due is None:
+            return
+
+        if self._call is not None and self._call.active():
+            if self._call.getTime() <= due:
+                return
+            self._call.cancel()
+
+        delay = max(0.0, due - self._reactor.seconds())
+        self._call = self._reactor.callLater(delay, self._run)
+
+    def _run(self):
+        with self._lock:
+            self._due = None
+        self._call = None
+
+        try:
+            due = self._transmit(self._reactor.seconds())
+        except:
+            logger.exception('unexpected exception transmitting messages')
+            due = self._reactor.seconds() + self.ErrorDelay
+
+        if due is not None:
+            self.schedule(due)
@@ -0,0 +1,106 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import logging
+import threading
+
+from gossip.message_queue import MessageQueue
+
+logger = logging.getLogger(__name__)
+
+
+class BlockValidationWorker(object):
+    """Validates complete transaction blocks in a dedicated thread, in
+    the order they are submitted, so that neither the thread dispatching
+    messages nor the reactor waits while a block is validated.
+    """
+
+    def __init__(self, validate):
+        """Constructor for the BlockValidationWorker class.
+
+        Args:
+            validate (function): Validates, and commits if it is valid, the
+                block it is called with.
+        """
+        self._validate = validate
+        self._queue = MessageQueue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._queued)
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        """Starts the worker thread.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                                            name='BlockValidation')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stops the worker thread once it completes the block it is
+        validating, discarding the blocks that are queued.
+
+        Args:
+            timeout (float): The number of seconds to wait for the block
+                being validated, None to wait until it is validated.
+        """
+        thread = self._thread
+        if thread is None:
+            return
+
+        self._thread = None
+        self._queue.appendleft(None)
+        if thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def submit(self, block):
+        """Queues a complete block for validation, unless it is already
+        queued.
+
+        Args:
+            block (TransactionBlock): The block.
+        """
+        with self._lock:
+            if block.Identifier in self._queued:
+                return
+            self._queued.add(block.Identifier)
+        self._queue.appendleft(block)
+
+    def _run(self):
+        while self._thread is not None:
+            block = self._queue.pop()
+            if block is None:
+                break
+
+            with self._lock:
+                self._queued.discard(block.Identifier)
+
+            try:
+                self._validate(block)
+            except:
+                logger.exception('blkid: %s - unexpected exception '
+                                 'validating block',
+                                 block.Identifier[:8])
+
+        with self._lock:
+            self._queued.clear()
@@ -128,10 +128,11 @@ class PoetConsensus(Consensus):
         journal.JournalStats.Duration.Value = \
             round(nblock.WaitTimer.duration, 2)
 
-        for txnid in nblock.TransactionIDs:
-            txn = journal.transaction_store[txnid]
-            txn.InBlock = "Uncommitted"
-            journal.transaction_store[txnid] = txn
+        with journal.transaction_store.batch():
+            for txnid in nblock.TransactionIDs:
+                txn = journal.transaction_store[txnid]
+                txn.InBlock = "Uncommitted"
+                journal.transaction_store[txnid] = txn
 
         return nblock
 
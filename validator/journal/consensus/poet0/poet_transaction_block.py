@@ -73,6 +73,9 @@ class PoetTransactionBlock(transaction_block.TransactionBlock):
     TransactionBlockTypeName = '/Poet/PoetTransactionBlock'
     MessageType = PoetTransactionBlockMessage
 
+    RecordAttributes = transaction_block.TransactionBlock.RecordAttributes \
+        + ('AggregateLocalMean', )
+
     def __init__(self, minfo=None):
         """Constructor for the PoetTransactionBlock class.
 
@@ -100,7 +103,7 @@ class PoetTransactionBlock(transaction_block.TransactionBlock):
 
     def __getstate__(self):
         state = self.__dict__.copy()
-        del state['_lock']
+        state.pop('_lock', None)
         return state
 
     def __setstate__(self, state):
@@ -156,10 +159,8 @@ class PoetTransactionBlock(transaction_block.TransactionBlock):
             self.AggregateLocalMean = self.WaitCertificate.local_mean
 
             if self.PreviousBlockID != NullIdentifier:
-                assert self.PreviousBlockID in journal.block_store
-                self.AggregateLocalMean += \
-                    journal.block_store[self.PreviousBlockID]\
-                    .AggregateLocalMean
+                self.AggregateLocalMean += journal.fork_choice.weight(
+                    self.PreviousBlockID, 'AggregateLocalMean')
 
     def is_valid(self, journal):
         """Verifies that the block received is valid.
@@ -0,0 +1,290 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+"""
+Immutable and copy-on-write value containers used by the state stores.
+
+Values held in a KeyValueStore are frozen once when they are written.
+Frozen values are shared by every checkpoint and every reader. A reader
+receives a copy-on-write container that is a shallow copy of the frozen
+value; nested containers are only copied when they are accessed through
+it, so a value that is only read never pays for a deep copy.
+
+CPython copies a dict subclass without calling its methods, so dict(value)
+and dict.update(value) only copy the outer container: the nested
+containers of the copy are still frozen and raise TypeError when they are
+modified. Use value.copy() or copy.deepcopy(value) for a copy that can be
+modified. Concatenating or repeating a frozen or copy-on-write list
+returns a copy-on-write list.
+"""
+
+import copy
+
+_IMMUTABLE_TYPES = (basestring, int, long, float, bool, type(None))
+
+
+def _readonly(self, *args, **kwargs):
+    raise TypeError('{0} is read-only; copy it before modifying it'.format(
+        type(self).__name__))
+
+
+def _concat(self, other):
+    if not isinstance(other, list):
+        return NotImplemented
+    return CopyOnWriteList(list.__add__(self, other))
+
+
+def _rconcat(self, other):
+    if not isinstance(other, list):
+        return NotImplemented
+    return CopyOnWriteList(list.__add__(other, self))
+
+
+def _repeat(self, count):
+    return CopyOnWriteList(list.__mul__(self, count))
+
+
+class FrozenDict(dict):
+    """A dict that cannot be modified once it has been created.
+
+    The nested containers of a copy made with dict() or dict.update() are
+    still frozen, use copy() for a copy that can be modified.
+    """
+
+    __slots__ = ()
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    clear = _readonly
+    pop = _readonly
+    popitem = _readonly
+    setdefault = _readonly
+    update = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self), ))
+
+    def copy(self):
+        """Returns a modifiable copy-on-write copy of the dict.
+        """
+        return CopyOnWriteDict(self)
+
+
+class FrozenList(list):
+    """A list that cannot be modified once it has been created.
+    """
+
+    __slots__ = ()
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    __setslice__ = _readonly
+    __delslice__ = _readonly
+    __iadd__ = _readonly
+    __imul__ = _readonly
+    append = _readonly
+    extend = _readonly
+    insert = _readonly
+    pop = _readonly
+    remove = _readonly
+    reverse = _readonly
+    sort = _readonly
+
+    __add__ = _concat
+    __radd__ = _rconcat
+    __mul__ = _repeat
+    __rmul__ = _repeat
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenList, (list(self), ))
+
+
+class CopyOnWriteDict(dict):
+    """A modifiable dict whose nested containers are copied from a frozen
+    value the first time they are accessed.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, _FROZEN_TYPES):
+            value = copy_on_write(value)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (dict, (thaw(self), ))
+
+    def copy(self):
+        return CopyOnWriteDict(self)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        dict.__setitem__(self, key, default)
+        return default
+
+    def pop(self, key, *args):
+        return copy_on_write(dict.pop(self, key, *args))
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        return key, copy_on_write(value)
+
+    def itervalues(self):
+        for key in self.iterkeys():
+            yield self[key]
+
+    def iteritems(self):
+        for key in self.iterkeys():
+            yield key, self[key]
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+
+class CopyOnWriteList(list):
+    """A modifiable list whose nested containers are copied from a frozen
+    value the first time they are accessed.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return CopyOnWriteList(list.__getitem__(self, index))
+
+        value = list.__getitem__(self, index)
+        if isinstance(value, _FROZEN_TYPES):
+            value = copy_on_write(value)
+            list.__setitem__(self, index, value)
+        return value
+
+    def __getslice__(self, i, j):
+        return CopyOnWriteList(list.__getslice__(self, i, j))
+
+    __add__ = _concat
+    __radd__ = _rconcat
+    __mul__ = _repeat
+    __rmul__ = _repeat
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def __reversed__(self):
+        for index in xrange(len(self) - 1, -1, -1):
+            yield self[index]
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (list, (thaw(self), ))
+
+    def pop(self, *args):
+        return copy_on_write(list.pop(self, *args))
+
+
+_FROZEN_TYPES = (FrozenDict, FrozenList)
+
+
+def freeze(value):
+    """Converts a value into its frozen representation.
+
+    Frozen sub-values, including the untouched parts of a copy-on-write
+    container, are reused without being copied.
+
+    Args:
+        value (object): The value to freeze.
+
+    Returns:
+        object: An immutable equivalent of the value.
+    """
+    if isinstance(value, _IMMUTABLE_TYPES + _FROZEN_TYPES):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in dict.iteritems(value))
+    if isinstance(value, list):
+        return FrozenList(freeze(v) for v in list.__iter__(value))
+    if isinstance(value, tuple):
+        return tuple(freeze(v) for v in value)
+    return copy.deepcopy(value)
+
+
+def copy_on_write(value):
+    """Returns a modifiable view of a frozen value.
+
+    Only the outermost container is copied; nested containers are copied
+    when they are accessed.
+
+    Args:
+        value (object): A value produced by freeze().
+
+    Returns:
+        object: A value that the caller is free to modify.
+    """
+    if isinstance(value, _IMMUTABLE_TYPES):
+        return value
+    if isinstance(value, FrozenDict):
+        return CopyOnWriteDict(value)
+    if isinstance(value, FrozenList):
+        return CopyOnWriteList(value)
+    if isinstance(value, tuple):
+        return tuple(copy_on_write(v) for v in value)
+    return copy.deepcopy(value)
+
+
+def thaw(value):
+    """Creates a plain, fully independent copy of a value.
+
+    Args:
+        value (object): A frozen, copy-on-write or plain value.
+
+    Returns:
+        object: A deep copy built from plain dicts and lists.
+    """
+    if isinstance(value, _IMMUTABLE_TYPES):
+        return value
+    if isinstance(value, dict):
+        return dict((k, thaw(v)) for k, v in dict.iteritems(value))
+    if isinstance(value, list):
+        return [thaw(v) for v in list.__iter__(value)]
+    if isinstance(value, tuple):
+        return tuple(thaw(v) for v in value)
+    return copy.deepcopy(value)
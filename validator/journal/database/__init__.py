@@ -15,5 +15,6 @@
 
 __all__ = [
     'database',
+    'dbm_database',
     'shelf_database',
     'lmdb_database']
@@ -13,7 +13,9 @@
 # limitations under the License.
 # ------------------------------------------------------------------------------
 from collections import OrderedDict
-from threading import RLock
+from threading import Lock
+
+from gossip import stats
 
 
 class Database(object):
@@ -66,6 +68,19 @@ class Database(object):
         """
         raise NotImplementedError()
 
+    def set_batch(self, add_pairs, del_keys=None):
+        """Sets and removes a group of keys in the database as a single
+        write where the implementation supports it
+
+        Args:
+            add_pairs (list): The (key, value) pairs to set.
+            del_keys (list): The keys to remove.
+        """
+        for key, value in add_pairs:
+            self.set(key, value)
+        for key in del_keys or []:
+            self.delete(key)
+
     def sync(self):
         """Ensures that pending writes are flushed to disk
         """
@@ -81,77 +96,236 @@ class Database(object):
         """
         raise NotImplementedError()
 
+    def reorganize(self):
+        """Reclaims the space freed by deleted keys where the
+        implementation does not reuse it
+        """
+        pass
+
+
+def copy_database(source, target, batch_size=1000):
+    """Copies every key of a database to another database, in batches
+    of writes.
+
+    Args:
+        source (Database): The database to copy.
+        target (Database): The database the keys are written to.
+        batch_size (int): The number of keys written in a batch.
+
+    Returns:
+        int: The number of keys copied.
+    """
+    keys = source.keys()
+    for start in xrange(0, len(keys), batch_size):
+        target.set_batch([(k, source.get(k))
+                          for k in keys[start:start + batch_size]])
+    target.sync()
+    return len(keys)
+
+
+_MISSING = object()
+_DELETED = object()
+
+
+def _encoded_size(value):
+    # imported here since records depend on the signed object classes
+    from journal.database import record
+    return len(record.encode(value))
+
 
 class CachedDatabase(object):
     """
-    Takes Database subclasses as argument to constructor
-    and implements a caching mechanism
+    Takes Database subclasses as argument to constructor and keeps the
+    most recently used values in a bounded LRU cache in front of it.
+
+    The cache is bounded by the number of entries and, optionally, by the
+    encoded size of the values it holds. In write-back mode writes are
+    kept in the cache and reach the database when they are evicted or
+    when the cache is synced.
+
     Attributes:
         _database: journal.database.database.Database instance of subclass
-        _cache: dict
-        _rlock: Threading.Rlock
+        _cache: OrderedDict from least to most recently used
+        _lock: threading.Lock protecting the cache, database reads on a
+            miss are made without holding it
+        _loading: keys being read from the database on a miss, a write
+            to the key removes it so the stale value is not cached
+        _dirty: keys whose cached value has not been written
+        Hits, Misses, Evictions, WriteBacks (gossip.stats.Counter)
+        Entries, Bytes (gossip.stats.Value)
     """
 
-    def __init__(self, database, cache_limit=1000):
-
+    def __init__(self, database, cache_limit=1000, size_limit=None,
+                 write_back=False, stats_domain=None, name=''):
+        """
+        Args:
+            database (Database): The database to cache.
+            cache_limit (int): Maximum number of cached entries.
+            size_limit (int): Maximum encoded size in bytes of the
+                cached values, None for no limit.
+            write_back (bool): Whether writes are deferred until the
+                entry is evicted or the cache is synced.
+            stats_domain (gossip.stats.Stats): Domain the cache metrics
+                are added to.
+            name (str): Prefix of the metric names.
+        """
         self._database = database
         self._cache = OrderedDict()
-        self._rlock = RLock()
+        self._lock = Lock()
         self._cachelimit = cache_limit
+        self._sizelimit = size_limit
+        self._writeback = write_back
+        self._sizes = {}
+        self._loading = set()
+        self._dirty = set()
+
+        self.Hits = stats.Counter(name + 'CacheHits')
+        self.Misses = stats.Counter(name + 'CacheMisses')
+        self.Evictions = stats.Counter(name + 'CacheEvictions')
+        self.WriteBacks = stats.Counter(name + 'CacheWriteBacks')
+        self.Entries = stats.Value(name + 'CacheEntries', 0)
+        self.Bytes = stats.Value(name + 'CacheBytes', 0)
+        if stats_domain is not None:
+            for metric in (self.Hits, self.Misses, self.Evictions,
+                           self.WriteBacks, self.Entries, self.Bytes):
+                stats_domain.add_metric(metric)
 
     def __getitem__(self, item):
-        with self._rlock:
-            if item in self._cache:
-                return self._cache[item]
-            return self._database[item]
+        value = self.get(item)
+        if value is None:
+            raise KeyError(item)
+        return value
 
     def __setitem__(self, key, value):
-        with self._rlock:
-            self._database[key] = value
-            self._cache[key] = value
-
-            if len(self._cache) > self._cachelimit:
-                self._cache.popitem(last=False)
+        self.set(key, value)
 
     def __delitem__(self, key):
-        with self._rlock:
-            if key in self._cache:
-                del self._cache[key]
-            del self._database[key]
+        self.delete(key)
 
     def __len__(self):
-        with self._rlock:
-            return len(self._database)
+        self._flush()
+        return len(self._database)
 
     def __contains__(self, item):
-        with self._rlock:
-            return item in self._cache or item in self._database
+        with self._lock:
+            value = self._cache.get(item, _MISSING)
+        if value is not _MISSING:
+            return value is not _DELETED
+        return item in self._database
+
+    def _insert(self, key, value):
+        """Makes value the most recently used entry for key, evicting
+        the least recently used entries beyond the limits. Must be called
+        with the lock held.
+        """
+        self._cache.pop(key, None)
+        self._cache[key] = value
+        if self._sizelimit is not None:
+            size = 0 if value is _DELETED else _encoded_size(value)
+            self.Bytes.Value += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+
+        while self._cache and (
+                len(self._cache) > self._cachelimit or
+                (self._sizelimit is not None and
+                 self.Bytes.Value > self._sizelimit)):
+            oldkey, oldvalue = self._cache.popitem(last=False)
+            self._discard_size(oldkey)
+            if oldkey in self._dirty:
+                self._dirty.discard(oldkey)
+                self._write_back([(oldkey, oldvalue)])
+            self.Evictions.increment()
+        self.Entries.Value = len(self._cache)
+
+    def _discard_size(self, key):
+        if self._sizelimit is not None:
+            self.Bytes.Value -= self._sizes.pop(key, 0)
+
+    def _remove(self, key):
+        if self._cache.pop(key, _MISSING) is not _MISSING:
+            self._discard_size(key)
+            self.Entries.Value = len(self._cache)
+
+    def _write_back(self, entries):
+        add_pairs = [(k, v) for k, v in entries if v is not _DELETED]
+        del_keys = [k for k, v in entries
+                    if v is _DELETED and k in self._database]
+        if add_pairs or del_keys:
+            self._database.set_batch(add_pairs, del_keys)
+            self.WriteBacks.increment(len(add_pairs) + len(del_keys))
+
+    def _flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = [(k, self._cache[k]) for k in self._dirty]
+            self._dirty = set()
+            self._write_back(entries)
+            for key, value in entries:
+                if value is _DELETED:
+                    self._remove(key)
 
     def get(self, key):
-        with self._rlock:
-            if key in self._cache:
-                return self._cache[key]
-            return self._database.get(key)
+        with self._lock:
+            value = self._cache.pop(key, _MISSING)
+            if value is not _MISSING:
+                self._cache[key] = value
+                self.Hits.increment()
+                return None if value is _DELETED else value
+            self.Misses.increment()
+            self._loading.add(key)
+
+        value = self._database.get(key)
+
+        with self._lock:
+            if key in self._loading:
+                self._loading.discard(key)
+                if value is not None:
+                    self._insert(key, value)
+        return value
 
     def set(self, key, value):
-        with self._rlock:
-            self._cache[key] = value
-            self._database.set(key, value)
+        self.set_batch([(key, value)])
 
     def delete(self, key):
-        with self._rlock:
-            if key in self._cache:
-                del self._cache[key]
+        with self._lock:
+            self._loading.discard(key)
+            if self._writeback:
+                cached = self._cache.get(key, _MISSING)
+                if cached is _DELETED or \
+                        (cached is _MISSING and key not in self._database):
+                    raise KeyError(key)
+                self._dirty.add(key)
+                self._insert(key, _DELETED)
+                return
+            self._remove(key)
             self._database.delete(key)
 
+    def set_batch(self, add_pairs, del_keys=None):
+        with self._lock:
+            for key, value in add_pairs:
+                self._loading.discard(key)
+                if self._writeback:
+                    self._dirty.add(key)
+                self._insert(key, value)
+            for key in del_keys or []:
+                self._loading.discard(key)
+                if self._writeback:
+                    self._dirty.add(key)
+                    self._insert(key, _DELETED)
+                else:
+                    self._remove(key)
+            if not self._writeback:
+                self._database.set_batch(add_pairs, del_keys)
+
     def sync(self):
-        with self._rlock:
-            self._database.sync()
+        self._flush()
+        self._database.sync()
 
     def close(self):
-        with self._rlock:
-            self._database.close()
+        self._flush()
+        self._database.close()
 
     def keys(self):
-        with self._rlock:
-            return self._database.keys()
+        self._flush()
+        return self._database.keys()
@@ -0,0 +1,105 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+from threading import RLock
+import anydbm
+
+from journal.database import database
+
+
+class DBMDatabase(database.Database):
+    """DBMDatabase is a thread-safe implementation of the
+    journal.database.Database interface which stores string values
+    directly in a dbm file opened with anydbm.
+
+    Attributes:
+       lock (threading.RLock): A reentrant lock to ensure threadsafe access.
+       dbm (anydbm): The underlying dbm database.
+    """
+
+    def __init__(self, filename, flag):
+        """Constructor for the DBMDatabase class.
+
+        Args:
+            filename (str): The filename of the database file.
+            flag (str): a flag indicating the mode for opening the database.
+                Refer to the documentation for anydbm.open().
+        """
+        super(DBMDatabase, self).__init__()
+        self._lock = RLock()
+        self._dbm = anydbm.open(filename, flag)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._dbm)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._dbm
+
+    def get(self, key):
+        """Retrieves a value associated with a key from the database
+
+        Args:
+            key (str): The key to retrieve
+        """
+        with self._lock:
+            return self._dbm[key] if key in self._dbm else None
+
+    def set(self, key, value):
+        """Sets a value associated with a key in the database
+
+        Args:
+            key (str): The key to set.
+            value (str): The value to associate with the key.
+        """
+        with self._lock:
+            self._dbm[key] = value
+
+    def delete(self, key):
+        """Removes a key:value from the database
+
+        Args:
+            key (str): The key to remove.
+        """
+        with self._lock:
+            del self._dbm[key]
+
+    def sync(self):
+        """Ensures that pending writes are flushed to disk
+        """
+        with self._lock:
+            if hasattr(self._dbm, 'sync'):
+                self._dbm.sync()
+
+    def reorganize(self):
+        """Reclaims the space freed by deleted keys, when the dbm
+        implementation supports it
+        """
+        with self._lock:
+            if hasattr(self._dbm, 'reorganize'):
+                self._dbm.reorganize()
+
+    def close(self):
+        """Closes the connection to the database
+        """
+        with self._lock:
+            self._dbm.close()
+
+    def keys(self):
+        """Returns a list of keys in the database
+        """
+        with self._lock:
+            return self._dbm.keys()
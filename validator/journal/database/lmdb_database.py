@@ -16,9 +16,9 @@
 from threading import RLock
 import os
 import lmdb
-import cPickle as pickle
 
 from journal.database import database
+from journal.database import record
 
 
 class LMDBDatabase(database.Database):
@@ -63,9 +63,15 @@ class LMDBDatabase(database.Database):
 
     def __contains__(self, key):
         with self._lock:
-            with self._lmdb.begin() as txn:
+            with self._lmdb.begin(buffers=True) as txn:
                 return bool(txn.get(key) is not None)
 
+    def _encode(self, value):
+        return record.encode(value)
+
+    def _decode(self, data):
+        return record.decode(data)
+
     def get(self, key):
         """Retrieves a value associated with a key from the database
 
@@ -74,9 +80,9 @@ class LMDBDatabase(database.Database):
         """
         with self._lock:
             with self._lmdb.begin() as txn:
-                pickled = txn.get(key)
-                if pickled is not None:
-                    return pickle.loads(pickled)
+                encoded = txn.get(key)
+                if encoded is not None:
+                    return self._decode(encoded)
 
     def set(self, key, value):
         """Sets a value associated with a key in the database
@@ -85,10 +91,10 @@ class LMDBDatabase(database.Database):
             key (str): The key to set.
             value (str): The value to associate with the key.
         """
-        pickled = pickle.dumps(value)
+        encoded = self._encode(value)
         with self._lock:
             with self._lmdb.begin(write=True, buffers=True) as txn:
-                txn.put(key, pickled, overwrite=True)
+                txn.put(key, encoded, overwrite=True)
 
     def delete(self, key):
         """Removes a key:value from the database
@@ -100,6 +106,21 @@ class LMDBDatabase(database.Database):
             with self._lmdb.begin(write=True, buffers=True) as txn:
                 txn.delete(key)
 
+    def set_batch(self, add_pairs, del_keys=None):
+        """Sets and removes a group of keys in a single write transaction
+
+        Args:
+            add_pairs (list): The (key, value) pairs to set.
+            del_keys (list): The keys to remove.
+        """
+        encoded = [(key, self._encode(value)) for key, value in add_pairs]
+        with self._lock:
+            with self._lmdb.begin(write=True, buffers=True) as txn:
+                for key, value in encoded:
+                    txn.put(key, value, overwrite=True)
+                for key in del_keys or []:
+                    txn.delete(key)
+
     def sync(self):
         """Ensures that pending writes are flushed to disk
         """
@@ -117,4 +138,16 @@ class LMDBDatabase(database.Database):
         """
         with self._lock:
             with self._lmdb.begin() as txn:
-                return [key for key, _ in txn.cursor()]
+                return list(txn.cursor().iternext(keys=True, values=False))
+
+
+class RawLMDBDatabase(LMDBDatabase):
+    """RawLMDBDatabase stores values that are already serialized strings
+    as they are rather than encoding them as journal records.
+    """
+
+    def _encode(self, value):
+        return value
+
+    def _decode(self, data):
+        return data
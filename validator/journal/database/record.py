@@ -0,0 +1,122 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+"""
+Serialization of the values kept in the journal databases.
+
+Signed objects such as transactions and blocks are stored as versioned
+records. A record is the canonical signed CBOR serialization of the object
+preceded by a small header that names the class of the object and holds
+the RecordAttributes of the object, the local state that is not covered by
+the signature such as the status of a transaction. Updating the status of
+a stored object rewrites the header and reuses the serialized body.
+
+Decoding a record only decodes the header; the object is constructed from
+the body the first time an attribute outside the header is used. Values
+that are not signed objects, and databases written before records were
+introduced, are pickled.
+"""
+
+import cPickle as pickle
+import importlib
+import struct
+
+import cbor
+
+from gossip.signed_object import SignedObject
+
+_MAGIC = '\x00JR'
+_VERSION = 1
+_PREFIX = struct.Struct('>3sBI')
+
+_CLASSES = {}
+
+
+class RecordVersionError(Exception):
+    pass
+
+
+def encode(value):
+    """Serializes a value for storage in a journal database.
+
+    Args:
+        value (object): The value to serialize.
+
+    Returns:
+        str: A record for signed objects, a pickle otherwise.
+    """
+    if isinstance(value, SignedObject) and value.Signature:
+        return _encode_record(value)
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def decode(data):
+    """Deserializes a value produced by encode() or by pickle.
+
+    Args:
+        data (str): The serialized value.
+
+    Returns:
+        object: The value, signed objects are constructed lazily.
+    """
+    if not data.startswith(_MAGIC):
+        return pickle.loads(data)
+
+    _, version, length = _PREFIX.unpack_from(data)
+    if version != _VERSION:
+        raise RecordVersionError(
+            'unsupported journal record version {0}'.format(version))
+
+    start = _PREFIX.size
+    header = cbor.loads(data[start:start + length])
+
+    cls = _record_class(header['Class'])
+    obj = cls.__new__(cls)
+    for attr, value in header['State'].iteritems():
+        # header values are scalars, the only sequences are tuple
+        # valued enumerations
+        obj.__dict__[attr] = tuple(value) if isinstance(value, list) \
+            else value
+    obj.__dict__['_record_body'] = data[start + length:]
+    obj.__dict__['_record_signature'] = obj.__dict__.get('Signature')
+    obj.__dict__['_record_lazy'] = True
+    return obj
+
+
+def _encode_record(obj):
+    state = obj.__dict__
+
+    # the serialized body only changes when the object is signed again
+    body = state.get('_record_body')
+    if body is None or state.get('_record_signature') != obj.Signature:
+        body = obj.serialize()
+        state['_record_body'] = body
+        state['_record_signature'] = obj.Signature
+
+    cls = type(obj)
+    header = cbor.dumps({
+        'Class': '{0}:{1}'.format(cls.__module__, cls.__name__),
+        'State': dict((a, state[a]) for a in obj.RecordAttributes
+                      if a in state)
+    })
+    return _PREFIX.pack(_MAGIC, _VERSION, len(header)) + header + body
+
+
+def _record_class(name):
+    cls = _CLASSES.get(name)
+    if cls is None:
+        module, classname = name.split(':')
+        cls = getattr(importlib.import_module(module), classname)
+        _CLASSES[name] = cls
+    return cls
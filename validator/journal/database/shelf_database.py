@@ -14,20 +14,20 @@
 # ------------------------------------------------------------------------------
 
 from threading import RLock
-from shelve import Shelf
 import anydbm
 
 from journal.database import database
+from journal.database import record
 
 
 class ShelfDatabase(database.Database):
     """ShelfDatabase is a thread-safe implementation of the
-    journal.database.Database interface which uses python Shelve for the
-    underlying persistence.
+    journal.database.Database interface which stores values encoded as
+    journal records in a dbm file, in the manner of python Shelve.
 
     Attributes:
        lock (threading.RLock): A reentrant lock to ensure threadsafe access.
-       shelf (shelve.Shelf): The underlying shelf database.
+       shelf (anydbm): The underlying dbm database.
     """
 
     def __init__(self, filename, flag):
@@ -40,7 +40,7 @@ class ShelfDatabase(database.Database):
         """
         super(ShelfDatabase, self).__init__()
         self._lock = RLock()
-        self._shelf = Shelf(anydbm.open(filename, flag))
+        self._shelf = anydbm.open(filename, flag)
 
     def __len__(self):
         with self._lock:
@@ -57,7 +57,9 @@ class ShelfDatabase(database.Database):
             key (str): The key to retrieve
         """
         with self._lock:
-            return self._shelf.get(key, default=None)
+            if key in self._shelf:
+                return record.decode(self._shelf[key])
+            return None
 
     def set(self, key, value):
         """Sets a value associated with a key in the database
@@ -66,8 +68,9 @@ class ShelfDatabase(database.Database):
             key (str): The key to set.
             value (str): The value to associate with the key.
         """
+        encoded = record.encode(value)
         with self._lock:
-            self._shelf[key] = value
+            self._shelf[key] = encoded
 
     def delete(self, key):
         """Removes a key:value from the database
@@ -78,11 +81,29 @@ class ShelfDatabase(database.Database):
         with self._lock:
             del self._shelf[key]
 
+    def set_batch(self, add_pairs, del_keys=None):
+        """Sets and removes a group of keys while holding the lock and
+        flushes them to disk together
+
+        Args:
+            add_pairs (list): The (key, value) pairs to set.
+            del_keys (list): The keys to remove.
+        """
+        encoded = [(key, record.encode(value)) for key, value in add_pairs]
+        with self._lock:
+            for key, value in encoded:
+                self._shelf[key] = value
+            for key in del_keys or []:
+                del self._shelf[key]
+            if hasattr(self._shelf, 'sync'):
+                self._shelf.sync()
+
     def sync(self):
         """Ensures that pending writes are flushed to disk
         """
         with self._lock:
-            self._shelf.sync()
+            if hasattr(self._shelf, 'sync'):
+                self._shelf.sync()
 
     def close(self):
         """Closes the connection to the database
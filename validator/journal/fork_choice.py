@@ -0,0 +1,112 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+from gossip.common import NullIdentifier
+from journal import transaction_block
+
+
+class ForkChoice(object):
+    """Indexes the previous block and the cumulative weight of the valid
+    blocks, so that the fork between two chains is found and the weight
+    of a block is read without loading blocks from the block store.
+
+    Blocks that are not in the index are loaded from the block store,
+    and indexed once they are valid since their weight no longer
+    changes.
+
+    Attributes:
+        WeightAttributes (tuple): The cumulative weight attributes of
+            the blocks that are indexed when a block has them.
+    """
+
+    WeightAttributes = ('TransactionDepth', 'AggregateLocalMean')
+
+    def __init__(self, block_store):
+        """Constructor for the ForkChoice class.
+
+        Args:
+            block_store (JournalStore): The store of the blocks.
+        """
+        self._block_store = block_store
+        self._blocks = {}
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def add_block(self, block):
+        """Indexes a valid block once its weight is computed.
+
+        Args:
+            block (TransactionBlock): The block.
+        """
+        self._blocks[block.Identifier] = self._entry(block)
+
+    def _entry(self, block):
+        weights = dict((attr, getattr(block, attr))
+                       for attr in self.WeightAttributes
+                       if hasattr(block, attr))
+        return block.PreviousBlockID, weights
+
+    def _get(self, blockid):
+        entry = self._blocks.get(blockid)
+        if entry is None:
+            block = self._block_store[blockid]
+            entry = self._entry(block)
+            if block.Status == transaction_block.Status.valid:
+                self._blocks[blockid] = entry
+        return entry
+
+    def previous_block_id(self, blockid):
+        """Returns the identifier of the previous block of a block.
+
+        Args:
+            blockid (str): The identifier of the block.
+        """
+        return self._get(blockid)[0]
+
+    def weight(self, blockid, attribute):
+        """Returns a cumulative weight of a block.
+
+        Args:
+            blockid (str): The identifier of the block.
+            attribute (str): The weight attribute, one of
+                WeightAttributes.
+
+        Returns:
+            object: The value of the attribute for the block.
+        """
+        return self._get(blockid)[1][attribute]
+
+    def find_fork(self, headid, is_committed):
+        """Finds the most recent committed block of the chain ending at a
+        block, visiting only the blocks that follow it.
+
+        Args:
+            headid (str): The identifier of the last block of the chain.
+            is_committed (function): Returns whether the block with the
+                given identifier is in the committed chain.
+
+        Returns:
+            tuple: The identifier of the fork block, NullIdentifier if
+                the chains share no block, and the list of identifiers
+                of the blocks that follow it up to headid.
+        """
+        branch = []
+        blockid = headid
+        while blockid != NullIdentifier and not is_committed(blockid):
+            branch.append(blockid)
+            blockid = self.previous_block_id(blockid)
+        branch.reverse()
+        return blockid, branch
@@ -13,16 +13,27 @@
 # limitations under the License.
 # ------------------------------------------------------------------------------
 
-import anydbm
 import logging
 import copy
+from threading import RLock
 
 import cbor
 
 from gossip.common import cbor2dict, dict2cbor, NullIdentifier
+from journal.database.dbm_database import DBMDatabase
+from journal.copy_on_write import copy_on_write, freeze
+from journal.persistent_map import PersistentMap
 
 logger = logging.getLogger(__name__)
 
+_MISSING = object()
+
+_SNAPSHOT_PREFIX = 'snapshot:'
+
+
+def _snapshot_key(blockid):
+    return _SNAPSHOT_PREFIX + blockid
+
 
 class ReadOnlyException(BaseException):
     """An exception thrown when an update is attempted on a read-only store.
@@ -40,13 +51,28 @@ class GlobalStoreManager(object):
     with the method CommitRootBlock. This step is necessary whether or not
     this is the first time the validator is run.
 
+    Each committed block is persisted as the changes it makes to the
+    state of its predecessor. When SnapshotInterval is set, the complete
+    state is also persisted every SnapshotInterval blocks, so restoring a
+    block replays at most SnapshotInterval - 1 blocks of changes on top
+    of the nearest snapshot. Once a snapshot is written, the history that
+    precedes the oldest of the SnapshotsToKeep most recent snapshots is
+    removed.
+
     Attributes:
         RootBlockID (str): The ID of the root block.
+        SnapshotInterval (int): The number of blocks between snapshots
+            of the complete state, 0 disables snapshots.
+        SnapshotsToKeep (int): The number of snapshots to retain in the
+            chain of a new snapshot, 0 retains the complete history.
     """
 
     RootBlockID = NullIdentifier
+    SnapshotInterval = 0
+    SnapshotsToKeep = 2
 
-    def __init__(self, blockstorefile='blockstore', dbmode='c'):
+    def __init__(self, blockstorefile='blockstore', dbmode='c',
+                 database=None):
         """Initialize a GlobalStoreManager, opening the database file.
 
         Args:
@@ -54,16 +80,35 @@ class GlobalStoreManager(object):
                 persistent data.
             dbmode (str): The mode used to open the file (see anydbm
                 parameters).
-        """
-        logger.info('create blockstore from file %s with flag %s',
-                    blockstorefile, dbmode)
-
+            database (journal.database.database.Database): Optional
+                database that stores the serialized blocks as they are,
+                used instead of opening a dbm file.
+        """
+        if database is None:
+            logger.info('create blockstore from file %s with flag %s',
+                        blockstorefile, dbmode)
+            database = DBMDatabase(blockstorefile, dbmode)
+
+        # _lock guards the loaded blocks and the database, the journal
+        # reads block stores while other blocks are committed
+        self._lock = RLock()
         self._blockmap = {}
-        self._persistmap = anydbm.open(blockstorefile, dbmode)
+        self._persistmap = database
+
+        # _deltadepth holds, for each loaded block, the number of blocks
+        # of changes that follow the nearest snapshot
+        self._deltadepth = {}
+
+        # _parents holds the previous block of every persisted block but
+        # the root and _snapshots the persisted blocks with a snapshot,
+        # both are read from the database on the first compaction
+        self._parents = None
+        self._snapshots = None
 
         rootstore = BlockStore()
         rootstore.commit_block(self.RootBlockID)
         self._blockmap[self.RootBlockID] = rootstore
+        self._deltadepth[self.RootBlockID] = 0
         self._persistmap[self.RootBlockID] = \
             dict2cbor(rootstore.dump_block(True))
         self._persistmap.sync()
@@ -74,7 +119,8 @@ class GlobalStoreManager(object):
     def close(self):
         """Close the database file.
         """
-        self._persistmap.close()
+        with self._lock:
+            self._persistmap.close()
 
     def add_transaction_store(self, tname, tstore):
         """Registers a data store type with a particular transaction type.
@@ -85,19 +131,20 @@ class GlobalStoreManager(object):
                transaction type.
         """
 
-        # we should really only be adding transaction stores to the
-        # root block, if this fails we need to think more about the
-        # initialization
-        assert len(self._blockmap) == 1
+        with self._lock:
+            # we should really only be adding transaction stores to the
+            # root block, if this fails we need to think more about the
+            # initialization
+            assert len(self._blockmap) == 1
 
-        rootstore = self._blockmap[self.RootBlockID]
-        rootstore.add_transaction_store(tname, tstore)
+            rootstore = self._blockmap[self.RootBlockID]
+            rootstore.add_transaction_store(tname, tstore)
 
-        rootstore.commit_block(self.RootBlockID)
-        self._blockmap[self.RootBlockID] = rootstore
-        self._persistmap[self.RootBlockID] = \
-            dict2cbor(rootstore.dump_block(True))
-        self._persistmap.sync()
+            rootstore.commit_block(self.RootBlockID)
+            self._blockmap[self.RootBlockID] = rootstore
+            self._persistmap[self.RootBlockID] = \
+                dict2cbor(rootstore.dump_block(True))
+            self._persistmap.sync()
 
     def commit_block_store(self, blockid, blockstore):
         """Associates the blockstore with the blockid and commits
@@ -111,14 +158,41 @@ class GlobalStoreManager(object):
                 blockstore to be used as the root store.
         """
 
-        # if we commit a block then we know that either this is the genesis
-        # block or that the previous block is committed already
-        assert blockstore.PreviousBlockID in self._persistmap
+        with self._lock:
+            # if we commit a block then we know that either this is the
+            # genesis block or that the previous block is committed already
+            assert blockstore.PreviousBlockID in self._persistmap
 
-        blockstore.commit_block(blockid)
-        self._blockmap[blockid] = blockstore
-        self._persistmap[blockid] = dict2cbor(blockstore.dump_block(True))
-        self._persistmap.sync()
+            blockstore.commit_block(blockid)
+            self._blockmap[blockid] = blockstore
+
+            blockinfo = blockstore.dump_block(True)
+            writes = []
+
+            depth = self._deltadepth.get(blockstore.PreviousBlockID)
+            depth = self.SnapshotInterval if depth is None else depth + 1
+            snapshot = 0 < self.SnapshotInterval <= depth
+            if snapshot:
+                logger.info('write snapshot of the state for block %s',
+                            blockid)
+                blockinfo['Snapshot'] = True
+                writes.append((_snapshot_key(blockid), dict2cbor(
+                    blockstore.dump_block(True, full=True))))
+                depth = 0
+            self._deltadepth[blockid] = depth
+
+            # the block and its snapshot are written together
+            writes.append((blockid, dict2cbor(blockinfo)))
+            self._persistmap.set_batch(writes)
+            self._persistmap.sync()
+
+            if self._parents is not None:
+                self._parents[blockid] = blockstore.PreviousBlockID
+                if snapshot:
+                    self._snapshots.add(blockid)
+
+            if snapshot and self.SnapshotsToKeep > 0:
+                self.compact(blockid)
 
     def require_store(self, blockid):
         """Ensure that the store for this block (including all dependent
@@ -144,15 +218,31 @@ class GlobalStoreManager(object):
             blockinfo = cbor2dict(self._persistmap[blockid])
             blockid = blockinfo['PreviousBlockID']
 
+            # there is no need to go back any further than a snapshot
+            # unless the previous block is already loaded
+            if blockinfo.get('Snapshot') and blockid not in self._blockmap:
+                break
+
         # pass 2... starting with the oldest block, begin to load
         # the stores
         for blockid in blocklist:
             logger.info('load block %s from storage', blockid)
             blockinfo = cbor.loads(self._persistmap[blockid])
-            prevstore = self._blockmap[blockinfo['PreviousBlockID']]
-            blockstore = prevstore.clone_block(blockinfo, True)
+            previd = blockinfo['PreviousBlockID']
+            if previd in self._blockmap:
+                prevstore = self._blockmap[previd]
+                depth = 0 if blockinfo.get('Snapshot') \
+                    else self._deltadepth.get(previd, 0) + 1
+            else:
+                logger.info('load block %s from snapshot', blockid)
+                blockinfo = cbor.loads(
+                    self._persistmap[_snapshot_key(blockid)])
+                prevstore = self._blockmap[self.RootBlockID]
+                depth = 0
+            blockstore = prevstore.clone_block(blockinfo, True, previd)
             blockstore.commit_block(blockid)
             self._blockmap[blockid] = blockstore
+            self._deltadepth[blockid] = depth
 
     def get_block_store(self, blockid):
         """Gets the blockstore associated with a particular blockid.
@@ -168,8 +258,9 @@ class GlobalStoreManager(object):
                 the identifier.
         """
 
-        self.require_store(blockid)
-        return self._blockmap[blockid]
+        with self._lock:
+            self.require_store(blockid)
+            return self._blockmap[blockid]
 
     def flush_block_store(self, blockid):
         """Removes the memory copy of this block and all predecessors.
@@ -191,6 +282,7 @@ class GlobalStoreManager(object):
 
         for blockid in blocklist:
             del self._blockmap[blockid]
+            self._deltadepth.pop(blockid, None)
 
     def flatten_block_store(self, blockid):
         """Collapses the history of this blockstore into a single blockstore.
@@ -204,16 +296,88 @@ class GlobalStoreManager(object):
             blockid (str): Identifier associated with the block.
         """
 
-        blockstore = self.get_block_store(blockid)
-        blockstore.flatten()
+        with self._lock:
+            blockstore = self.get_block_store(blockid)
+            blockstore.flatten()
+
+            self.flush_block_store(blockstore.PreviousBlockID)
 
-        self.flush_block_store(blockstore.PreviousBlockID)
+    def compact(self, blockid):
+        """Removes the persistent history that is no longer needed to
+        restore the chain ending with blockid.
+
+        The SnapshotsToKeep most recent snapshots in the chain are kept.
+        The blocks that precede the oldest of them are removed, together
+        with any fork that branches from the removed blocks.
+
+        Args:
+            blockid (str): Identifier of the most recent block in the
+                chain.
+        """
+        if self._parents is None:
+            self._load_parents()
+        parents = self._parents
+
+        snapshots = 0
+        while blockid in parents:
+            if blockid in self._snapshots:
+                snapshots += 1
+                if snapshots >= self.SnapshotsToKeep:
+                    break
+            blockid = parents[blockid]
+        else:
+            return
+
+        removed = set()
+        previd = parents[blockid]
+        while previd in parents:
+            removed.add(previd)
+            previd = parents[previd]
+
+        children = {}
+        for key, previd in parents.iteritems():
+            children.setdefault(previd, []).append(key)
+
+        pending = list(removed)
+        while pending:
+            for key in children.get(pending.pop(), []):
+                if key != blockid and key not in removed:
+                    removed.add(key)
+                    pending.append(key)
+
+        if not removed:
+            return
+
+        logger.info('remove %s blocks that precede snapshot %s from storage',
+                    len(removed), blockid)
+        deletes = list(removed)
+        deletes.extend(_snapshot_key(k) for k in removed
+                       if k in self._snapshots)
+        self._persistmap.set_batch([], deletes)
+        self._persistmap.sync()
+        self._persistmap.reorganize()
+
+        for key in removed:
+            del parents[key]
+            self._snapshots.discard(key)
+
+    def _load_parents(self):
+        self._parents = {}
+        self._snapshots = set()
+        for key in self.persistmap_keys():
+            if key != self.RootBlockID:
+                blockinfo = cbor2dict(self._persistmap[key])
+                self._parents[key] = blockinfo['PreviousBlockID']
+                if blockinfo.get('Snapshot'):
+                    self._snapshots.add(key)
 
     def persistmap_keys(self):
         '''
         Returns: a list of the block ids in the persistent store
         '''
-        return self._persistmap.keys()
+        with self._lock:
+            return [k for k in self._persistmap.keys()
+                    if not k.startswith(_SNAPSHOT_PREFIX)]
 
 
 class BlockStore(object):
@@ -229,13 +393,16 @@ class BlockStore(object):
     the stores.
 
     Attributes:
-        PrevBlock (global_store_manager.BlockStore): The previous block.
+        PrevBlock (global_store_manager.BlockStore): The store the state
+            of the block derives from, the previous block or, for a block
+            restored from a snapshot, the root block.
         BlockID (str): The ID of the root block.
         TransactionStores (dict): The transaction stores associated with
             this block store.
     """
 
-    def __init__(self, prevblock=None, blockinfo=None, readonly=False):
+    def __init__(self, prevblock=None, blockinfo=None, readonly=False,
+                 previousid=None):
         """Initializes a new BlockStore.
 
         Args:
@@ -243,9 +410,12 @@ class BlockStore(object):
                 to initialize previous block pointer, required for all but the
                 root block.
             blockinfo (dict): Optional initial data for the block.
+            previousid (str): The identifier of the previous block when it
+                is not prevblock, for a block restored from a snapshot.
         """
 
         self.PrevBlock = prevblock
+        self._previousid = previousid
 
         self.BlockID = GlobalStoreManager.RootBlockID
         self.TransactionStores = {}
@@ -264,6 +434,8 @@ class BlockStore(object):
         NullIdentifier if this is the root block (ie there is no previous
         block)
         """
+        if self._previousid is not None:
+            return self._previousid
         return self.PrevBlock.BlockID if self.PrevBlock else NullIdentifier
 
     def add_transaction_store(self, tname, tstore):
@@ -288,14 +460,16 @@ class BlockStore(object):
         """
         return self.TransactionStores[tname]
 
-    def clone_block(self, blockinfo=None, readonly=False):
+    def clone_block(self, blockinfo=None, readonly=False, previousid=None):
         """Create a copy of the ledger by creating and registering a copy
         of each store in the current ledger.
 
         Args:
             blockinfo (dict): Optional output of the dump() method.
+            previousid (str): The identifier of the previous block when it
+                is not this block, for a block restored from a snapshot.
         """
-        return BlockStore(self, blockinfo, readonly)
+        return BlockStore(self, blockinfo, readonly, previousid)
 
     def commit_block(self, blockid):
         """Persist the state of the store to disk.
@@ -316,9 +490,15 @@ class BlockStore(object):
         for tstore in self.TransactionStores.itervalues():
             tstore.flatten()
 
-    def dump_block(self, readonly=True):
+    def dump_block(self, readonly=True, full=False):
         """Serialize the stores associated with this block.
 
+        Args:
+            readonly (bool): Whether or not the values may be shared
+                with the stores rather than copied.
+            full (bool): Whether to serialize the complete state of the
+                stores rather than the changes made in this block.
+
         Returns:
             dict: Information about the stores associated with this
                 block.
@@ -328,7 +508,7 @@ class BlockStore(object):
         result['PreviousBlockID'] = self.PreviousBlockID
         result['TransactionStores'] = {}
         for tname, tstore in self.TransactionStores.iteritems():
-            result['TransactionStores'][tname] = tstore.dump(readonly)
+            result['TransactionStores'][tname] = tstore.dump(readonly, full)
 
         return result
 
@@ -338,14 +518,31 @@ class KeyValueStore(object):
     The KeyValueStore class implements a journaling dictionary that
     enables rollback through generational updates.
 
-    For optimization the chain of stores can be flattened to limit
-    traversal of the chain.
+    Every checkpoint keeps a persistent map of the state resolved
+    through all previous checkpoints; the map is shared structurally
+    between checkpoints so lookups cost the same at any depth of the
+    chain while cloning a checkpoint stays cheap. For optimization the
+    chain of stores can be flattened to release the history.
+
+    Values are frozen when they are written and shared between
+    checkpoints; reads return copy-on-write containers so that only the
+    parts of a value that are actually modified get copied. Setting
+    CopyOnWrite to False restores the original behavior of deep copying
+    every value on get and set.
+
+    A checkpoint can record the keys read and written through it, which
+    is used to detect conflicts between transactions executed against
+    the same state.
 
     Attributes:
+        CopyOnWrite (bool): Whether values are shared copy-on-write
+            rather than deep copied on every access.
         ReadOnly (bool): Whether or not the store is read only.
         PrevStore (KeyValueStore): The previous checkpoint of the store.
     """
 
+    CopyOnWrite = True
+
     def __init__(self, prevstore=None, storeinfo=None, readonly=False):
         """Initialize a new KeyValueStore object.
 
@@ -358,10 +555,29 @@ class KeyValueStore(object):
 
         self.ReadOnly = False
         self.PrevStore = prevstore
-        copyfn = copy.copy if readonly else copy.deepcopy
+
+        # _basemap resolves every key set in previous checkpoints,
+        # _resolvedmap caches the composition of _basemap with this
+        # checkpoint once it is first needed, and is kept up to date by
+        # the writes that follow
+        self._basemap = prevstore._resolved() if prevstore is not None \
+            else PersistentMap.Empty
+        self._resolvedmap = None
+
+        # the keys read and written while tracking, see start_tracking;
+        # a read of the complete store sets _readall
+        self._readkeys = None
+        self._writtenkeys = None
+        self._readall = False
 
         if storeinfo:
-            self._store = copyfn(storeinfo['Store'])
+            if self.CopyOnWrite:
+                self._store = dict((k, freeze(v)) for k, v
+                                   in storeinfo['Store'].iteritems())
+            elif readonly:
+                self._store = copy.copy(storeinfo['Store'])
+            else:
+                self._store = copy.deepcopy(storeinfo['Store'])
             self._deletedkeys = set(storeinfo['DeletedKeys'])
         else:
             self._store = dict()
@@ -379,6 +595,36 @@ class KeyValueStore(object):
         """
         return KeyValueStore(self, storeinfo, readonly)
 
+    def start_tracking(self):
+        """Starts recording the keys read and written in this
+        checkpoint.
+        """
+        self._readkeys = set()
+        self._writtenkeys = set()
+        self._readall = False
+
+    def stop_tracking(self):
+        """Stops recording the keys read and written in this checkpoint.
+
+        Returns:
+            tuple: The set of keys read, None if the complete store was
+                read, and the set of keys written since start_tracking.
+        """
+        readkeys = None if self._readall else self._readkeys
+        writtenkeys = self._writtenkeys
+        self._readkeys = None
+        self._writtenkeys = None
+        self._readall = False
+        return readkeys, writtenkeys
+
+    def _note_read(self, key):
+        if self._readkeys is not None:
+            self._readkeys.add(key)
+
+    def _note_write(self, key):
+        if self._writtenkeys is not None:
+            self._writtenkeys.add(key)
+
     def commit(self):
         """Marks the store as read only.
 
@@ -387,6 +633,26 @@ class KeyValueStore(object):
         """
         self.ReadOnly = True
 
+    def _resolved(self):
+        """Computes the persistent map of all keys visible in this
+        checkpoint.
+
+        The map is derived from the previous checkpoint by applying only
+        the changes made in this checkpoint the first time it is needed,
+        set and delete then apply their change to the cached map.
+
+        Returns:
+            PersistentMap: The resolved state of the store.
+        """
+        if self._readkeys is not None:
+            self._readall = True
+        if self._resolvedmap is not None:
+            return self._resolvedmap
+
+        self._resolvedmap = self._basemap.update(self._store.iteritems(),
+                                                 self._deletedkeys)
+        return self._resolvedmap
+
     def compose(self, readonly=True):
         """Creates a dictionary that is the composition of all
         previous stores.
@@ -401,28 +667,11 @@ class KeyValueStore(object):
         Returns:
             dict: A dictionary with a copy of all items in the store.
         """
-        copyfn = copy.copy if readonly else copy.deepcopy
-
-        storelist = []
-        store = self
-        while store:
-            storelist.insert(0, store)
-            store = store.PrevStore
+        if readonly:
+            return dict(self._resolved().iteritems())
 
-        result = dict()
-        for store in storelist:
-            # copy our dictionary into the result
-            result.update(copyfn(store._store))
-            # remove the deleted keys from the store
-            for k in store._deletedkeys:
-                result.pop(k, None)
-
-        # it would be possible to flatten the store here since
-        # we've already done all the work; however, that would still
-        # use too much memory. we only want to flatten if we are
-        # flushing previous state
-
-        return result
+        return dict((k, copy.deepcopy(v))
+                    for k, v in self._resolved().iteritems())
 
     def flatten(self):
         """Truncates the journal history at this point.
@@ -431,13 +680,73 @@ class KeyValueStore(object):
         reverse references.
         """
         if self.ReadOnly:
+            self._resolvedmap = self._resolved()
             self._store = self.compose(readonly=True)
             self._deletedkeys = set()
+            self._basemap = PersistentMap.Empty
             self.PrevStore = None
 
+    def detach(self):
+        """Creates a read only copy of the store that holds the
+        composition of all previous stores and no reference to them, to
+        send the state to another process.
+
+        Returns:
+            KeyValueStore: The copy of the store.
+        """
+        store = copy.copy(self)
+        store.ReadOnly = True
+        store.flatten()
+        # the resolved map is built again from the flattened store
+        store._resolvedmap = None
+        return store
+
+    def changes_since(self, store):
+        """Returns the changes made to a previous checkpoint of the store
+        by the checkpoints that follow it, up to and including this one.
+
+        Args:
+            store (KeyValueStore): A previous checkpoint of this store.
+
+        Returns:
+            dict: The changes in the format of dump(), None if store is
+                not a previous checkpoint of this one, such as after the
+                checkpoints between them were flattened.
+        """
+        chain = []
+        current = self
+        while current is not store:
+            if current is None:
+                return None
+            chain.append(current)
+            current = current.PrevStore
+
+        changes = dict()
+        deletedkeys = set()
+        for checkpoint in reversed(chain):
+            for key in checkpoint._deletedkeys:
+                changes.pop(key, None)
+                deletedkeys.add(key)
+            for key, value in checkpoint._store.iteritems():
+                changes[key] = value
+                deletedkeys.discard(key)
+
+        return {'Store': changes, 'DeletedKeys': list(deletedkeys)}
+
+    def _lookup(self, key, default=None):
+        """Finds the stored value of a key in this checkpoint or in the
+        resolved state of the previous checkpoints.
+        """
+        self._note_read(key)
+        if key in self._store:
+            return self._store[key]
+        if key in self._deletedkeys:
+            return default
+        return self._basemap.get(key, default)
+
     def get(self, key):
-        """Gets the value associated with a key, cascading the
-        request through the chain of stores.
+        """Gets the value associated with a key from this checkpoint or
+        the resolved state of the previous checkpoints.
 
         Args:
             key (str): The key to lookup.
@@ -445,13 +754,10 @@ class KeyValueStore(object):
         Returns:
             object: The value associated with the key.
         """
-        store = self
-        while store is not None and key not in store._deletedkeys:
-            if key in store._store:
-                return copy.deepcopy(store._store[key])
-
-            store = store.PrevStore
-        raise KeyError('attempt to access missing key', key)
+        value = self._lookup(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError('attempt to access missing key', key)
+        return self._copy_value(value)
 
     def __getitem__(self, key):
         return self.get(key)
@@ -464,14 +770,20 @@ class KeyValueStore(object):
 
         Args:
             key (str): The key to set.
-            value (str): The value to bind to the key. A deepcopy is
-                made.
+            value (str): The value to bind to the key. A frozen copy is
+                made, or a deepcopy if CopyOnWrite is disabled.
         """
         if self.ReadOnly:
             raise ReadOnlyException("Attempt to modify readonly store")
 
-        self._store[key] = copy.deepcopy(value)
+        if self.CopyOnWrite:
+            self._store[key] = freeze(value)
+        else:
+            self._store[key] = copy.deepcopy(value)
         self._deletedkeys.discard(key)
+        if self._resolvedmap is not None:
+            self._resolvedmap = self._resolvedmap.set(key, self._store[key])
+        self._note_write(key)
 
     def __setitem__(self, key, value):
         self.set(key, value)
@@ -490,12 +802,15 @@ class KeyValueStore(object):
 
         self._store.pop(key, None)
         self._deletedkeys.add(key)
+        if self._resolvedmap is not None:
+            self._resolvedmap = self._resolvedmap.delete(key)
+        self._note_write(key)
 
     def __delitem__(self, key):
         self.delete(key)
 
     def has_key(self, key):
-        """Walks the chain to determine if the key exists in the store.
+        """Determines if the key exists in the store.
 
         Args:
             key (str): The key to search for.
@@ -503,13 +818,14 @@ class KeyValueStore(object):
         Returns:
             bool: Whether or not the key exists in the store.
         """
-        if key in self._store:
-            return True
+        return self._lookup(key, _MISSING) is not _MISSING
 
-        if self.PrevStore and key not in self._deletedkeys:
-            return key in self.PrevStore
-
-        return False
+    def _copy_value(self, value):
+        """Returns a copy of a stored value that the caller may modify.
+        """
+        if self.CopyOnWrite:
+            return copy_on_write(value)
+        return copy.deepcopy(value)
 
     def _keys(self):
         """Computes the set of valid keys used in the store.
@@ -517,19 +833,7 @@ class KeyValueStore(object):
         Returns:
             set: The set of valid keys in the store.
         """
-        # construct and reverse historical references
-        stores = []
-        store = self
-        while store is not None:
-            stores.append(store)
-            store = store.PrevStore
-        stores.reverse()
-        # reconstruct history
-        retval = set()
-        for store in stores:
-            retval -= store._deletedkeys
-            retval |= set(store._store.keys())
-        return retval
+        return set(self._resolved().iterkeys())
 
     def keys(self):
         """Computes the set of valid keys used in the store.
@@ -537,19 +841,39 @@ class KeyValueStore(object):
         Returns:
             list: A list of valid keys in the store.
         """
-        return list(self._keys())
+        return self._resolved().keys()
+
+    def __len__(self):
+        return len(self._resolved())
+
+    def __nonzero__(self):
+        # a store is always truthy, even when it holds no keys
+        return True
 
     def __iter__(self):
         """Create an iterator for the keys.
+
+        The iterator works on a snapshot of the store, so the store may
+        be modified while iterating.
         """
-        for k in self.keys():
-            yield k
+        return self._resolved().iterkeys()
 
     def iteritems(self):
         """Creates an iterator for items in the store.
+
+        Each value is a copy that the caller may modify.
+        """
+        for k, v in self._resolved().iteritems():
+            yield k, self._copy_value(v)
+
+    def iteritems_readonly(self):
+        """Creates an iterator for items in the store without copying
+        the values.
+
+        The values are shared with the store and must not be modified;
+        with CopyOnWrite enabled they are frozen and cannot be.
         """
-        for k in self.keys():
-            yield k, self.get(k)
+        return self._resolved().iteritems()
 
     def __contains__(self, key):
         """Determines whether a key occurs in the store.
@@ -560,26 +884,28 @@ class KeyValueStore(object):
         Returns:
             bool: Whether the key exists in the store.
         """
-        retval = False
-        store = self
-        while store is not None:
-            if key in store._store:
-                retval = True
-                break
-            if key in self._deletedkeys:
-                break
-            store = store.PrevStore
-        return retval
+        return self._lookup(key, _MISSING) is not _MISSING
 
-    def dump(self, readonly=False):
+    def dump(self, readonly=False, full=False):
         """Returns a dict containing information about the store.
 
+        Args:
+            readonly (bool): Whether or not the values may be shared
+                with the store rather than copied.
+            full (bool): Whether to dump the composition of all
+                previous stores rather than the changes made in this
+                checkpoint.
+
         Returns:
             dict: A dict containing information about the store.
         """
-        copyfn = copy.copy if readonly else copy.deepcopy
-
         result = dict()
+        if full:
+            result['Store'] = self.compose(readonly)
+            result['DeletedKeys'] = []
+            return result
+
+        copyfn = copy.copy if readonly else copy.deepcopy
         result['Store'] = copyfn(self._store)
         result['DeletedKeys'] = list(self._deletedkeys)
 
@@ -16,8 +16,8 @@
 import logging
 from threading import RLock
 import time
-from collections import OrderedDict
 import os
+import whichdb
 
 from gossip import common
 from gossip import event_handler
@@ -25,6 +25,15 @@ from gossip.message_dispatcher import MessageDispatcher
 from gossip import stats
 
 from journal import journal_store
+from journal.block_validation_worker import BlockValidationWorker
+from journal.database.database import copy_database
+from journal.database.dbm_database import DBMDatabase
+from journal.fork_choice import ForkChoice
+from journal.parallel_executor import ParallelExecutor
+from journal.pending_block_index import PendingBlockIndex
+from journal.pending_graph import PendingTransactionGraph
+from journal.transaction_fetcher import TransactionFetcher
+from journal.transaction_pool import TransactionPool
 from journal.consensus.consensus_base import Consensus
 from journal import transaction
 from journal import transaction_block
@@ -38,6 +47,10 @@ from sawtooth.exceptions import NotAvailableException
 
 logger = logging.getLogger(__name__)
 
+# keys of the committed chain height index in the chain store
+_CHAIN_HEIGHT_KEY = 'ChainHeight'
+_BLOCK_AT_HEIGHT_KEY = 'BlockAtHeight:{0}'
+
 
 class Journal(object):
     """The base journal class.
@@ -78,8 +91,8 @@ class Journal(object):
             to call when processing a decommit block.
         on_block_test (EventHandler): An EventHandler for functions
             to call when processing a block test.
-        pending_transactions (dict): A dict of pending, unprocessed
-            transactions.
+        pending_transactions (TransactionPool): The ordered pool of
+            pending, unprocessed transactions.
         transaction_store (JournalStore): A dict-like object representing
             the persisted copy of the transaction store.
         block_store (JournalStore): A dict-like object representing the
@@ -104,6 +117,13 @@ class Journal(object):
             which still need to be processed.
         global_store_map (GlobalStoreManager): Manages access to the
             various persistence stores.
+        fork_choice (ForkChoice): Indexes the previous block and the
+            cumulative weight of the valid blocks.
+        transaction_fetcher (TransactionFetcher): Requests the missing
+            transactions from peers in batches.
+        block_validator (BlockValidationWorker): Validates and commits
+            the complete blocks, in its own thread once the journal is
+            initialized if validation_worker is set.
     """
 
     def __init__(self,
@@ -117,7 +137,10 @@ class Journal(object):
                  max_txn_age=None,
                  genesis_ledger=None,
                  data_directory=None,
-                 store_type=None):
+                 store_type=None,
+                 store_cache=None,
+                 execution_processes=None,
+                 validation_worker=None):
         """Constructor for the Journal class.
 
         Args:
@@ -125,6 +148,16 @@ class Journal(object):
             genesis_ledger (bool): Whether or not this journal is associated
                 with a genesis node.
             DataDirectory (str):
+            store_cache (dict): Cache settings of the cached store types
+                by store name ('txn', 'block', 'chain' or 'local'), each a
+                dict with optional 'Entries', 'Bytes' and 'WriteBack'
+                values.
+            execution_processes (int): The number of processes used to
+                test and apply the transactions of blocks, None or 0
+                to apply them in the validator process.
+            validation_worker (bool): Whether blocks are validated in a
+                dedicated thread once the journal is initialized, rather
+                than in the thread that receives them.
         """
         self.local_node = local_node
         self.gossip = gossip
@@ -193,29 +226,54 @@ class Journal(object):
         self.on_block_test = event_handler.EventHandler('onBlockTest')
 
         self._txn_lock = RLock()
-        self.pending_transactions = OrderedDict()
+        self.pending_transactions = TransactionPool(self.local_node.Name)
         self.transaction_enqueue_time = None
+        self._pending_graph = PendingTransactionGraph(
+            self._is_committed_transaction)
 
         self.transaction_store = None
         self.block_store = None
         self.chain_store = None
         self.local_store = None
         self.global_store_map = None
-        self.open_databases(store_type, data_directory)
+        self.CacheStats = stats.Stats(self.local_node.Name, 'cache')
+        self.open_databases(store_type, data_directory, store_cache)
+        self.fork_choice = ForkChoice(self.block_store)
+
+        self.transaction_executor = None
+        if execution_processes:
+            self.transaction_executor = ParallelExecutor(
+                int(execution_processes), self.local_node.Name)
+
+        self.validation_worker = bool(validation_worker)
+        self.block_validator = BlockValidationWorker(self._validate_block)
 
         self.requested_transactions = {}
         self.requested_blocks = {}
+        self.transaction_fetcher = TransactionFetcher(
+            self._send_txn_batch_request, self._broadcast_txn_request)
 
         self.next_block_retry = time.time() + self.block_retry_interval
 
         self.dispatcher.on_heartbeat += self._trigger_retry_blocks
         self.dispatcher.on_heartbeat += self._check_claim_block
+        self.dispatcher.on_heartbeat += self._request_missing_txns
 
         self.most_recent_committed_block_id = common.NullIdentifier
         self.pending_block = None
 
+        # the state built by the last call to _prepare_transaction_list,
+        # as (previous block id, transaction ids, block store)
+        self._candidate_store = None
+
+        # the committed chain from the genesis block to the head and the
+        # height of each of its blocks
+        self._committed_chain = []
+        self._committed_heights = {}
+
         self.pending_block_ids = set()
         self.invalid_block_ids = set()
+        self._pending_blocks = PendingBlockIndex()
 
         # initialize the ledger stats data structures
         self._init_ledger_stats(stat_domains)
@@ -227,7 +285,7 @@ class Journal(object):
         journal_transfer.register_message_handlers(self)
         self.consensus.initialization_complete(self)
 
-    def open_databases(self, store_type, data_directory):
+    def open_databases(self, store_type, data_directory, store_cache=None):
         # this flag indicates whether we should create a completely new
         # database file or reuse an existing file
         store_type = 'shelf' if store_type is None else store_type
@@ -235,7 +293,7 @@ class Journal(object):
         dbprefix = dbdir + "/" + str(self.local_node)
 
         if store_type in ['shelf', 'cached-shelf', 'lmdb', 'cached-lmdb']:
-            def get_store(db_name, db_type):
+            def get_store(db_name, db_type, store_name):
                 file_name = db_name
                 db_cls = None
                 if db_type in ['shelf', 'cached-shelf']:
@@ -250,20 +308,48 @@ class Journal(object):
                 db = db_cls(file_name, db_flag)
                 if db_type in ['cached-shelf', 'cached-lmdb']:
                     from journal.database.database import CachedDatabase
-                    db = CachedDatabase(db)
+                    cache = (store_cache or {}).get(store_name, {})
+                    db = CachedDatabase(
+                        db,
+                        cache_limit=cache.get('Entries', 1000),
+                        size_limit=cache.get('Bytes'),
+                        write_back=cache.get('WriteBack', False),
+                        stats_domain=self.CacheStats,
+                        name=store_name)
                 return journal_store.JournalStore(db)
 
-            self.transaction_store = get_store(dbprefix + '_txn', store_type)
-            self.block_store = get_store(dbprefix + '_block', store_type)
-            self.chain_store = get_store(dbprefix + '_chain', store_type)
-            self.local_store = get_store(dbprefix + '_local', store_type)
+            self.transaction_store = get_store(
+                dbprefix + '_txn', store_type, 'txn')
+            self.block_store = get_store(
+                dbprefix + '_block', store_type, 'block')
+            self.chain_store = get_store(
+                dbprefix + '_chain', store_type, 'chain')
+            self.local_store = get_store(
+                dbprefix + '_local', store_type, 'local')
         else:
             raise KeyError("%s is not a supported StoreType", store_type)
 
-        # Set up the global store and transaction handlers
-        gsm_fname = dbprefix + "_state" + ".dbm"
-        db_flag = 'c' if os.path.isfile(gsm_fname) else 'n'
-        self.global_store_map = GlobalStoreManager(gsm_fname, db_flag)
+        # Set up the global store and transaction handlers, the state
+        # is kept in an lmdb environment when lmdb is the store type
+        if store_type in ['lmdb', 'cached-lmdb']:
+            from journal.database import lmdb_database
+            gsm_fname = dbprefix + "_state" + ".lmdb"
+            dbm_fname = dbprefix + "_state" + ".dbm"
+            db_flag = 'c' if os.path.isfile(gsm_fname) else 'n'
+            database = lmdb_database.RawLMDBDatabase(gsm_fname, db_flag)
+            if db_flag == 'n' and whichdb.whichdb(dbm_fname):
+                # the state of a validator that kept it in a dbm file
+                # with the lmdb store type is moved to the environment
+                olddb = DBMDatabase(dbm_fname, 'r')
+                count = copy_database(olddb, database)
+                olddb.close()
+                logger.info('copied %d blocks of state from %s to %s',
+                            count, dbm_fname, gsm_fname)
+            self.global_store_map = GlobalStoreManager(database=database)
+        else:
+            gsm_fname = dbprefix + "_state" + ".dbm"
+            db_flag = 'c' if os.path.isfile(gsm_fname) else 'n'
+            self.global_store_map = GlobalStoreManager(gsm_fname, db_flag)
 
     @property
     def committed_block_count(self):
@@ -307,6 +393,11 @@ class Journal(object):
     def shutdown(self):
         """Shuts down the journal in an orderly fashion.
         """
+        # let the block being validated complete before the stores close
+        self.block_validator.stop(timeout=30.0)
+        if self.transaction_executor is not None:
+            self.transaction_executor.close()
+
         logger.info('close journal databases in preparation for shutdown')
 
         # Global store manager handles its own database
@@ -358,17 +449,42 @@ class Journal(object):
         Returns:
             list: A list of committed block ids.
         """
-        if count == 0:
-            count = len(self.block_store)
+        chain = self._committed_chain
+        if count == 0 or count > len(chain):
+            count = len(chain)
 
-        block_ids = []
+        return chain[len(chain) - count:][::-1]
 
-        blkid = self.most_recent_committed_block_id
-        while blkid != common.NullIdentifier and len(block_ids) < count:
-            block_ids.append(blkid)
-            blkid = self.block_store[blkid].PreviousBlockID
+    def committed_block_ids_from(self, height, count):
+        """Returns the list of block identifiers of the committed chain
+        in chain order, starting from the block at the given height.
+
+        Args:
+            height (int): Height of the first block, the genesis block
+                is at height 0.
+            count (int): How many results should be returned.
+
+        Returns:
+            list: A list of committed block ids.
+        """
+        return self._committed_chain[height:height + count]
+
+    def _is_committed_transaction(self, txnid):
+        txn = self.transaction_store.get(txnid)
+        return txn is not None and \
+            txn.Status == transaction.Status.committed
+
+    def committed_block_height(self, blockid):
+        """Returns the height of a block in the committed chain.
+
+        Args:
+            blockid (str): The identifier of the block.
 
-        return block_ids
+        Returns:
+            int: The height of the block, or None if the block is not
+                committed.
+        """
+        return self._committed_heights.get(blockid)
 
     def compute_chain_root(self):
         """
@@ -419,12 +535,60 @@ class Journal(object):
                 head = self.compute_chain_root()
         if head is not None:
             self.most_recent_committed_block_id = head
+            self._restore_chain_index(head)
             self.global_store_map.get_block_store(head)
             logger.info('commit head: %s', head)
             self.restored = True
         else:
             logger.warn('unable to restore ledger state')
 
+    def _restore_chain_index(self, head):
+        """Loads the committed chain index, rebuilding it from the block
+        store when it does not end at the head of the chain.
+        """
+        height = self.chain_store.get(_CHAIN_HEIGHT_KEY) or 0
+        chain = [self.chain_store.get(_BLOCK_AT_HEIGHT_KEY.format(h))
+                 for h in xrange(height)]
+
+        if not chain or chain[-1] != head or None in chain:
+            logger.info('rebuild the committed chain index from %s', head)
+            chain = []
+            blkid = head
+            while blkid != common.NullIdentifier:
+                chain.append(blkid)
+                blkid = self.block_store[blkid].PreviousBlockID
+            chain.reverse()
+
+            with self.chain_store.batch():
+                for h, blkid in enumerate(chain):
+                    self.chain_store[_BLOCK_AT_HEIGHT_KEY.format(h)] = blkid
+                self.chain_store[_CHAIN_HEIGHT_KEY] = len(chain)
+
+        self._committed_chain = chain
+        self._committed_heights = dict(
+            (blkid, h) for h, blkid in enumerate(chain))
+
+    def _push_committed_block(self, blockid):
+        height = len(self._committed_chain)
+        self._committed_chain.append(blockid)
+        self._committed_heights[blockid] = height
+
+        self.most_recent_committed_block_id = blockid
+        with self.chain_store.batch():
+            self.chain_store['MostRecentBlockID'] = blockid
+            self.chain_store[_BLOCK_AT_HEIGHT_KEY.format(height)] = blockid
+            self.chain_store[_CHAIN_HEIGHT_KEY] = height + 1
+
+    def _pop_committed_block(self, previd):
+        blockid = self._committed_chain.pop()
+        height = self._committed_heights.pop(blockid)
+
+        self.most_recent_committed_block_id = previd
+        with self.chain_store.batch():
+            self.chain_store['MostRecentBlockID'] = previd
+            self.chain_store.delete(_BLOCK_AT_HEIGHT_KEY.format(height))
+            self.chain_store[_CHAIN_HEIGHT_KEY] = height
+
     def initialization_complete(self):
         """Processes all invocations that arrived while the ledger was
         being initialized.
@@ -435,6 +599,7 @@ class Journal(object):
         self.initial_load = True
 
         if self.restored is True:
+            self._start_block_validation()
             return
 
         for txn in self.initial_transactions:
@@ -470,11 +635,19 @@ class Journal(object):
         else:
             if self.most_recent_committed_block_id == common.NullIdentifier:
                 logger.critical('no ledger for a new network node')
+                self._start_block_validation()
                 return
 
         self.initial_load = False
+        self._start_block_validation()
         logger.info('finished processing initial transactions and blocks')
 
+    def _start_block_validation(self):
+        # blocks that arrive once the initial blocks are processed are
+        # validated in the worker thread
+        if self.validation_worker:
+            self.block_validator.start()
+
     def add_pending_transaction(self, txn, prepend=False, build_block=True):
         """Adds a transaction to the list of candidates for commit.
 
@@ -492,28 +665,47 @@ class Journal(object):
                 self.initial_transactions.append(txn)
                 return
 
+            self.transaction_fetcher.arrived(txn.Identifier)
+
             # if we already have the transaction there is nothing to do
             if txn.Identifier in self.transaction_store:
                 assert self.transaction_store[txn.Identifier]
                 return
 
+            # a full pool either evicts its oldest or lowest priority
+            # transactions or refuses the new one, as does an originator
+            # over its quota
+            if txn.add_to_pending():
+                evicted = self.pending_transactions.make_room(
+                    txn.OriginatorID)
+                if evicted is None:
+                    logger.info('txnid: %s - pending transactions full, '
+                                'dropping', txn.Identifier[:8])
+                    return
+                for txnid in evicted:
+                    logger.info('txnid: %s - evicted from pending '
+                                'transactions', txnid[:8])
+                    self._drop_pending_transactions(
+                        self._pending_graph.discard(txnid))
+
             # add it to the transaction store
             txn.Status = transaction.Status.pending
             self.transaction_store[txn.Identifier] = txn
             if txn.add_to_pending():
                 if prepend:
-                    pending = OrderedDict()
-                    pending[txn.Identifier] = True
-                    pending.update(self.pending_transactions)
-                    self.pending_transactions = pending
+                    self.pending_transactions.prepend(txn.Identifier,
+                                                      txn.OriginatorID)
                 else:
-                    self.pending_transactions[txn.Identifier] = True
+                    self.pending_transactions.append(txn.Identifier,
+                                                     txn.OriginatorID,
+                                                     txn.priority())
+                self._pending_graph.add(txn.Identifier, txn.Dependencies,
+                                        prepend)
                 if self.transaction_enqueue_time is None:
                     self.transaction_enqueue_time = time.time()
 
             # if this is a transaction we requested, then remove it from
-            # the list and look for any blocks that might be completed
-            # as a result of processing the transaction
+            # the list
             if txn.Identifier in self.requested_transactions:
                 logger.info('txnid %s - catching up',
                             txn.Identifier[:8])
@@ -521,13 +713,11 @@ class Journal(object):
                 txn.InBlock = "Uncommitted"
                 self.transaction_store[txn.Identifier] = txn
 
-                block_ids = []
-                for block_id in self.pending_block_ids:
-                    if txn.Identifier in \
-                            self.block_store[block_id].TransactionIDs:
-                        block_ids.append(block_id)
-
-                for block_id in block_ids:
+            # look for any blocks that are completed as a result of
+            # processing the transaction
+            for block_id in \
+                    self._pending_blocks.transaction_arrived(txn.Identifier):
+                if block_id in self.pending_block_ids:
                     self._handleblock(self.block_store[block_id])
 
             # there is a chance the we deferred creating a transaction block
@@ -575,22 +765,26 @@ class Journal(object):
             self.initial_block_list.append(tblock)
             return
 
-        # If this is a block we requested, then remove it from the list
-        if tblock.Identifier in self.requested_blocks:
-            del self.requested_blocks[tblock.Identifier]
+        with self._txn_lock:
+            # If this is a block we requested, then remove it from the list
+            if tblock.Identifier in self.requested_blocks:
+                del self.requested_blocks[tblock.Identifier]
 
-        # Make sure that we have not already processed this block
-        if tblock.Identifier in self.block_store:
-            logger.info('blkid: %s - previously committed block',
-                        tblock.Identifier[:8])
-            return
+            # Make sure that we have not already processed this block
+            if tblock.Identifier in self.block_store:
+                logger.info('blkid: %s - previously committed block',
+                            tblock.Identifier[:8])
+                return
 
-        # Make sure we initialize the state of the block
-        tblock.Status = transaction_block.Status.incomplete
+            # Make sure we initialize the state of the block
+            tblock.Status = transaction_block.Status.incomplete
 
-        # Add this block to block pool, mark as orphaned until it is committed
-        self.pending_block_ids.add(tblock.Identifier)
-        self.block_store[tblock.Identifier] = tblock
+            # Add this block to block pool, mark as orphaned until it is
+            # committed
+            self.pending_block_ids.add(tblock.Identifier)
+            self._pending_blocks.add(tblock.Identifier,
+                                     tblock.PreviousBlockID)
+            self.block_store[tblock.Identifier] = tblock
 
         self._handleblock(tblock)
 
@@ -679,13 +873,12 @@ class Journal(object):
         self.JournalStats.MissingTxnRequestCount.increment()
 
         # if the request for the missing block came from another node, then
-        # we need to reuse the request or we'll process multiple copies
+        # we need to reuse the request or we'll process multiple copies,
+        # our own requests are batched and sent to a few peers
         if not request:
             logger.info('txnid: %s - new request from same node(%s)',
                         txn_id[:8], self.local_node.Name)
-            request = transaction_message.TransactionRequestMessage(
-                {'TransactionID': txn_id})
-            self.gossip.forward_message(request, exceptions=exceptions)
+            self.transaction_fetcher.request([txn_id])
         else:
             logger.info('txnid: %s - new request from another node(%s)  ',
                         txn_id[:8],
@@ -694,6 +887,29 @@ class Journal(object):
                                         exceptions=exceptions,
                                         initialize=False)
 
+    def _request_missing_txns(self, now):
+        # batch requests only go to peers that announced they handle them,
+        # transactions no such peer can supply are requested from all peers
+        capability = transaction_message.TransactionBatchRequestMessage.\
+            Capability
+        peers = [p.Identifier for p in self.gossip.peer_list()
+                 if capability in p.Capabilities]
+        self.transaction_fetcher.flush(now, peers)
+
+    def _send_txn_batch_request(self, peerid, txnids):
+        logger.info('requesting %d missing transactions from %s',
+                    len(txnids), self.gossip.node_id_to_name(peerid))
+        self.JournalStats.MissingTxnBatchCount.increment()
+        request = transaction_message.TransactionBatchRequestMessage(
+            {'TransactionIDs': txnids})
+        self.gossip.send_message(request, peerid)
+
+    def _broadcast_txn_request(self, txn_id):
+        logger.info('txnid: %s - requesting from all peers', txn_id[:8])
+        request = transaction_message.TransactionRequestMessage(
+            {'TransactionID': txn_id})
+        self.gossip.forward_message(request)
+
     def build_block(self, genesis=False):
         """Builds the next transaction block for the ledger.
 
@@ -774,21 +990,17 @@ class Journal(object):
                         )
 
             # now find the root of the fork
-            fork_id = self._find_fork(tblock)
+            fork_id, branch = self.fork_choice.find_fork(
+                tblock.Identifier, self._committed_heights.__contains__)
 
             assert fork_id
 
             # at this point we have a new chain that is longer than the current
             # one, need to move the blocks in the current chain that follow the
-            # fork into the orphaned pool and then move the blocks from the new
-            # chain into the committed pool and finally rebuild the global
-            # store
-
-            # move the previously committed blocks into the orphaned list
-            self._decommit_block_chain(fork_id)
-
-            # move the new blocks from the orphaned list to the committed list
-            self._commit_block_chain(tblock.Identifier, fork_id)
+            # fork into the orphaned pool and move the blocks from the new
+            # chain into the committed pool, which is done as one transition
+            self._reorganize(fork_id,
+                             [self.block_store[blkid] for blkid in branch])
             self.pending_block = self.build_block()
         except Exception as e:
             logger.exception("blkid: %s - (fork) error resolving fork",
@@ -802,7 +1014,8 @@ class Journal(object):
     def _handleblock(self, tblock):
         # pylint: disable=redefined-variable-type
         """
-        Attempt to add a block to the chain.
+        Attempt to add a block to the chain. Once the block and its
+        predecessors are complete it is submitted to the block validator.
         """
 
         assert tblock.Identifier in self.pending_block_ids
@@ -828,10 +1041,7 @@ class Journal(object):
                 # block store though we could substitute a check for the
                 # previous block in the invalid block list
                 if pblock.Status == transaction_block.Status.invalid:
-                    self.pending_block_ids.discard(tblock.Identifier)
-                    self.invalid_block_ids.add(tblock.Identifier)
-                    tblock.Status = transaction_block.Status.invalid
-                    self.block_store[tblock.Identifier] = tblock
+                    self._invalidate_block(tblock)
                     return
 
                 # third test... is the previous block complete, if not then
@@ -844,117 +1054,170 @@ class Journal(object):
             # fourth test... check for missing transactions in this block, if
             # any are missing, request them and then save this block for later
             # processing
-            missing = tblock.missing_transactions(self)
-            if missing:
-                logger.info("blkid: %s - missing transactions: %s",
-                            tblock.Identifier, repr(missing))
-                for txnid in missing:
-                    self.request_missing_txn(txnid)
-                    self.JournalStats.MissingTxnFromBlockCount.increment()
+            if self._wait_for_missing_transactions(tblock):
                 return
 
             # at this point we know that the block is complete
             tblock.Status = transaction_block.Status.complete
             self.block_store[tblock.Identifier] = tblock
 
-            # fifth test... run the checks for a valid block, generally
-            # these are specific to the various transaction families or
-            # consensus mechanisms
-            try:
-                if (not tblock.is_valid(self)
-                        or not self.on_block_test.fire(self, tblock)):
-                    logger.debug('blkid: %s - block test failed',
-                                 tblock.Identifier[:8])
-                    self.pending_block_ids.discard(tblock.Identifier)
-                    self.invalid_block_ids.add(tblock.Identifier)
-                    tblock.Status = transaction_block.Status.invalid
-                    self.block_store[tblock.Identifier] = tblock
+            if not self.block_validator.running:
+                self._validate_block(tblock)
+                return
+
+        self.block_validator.submit(tblock)
+
+    def _validate_block(self, tblock):
+        """Runs the validity tests of a complete block, then commits the
+        block. The block tests read the journal so they run with the
+        journal lock held, while the transactions of the block are
+        applied without it to a copy of the state of the previous block.
+        Blocks are validated in the block validator thread, or with the
+        journal lock held when it is not running.
+
+        Args:
+            tblock (TransactionBlock): The complete block.
+        """
+        newstore = None
+        try:
+            with self._txn_lock:
+                # the block may be committed, or found invalid, while it
+                # is queued, and is validated again once its previous
+                # block is committed if that is not valid yet
+                if tblock.Identifier not in self.pending_block_ids:
+                    return
+                if tblock.PreviousBlockID != common.NullIdentifier and \
+                        self.block_store[tblock.PreviousBlockID].Status != \
+                        transaction_block.Status.valid:
                     return
-            except NotAvailableException:
+
+                # fifth test... run the checks for a valid block,
+                # generally these are specific to the various transaction
+                # families or consensus mechanisms
+                valid = tblock.is_valid(self) and \
+                    self.on_block_test.fire(self, tblock)
+
+            if not valid:
+                logger.debug('blkid: %s - block test failed',
+                             tblock.Identifier[:8])
+            else:
+                # sixth test... verify that every transaction in the now
+                # complete block is valid independently and build the new
+                # data store
+                newstore = self._test_and_apply_block(tblock)
+                if newstore is None:
+                    logger.debug('blkid: %s - transaction validity test '
+                                 'failed', tblock.Identifier[:8])
+        except NotAvailableException:
+            with self._txn_lock:
                 tblock.Status = transaction_block.Status.retry
                 self.block_store[tblock.Identifier] = tblock
-                logger.debug('blkid: %s - NotAvailableException - not able to '
-                             'verify, will retry later',
-                             tblock.Identifier[:8])
+                self._pending_blocks.schedule_retry(
+                    tblock.Identifier,
+                    time.time() + self.block_retry_interval)
+            logger.debug('blkid: %s - NotAvailableException - not able to '
+                         'verify, will retry later',
+                         tblock.Identifier[:8])
+            return
+
+        with self._txn_lock:
+            if tblock.Identifier not in self.pending_block_ids:
                 return
 
-            # sixth test... verify that every transaction in the now complete
-            # block is valid independently and build the new data store
-            newstore = self._test_and_apply_block(tblock)
             if newstore is None:
-                logger.debug('blkid: %s - transaction validity test failed',
-                             tblock.Identifier[:8])
-                self.pending_block_ids.discard(tblock.Identifier)
-                self.invalid_block_ids.add(tblock.Identifier)
-                tblock.Status = transaction_block.Status.invalid
+                self._invalidate_block(tblock)
+                return
+
+            # transactions of the block dropped from the pending
+            # transactions while it was validated are requested again
+            if self._wait_for_missing_transactions(tblock):
+                tblock.Status = transaction_block.Status.incomplete
                 self.block_store[tblock.Identifier] = tblock
                 return
 
-            # at this point we know that the block is valid
-            tblock.Status = transaction_block.Status.valid
-            tblock.CommitTime = time.time() - self.start_time
-            tblock.update_block_weight(self)
+            self._commit_valid_block(tblock, newstore)
 
-            if hasattr(tblock, 'AggregateLocalMean'):
-                self.JournalStats.AggregateLocalMean.Value = \
-                    tblock.AggregateLocalMean
+    def _commit_valid_block(self, tblock, newstore):
+        # at this point we know that the block is valid
+        tblock.Status = transaction_block.Status.valid
+        tblock.CommitTime = time.time() - self.start_time
+        tblock.update_block_weight(self)
+        self.fork_choice.add_block(tblock)
 
-            # time to apply the transactions in the block to get a new state
-            self.global_store_map.commit_block_store(tblock.Identifier,
-                                                     newstore)
-            self.block_store[tblock.Identifier] = tblock
+        if hasattr(tblock, 'AggregateLocalMean'):
+            self.JournalStats.AggregateLocalMean.Value = \
+                tblock.AggregateLocalMean
 
-            # remove the block from the pending block list
-            self.pending_block_ids.discard(tblock.Identifier)
+        # time to apply the transactions in the block to get a new state
+        self.global_store_map.commit_block_store(tblock.Identifier,
+                                                 newstore)
+        self.block_store[tblock.Identifier] = tblock
 
-            # and now check to see if we should start to use this block as the
-            # one on which we build a new chain
+        # remove the block from the pending block list
+        self._discard_pending_block(tblock.Identifier)
 
-            # handle the easy, common case here where the new block extends the
-            # current chain
-            if tblock.PreviousBlockID == self.most_recent_committed_block_id:
-                self.handle_advance(tblock)
-            else:
-                self.handle_fork(tblock)
-
-            self._clean_transaction_blocks()
-
-            # check the other orphaned blocks to see if this
-            # block connects one to the chain, if a new block is connected to
-            # the chain then we need to go through the entire process again
-            # with the newly connected block
-            # Also checks if we have pending blocks that need to be retried. If
-            # so adds them to the list to be handled.
-            blockids = set()
-            for blockid in self.pending_block_ids:
-                if self.block_store[blockid].PreviousBlockID ==\
-                        tblock.Identifier:
-                    blockids.add(blockid)
-
-            for blockid in blockids:
+        # and now check to see if we should start to use this block as the
+        # one on which we build a new chain
+
+        # handle the easy, common case here where the new block extends the
+        # current chain
+        if tblock.PreviousBlockID == self.most_recent_committed_block_id:
+            self.handle_advance(tblock)
+        else:
+            self.handle_fork(tblock)
+
+        self._clean_transaction_blocks()
+
+        # check the other orphaned blocks to see if this
+        # block connects one to the chain, if a new block is connected to
+        # the chain then we need to go through the entire process again
+        # with the newly connected block
+        # Also checks if we have pending blocks that need to be retried. If
+        # so adds them to the list to be handled.
+        for blockid in self._pending_blocks.children(tblock.Identifier):
+            if blockid in self.pending_block_ids:
                 self._handleblock(self.block_store[blockid])
 
-            self.retry_blocks()
+        self.retry_blocks()
+
+    def _wait_for_missing_transactions(self, tblock):
+        missing = tblock.missing_transactions(self)
+        if not missing:
+            return False
+
+        logger.info("blkid: %s - missing transactions: %s",
+                    tblock.Identifier, repr(missing))
+        for txnid in missing:
+            self.request_missing_txn(txnid)
+            self.JournalStats.MissingTxnFromBlockCount.increment()
+        self._pending_blocks.wait_for_transactions(tblock.Identifier,
+                                                   missing)
+        return True
+
+    def _invalidate_block(self, tblock):
+        self._discard_pending_block(tblock.Identifier)
+        self.invalid_block_ids.add(tblock.Identifier)
+        tblock.Status = transaction_block.Status.invalid
+        self.block_store[tblock.Identifier] = tblock
 
     def retry_blocks(self):
         # check the orphaned blocks to see if any had a recoverable validation
         # failure, if the did and the retry time has expired then send the
-        # block to be revalidated. We only process the first expired block
-        # in the list, as that will call this function that will process
-        # the next block ready for retry. The retry will modify the
-        # PendingBlockIDs set, so we can not be iterating the set as
-        # the retry happens.
-        retry_block = None
-        for blockid in self.pending_block_ids:
-            block = self.block_store[blockid]
-            if block.Status == transaction_block.Status.retry:
-                retry_block = block
-                break
-
-        if retry_block:
+        # block to be revalidated. A block that fails again is scheduled
+        # for a later retry, and a block committed while retrying another
+        # is no longer pending.
+        with self._txn_lock:
+            due = self._pending_blocks.pop_due_retries(time.time())
+        for blockid in due:
+            if blockid not in self.pending_block_ids:
+                continue
             logger.debug('blkid: %s - Retrying block validation.',
-                         retry_block.Identifier[:8])
-            self._handleblock(retry_block)
+                         blockid[:8])
+            self._handleblock(self.block_store[blockid])
+
+    def _discard_pending_block(self, blockid):
+        self.pending_block_ids.discard(blockid)
+        self._pending_blocks.discard(blockid)
 
     def _trigger_retry_blocks(self, now):
         if time.time() > self.next_block_retry:
@@ -971,15 +1234,11 @@ class Journal(object):
             blockid (UUID) -- head of the chain to commit
             forkid (UUID) -- point where the fork occurred
         """
-        chain = []
-        b_id = blockid
-        while b_id != forkid:
-            block = self.block_store[b_id]
-            chain.append(block)
-            b_id = block.PreviousBlockID
-        chain.reverse()
-        for block in chain:
-            self._commit_block(block)
+        assert forkid == self.most_recent_committed_block_id
+        _, branch = self.fork_choice.find_fork(
+            blockid, lambda b_id: b_id == forkid)
+        self._reorganize(forkid,
+                         [self.block_store[b_id] for b_id in branch])
 
     def _commit_block(self, tblock):
         """
@@ -990,43 +1249,8 @@ class Journal(object):
              tblock (Transaction.TransactionBlock) -- block of transactions to
                  be committed
         """
-
-        with self._txn_lock:
-            logger.info('blkid: %s - commit block from %s with previous '
-                        'blkid: %s',
-                        tblock.Identifier[:8],
-                        self.gossip.node_id_to_name(tblock.OriginatorID),
-                        tblock.PreviousBlockID[:8])
-
-            assert tblock.Status == transaction_block.Status.valid
-
-            # Remove all of the newly committed transactions from the
-            # pending list and put them in the committed list
-            for txnid in tblock.TransactionIDs:
-                assert txnid in self.transaction_store
-                if txnid in self.pending_transactions:
-                    del self.pending_transactions[txnid]
-
-                txn = self.transaction_store[txnid]
-                txn.Status = transaction.Status.committed
-                txn.InBlock = tblock.Identifier
-                self.transaction_store[txnid] = txn
-
-            # Update the head of the chain
-            self.most_recent_committed_block_id = tblock.Identifier
-            self.chain_store['MostRecentBlockID'] = \
-                self.most_recent_committed_block_id
-            self.JournalStats.PreviousBlockID.Value = \
-                self.most_recent_committed_block_id
-
-            # Update stats
-            self.JournalStats.CommittedTxnCount.increment(len(
-                tblock.TransactionIDs))
-            self.JournalStats.CommittedBlockCount.Value = \
-                self.committed_block_count + 1
-
-            # fire the event handler for block commit
-            self.on_commit_block.fire(self, tblock)
+        assert tblock.PreviousBlockID == self.most_recent_committed_block_id
+        self._reorganize(tblock.PreviousBlockID, [tblock])
 
     def _decommit_block_chain(self, forkid):
         """
@@ -1035,10 +1259,7 @@ class Journal(object):
         Args:
             forkid (UUID) -- identifier of the block where the fork occurred
         """
-        blockid = self.most_recent_committed_block_id
-        while blockid != forkid:
-            self._decommit_block()
-            blockid = self.most_recent_committed_block_id
+        self._reorganize(forkid, [])
 
     def _decommit_block(self):
         """
@@ -1046,48 +1267,129 @@ class Journal(object):
         orphaned pool and move all transactions in the block back into the
         pending transaction list.
         """
-
         with self._txn_lock:
-            blockid = self.most_recent_committed_block_id
-            block = self.block_store[blockid]
-            assert block.Status == transaction_block.Status.valid
+            block = self.most_recent_committed_block
+            self._reorganize(block.PreviousBlockID, [])
 
-            # fire the event handler for block decommit
-            self.on_decommit_block.fire(self, block)
-
-            # move the head of the chain back
-            self.most_recent_committed_block_id = block.PreviousBlockID
-            self.chain_store['MostRecentBlockID'] = \
-                self.most_recent_committed_block_id
-
-            # this bizarre bit of code is intended to preserve the ordering of
-            # transactions, where all committed transactions occur before
-            # pending transactions
-            pending = OrderedDict()
-            for txnid in block.TransactionIDs:
-                # there is a chance that this block is incomplete and some
-                # of the transactions have not arrived, don't put
-                # transactions into pending if we dont have the transaction
-                txn = self.transaction_store.get(txnid)
-                if txn:
-                    txn.Status = transaction.Status.pending
-                    self.transaction_store[txnid] = txn
+    def _reorganize(self, forkid, branch):
+        """
+        Move the head of the block chain to the last block of branch as
+        one transition: the blocks that follow the fork in the committed
+        chain are decommitted, the blocks of branch are committed, the
+        transactions of all of them are updated in one batch and the
+        pending transaction list is rebuilt at most once, so the cost
+        depends on the depth of the fork and not on the length of the
+        chain or on the number of pending transactions
 
-                    if txn.add_to_pending():
-                        pending[txnid] = True
+        Args:
+            forkid (UUID) -- identifier of the most recent committed block
+                shared with the new chain
+            branch (list of TransactionBlock) -- blocks that follow the
+                fork in the new chain, in chain order
+        """
 
-            pending.update(self.pending_transactions)
-            self.pending_transactions = pending
+        with self._txn_lock:
+            height = 0 if forkid == common.NullIdentifier \
+                else self._committed_heights[forkid] + 1
+            decommitted = [self.block_store[blockid]
+                           for blockid in self._committed_chain[height:]]
+            if decommitted:
+                self._candidate_store = None
+
+            # transactions that are in both chains remain committed
+            recommitted = set()
+            for block in branch:
+                recommitted.update(block.TransactionIDs)
+
+            readded = []
+            decommittedtxns = []
+            with self.transaction_store.batch(), \
+                    self.chain_store.batch(), self.block_store.batch():
+                for block in reversed(decommitted):
+                    assert block.Status == transaction_block.Status.valid
+                    logger.info('blkid: %s - decommit block',
+                                block.Identifier[:8])
+
+                    # fire the event handler for block decommit
+                    self.on_decommit_block.fire(self, block)
+
+                    # move the head of the chain back
+                    self._pop_committed_block(block.PreviousBlockID)
+
+                for block in decommitted:
+                    for txnid in block.TransactionIDs:
+                        if txnid in recommitted:
+                            continue
+                        decommittedtxns.append(txnid)
+
+                        # there is a chance that this block is incomplete
+                        # and some of the transactions have not arrived,
+                        # don't put transactions into pending if we dont
+                        # have the transaction
+                        txn = self.transaction_store.get(txnid)
+                        if txn:
+                            txn.Status = transaction.Status.pending
+                            self.transaction_store[txnid] = txn
+                            if txn.add_to_pending():
+                                readded.append(txn)
+
+                for block in branch:
+                    logger.info('blkid: %s - commit block from %s with '
+                                'previous blkid: %s',
+                                block.Identifier[:8],
+                                self.gossip.node_id_to_name(
+                                    block.OriginatorID),
+                                block.PreviousBlockID[:8])
+
+                    assert block.Status == transaction_block.Status.valid
+
+                    # Remove all of the newly committed transactions from
+                    # the pending list and put them in the committed list
+                    for txnid in block.TransactionIDs:
+                        assert txnid in self.transaction_store
+                        self.pending_transactions.discard(txnid)
+                        self._pending_graph.commit(txnid)
+
+                        txn = self.transaction_store[txnid]
+                        txn.Status = transaction.Status.committed
+                        txn.InBlock = block.Identifier
+                        self.transaction_store[txnid] = txn
+
+                    # Update the head of the chain
+                    assert block.PreviousBlockID == \
+                        self.most_recent_committed_block_id
+                    self._push_committed_block(block.Identifier)
+
+                    # fire the event handler for block commit
+                    self.on_commit_block.fire(self, block)
+
+            # preserve the ordering of transactions, where all committed
+            # transactions occur before pending transactions
+            for txn in reversed(readded):
+                self.pending_transactions.prepend(txn.Identifier,
+                                                  txn.OriginatorID)
+
+            # the decommitted transactions block the pending transactions
+            # that depend on them until they are committed again
+            for txnid in decommittedtxns:
+                self._pending_graph.decommit(txnid)
+            for txn in reversed(readded):
+                self._pending_graph.add(txn.Identifier, txn.Dependencies,
+                                        True)
 
             # update stats
+            self.JournalStats.PreviousBlockID.Value = \
+                self.most_recent_committed_block_id
+            self.JournalStats.CommittedTxnCount.increment(
+                sum(len(b.TransactionIDs) for b in branch) -
+                sum(len(b.TransactionIDs) for b in decommitted))
             self.JournalStats.CommittedBlockCount.Value = \
                 self.committed_block_count + 1
-            self.JournalStats.CommittedTxnCount.increment(-len(
-                block.TransactionIDs))
 
     def _test_and_apply_block(self, tblock):
         """Test and apply transactions to the previous block's global
-        store to create a new version of the store
+        store to create a new version of the store. The journal lock is
+        only held to read the transactions of the block.
 
         Args:
             tblock (Transaction.TransactionBlock) -- block of transactions to
@@ -1099,29 +1401,61 @@ class Journal(object):
         with self._txn_lock:
             assert tblock.Status == transaction_block.Status.complete
 
-            # make a copy of the store from the previous block, the previous
-            # block must be complete if this block is complete
-            teststore = self.global_store_map.get_block_store(
-                tblock.PreviousBlockID).clone_block()
-
-            # apply the transactions
+            # a block built by this validator on the state it prepared
+            # already has its transactions applied
+            candidate = self._candidate_store
+            if candidate is not None and \
+                    candidate[0] == tblock.PreviousBlockID and \
+                    candidate[1] == tblock.TransactionIDs:
+                self._candidate_store = None
+                self.JournalStats.ReusedBlockStoreCount.increment()
+                return candidate[2]
+
+            # a transaction dropped from the pending transactions since
+            # the block was complete is requested when it is retried
             try:
-                for txnid in tblock.TransactionIDs:
-                    txn = self.transaction_store[txnid]
-                    txnstore = teststore.get_transaction_store(
-                        txn.TransactionTypeName)
-                    if not txn.is_valid(txnstore):
-                        return None
-
-                    txn.apply(txnstore)
+                txns = [self.transaction_store[txnid]
+                        for txnid in tblock.TransactionIDs]
+            except KeyError:
+                raise NotAvailableException
+
+        # make a copy of the store from the previous block, the previous
+        # block must be complete if this block is complete; the copy
+        # resolves the state of the previous block when it is created so
+        # it is not affected by blocks committed or flattened meanwhile
+        prevstore = self.global_store_map.get_block_store(
+            tblock.PreviousBlockID)
+
+        executor = self.transaction_executor
+        if executor is not None and executor.is_parallel(len(txns)):
+            try:
+                return executor.execute(prevstore, txns)
             except:
-                logger.exception('txnid: %s - unexpected exception '
+                logger.exception('blkid: %s - unexpected exception '
                                  'when testing transaction block '
                                  'validity.',
-                                 txnid[:8])
+                                 tblock.Identifier[:8])
                 return None
 
-            return teststore
+        teststore = prevstore.clone_block()
+
+        # apply the transactions
+        try:
+            for txn in txns:
+                txnstore = teststore.get_transaction_store(
+                    txn.TransactionTypeName)
+                if not txn.is_valid(txnstore):
+                    return None
+
+                txn.apply(txnstore)
+        except:
+            logger.exception('txnid: %s - unexpected exception '
+                             'when testing transaction block '
+                             'validity.',
+                             txn.Identifier[:8])
+            return None
+
+        return teststore
 
     def _find_fork(self, tblock):
         """
@@ -1132,16 +1466,9 @@ class Journal(object):
         :param depth int: depth in the current chain to search, 0 implies all
         """
 
-        blockids = set(self.committed_block_ids(0))
-        forkid = tblock.PreviousBlockID
-        while True:
-            if forkid == common.NullIdentifier or forkid in blockids:
-                return forkid
-
-            assert forkid in self.block_store
-            forkid = self.block_store[forkid].PreviousBlockID
-
-        return None
+        forkid, _ = self.fork_choice.find_fork(
+            tblock.PreviousBlockID, self._committed_heights.__contains__)
+        return forkid
 
     def _prepare_transaction_list(self, maxcount=0):
         """
@@ -1153,144 +1480,131 @@ class Journal(object):
         """
 
         with self._txn_lock:
-            # generate a list of valid transactions to place in the new block
-            addtxns = []
+            # a dependency in the transaction store that is not pending,
+            # for instance one evicted while its block was not committed,
+            # is made pending again; transactions waiting for the other
+            # dependencies age each time a block is prepared without
+            # them, and are dropped once they are too old
             deltxns = []
-            store = self.global_store.clone_block()
-            for txnid in self.pending_transactions.iterkeys():
+            unavailable = self._pending_graph.unavailable_dependencies()
+            for dependencyID, txnids in unavailable.items():
+                deptxn = self.transaction_store.get(dependencyID)
+                if deptxn is None:
+                    logger.info('txnid: %s - missing, calling '
+                                'request_missing_txn', dependencyID[:8])
+                    self.request_missing_txn(dependencyID)
+                    self.JournalStats.MissingTxnDepCount.increment()
+                elif self._readd_pending_transaction(deptxn):
+                    continue
+                for txnid in list(txnids):
+                    txn = self.transaction_store[txnid]
+                    txn.increment_age()
+                    self.transaction_store[txnid] = txn
+                    logger.info('txnid: %s - not ready (age %s)',
+                                txnid[:8], txn.age)
+                    if txn.age > self.max_txn_age:
+                        logger.warn('txnid: %s - too old, dropping - %s',
+                                    txnid[:8], str(txn))
+                        deltxns.extend(self._pending_graph.discard(txnid))
+
+            # generate a list of valid transactions to place in the new
+            # block, the pending transaction graph only offers transactions
+            # whose dependencies are committed or already in the block;
+            # the candidate of the previous call is extended while the
+            # graph keeps it, so its transactions are not applied again;
+            # a candidate with more than maxcount transactions is built
+            # again in a fresh store, its transactions are offered again
+            prevblockid = self.most_recent_committed_block_id
+            candidate = self._candidate_store
+            if candidate is not None and candidate[0] == prevblockid and \
+                    self._pending_graph.selecting and \
+                    (not maxcount or len(candidate[1]) <= maxcount):
+                store = candidate[2]
+            else:
+                self._pending_graph.reset_selection()
+                store = self.global_store.clone_block()
+
+            def accept(txnid):
                 txn = self.transaction_store[txnid]
-                if txn:
-                    self._prepare_transaction(addtxns, deltxns, store, txn)
+                txnstore = store.get_transaction_store(
+                    txn.TransactionTypeName)
+                if txn.is_valid(txnstore):
+                    logger.debug('txnid: %s - is valid, adding to block',
+                                 txnid[:8])
+                    txn.apply(txnstore)
+                    return True
+
+                # because we have all of the dependencies but the
+                # transaction is still invalid we know that this
+                # transaction is broken and we can simply throw it away
+                logger.warn(
+                    'txnid: %s - is not valid for this block, dropping - %s',
+                    txnid[:8], str(txn))
+                logger.info(common.pretty_print_dict(txn.dump()))
+                return False
 
-                if maxcount and len(addtxns) >= maxcount:
-                    break
+            addtxns, invalid = self._pending_graph.select(accept, maxcount)
 
-            # as part of the process, we may identify transactions that
-            # are invalid so go ahead and get rid of them, since these
-            # had all dependencies met we know that they will never be valid
-            for txnid in deltxns:
-                self.JournalStats.InvalidTxnCount.increment()
-                if txnid in self.transaction_store:
-                    txn = self.transaction_store[txnid]
-                    if txn.InBlock is None:
-                        logger.debug("txnid: %s - deleting from transaction "
-                                     "store", txnid)
-                        del self.transaction_store[txnid]
-                if txnid in self.pending_transactions:
-                    logger.debug("txnid: %s - deleting from pending "
-                                 "transactions", txnid)
-                    del self.pending_transactions[txnid]
+            # transactions that depend on invalid transactions will never
+            # be valid either so go ahead and get rid of them as well
+            for txnid in invalid:
+                deltxns.extend(self._pending_graph.discard(txnid))
+
+            # keep the state in case this validator claims a block with
+            # these transactions, so that it is not built again when the
+            # block is committed
+            self._candidate_store = (prevblockid, list(addtxns), store)
+
+            self.JournalStats.InvalidTxnCount.increment(len(deltxns))
+            self._drop_pending_transactions(deltxns)
 
             return addtxns
 
-    def _prepare_transaction(self, addtxns, deltxns, store, txn):
-        """
-        Determine if a particular transaction is valid
+    def _readd_pending_transaction(self, txn):
+        """Makes a transaction of the transaction store that is neither
+        pending nor committed pending again, when it can be.
 
         Args:
-            addtxns (list of Transaction.Transaction) -- transaction to be
-                added to the current block
-            deltxns (list of Transaction.Transaction) -- invalid transactions
-            store (GlobalStore) -- current global store
-            txn -- the transaction to be tested
+            txn (Transaction.Transaction): The transaction.
+
         Returns:
-            True if the transaction is valid
+            bool: Whether the transaction is pending.
         """
+        if txn.Status == transaction.Status.failed or \
+                not txn.add_to_pending():
+            return False
+        # the transaction does not evict other pending transactions
+        if self.pending_transactions.make_room(txn.OriginatorID) != []:
+            return False
 
-        with self._txn_lock:
-            logger.debug('txnid: %s - add transaction %s',
-                         txn.Identifier[:8],
-                         str(txn))
-
-            # Because the dependencies may reorder transactions in the block
-            # in a way that is different from the arrival order, this
-            # transaction might already be in the block
-            if txn.Identifier in addtxns:
-                return True
-
-            # First step in adding the transaction to the list is to make
-            # sure that all dependent transactions are in the list already
-            ready = True
-            for dependencyID in txn.Dependencies:
-                logger.debug('txnid: %s - check dependency %s',
-                             txn.Identifier[:8], dependencyID[:8])
-
-                # check to see if the dependency has already been committed
-                if (dependencyID in self.transaction_store and
-                        (self.transaction_store[dependencyID].Status ==
-                         transaction.Status.committed)):
-                    continue
-
-                # check to see if the dependency is already in this block
-                if dependencyID in addtxns:
-                    continue
-
-                # check to see if the dependency is among the transactions to
-                # be deleted, if so then this transaction will never be valid
-                # and we can just get rid of it
-                if dependencyID in deltxns:
-                    logger.info('txnid: %s - depends on deleted '
-                                'transaction %s',
-                                txn.Identifier[:8], dependencyID[:8])
-                    deltxns.append(txn.Identifier)
-                    ready = False
-                    continue
+        logger.info('txnid: %s - dependency is not pending, adding it',
+                    txn.Identifier[:8])
+        txn.Status = transaction.Status.pending
+        self.transaction_store[txn.Identifier] = txn
+        self.pending_transactions.append(txn.Identifier, txn.OriginatorID,
+                                         txn.priority())
+        self._pending_graph.add(txn.Identifier, txn.Dependencies)
+        return True
 
-                # recurse into the dependency, note that we need to make sure
-                # there are no loops in the dependencies but not doing that
-                # right now
-                deptxn = self.transaction_store.get(dependencyID)
-                if deptxn and self._prepare_transaction(addtxns,
-                                                        deltxns,
-                                                        store,
-                                                        deptxn):
-                    continue
+    def _drop_pending_transactions(self, txnids):
+        """Removes transactions that will not be committed from the
+        pending transactions and, unless they are in a block, from the
+        transaction store.
 
-                # at this point we cannot find the dependency so send out a
-                # request for it and wait, we should set a timer on this
-                # transaction so we can just throw it away if the dependencies
-                # cannot be met
-                ready = False
-
-                logger.info('txnid: %s - missing %s, '
-                            'calling request_missing_txn',
-                            txn.Identifier[:8], dependencyID[:8])
-                self.request_missing_txn(dependencyID)
-                self.JournalStats.MissingTxnDepCount.increment()
-
-            # if all of the dependencies have not been met then there isn't any
-            # point in continuing on so bail out
-            if not ready:
-                txn.increment_age()
-                self.transaction_store[txn.Identifier] = txn
-                logger.info('txnid: %s - not ready (age %s)',
-                            txn.Identifier[:8], txn.age)
-                if txn.age > self.max_txn_age:
-                    logger.warn('txnid: %s - too old, dropping - %s',
-                                txn.Identifier[:8], str(txn))
-                    deltxns.append(txn.Identifier)
-                return False
-
-            # after all that work... we know the dependencies are met, so
-            # see if # the transaction is valid, that is that all of the
-            # preconditions encoded in the transaction itself are met
-            txnstore = store.get_transaction_store(txn.TransactionTypeName)
-            if txn.is_valid(txnstore):
-                logger.debug('txnid: %s - is valid, adding to block',
-                             txn.Identifier[:8])
-                addtxns.append(txn.Identifier)
-                txn.apply(txnstore)
-                return True
-
-            # because we have all of the dependencies but the transaction is
-            # still invalid we know that this transaction is broken and we
-            # can simply throw it away
-            logger.warn(
-                'txnid: %s - is not valid for this block, dropping - %s',
-                txn.Identifier[:8], str(txn))
-            logger.info(common.pretty_print_dict(txn.dump()))
-            deltxns.append(txn.Identifier)
-            return False
+        Args:
+            txnids (list): The identifiers of the transactions, already
+                discarded from the pending transaction graph.
+        """
+        for txnid in txnids:
+            if txnid in self.transaction_store:
+                txn = self.transaction_store[txnid]
+                if txn.InBlock is None:
+                    logger.debug("txnid: %s - deleting from transaction "
+                                 "store", txnid)
+                    del self.transaction_store[txnid]
+            if self.pending_transactions.discard(txnid):
+                logger.debug("txnid: %s - deleting from pending "
+                             "transactions", txnid)
 
     def _clean_transaction_blocks(self):
         """
@@ -1299,6 +1613,8 @@ class Journal(object):
         memory used to store the block and the corresponding transactions
         """
         with self._txn_lock:
+            # the writes of the block were made in a batch, so each store
+            # is flushed to disk once for the block
             self.chain_store.sync()
             self.transaction_store.sync()
             self.block_store.sync()
@@ -1313,14 +1629,13 @@ class Journal(object):
                     % self.maximum_blocks_to_keep == 0:
                 logger.info('compress global state for block number %s',
                             self.most_recent_committed_block.BlockNum)
-                depth = 0
-                blockid = self.most_recent_committed_block_id
-                while (blockid != common.NullIdentifier and
-                       depth < self.maximum_blocks_to_keep):
-                    blockid = self.block_store[blockid].PreviousBlockID
-                    depth += 1
-
-                if blockid != common.NullIdentifier:
+
+                # the block maximum_blocks_to_keep blocks behind the head
+                # is found in the committed chain index
+                height = len(self._committed_chain) - 1 - \
+                    self.maximum_blocks_to_keep
+                if height >= 0:
+                    blockid = self._committed_chain[height]
                     logger.debug('flatten storage for block %s', blockid)
                     self.global_store_map.flatten_block_store(blockid)
 
@@ -1332,10 +1647,14 @@ class Journal(object):
         self.JournalStats.add_metric(stats.Counter('CommittedTxnCount'))
         self.JournalStats.add_metric(stats.Counter('InvalidTxnCount'))
         self.JournalStats.add_metric(stats.Counter('MissingTxnRequestCount'))
+        self.JournalStats.add_metric(stats.Counter('MissingTxnBatchCount'))
         self.JournalStats.add_metric(stats.Counter('MissingTxnFromBlockCount'))
         self.JournalStats.add_metric(stats.Counter('MissingTxnDepCount'))
+        self.JournalStats.add_metric(stats.Counter('ReusedBlockStoreCount'))
         self.JournalStats.add_metric(stats.Sample(
             'PendingBlockCount', lambda: self.pending_block_count))
+        self.JournalStats.add_metric(stats.Sample(
+            'QueuedBlockCount', lambda: len(self.block_validator)))
         self.JournalStats.add_metric(stats.Sample(
             'PendingTxnCount',
             lambda: self.pending_txn_count))
@@ -1350,6 +1669,11 @@ class Journal(object):
         if stat_domains is not None:
             stat_domains['journal'] = self.JournalStats
             stat_domains['journalconfig'] = self.JournalConfigStats
+            stat_domains['cache'] = self.CacheStats
+            stat_domains['pool'] = self.pending_transactions.Stats
+            if self.transaction_executor is not None:
+                stat_domains['execution'] = \
+                    self.transaction_executor.Stats
 
     def _check_claim_block(self, now):
         with self._txn_lock:
@@ -1359,7 +1683,10 @@ class Journal(object):
                         now - self.transaction_enqueue_time
                 else:
                     transaction_time_waiting = 0
-                txn_list = self._prepare_transaction_list()
+                # only enough transactions to decide whether to build a
+                # block need to be prepared
+                txn_list = self._prepare_transaction_list(
+                    self.minimum_transactions_per_block + 1)
                 txn_count = len(txn_list)
                 build_block = (
                     txn_count > self.minimum_transactions_per_block or
@@ -1372,6 +1699,8 @@ class Journal(object):
                     # pending transactions, if it is less then all of them
                     # then set the TransactionEnqueueTime we can track these
                     # transactions wait time.
+                    if self.pending_block is not None:
+                        txn_count = len(self.pending_block.TransactionIDs)
                     remaining_transactions = \
                         len(self.pending_transactions) - txn_count
                     self.transaction_enqueue_time =\
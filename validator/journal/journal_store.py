@@ -14,6 +14,12 @@
 # ------------------------------------------------------------------------------
 
 
+from contextlib import contextmanager
+from threading import RLock
+
+_DELETED = object()
+
+
 class JournalStore(object):
     """JournalStore exposes dict-like behaviors on an underlying key-value
     database interface.
@@ -38,6 +44,14 @@ class JournalStore(object):
         """
         self._database = database
 
+        # writes made within batch() are held in _pending until the
+        # outermost batch completes, deleted keys map to _DELETED; the
+        # thread in a batch holds _lock until the batch completes so
+        # other threads neither see nor join the writes of the batch
+        self._lock = RLock()
+        self._pending = None
+        self._batchdepth = 0
+
     def __getitem__(self, key):
         return self.get(key)
 
@@ -45,13 +59,17 @@ class JournalStore(object):
         return self.set(key, value)
 
     def __delitem__(self, key):
-        self._database.delete(key)
+        self.delete(key)
 
     def __len__(self):
-        return len(self._database)
+        with self._lock:
+            return len(self._database)
 
     def __contains__(self, key):
-        return key in self._database
+        with self._lock:
+            if self._pending is not None and key in self._pending:
+                return self._pending[key] is not _DELETED
+            return key in self._database
 
     def get(self, key):
         """Retrieves a value associated with a key from the database
@@ -59,7 +77,11 @@ class JournalStore(object):
         Args:
             key (str): The key to retrieve
         """
-        return self._database.get(key)
+        with self._lock:
+            if self._pending is not None and key in self._pending:
+                value = self._pending[key]
+                return value if value is not _DELETED else None
+            return self._database.get(key)
 
     def set(self, key, value):
         """Sets a value associated with a key in the database
@@ -68,7 +90,11 @@ class JournalStore(object):
             key (str): The key to set.
             value (str): The value to associate with the key.
         """
-        self._database.set(key, value)
+        with self._lock:
+            if self._pending is not None:
+                self._pending[key] = value
+            else:
+                self._database.set(key, value)
 
     def delete(self, key):
         """Removes a key:value from the database
@@ -76,14 +102,81 @@ class JournalStore(object):
         Args:
             key (str): The key to remove.
         """
-        self._database.delete(key)
+        with self._lock:
+            if self._pending is None:
+                self._database.delete(key)
+            elif key in self._database:
+                self._pending[key] = _DELETED
+            else:
+                self._pending.pop(key, None)
+
+    def set_many(self, add_pairs):
+        """Sets a group of key:value pairs with a single database write
+
+        Args:
+            add_pairs (list): The (key, value) pairs to set.
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending.update(add_pairs)
+            else:
+                self._database.set_batch(list(add_pairs))
+
+    def delete_many(self, keys):
+        """Removes a group of keys with a single database write
+
+        Args:
+            keys (list): The keys to remove.
+        """
+        with self._lock:
+            if self._pending is not None:
+                for key in keys:
+                    self.delete(key)
+            else:
+                self._database.set_batch([], list(keys))
+
+    @contextmanager
+    def batch(self):
+        """Groups the writes made within the context into a single write
+        to the database when the outermost batch completes. The writes
+        are discarded if the context raises an exception.
+
+        Writes made within the batch are visible to reads through the
+        JournalStore before they reach the database. Other threads wait
+        for the batch to complete before they read or write.
+        """
+        with self._lock:
+            if self._batchdepth == 0:
+                self._pending = {}
+            self._batchdepth += 1
+            try:
+                yield self
+                if self._batchdepth == 1:
+                    self._flush()
+            finally:
+                self._batchdepth -= 1
+                if self._batchdepth == 0:
+                    self._pending = None
+
+    def _flush(self):
+        add_pairs = []
+        del_keys = []
+        for key, value in self._pending.iteritems():
+            if value is _DELETED:
+                del_keys.append(key)
+            else:
+                add_pairs.append((key, value))
+        if add_pairs or del_keys:
+            self._database.set_batch(add_pairs, del_keys)
 
     def sync(self):
         """Ensures that pending writes are flushed to disk
         """
-        self._database.sync()
+        with self._lock:
+            self._database.sync()
 
     def close(self):
         """Closes the connection to the database
         """
-        self._database.close()
+        with self._lock:
+            self._database.close()
@@ -81,12 +81,7 @@ def _blocklistrequesthandler(msg, journal):
     reply.InReplyTo = msg.Identifier
     reply.BlockListIndex = msg.BlockListIndex
 
-    blockids = journal.committed_block_ids()
-    blockids.reverse()
-
-    index = msg.BlockListIndex
-    if index < len(blockids):
-        reply.BlockIDs = blockids[index:index + 100]
+    reply.BlockIDs = journal.committed_block_ids_from(msg.BlockListIndex, 100)
 
     logger.debug('sending %d committed blocks to %s for request %s',
                  len(reply.BlockIDs), source, msg.Identifier[:8])
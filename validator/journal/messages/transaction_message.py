@@ -25,6 +25,10 @@ def register_message_handlers(journal):
                                                 transaction_message_handler)
     journal.dispatcher.register_message_handler(TransactionRequestMessage,
                                                 _txn_request_handler)
+    journal.dispatcher.register_message_handler(
+        TransactionBatchRequestMessage, _txn_batch_request_handler)
+    journal.dispatcher.register_message_handler(
+        TransactionBatchReplyMessage, _txn_batch_reply_handler)
 
 
 class TransactionMessage(message.Message):
@@ -106,3 +110,86 @@ def _txn_request_handler(msg, journal):
         journal.request_missing_txn(msg.TransactionID,
                                     exceptions=[msg.SenderID],
                                     request=msg)
+
+
+class TransactionBatchRequestMessage(message.Message):
+    """Requests a list of transactions from a single peer. The request is
+    only sent to peers that announced the Capability.
+
+    Attributes:
+        Capability (str): The capability peers announce when they handle
+            the request.
+        TransactionIDs (list): The identifiers of the transactions.
+    """
+    MessageType = \
+        "/journal.messages.TransactionMessage/TransactionBatchRequest"
+    Capability = 'TransactionBatchRequest'
+
+    def __init__(self, minfo=None):
+        if minfo is None:
+            minfo = {}
+        super(TransactionBatchRequestMessage, self).__init__(minfo)
+
+        self.IsSystemMessage = False
+        self.IsForward = False
+        self.IsReliable = True
+
+        self.TransactionIDs = minfo.get('TransactionIDs', [])
+
+    def dump(self):
+        result = super(TransactionBatchRequestMessage, self).dump()
+        result['TransactionIDs'] = self.TransactionIDs
+
+        return result
+
+
+def _txn_batch_request_handler(msg, journal):
+    # the transactions are sent to the requesting peer only, followed by
+    # the list of the ones this validator does not have so that they are
+    # requested elsewhere
+    with journal._txn_lock:
+        txns = []
+        missing = []
+        for txnid in msg.TransactionIDs:
+            txn = journal.transaction_store.get(txnid)
+            if txn:
+                txns.append(txn)
+            else:
+                missing.append(txnid)
+
+    for txn in txns:
+        journal.gossip.send_message(txn.build_message(), msg.SenderID)
+    if missing:
+        reply = TransactionBatchReplyMessage({'TransactionIDs': missing})
+        journal.gossip.send_message(reply, msg.SenderID)
+
+
+class TransactionBatchReplyMessage(message.Message):
+    """Lists the requested transactions a peer does not have.
+
+    Attributes:
+        TransactionIDs (list): The identifiers of the transactions.
+    """
+    MessageType = \
+        "/journal.messages.TransactionMessage/TransactionBatchReply"
+
+    def __init__(self, minfo=None):
+        if minfo is None:
+            minfo = {}
+        super(TransactionBatchReplyMessage, self).__init__(minfo)
+
+        self.IsSystemMessage = False
+        self.IsForward = False
+        self.IsReliable = True
+
+        self.TransactionIDs = minfo.get('TransactionIDs', [])
+
+    def dump(self):
+        result = super(TransactionBatchReplyMessage, self).dump()
+        result['TransactionIDs'] = self.TransactionIDs
+
+        return result
+
+
+def _txn_batch_reply_handler(msg, journal):
+    journal.transaction_fetcher.not_found(msg.SenderID, msg.TransactionIDs)
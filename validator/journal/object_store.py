@@ -14,9 +14,9 @@
 # ------------------------------------------------------------------------------
 
 import logging
-import copy
 
 from journal import global_store_manager
+from journal.persistent_map import PersistentMap
 
 
 LOGGER = logging.getLogger(__name__)
@@ -30,29 +30,135 @@ class UniqueConstraintError(Exception):
     pass
 
 
+_MISSING = object()
+
+
 class ObjectStore(global_store_manager.KeyValueStore):
+    """A KeyValueStore of typed objects with unique secondary indexes.
+
+    An index named '<object-type>:<attribute>' maps attribute values to
+    the key of the object holding them. Indexes are persistent maps that
+    are shared with the previous checkpoint, so cloning a store does not
+    copy them. Each checkpoint records its index changes in its dump so
+    that indexes are restored along with the store.
+
+    While tracking, index entries are read and written as keys of the
+    form (index, value).
+    """
+
     def __init__(self, prevstore=None, storeinfo=None, readonly=False,
                  indexes=None, clone_indexes=None):
         super(ObjectStore, self).__init__(
             prevstore, storeinfo, readonly)
 
+        # _indexchanges holds the index entries changed in this checkpoint,
+        # a value of None marks a removed entry; _fullindexes are indexes
+        # whose complete content must be included in the dump, and
+        # _latebuilt are indexes built after this store was committed
+        self._indexes = {}
+        self._indexchanges = {}
+        self._fullindexes = set()
+        self._latebuilt = set()
+
+        previndexes = {}
         if clone_indexes is not None:
-            self._indexes = copy.deepcopy(clone_indexes)
+            previndexes = clone_indexes
+        elif isinstance(prevstore, ObjectStore):
+            previndexes = prevstore._indexes
+
+        if storeinfo:
+            self._load_indexes(storeinfo.get('Indexes', {}), previndexes)
+        else:
+            self._indexes = dict(previndexes)
+            if isinstance(prevstore, ObjectStore):
+                self._fullindexes = \
+                    set(prevstore._latebuilt) & set(self._indexes)
+
+        if indexes is not None:
+            for key in indexes:
+                self._parse_and_check_index(key)
+                if key not in self._indexes:
+                    self._indexes[key] = PersistentMap.Empty
+                    self._fullindexes.add(key)
+
+    def _load_indexes(self, indexinfo, previndexes):
+        for index, info in indexinfo.iteritems():
+            if info['Full']:
+                base = PersistentMap.Empty
+            elif index in previndexes:
+                base = previndexes[index]
+            else:
+                # the index was not maintained by the previous checkpoint
+                # so the changes cannot be applied, it will be rebuilt
+                # on demand
+                continue
+            self._indexes[index] = base.update(
+                [(value, key) for value, key in info['Set']],
+                info['Deleted'])
+
+    def _add_index(self, index, indexmap):
+        self._indexes[index] = indexmap
+        self._indexchanges[index] = {}
+        if self.ReadOnly:
+            self._latebuilt.add(index)
         else:
-            self._indexes = {}
-            if indexes is not None:
-                for key in indexes:
-                    self._parse_and_check_index(key)
-                    self._indexes[key] = {}
+            self._fullindexes.add(index)
 
     def _build_index(self, index):
-        self._indexes[index] = {}
         object_type, attribute = self._parse_and_check_index(index)
-        for _, object_info in self.iteritems():
+
+        # derive the index from the previous checkpoint when possible,
+        # building it there first if that checkpoint is committed so
+        # that later checkpoints inherit it
+        prevstore = self.PrevStore
+        if isinstance(prevstore, ObjectStore) and \
+                (index in prevstore._indexes or prevstore.ReadOnly):
+            if index not in prevstore._indexes:
+                prevstore._build_index(index)
+            self._derive_index(index, prevstore._indexes[index])
+            return
+
+        entries = {}
+        for key, object_info in self.iteritems_readonly():
             if attribute in object_info and \
-                    object_info[attribute] not in self._indexes[index] \
+                    object_info[attribute] not in entries \
                     and object_type == object_info['object-type']:
-                self._indexes[index][object_info[attribute]] = object_info
+                entries[object_info[attribute]] = key
+        self._add_index(index, PersistentMap.Empty.update(
+            entries.iteritems()))
+
+    def _derive_index(self, index, indexmap):
+        """Applies the changes made in this checkpoint to the index of
+        the previous checkpoint.
+        """
+        object_type, attribute = self._parse_and_check_index(index)
+
+        def indexed_value(obj):
+            if obj is not None and attribute in obj and \
+                    obj['object-type'] == object_type:
+                return obj[attribute]
+            return _MISSING
+
+        changed = list(self._deletedkeys) + list(self._store)
+        for key in changed:
+            value = indexed_value(self._basemap.get(key))
+            if value is not _MISSING and indexmap.get(value) == key:
+                indexmap = indexmap.delete(value)
+        for key in self._store:
+            value = indexed_value(self._store[key])
+            if value is not _MISSING and value not in indexmap:
+                indexmap = indexmap.set(value, key)
+        self._add_index(index, indexmap)
+
+    def _set_index_entry(self, index, value, key):
+        self._note_write((index, value))
+        self._indexes[index] = self._indexes[index].set(value, key)
+        self._indexchanges.setdefault(index, {})[value] = key
+
+    def _delete_index_entry(self, index, value):
+        self._note_write((index, value))
+        self._indexes[index] = self._indexes[index].delete(value)
+        self._indexchanges.setdefault(index, {})[value] = None
 
     @staticmethod
     def _object_type_check(obj, object_type, key):
@@ -80,8 +186,51 @@ class ObjectStore(global_store_manager.KeyValueStore):
             ObjectStore: A new checkpoint that extends the current
                 store.
         """
-        return ObjectStore(self, storeinfo, readonly,
-                           clone_indexes=self._indexes)
+        return ObjectStore(self, storeinfo, readonly)
+
+    def flatten(self):
+        super(ObjectStore, self).flatten()
+        # the flattened store no longer has a previous checkpoint to
+        # apply index changes to
+        if self.PrevStore is None:
+            self._fullindexes = set(self._indexes)
+
+    def dump(self, readonly=False, full=False):
+        """Returns a dict containing information about the store.
+
+        Args:
+            readonly (bool): Whether or not the values may be shared
+                with the store rather than copied.
+            full (bool): Whether to dump the composition of all
+                previous stores rather than the changes made in this
+                checkpoint.
+
+        Returns:
+            dict: A dict containing information about the store.
+        """
+        result = super(ObjectStore, self).dump(readonly, full)
+
+        indexinfo = {}
+        for index, indexmap in self._indexes.iteritems():
+            if full or index in self._fullindexes or \
+                    index in self._latebuilt:
+                indexinfo[index] = {
+                    'Full': True,
+                    'Set': [[v, k] for v, k in indexmap.iteritems()],
+                    'Deleted': []
+                }
+            else:
+                changes = self._indexchanges.get(index, {})
+                indexinfo[index] = {
+                    'Full': False,
+                    'Set': [[v, k] for v, k in changes.iteritems()
+                            if k is not None],
+                    'Deleted': [v for v, k in changes.iteritems()
+                                if k is None]
+                }
+        result['Indexes'] = indexinfo
+
+        return result
 
     def lookup(self, index, key):
         """
@@ -100,10 +249,13 @@ class ObjectStore(global_store_manager.KeyValueStore):
 
         if index not in self._indexes:
             self._build_index(index)
-        obj = self._indexes[index].get(key)
+
+        self._note_read((index, key))
+        objectid = self._indexes[index].get(key)
+        obj = self._lookup(objectid) if objectid is not None else None
 
         ObjectStore._object_type_check(obj, object_type, key)
-        return obj
+        return self._copy_value(obj)
 
     def get(self, key, object_type=None):
         # pylint: disable=arguments-differ
@@ -124,9 +276,9 @@ class ObjectStore(global_store_manager.KeyValueStore):
         Returns:
             An iterator
         """
-        for key, object_info in self.iteritems():
+        for key, object_info in self.iteritems_readonly():
             if object_info['object-type'] == object_type:
-                yield key, object_info
+                yield key, self._copy_value(object_info)
 
     def get_all_by_object_type(self, object_type):
         """
@@ -148,61 +300,54 @@ class ObjectStore(global_store_manager.KeyValueStore):
     def set(self, key, value):
         ObjectStore._object_type_check(value, None, key)
         object_type = value['object-type']
-        old_object = None
-        try:
-            old_object = super(ObjectStore, self).get(key)
-        except KeyError:
-            pass
-
-        if old_object is None:
-            # error out early if any index would be violated
-            for att in value.keys():
-                index = object_type + ":" + att
-                if index in self._indexes and \
-                        value[att] in self._indexes[index]:
-                    raise UniqueConstraintError(
-                        "value for {} already used in "
-                        "unique index {}: {}".format(
-                            att, index, value[att]
-                        ))
-
-            super(ObjectStore, self).set(key, value)
-
-            for att in value.keys():
-                index = object_type + ":" + att
-                if index in self._indexes:
-                    self._indexes[index][value[att]] = value
-        else:
-            # on update make sure the new object isn't of a different type
+
+        # on update make sure the new object isn't of a different type
+        old_object = self._lookup(key)
+        if old_object is not None:
             ObjectStore._object_type_check(value,
                                            old_object['object-type'], key)
-            # error early if an indexed value is changed to another
-            # value's attribute
-            for att in old_object.iterkeys():
-                index = object_type + ":" + att
-                if index in self._indexes \
-                        and old_object[att] != value[att] \
-                        and value[att] in self._indexes[index] \
-                        and self._indexes[index][value[att]] != old_object:
-                    raise UniqueConstraintError("Value for {} already used "
-                                                "in unique index {}: {}".
-                                                format(att, index,
-                                                       value[att]))
-            for att in old_object.iterkeys():
-                index = object_type + ":" + att
-                if index in self._indexes:
-                    self._indexes[index][value[att]] = value
-
-            super(ObjectStore, self).set(key, value)
+
+        # error out early if any index would be violated
+        for att in value.iterkeys():
+            index = object_type + ":" + att
+            if index in self._indexes:
+                self._note_read((index, value[att]))
+            if index in self._indexes and \
+                    self._indexes[index].get(value[att], key) != key:
+                raise UniqueConstraintError(
+                    "value for {} already used in "
+                    "unique index {}: {}".format(
+                        att, index, value[att]
+                    ))
+
+        super(ObjectStore, self).set(key, value)
+
+        if old_object is not None:
+            self._unindex(key, old_object, value)
+        for att in value.iterkeys():
+            index = object_type + ":" + att
+            if index in self._indexes and \
+                    self._indexes[index].get(value[att]) != key:
+                self._set_index_entry(index, value[att], key)
 
     def delete(self, key, object_type=None):
         # pylint: disable=arguments-differ
-        obj = self.get(key, object_type=object_type)
+        obj = ObjectStore._object_type_check(self._lookup(key),
+                                             object_type, key)
         super(ObjectStore, self).delete(key)
-        for attribute in obj.keys():
-            if object_type is None:
-                index = obj['object-type'] + ":" + attribute
-            else:
-                index = object_type + ":" + attribute
-            if index in self._indexes:
-                del self._indexes[index][obj[attribute]]
+        self._unindex(key, obj)
+
+    def _unindex(self, key, old_object, new_object=None):
+        """Removes the index entries of old_object that are not kept by
+        new_object.
+        """
+        object_type = old_object['object-type']
+        for att, value in old_object.iteritems():
+            index = object_type + ":" + att
+            if index not in self._indexes:
+                continue
+            if new_object is not None and att in new_object \
+                    and new_object[att] == value:
+                continue
+            if self._indexes[index].get(value) == key:
+                self._delete_index_entry(index, value)
@@ -0,0 +1,366 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+"""
+This module defines the ParallelExecutor class which tests and applies
+the transactions of a block in a pool of worker processes.
+"""
+
+import cPickle as pickle
+import logging
+import multiprocessing
+import os
+import tempfile
+
+from gossip import stats
+from journal import transaction
+
+logger = logging.getLogger(__name__)
+
+# the snapshot of the transaction stores a worker process loaded, and the
+# sequence number of the block and the transaction stores of the previous
+# block derived from it, so that the state is built once for all of the
+# chunks of a block the worker executes
+_snapshot_epoch = None
+_snapshot_stores = None
+_state_sequence = None
+_state_stores = None
+
+
+def _initialize_worker():
+    """Prepares a worker process, the validator verifies the signatures
+    of the transactions before they are executed.
+    """
+    transaction.Transaction.VerifySignature = False
+
+
+def _execute_tracked(store, txn):
+    """Tests and applies a transaction, recording the keys it reads and
+    writes.
+
+    Returns:
+        tuple: Whether the transaction is valid, the keys read, None if
+            the complete store was read, and the keys written.
+    """
+    store.start_tracking()
+    try:
+        valid = txn.is_valid(store)
+        if valid:
+            txn.apply(store)
+    finally:
+        readkeys, writtenkeys = store.stop_tracking()
+    return valid, readkeys, writtenkeys
+
+
+def _load_state(epoch, snapshotfile, sequence, changes):
+    """Builds the transaction stores of the previous block in a worker
+    process from the snapshot and the changes made since.
+    """
+    global _snapshot_epoch, _snapshot_stores, _state_sequence, _state_stores
+
+    if _snapshot_epoch != epoch:
+        with open(snapshotfile, 'rb') as fp:
+            _snapshot_stores = pickle.load(fp)
+        _snapshot_epoch = epoch
+        _state_sequence = None
+
+    if _state_sequence != sequence:
+        _state_stores = {}
+        for tname, storechanges in changes.iteritems():
+            store = _snapshot_stores[tname].clone_store()
+            for key in storechanges['DeletedKeys']:
+                if key in store:
+                    store.delete(key)
+            for key, value in storechanges['Store'].iteritems():
+                store.set(key, value)
+            store.commit()
+            _state_stores[tname] = store
+        _state_sequence = sequence
+
+
+def _speculate(task):
+    """Executes transactions of the block against the state of the
+    previous block, this runs in the worker processes.
+
+    Args:
+        task (tuple): The epoch and the file of the snapshot of the
+            transaction stores, the sequence number of the block, the
+            changes made to the snapshot by the previous block and the
+            transactions to execute.
+
+    Returns:
+        list: For each transaction whether it is valid, None if it
+            failed, the keys read and written and the dump of its
+            changes to the store.
+    """
+    epoch, snapshotfile, sequence, changes, txns = task
+    _load_state(epoch, snapshotfile, sequence, changes)
+
+    results = []
+    for txn in txns:
+        store = _state_stores[txn.TransactionTypeName].clone_store()
+        try:
+            valid, readkeys, writtenkeys = _execute_tracked(store, txn)
+        except:
+            # the transaction is executed again by the validator, which
+            # reports the failure
+            results.append((None, None, None, None))
+            continue
+        results.append((valid, readkeys, writtenkeys,
+                        store.dump(readonly=True) if valid else None))
+    return results
+
+
+class _ReplayError(Exception):
+    pass
+
+
+class ParallelExecutor(object):
+    """Tests and applies the transactions of a block in parallel.
+
+    Each transaction is executed speculatively in a worker process
+    against the state of the previous block, recording the keys it reads
+    and writes. The results are then merged in block order: the changes
+    of a transaction are applied unless it read a key written by an
+    earlier transaction of the block, in which case it is executed again
+    against the merged state. The resulting state is the same as that of
+    executing the transactions one after the other.
+
+    The workers are forked once, when the executor is created, which
+    must happen before the validator starts its threads. The state is
+    sent to the workers as a snapshot, pickled to a file that each
+    worker loads once, and for each block only the changes made to the
+    snapshot by the previous block are sent with the transactions. A
+    new snapshot is taken when the previous block does not extend the
+    snapshot, such as on a fork or once the checkpoints were flattened,
+    or when the changes exceed MaximumChanges keys.
+
+    The signatures of the transactions are verified by the validator
+    before they are executed, and not again in the workers. A block
+    whose speculative execution fails or does not complete within
+    Timeout seconds is executed sequentially, and the workers are not
+    used again after a timeout.
+
+    Attributes:
+        MinimumTransactions (int): The number of transactions below
+            which a block is executed sequentially.
+        MaximumChanges (int): The number of keys changed since the
+            snapshot above which a new snapshot is taken.
+        Timeout (float): The number of seconds to wait for the
+            speculative execution of a block.
+        Stats (stats.Stats): The executor metrics, SpeculatedTxnCount
+            is the number of transactions whose speculative execution
+            was used and ConflictTxnCount the number executed again.
+    """
+
+    MinimumTransactions = 32
+    MaximumChanges = 4096
+    Timeout = 60.0
+
+    def __init__(self, processes, nodename='executor'):
+        """Constructor for the ParallelExecutor class.
+
+        Args:
+            processes (int): The number of worker processes.
+            nodename (str): The name of the node for the metrics.
+        """
+        self.processes = processes
+        self._pool = multiprocessing.Pool(
+            processes, _initialize_worker) if processes > 0 else None
+        self._sequence = 0
+
+        # the transaction stores of the snapshot the workers load from
+        # _snapshotfile, by transaction family
+        self._epoch = 0
+        self._snapshot = None
+        self._snapshotfile = None
+
+        self.Stats = stats.Stats(nodename, 'execution')
+        self.Stats.add_metric(stats.Counter('SpeculatedTxnCount'))
+        self.Stats.add_metric(stats.Counter('ConflictTxnCount'))
+        self.Stats.add_metric(stats.Counter('SequentialBlockCount'))
+
+    def is_parallel(self, txncount):
+        """Returns whether a block with txncount transactions is executed
+        in the worker processes.
+        """
+        return self._pool is not None and \
+            txncount >= self.MinimumTransactions
+
+    def close(self):
+        """Stops the worker processes.
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._discard_snapshot()
+
+    def execute(self, prevblock, txns):
+        """Tests and applies the transactions of a block.
+
+        Args:
+            prevblock (global_store_manager.BlockStore): The state of the
+                previous block.
+            txns (list): The transactions of the block, in block order.
+
+        Returns:
+            global_store_manager.BlockStore: The state after applying the
+                transactions, None if a transaction is not valid.
+        """
+        # the workers do not verify the signatures
+        if not all(txn.verify_signature() for txn in txns):
+            return None
+
+        results = self._speculate_all(prevblock, txns)
+        if results is not None:
+            blockstore = prevblock.clone_block()
+            try:
+                if self._merge(blockstore, txns, results):
+                    return blockstore
+                return None
+            except _ReplayError:
+                logger.info('unable to merge the speculative execution of '
+                            'the block, executing it sequentially')
+
+        self.Stats.SequentialBlockCount.increment()
+        blockstore = prevblock.clone_block()
+        for txn in txns:
+            txnstore = blockstore.get_transaction_store(
+                txn.TransactionTypeName)
+            if not txn.is_valid(txnstore):
+                return None
+            txn.apply(txnstore)
+        return blockstore
+
+    def _speculate_all(self, prevblock, txns):
+        pool = self._pool
+        if pool is None:
+            return None
+
+        # several chunks per worker keep the workers busy when the cost
+        # of the transactions varies
+        chunksize = max(1, len(txns) // (self.processes * 4))
+        self._sequence += 1
+        try:
+            families = set(txn.TransactionTypeName for txn in txns)
+            changes = self._changes(prevblock, families)
+            if changes is None:
+                self._take_snapshot(prevblock)
+                changes = self._changes(prevblock, families)
+
+            tasks = [(self._epoch, self._snapshotfile, self._sequence,
+                      changes, txns[i:i + chunksize])
+                     for i in xrange(0, len(txns), chunksize)]
+
+            results = []
+            for chunk in pool.map_async(_speculate, tasks).get(
+                    self.Timeout):
+                results.extend(chunk)
+            return results
+        except multiprocessing.TimeoutError:
+            logger.warn('speculative execution did not complete in %s '
+                        'seconds, executing blocks sequentially',
+                        self.Timeout)
+            self.close()
+            return None
+        except:
+            logger.exception('speculative execution failed')
+            return None
+
+    def _changes(self, prevblock, families):
+        """Returns the changes made to the snapshot by the previous block
+        for each transaction family, None if a new snapshot is needed.
+        """
+        if self._snapshot is None:
+            return None
+
+        changes = {}
+        count = 0
+        for tname in families:
+            if tname not in self._snapshot:
+                return None
+            storechanges = prevblock.get_transaction_store(
+                tname).changes_since(self._snapshot[tname])
+            if storechanges is None:
+                return None
+            count += len(storechanges['Store']) + \
+                len(storechanges['DeletedKeys'])
+            if count > self.MaximumChanges:
+                return None
+            changes[tname] = storechanges
+        return changes
+
+    def _take_snapshot(self, prevblock):
+        self._discard_snapshot()
+
+        snapshot = dict(prevblock.TransactionStores)
+        fd, snapshotfile = tempfile.mkstemp(prefix='executor-state-')
+        with os.fdopen(fd, 'wb') as fp:
+            pickle.dump(dict((tname, store.detach())
+                             for tname, store in snapshot.iteritems()),
+                        fp, pickle.HIGHEST_PROTOCOL)
+
+        self._epoch += 1
+        self._snapshot = snapshot
+        self._snapshotfile = snapshotfile
+
+    def _discard_snapshot(self):
+        if self._snapshotfile is not None:
+            try:
+                os.remove(self._snapshotfile)
+            except OSError:
+                logger.warn('unable to remove %s', self._snapshotfile)
+        self._snapshot = None
+        self._snapshotfile = None
+
+    def _merge(self, blockstore, txns, results):
+        # the keys written by the transactions merged so far, for each
+        # transaction family
+        written = {}
+        for txn, result in zip(txns, results):
+            valid, readkeys, writtenkeys, changes = result
+            txnstore = blockstore.get_transaction_store(
+                txn.TransactionTypeName)
+            familywritten = written.setdefault(txn.TransactionTypeName,
+                                               set())
+
+            if valid and (familywritten.isdisjoint(readkeys)
+                          if readkeys is not None else not familywritten):
+                self._replay(txnstore, changes)
+                self.Stats.SpeculatedTxnCount.increment()
+            else:
+                # the transaction conflicts with an earlier one, or was
+                # found invalid or failed against the previous state
+                self.Stats.ConflictTxnCount.increment()
+                valid, _, writtenkeys = _execute_tracked(txnstore, txn)
+                if not valid:
+                    return False
+
+            familywritten.update(writtenkeys)
+        return True
+
+    @staticmethod
+    def _replay(txnstore, changes):
+        try:
+            for key in changes['DeletedKeys']:
+                if key in txnstore:
+                    txnstore.delete(key)
+            for key, value in changes['Store'].iteritems():
+                txnstore.set(key, value)
+        except:
+            # the store may enforce constraints the speculative execution
+            # did not see, such as an index built since
+            logger.exception('unable to apply speculative changes')
+            raise _ReplayError()
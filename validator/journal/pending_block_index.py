@@ -0,0 +1,153 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import heapq
+
+
+class PendingBlockIndex(object):
+    """Indexes the pending blocks by what they are waiting for.
+
+    The index maps the identifier of a block to the pending blocks that
+    extend it, the identifier of a missing transaction to the pending
+    blocks that hold it, and keeps the blocks whose validation is retried
+    ordered by the time of their next retry, so that the journal finds
+    the blocks affected by an event without loading every pending block
+    from the block store.
+
+    It is not thread safe, the journal updates it while holding its
+    transaction lock.
+    """
+
+    def __init__(self):
+        # _parents maps each pending block to its previous block and
+        # _children the reverse; _missing holds the transactions each
+        # block is waiting for and _waiting the reverse; _retries is a
+        # heap of (due, blockid) where entries that do not match
+        # _retrydue are stale
+        self._parents = {}
+        self._children = {}
+        self._missing = {}
+        self._waiting = {}
+        self._retries = []
+        self._retrydue = {}
+
+    def __len__(self):
+        return len(self._parents)
+
+    def __contains__(self, blockid):
+        return blockid in self._parents
+
+    def add(self, blockid, previd):
+        """Adds a pending block.
+
+        Args:
+            blockid (str): The identifier of the block.
+            previd (str): The identifier of the previous block.
+        """
+        self.discard(blockid)
+        self._parents[blockid] = previd
+        self._children.setdefault(previd, set()).add(blockid)
+
+    def discard(self, blockid):
+        """Removes a block that is no longer pending.
+
+        Args:
+            blockid (str): The identifier of the block.
+        """
+        previd = self._parents.pop(blockid, None)
+        if previd is not None:
+            children = self._children[previd]
+            children.discard(blockid)
+            if not children:
+                del self._children[previd]
+
+        self._clear_missing(blockid)
+        self._retrydue.pop(blockid, None)
+
+    def children(self, previd):
+        """Returns the pending blocks that extend a block.
+
+        Args:
+            previd (str): The identifier of the previous block.
+
+        Returns:
+            list: The identifiers of the pending blocks.
+        """
+        return list(self._children.get(previd, ()))
+
+    def wait_for_transactions(self, blockid, txnids):
+        """Notes the transactions of a pending block that are missing.
+
+        Args:
+            blockid (str): The identifier of the block.
+            txnids (list): The identifiers of the missing transactions.
+        """
+        self._clear_missing(blockid)
+        self._missing[blockid] = set(txnids)
+        for txnid in txnids:
+            self._waiting.setdefault(txnid, set()).add(blockid)
+
+    def transaction_arrived(self, txnid):
+        """Notes that a transaction is no longer missing.
+
+        Args:
+            txnid (str): The identifier of the transaction.
+
+        Returns:
+            list: The identifiers of the pending blocks that are no
+                longer missing any transaction.
+        """
+        completed = []
+        for blockid in self._waiting.pop(txnid, ()):
+            missing = self._missing[blockid]
+            missing.discard(txnid)
+            if not missing:
+                del self._missing[blockid]
+                completed.append(blockid)
+        return completed
+
+    def _clear_missing(self, blockid):
+        for txnid in self._missing.pop(blockid, ()):
+            waiting = self._waiting[txnid]
+            waiting.discard(blockid)
+            if not waiting:
+                del self._waiting[txnid]
+
+    def schedule_retry(self, blockid, due):
+        """Schedules the validation of a pending block to be retried.
+
+        Args:
+            blockid (str): The identifier of the block.
+            due (float): The time of the retry.
+        """
+        self._retrydue[blockid] = due
+        heapq.heappush(self._retries, (due, blockid))
+
+    def pop_due_retries(self, now):
+        """Removes and returns the blocks whose retry is due.
+
+        Args:
+            now (float): The current time.
+
+        Returns:
+            list: The identifiers of the blocks, earliest due first.
+        """
+        due = []
+        while self._retries and self._retries[0][0] <= now:
+            duetime, blockid = heapq.heappop(self._retries)
+            if self._retrydue.get(blockid) == duetime:
+                del self._retrydue[blockid]
+                due.append(blockid)
+        return due
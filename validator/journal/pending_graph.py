@@ -0,0 +1,329 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import heapq
+
+
+class _Selection(object):
+    """The transactions selected for the block candidate being built,
+    kept across calls to PendingTransactionGraph.select so that a
+    candidate is extended rather than built again.
+    """
+
+    __slots__ = ('heap', 'selected', 'accepted', 'offered', 'remaining')
+
+    def __init__(self, heap):
+        self.heap = heap
+        self.selected = []
+        self.accepted = set()
+        self.offered = set()
+        self.remaining = {}
+
+
+class PendingTransactionGraph(object):
+    """The dependency graph of the pending transactions.
+
+    A pending transaction is blocked by each of its dependencies that is
+    not committed. Transactions that are not blocked are ready, and a
+    transaction blocked only by pending transactions becomes a candidate
+    for a block once all of those are selected for the block, so block
+    candidates are built from the ready transactions without visiting
+    any transaction that cannot be included.
+
+    The ready transactions are kept in a heap ordered by arrival, and
+    the block candidate is extended with the transactions that become
+    candidates until a transaction is committed or decommitted, or a
+    selected transaction is removed.
+
+    The graph is updated as transactions arrive, commit and decommit. It
+    is not thread safe, the journal updates it while holding its
+    transaction lock.
+    """
+
+    def __init__(self, is_committed):
+        """Constructor for the PendingTransactionGraph class.
+
+        Args:
+            is_committed (function): Returns whether the transaction
+                with the given identifier is committed.
+        """
+        self._is_committed = is_committed
+
+        # _sequence orders the pending transactions by arrival, prepended
+        # transactions get negative sequence numbers; _blocking holds the
+        # uncommitted dependencies of each pending transaction and
+        # _dependents the pending transactions that depend on a
+        # transaction, whether it is pending or committed; _unavailable
+        # holds the dependencies that are neither pending nor committed
+        self._sequence = {}
+        self._dependencies = {}
+        self._blocking = {}
+        self._dependents = {}
+        self._ready = set()
+        self._unavailable = {}
+        self._first = 0
+        self._next = 0
+
+        # _readyheap holds (sequence, identifier) for the ready
+        # transactions, entries of transactions that are no longer ready
+        # are skipped and dropped when the heap is rebuilt
+        self._readyheap = []
+        self._selection = None
+
+    def __len__(self):
+        return len(self._sequence)
+
+    def __contains__(self, txnid):
+        return txnid in self._sequence
+
+    @property
+    def ready_count(self):
+        """Returns the number of pending transactions whose dependencies
+        are all committed.
+        """
+        return len(self._ready)
+
+    @property
+    def selecting(self):
+        """Returns whether a block candidate is being built, that the
+        next select extends.
+        """
+        return self._selection is not None
+
+    def add(self, txnid, dependencies, prepend=False):
+        """Adds a pending transaction.
+
+        Args:
+            txnid (str): The identifier of the transaction.
+            dependencies (list): The identifiers of the transactions it
+                depends on.
+            prepend (bool): Whether the transaction is ordered before
+                all of the pending transactions rather than after them.
+        """
+        if txnid in self._sequence:
+            return
+
+        if prepend:
+            # the block candidate no longer follows the arrival order
+            self._selection = None
+            self._first -= 1
+            self._sequence[txnid] = self._first
+        else:
+            self._sequence[txnid] = self._next
+            self._next += 1
+
+        dependencies = frozenset(dependencies)
+        self._dependencies[txnid] = dependencies
+
+        blocking = set()
+        for depid in dependencies:
+            self._dependents.setdefault(depid, set()).add(txnid)
+            if depid in self._sequence or not self._is_committed(depid):
+                blocking.add(depid)
+                if depid not in self._sequence:
+                    self._unavailable.setdefault(depid, set()).add(txnid)
+        self._blocking[txnid] = blocking
+
+        # the transaction may have been unavailable, and transactions
+        # already pending may depend on it
+        self._unavailable.pop(txnid, None)
+        for dependent in self._dependents.get(txnid, ()):
+            if dependent in self._blocking and \
+                    txnid not in self._blocking[dependent]:
+                self._blocking[dependent].add(txnid)
+                self._ready.discard(dependent)
+                self._selection = None
+
+        if not blocking:
+            self._make_ready(txnid)
+        elif self._selection is not None:
+            # the transaction may only depend on selected transactions
+            remaining = len(blocking.difference(self._selection.accepted))
+            self._selection.remaining[txnid] = remaining
+            if not remaining:
+                heapq.heappush(self._selection.heap,
+                               (self._sequence[txnid], txnid))
+
+    def _make_ready(self, txnid):
+        self._ready.add(txnid)
+        entry = (self._sequence[txnid], txnid)
+        heapq.heappush(self._readyheap, entry)
+        if self._selection is not None:
+            heapq.heappush(self._selection.heap, entry)
+
+    def commit(self, txnid):
+        """Notes that a transaction was committed, removing it from the
+        pending transactions and unblocking those that depend on it.
+
+        Args:
+            txnid (str): The identifier of the transaction.
+        """
+        self._selection = None
+        self._remove(txnid)
+        self._unavailable.pop(txnid, None)
+        for dependent in self._dependents.get(txnid, ()):
+            blocking = self._blocking.get(dependent)
+            if blocking is not None:
+                blocking.discard(txnid)
+                if not blocking:
+                    self._make_ready(dependent)
+
+    def decommit(self, txnid):
+        """Notes that a committed transaction was decommitted, blocking
+        the pending transactions that depend on it.
+
+        Args:
+            txnid (str): The identifier of the transaction.
+        """
+        self._selection = None
+        for dependent in self._dependents.get(txnid, ()):
+            if dependent in self._blocking:
+                self._blocking[dependent].add(txnid)
+                self._ready.discard(dependent)
+                if txnid not in self._sequence:
+                    self._unavailable.setdefault(txnid, set()).add(
+                        dependent)
+
+    def discard(self, txnid):
+        """Removes a transaction that will never be valid along with the
+        pending transactions that depend on it, directly or not.
+
+        Args:
+            txnid (str): The identifier of the transaction.
+
+        Returns:
+            list: The identifiers of the removed pending transactions.
+        """
+        removed = []
+        stack = [txnid]
+        while stack:
+            txnid = stack.pop()
+            if txnid not in self._sequence:
+                continue
+            self._remove(txnid)
+            removed.append(txnid)
+            stack.extend(self._dependents.get(txnid, ()))
+        return removed
+
+    def _remove(self, txnid):
+        if self._sequence.pop(txnid, None) is None:
+            return
+
+        if self._selection is not None and \
+                txnid in self._selection.accepted:
+            self._selection = None
+
+        for depid in self._dependencies.pop(txnid):
+            dependents = self._dependents[depid]
+            dependents.discard(txnid)
+            if not dependents:
+                del self._dependents[depid]
+
+            waiting = self._unavailable.get(depid)
+            if waiting is not None:
+                waiting.discard(txnid)
+                if not waiting:
+                    del self._unavailable[depid]
+
+        del self._blocking[txnid]
+        self._ready.discard(txnid)
+
+    def unavailable_dependencies(self):
+        """Returns the dependencies that are neither pending nor
+        committed, whether or not they are in the transaction store.
+
+        Returns:
+            dict: A map from the identifier of each unavailable
+                transaction to the set of pending transactions waiting
+                for it.
+        """
+        for depid in [d for d in self._unavailable
+                      if self._is_committed(d)]:
+            self.commit(depid)
+        return self._unavailable
+
+    def reset_selection(self):
+        """Discards the block candidate, the next select builds a new
+        one from the ready transactions.
+        """
+        self._selection = None
+
+    def select(self, accept, maxcount=0):
+        """Selects the transactions of a block candidate.
+
+        Ready transactions are offered in arrival order, and each
+        transaction accepted makes the transactions blocked only by
+        accepted transactions candidates as well, so dependencies are
+        always selected before the transactions that depend on them.
+
+        The candidate of the previous call is extended, its transactions
+        are not offered again, unless it was reset since. A candidate
+        with more than maxcount transactions must be reset first, the
+        state its transactions were applied to no longer matches.
+
+        Args:
+            accept (function): Called with each candidate transaction
+                identifier, returns whether the transaction is added to
+                the block.
+            maxcount (int): The maximum number of transactions to
+                select, 0 for no limit.
+
+        Returns:
+            tuple: The list of selected transaction identifiers in block
+                order and the list of transaction identifiers rejected by
+                this call.
+        """
+        selection = self._selection
+        if selection is not None and maxcount and \
+                len(selection.selected) > maxcount:
+            raise ValueError('block candidate of {0} transactions exceeds '
+                             '{1}'.format(len(selection.selected), maxcount))
+        if selection is None:
+            if len(self._readyheap) > 2 * len(self._ready) + 16:
+                self._readyheap = [(self._sequence[t], t)
+                                   for t in self._ready]
+                heapq.heapify(self._readyheap)
+            selection = _Selection(list(self._readyheap))
+            self._selection = selection
+
+        heap = selection.heap
+        selected = selection.selected
+        accepted = selection.accepted
+        offered = selection.offered
+        remaining = selection.remaining
+        rejected = []
+        while heap and (not maxcount or len(selected) < maxcount):
+            seq, txnid = heapq.heappop(heap)
+            if txnid in offered or self._sequence.get(txnid) != seq or \
+                    not (txnid in self._ready or remaining.get(txnid) == 0):
+                continue
+            offered.add(txnid)
+            if not accept(txnid):
+                rejected.append(txnid)
+                continue
+
+            selected.append(txnid)
+            accepted.add(txnid)
+            for dependent in self._dependents.get(txnid, ()):
+                blocking = self._blocking.get(dependent)
+                if blocking is None or txnid not in blocking:
+                    continue
+                count = remaining.get(dependent, len(blocking)) - 1
+                remaining[dependent] = count
+                if count == 0:
+                    heapq.heappush(
+                        heap, (self._sequence[dependent], dependent))
+
+        return list(selected), rejected
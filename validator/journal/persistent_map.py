@@ -0,0 +1,294 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+"""
+A persistent (immutable) hash map based on a hash array mapped trie.
+
+Updates return a new map that shares every untouched node with the
+original, so keeping one version of the map per checkpoint costs memory
+proportional to the changes between checkpoints while lookups stay
+constant time regardless of how many versions have been derived.
+"""
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_BITS = 64
+_HASH_MASK = (1 << _HASH_BITS) - 1
+
+_MISSING = object()
+
+
+def _hash(key):
+    return hash(key) & _HASH_MASK
+
+
+def _popcount(value):
+    return bin(value).count('1')
+
+
+class _Node(object):
+    """An interior trie node. Entries are (key, value) leaf tuples,
+    child nodes or collision nodes, in slot order.
+    """
+
+    __slots__ = ('bitmap', 'entries', 'owner')
+
+    def __init__(self, bitmap, entries, owner):
+        self.bitmap = bitmap
+        self.entries = entries
+        self.owner = owner
+
+    def editable(self, owner):
+        if owner is not None and self.owner is owner:
+            return self
+        return _Node(self.bitmap, list(self.entries), owner)
+
+
+class _Collision(object):
+    """Holds the leaves of keys whose full hashes are identical.
+    """
+
+    __slots__ = ('entries', )
+
+    def __init__(self, entries):
+        self.entries = entries
+
+
+def _make_pair(shift, hash1, leaf1, hash2, leaf2, owner):
+    if shift >= _HASH_BITS:
+        return _Collision([leaf1, leaf2])
+
+    slot1 = (hash1 >> shift) & _MASK
+    slot2 = (hash2 >> shift) & _MASK
+    if slot1 == slot2:
+        child = _make_pair(shift + _BITS, hash1, leaf1, hash2, leaf2, owner)
+        return _Node(1 << slot1, [child], owner)
+    if slot1 < slot2:
+        return _Node((1 << slot1) | (1 << slot2), [leaf1, leaf2], owner)
+    return _Node((1 << slot1) | (1 << slot2), [leaf2, leaf1], owner)
+
+
+def _assoc(node, shift, keyhash, key, value, owner):
+    """Returns (node, added) where node has key bound to value.
+    """
+    bit = 1 << ((keyhash >> shift) & _MASK)
+    index = _popcount(node.bitmap & (bit - 1))
+
+    if not node.bitmap & bit:
+        node = node.editable(owner)
+        node.entries.insert(index, (key, value))
+        node.bitmap |= bit
+        return node, True
+
+    entry = node.entries[index]
+    entry_type = type(entry)
+    if entry_type is tuple:
+        if entry[0] == key:
+            if entry[1] is value:
+                return node, False
+            replacement = (key, value)
+            added = False
+        else:
+            replacement = _make_pair(shift + _BITS, _hash(entry[0]), entry,
+                                     keyhash, (key, value), owner)
+            added = True
+    elif entry_type is _Collision:
+        leaves = [leaf for leaf in entry.entries if leaf[0] != key]
+        added = len(leaves) == len(entry.entries)
+        leaves.append((key, value))
+        replacement = _Collision(leaves)
+    else:
+        replacement, added = _assoc(entry, shift + _BITS, keyhash, key,
+                                    value, owner)
+        if replacement is entry:
+            return node, added
+
+    node = node.editable(owner)
+    node.entries[index] = replacement
+    return node, added
+
+
+def _dissoc(node, shift, keyhash, key, owner):
+    """Returns (entry, removed) where entry is the node without key, a
+    single leaf if only one remains, or None if the node is now empty.
+    """
+    bit = 1 << ((keyhash >> shift) & _MASK)
+    if not node.bitmap & bit:
+        return node, False
+    index = _popcount(node.bitmap & (bit - 1))
+
+    entry = node.entries[index]
+    entry_type = type(entry)
+    if entry_type is tuple:
+        if entry[0] != key:
+            return node, False
+        replacement = None
+    elif entry_type is _Collision:
+        leaves = [leaf for leaf in entry.entries if leaf[0] != key]
+        if len(leaves) == len(entry.entries):
+            return node, False
+        replacement = leaves[0] if len(leaves) == 1 else _Collision(leaves)
+    else:
+        replacement, removed = _dissoc(entry, shift + _BITS, keyhash, key,
+                                       owner)
+        if not removed:
+            return node, False
+
+    if replacement is None:
+        if len(node.entries) == 1:
+            return None, True
+        if len(node.entries) == 2 and shift > 0:
+            remaining = node.entries[1 - index]
+            if isinstance(remaining, tuple):
+                return remaining, True
+        node = node.editable(owner)
+        del node.entries[index]
+        node.bitmap &= ~bit
+        return node, True
+
+    if len(node.entries) == 1 and shift > 0 and \
+            isinstance(replacement, tuple):
+        return replacement, True
+
+    node = node.editable(owner)
+    node.entries[index] = replacement
+    return node, True
+
+
+class PersistentMap(object):
+    """An immutable mapping with cheap derivation of modified copies.
+
+    Attributes:
+        Empty (PersistentMap): A shared empty map.
+    """
+
+    __slots__ = ('_root', '_count')
+
+    Empty = None
+
+    def __init__(self, root=None, count=0):
+        self._root = root if root is not None else _Node(0, [], None)
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __iter__(self):
+        return self.iterkeys()
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        """Returns the value bound to key, or default if there is none.
+        """
+        keyhash = _hash(key)
+        node = self._root
+        shift = 0
+        while True:
+            bit = 1 << ((keyhash >> shift) & _MASK)
+            if not node.bitmap & bit:
+                return default
+            entry = node.entries[_popcount(node.bitmap & (bit - 1))]
+            entry_type = type(entry)
+            if entry_type is tuple:
+                return entry[1] if entry[0] == key else default
+            if entry_type is _Collision:
+                for leaf in entry.entries:
+                    if leaf[0] == key:
+                        return leaf[1]
+                return default
+            node = entry
+            shift += _BITS
+
+    def set(self, key, value):
+        """Returns a new map with key bound to value.
+        """
+        root, added = _assoc(self._root, 0, _hash(key), key, value, None)
+        if root is self._root:
+            return self
+        return PersistentMap(root, self._count + (1 if added else 0))
+
+    def delete(self, key):
+        """Returns a new map without key; missing keys are ignored.
+        """
+        root, removed = _dissoc(self._root, 0, _hash(key), key, None)
+        if not removed:
+            return self
+        return PersistentMap(root, self._count - 1)
+
+    def update(self, items=None, deletes=None):
+        """Returns a new map with a batch of changes applied.
+
+        Nodes created while applying the batch are modified in place
+        rather than copied again for every key.
+
+        Args:
+            items (iterable): (key, value) pairs to bind.
+            deletes (iterable): Keys to remove.
+
+        Returns:
+            PersistentMap: The updated map.
+        """
+        owner = object()
+        root = self._root
+        count = self._count
+        for key in deletes or ():
+            newroot, removed = _dissoc(root, 0, _hash(key), key, owner)
+            if removed:
+                root = newroot if newroot is not None else _Node(0, [], owner)
+                count -= 1
+        for key, value in items or ():
+            root, added = _assoc(root, 0, _hash(key), key, value, owner)
+            if added:
+                count += 1
+        if root is self._root:
+            return self
+        return PersistentMap(root, count)
+
+    def iteritems(self):
+        """Iterates over the (key, value) pairs in the map.
+        """
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            for entry in node.entries:
+                entry_type = type(entry)
+                if entry_type is tuple:
+                    yield entry
+                elif entry_type is _Collision:
+                    for leaf in entry.entries:
+                        yield leaf
+                else:
+                    stack.append(entry)
+
+    def iterkeys(self):
+        for key, _ in self.iteritems():
+            yield key
+
+    def itervalues(self):
+        for _, value in self.iteritems():
+            yield value
+
+    def keys(self):
+        return list(self.iterkeys())
+
+
+PersistentMap.Empty = PersistentMap()
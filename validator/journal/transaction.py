@@ -82,10 +82,17 @@ class Transaction(signed_object.SignedObject):
         Transaction.Status (transaction.Status): The status of the transaction.
         Dependencies (list): A list of transactions that this transaction
             is dependent on.
+        Transaction.VerifySignature (bool): Whether check_valid verifies
+            the signature, the worker processes of the parallel executor
+            test transactions whose signature the validator verified.
     """
 
     TransactionTypeName = '/Transaction'
     MessageType = transaction_message.TransactionMessage
+    VerifySignature = True
+
+    RecordAttributes = signed_object.SignedObject.RecordAttributes + \
+        ('Status', 'InBlock', '_age')
 
     def __init__(self, minfo=None):
         """Constructor for the Transaction class.
@@ -145,7 +152,8 @@ class Transaction(signed_object.SignedObject):
         Args:
             store (dict): Transaction store mapping.
         """
-        if not super(Transaction, self).is_valid(store):
+        if self.VerifySignature and \
+                not super(Transaction, self).is_valid(store):
             raise InvalidTransactionError("invalid signature")
 
     def apply(self, store):
@@ -163,6 +171,18 @@ class Transaction(signed_object.SignedObject):
         """
         return True
 
+    def priority(self):
+        """Returns the priority of the transaction in the pending
+        transactions, a full pool with the 'priority' eviction policy
+        evicts the transactions with the lowest priority first.
+
+        Transaction families override this to rank their transactions.
+
+        Returns:
+            int: 0.
+        """
+        return 0
+
     def build_message(self):
         """Constructs a message containing the transaction.
 
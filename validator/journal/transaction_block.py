@@ -58,6 +58,9 @@ class TransactionBlock(signed_object.SignedObject):
     TransactionBlockTypeName = "/TransactionBlock"
     MessageType = transaction_block_message.TransactionBlockMessage
 
+    RecordAttributes = signed_object.SignedObject.RecordAttributes + \
+        ('Status', 'CommitTime', 'TransactionDepth')
+
     def __init__(self, minfo=None):
         """Constructor for the TransactionBlock class.
 
@@ -144,9 +147,8 @@ class TransactionBlock(signed_object.SignedObject):
         self.TransactionDepth = len(self.TransactionIDs)
 
         if self.PreviousBlockID != common.NullIdentifier:
-            assert self.PreviousBlockID in journal.block_store
-            self.TransactionDepth += journal.block_store[
-                self.PreviousBlockID].TransactionDepth
+            self.TransactionDepth += journal.fork_choice.weight(
+                self.PreviousBlockID, 'TransactionDepth')
 
     def build_message(self):
         """Constructs a message containing the transaction block.
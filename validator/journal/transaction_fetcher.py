@@ -0,0 +1,186 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import random
+from collections import OrderedDict
+from threading import Lock
+
+
+class TransactionFetcher(object):
+    """Requests missing transactions from a few peers in batches rather
+    than flooding a request for each transaction to every peer.
+
+    Missing transactions are queued once however many blocks wait for
+    them, and each flush assigns them to the peers with the fewest
+    outstanding requests. A transaction that a peer does not have, or
+    that does not arrive in time, is requested from another peer, and
+    broadcast once MaximumAttempts peers were asked.
+
+    Attributes:
+        BatchSize (int): The maximum number of transactions in a request.
+        MaximumInFlight (int): The maximum number of outstanding
+            transactions requested from a peer.
+        RequestTimeout (float): The number of seconds to wait for a
+            requested transaction before asking another peer.
+        Fanout (int): The number of peers asked for each transaction.
+        MaximumAttempts (int): The number of peers asked for a
+            transaction before it is broadcast.
+    """
+
+    BatchSize = 256
+    MaximumInFlight = 1024
+    RequestTimeout = 5.0
+    Fanout = 1
+    MaximumAttempts = 3
+
+    def __init__(self, send_request, broadcast_request):
+        """Constructor for the TransactionFetcher class.
+
+        Args:
+            send_request (function): Sends a request for a list of
+                transaction identifiers to the peer with an identifier.
+            broadcast_request (function): Requests a transaction
+                identifier from every peer.
+        """
+        self._send_request = send_request
+        self._broadcast_request = broadcast_request
+        self._lock = Lock()
+
+        # the transactions to request and the peers already asked
+        self._queued = OrderedDict()
+
+        # the requested transactions as [peers asked, peers still asked,
+        # deadline], and the number of transactions requested from a peer
+        self._outstanding = {}
+        self._inflight = {}
+
+    def __len__(self):
+        return len(self._queued) + len(self._outstanding)
+
+    def __contains__(self, txnid):
+        return txnid in self._queued or txnid in self._outstanding
+
+    def inflight(self, peerid):
+        """Returns the number of outstanding transactions requested from
+        a peer.
+        """
+        return self._inflight.get(peerid, 0)
+
+    def request(self, txnids):
+        """Queues missing transactions that are not already requested.
+
+        Args:
+            txnids (list): The identifiers of the transactions.
+        """
+        with self._lock:
+            for txnid in txnids:
+                if txnid not in self._queued and \
+                        txnid not in self._outstanding:
+                    self._queued[txnid] = set()
+
+    def arrived(self, txnid):
+        """Stops requesting a transaction once it arrives.
+
+        Args:
+            txnid (str): The identifier of the transaction.
+        """
+        with self._lock:
+            self._queued.pop(txnid, None)
+            entry = self._outstanding.pop(txnid, None)
+            if entry is not None:
+                for peerid in entry[1]:
+                    self._release(peerid)
+
+    def not_found(self, peerid, txnids):
+        """Requests transactions a peer does not have from other peers.
+
+        Args:
+            peerid (str): The identifier of the peer.
+            txnids (list): The identifiers of the transactions.
+        """
+        with self._lock:
+            for txnid in txnids:
+                entry = self._outstanding.get(txnid)
+                if entry is None or peerid not in entry[1]:
+                    continue
+                entry[1].discard(peerid)
+                self._release(peerid)
+                if not entry[1]:
+                    del self._outstanding[txnid]
+                    self._queued[txnid] = entry[0]
+
+    def _release(self, peerid):
+        count = self._inflight[peerid] - 1
+        if count:
+            self._inflight[peerid] = count
+        else:
+            del self._inflight[peerid]
+
+    def flush(self, now, peerids):
+        """Sends the requests for the queued transactions, and queues
+        again the requests that timed out.
+
+        Args:
+            now (float): The current time.
+            peerids (list): The identifiers of the peers that handle
+                batch requests.
+
+        Returns:
+            int: The number of requests sent to peers.
+        """
+        with self._lock:
+            for txnid, entry in self._outstanding.items():
+                if entry[2] <= now:
+                    del self._outstanding[txnid]
+                    for peerid in entry[1]:
+                        self._release(peerid)
+                    self._queued[txnid] = entry[0]
+
+            batches = {}
+            broadcast = []
+            for txnid, asked in self._queued.items():
+                untried = [p for p in peerids if p not in asked]
+                if not untried or len(asked) >= self.MaximumAttempts:
+                    del self._queued[txnid]
+                    broadcast.append(txnid)
+                    continue
+
+                # prefer the least loaded peers, spreading the
+                # transactions of a block across them
+                chosen = [p for p in untried
+                          if self.inflight(p) < self.MaximumInFlight]
+                if not chosen:
+                    continue
+                random.shuffle(chosen)
+                chosen.sort(key=self.inflight)
+                chosen = set(chosen[:self.Fanout])
+
+                del self._queued[txnid]
+                asked.update(chosen)
+                self._outstanding[txnid] = \
+                    [asked, chosen, now + self.RequestTimeout]
+                for peerid in chosen:
+                    self._inflight[peerid] = self.inflight(peerid) + 1
+                    batches.setdefault(peerid, []).append(txnid)
+
+        sent = 0
+        for peerid, txnids in batches.iteritems():
+            for start in xrange(0, len(txnids), self.BatchSize):
+                self._send_request(peerid,
+                                   txnids[start:start + self.BatchSize])
+                sent += 1
+        for txnid in broadcast:
+            self._broadcast_request(txnid)
+        return sent
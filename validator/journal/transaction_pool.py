@@ -0,0 +1,280 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import heapq
+import time
+
+from gossip import stats
+
+
+class _Link(object):
+    """An entry of the circular list of the transaction pool, and of the
+    circular list of the transactions that can be evicted in the order
+    they were appended.
+    """
+
+    __slots__ = ('prev', 'next', 'evictprev', 'evictnext', 'originator',
+                 'entered', 'txnid', 'exempt', 'priority', 'sequence')
+
+    def __init__(self, originator=None, entered=None, txnid=None,
+                 exempt=False, priority=0):
+        self.prev = self
+        self.next = self
+        self.evictprev = self
+        self.evictnext = self
+        self.originator = originator
+        self.entered = entered
+        self.txnid = txnid
+        self.exempt = exempt
+        self.priority = priority
+        self.sequence = None
+
+
+class TransactionPool(object):
+    """The ordered pool of pending transaction identifiers.
+
+    Transactions are added at either end of the pool and removed from
+    anywhere in constant time. The pool may be bounded in size, in which
+    case a transaction arriving while it is full either evicts the
+    oldest transactions appended to the pool, evicts the transactions
+    with the lowest priority, or is refused, and in the number of
+    transactions from a single originator. Transactions added at the
+    front of the pool, such as those of decommitted blocks, are not
+    evicted, nor do they slow down the eviction of the others.
+
+    Attributes:
+        MaximumSize (int): The number of transactions in a full pool, 0
+            for no limit.
+        MaximumPerOriginator (int): The number of transactions from a
+            single originator the pool admits, 0 for no limit.
+        EvictionPolicy (str): 'oldest' to evict the oldest transactions
+            of a full pool, 'priority' to evict the transactions with the
+            lowest priority and the oldest of those first, 'newest' to
+            refuse new transactions.
+        Stats (stats.Stats): The pool metrics, TxnTimeInPool is the
+            time in seconds transactions spend in the pool.
+    """
+
+    MaximumSize = 0
+    MaximumPerOriginator = 0
+    EvictionPolicy = 'oldest'
+
+    def __init__(self, nodename='pool'):
+        """Constructor for the TransactionPool class.
+
+        Args:
+            nodename (str): The name of the node for the metrics.
+        """
+        # _links maps each identifier to its entry in a circular list
+        # through _root, the transactions that can be evicted are also
+        # in a circular list through _root in the order they were
+        # appended and in a heap of (priority, sequence, identifier)
+        # whose entries are removed lazily
+        self._root = _Link()
+        self._links = {}
+        self._originators = {}
+        self._heap = []
+        self._sequence = 0
+
+        self.Stats = stats.Stats(nodename, 'pool')
+        self.Stats.add_metric(stats.Sample('PoolSize', lambda: len(self)))
+        self.Stats.add_metric(stats.Counter('EvictedTxnCount'))
+        self.Stats.add_metric(stats.Counter('RefusedTxnCount'))
+        self.Stats.add_metric(stats.Average('TxnTimeInPool'))
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, txnid):
+        return txnid in self._links
+
+    def __iter__(self):
+        link = self._root.next
+        while link is not self._root:
+            nextlink = link.next
+            yield link.txnid
+            link = nextlink
+
+    def iterkeys(self):
+        return iter(self)
+
+    def keys(self):
+        """Returns the list of transaction identifiers in pool order.
+        """
+        return list(self)
+
+    def get(self, txnid, default=None):
+        """Returns the time a transaction entered the pool, or default
+        when it is not in the pool.
+        """
+        link = self._links.get(txnid)
+        return link.entered if link is not None else default
+
+    def __copy__(self):
+        pool = TransactionPool.__new__(TransactionPool)
+        pool._root = _Link()
+        pool._links = {}
+        pool._originators = {}
+        pool._heap = []
+        pool._sequence = 0
+        pool.Stats = self.Stats
+        for txnid in self:
+            link = self._links[txnid]
+            pool._insert(_Link(link.originator, link.entered, txnid,
+                               link.exempt, link.priority),
+                         pool._root.prev)
+        return pool
+
+    def _insert(self, link, prevlink):
+        nextlink = prevlink.next
+        link.prev = prevlink
+        link.next = nextlink
+        prevlink.next = nextlink.prev = link
+        self._links[link.txnid] = link
+        self._originators[link.originator] = \
+            self._originators.get(link.originator, 0) + 1
+
+        if not link.exempt:
+            link.evictprev = self._root.evictprev
+            link.evictnext = self._root
+            self._root.evictprev.evictnext = link
+            self._root.evictprev = link
+
+            link.sequence = self._sequence
+            self._sequence += 1
+            heapq.heappush(self._heap,
+                           (link.priority, link.sequence, link.txnid))
+
+    def append(self, txnid, originator=None, priority=0):
+        """Adds a transaction at the back of the pool.
+
+        Args:
+            txnid (str): The identifier of the transaction.
+            originator (str): The identifier of its originator.
+            priority (int): The priority of the transaction, transactions
+                with a lower priority are evicted first by the 'priority'
+                EvictionPolicy.
+        """
+        if txnid not in self._links:
+            self._insert(_Link(originator, time.time(), txnid,
+                               priority=priority),
+                         self._root.prev)
+
+    def prepend(self, txnid, originator=None):
+        """Adds a transaction at the front of the pool, where it is not
+        evicted.
+
+        Args:
+            txnid (str): The identifier of the transaction.
+            originator (str): The identifier of its originator.
+        """
+        if txnid not in self._links:
+            self._insert(_Link(originator, time.time(), txnid, True),
+                         self._root)
+
+    def discard(self, txnid):
+        """Removes a transaction from the pool if it is there.
+
+        Args:
+            txnid (str): The identifier of the transaction.
+
+        Returns:
+            bool: Whether the transaction was in the pool.
+        """
+        link = self._links.pop(txnid, None)
+        if link is None:
+            return False
+
+        link.prev.next = link.next
+        link.next.prev = link.prev
+        if not link.exempt:
+            link.evictprev.evictnext = link.evictnext
+            link.evictnext.evictprev = link.evictprev
+            if len(self._heap) > 2 * len(self._links) + 16:
+                self._heap = [(other.priority, other.sequence, other.txnid)
+                              for other in self._links.itervalues()
+                              if not other.exempt]
+                heapq.heapify(self._heap)
+
+        count = self._originators[link.originator] - 1
+        if count:
+            self._originators[link.originator] = count
+        else:
+            del self._originators[link.originator]
+
+        self.Stats.TxnTimeInPool.add_value(time.time() - link.entered)
+        return True
+
+    def __delitem__(self, txnid):
+        if not self.discard(txnid):
+            raise KeyError(txnid)
+
+    def originator_count(self, originator):
+        """Returns the number of transactions in the pool from an
+        originator.
+        """
+        return self._originators.get(originator, 0)
+
+    def make_room(self, originator=None):
+        """Determines whether a new transaction is admitted to the pool
+        and which transactions it evicts.
+
+        Args:
+            originator (str): The identifier of the originator of the new
+                transaction.
+
+        Returns:
+            list: The identifiers of the transactions to remove before
+                adding the new one, or None if it is refused.
+        """
+        if self.MaximumPerOriginator and \
+                self.originator_count(originator) >= \
+                self.MaximumPerOriginator:
+            self.Stats.RefusedTxnCount.increment()
+            return None
+
+        excess = len(self) + 1 - self.MaximumSize
+        if not self.MaximumSize or excess <= 0:
+            return []
+
+        evicted = []
+        if self.EvictionPolicy == 'priority':
+            evicted = self._lowest_priority(excess)
+        elif self.EvictionPolicy != 'newest':
+            link = self._root.evictnext
+            while len(evicted) < excess and link is not self._root:
+                evicted.append(link.txnid)
+                link = link.evictnext
+
+        # the pool is full of transactions that are not evicted
+        if len(evicted) < excess:
+            self.Stats.RefusedTxnCount.increment()
+            return None
+
+        self.Stats.EvictedTxnCount.increment(len(evicted))
+        return evicted
+
+    def _lowest_priority(self, count):
+        # the entries taken are pushed back, the transactions are only
+        # removed from the heap once they are discarded from the pool
+        entries = []
+        while self._heap and len(entries) < count:
+            entry = heapq.heappop(self._heap)
+            link = self._links.get(entry[2])
+            if link is not None and link.sequence == entry[1]:
+                entries.append(entry)
+        for entry in entries:
+            heapq.heappush(self._heap, entry)
+        return [e[2] for e in entries]
@@ -0,0 +1,107 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+"""
+Micro-benchmarks for KeyValueStore get/set with and without copy-on-write,
+and for lookups through deep chains of checkpoints.
+
+Run from the validator directory:
+    python tests/benchmarks/bench_key_value_store.py
+"""
+
+import argparse
+import timeit
+
+from journal.global_store_manager import KeyValueStore
+
+
+def make_value(width):
+    return {'object-type': 'holding',
+            'creator': 'a' * 40,
+            'count': 100,
+            'description': 'benchmark holding',
+            'history': [{'seq': i, 'from': 'b' * 40, 'amount': i}
+                        for i in xrange(width)]}
+
+
+def bench(copy_on_write, width, iterations):
+    KeyValueStore.CopyOnWrite = copy_on_write
+    store = KeyValueStore()
+    store.set('key', make_value(width))
+    store.commit()
+    store = store.clone_store()
+
+    def get():
+        store.get('key')
+
+    def read_modify_write():
+        value = store.get('key')
+        value['count'] += 1
+        store.set('key', value)
+
+    get_time = timeit.timeit(get, number=iterations) / iterations
+    rmw_time = timeit.timeit(read_modify_write, number=iterations) \
+        / iterations
+    return get_time, rmw_time
+
+
+def bench_depth(depth, iterations):
+    KeyValueStore.CopyOnWrite = True
+    store = KeyValueStore()
+    store.set('oldest', 0)
+    for i in xrange(depth):
+        store.set('key{0}'.format(i), i)
+        store.commit()
+        store = store.clone_store()
+
+    def get_oldest():
+        store.get('oldest')
+
+    def contains_missing():
+        return 'missing' in store
+
+    hit_time = timeit.timeit(get_oldest, number=iterations) / iterations
+    miss_time = timeit.timeit(contains_missing, number=iterations) \
+        / iterations
+    return hit_time, miss_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=10000)
+    parser.add_argument('--widths', type=int, nargs='+',
+                        default=[0, 10, 100])
+    parser.add_argument('--depths', type=int, nargs='+',
+                        default=[1, 10, 50, 100, 200])
+    args = parser.parse_args()
+
+    print '{0:>6} {1:>12} {2:>12} {3:>12} {4:>12}'.format(
+        'width', 'get deep', 'get cow', 'rmw deep', 'rmw cow')
+    for width in args.widths:
+        deep_get, deep_rmw = bench(False, width, args.iterations)
+        cow_get, cow_rmw = bench(True, width, args.iterations)
+        print '{0:>6} {1:>10.2f}us {2:>10.2f}us {3:>10.2f}us {4:>10.2f}us' \
+            .format(width, deep_get * 1e6, cow_get * 1e6,
+                    deep_rmw * 1e6, cow_rmw * 1e6)
+
+    print
+    print '{0:>6} {1:>12} {2:>12}'.format('depth', 'get oldest', 'miss')
+    for depth in args.depths:
+        hit_time, miss_time = bench_depth(depth, args.iterations)
+        print '{0:>6} {1:>10.2f}us {2:>10.2f}us'.format(
+            depth, hit_time * 1e6, miss_time * 1e6)
+
+
+if __name__ == '__main__':
+    main()
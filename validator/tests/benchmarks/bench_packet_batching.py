@@ -0,0 +1,154 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+"""
+Benchmark of the number of messages per second sent to a peer over
+localhost UDP with one message per packet and with batch packets.
+
+Each reliable packet is acknowledged by the receiver, which decodes every
+message, and the sender keeps at most a window of unacknowledged packets.
+
+Run from the validator directory:
+    python tests/benchmarks/bench_packet_batching.py --messages 20000
+"""
+
+import argparse
+import socket
+import threading
+import time
+
+from gossip.gossip_core import Gossip
+from gossip.message import Message
+from gossip.message import Packet
+from gossip.message import unpack_message_data
+from gossip.node import Node
+
+
+class PaddedMessage(Message):
+    MessageType = "/bench.PaddedMessage"
+
+    def __init__(self, minfo=None):
+        if minfo is None:
+            minfo = {}
+        super(PaddedMessage, self).__init__(minfo)
+        self.Padding = minfo.get('Padding', '')
+
+    def dump(self):
+        result = super(PaddedMessage, self).dump()
+        result['Padding'] = self.Padding
+        return result
+
+
+def make_packets(msgs, src, dst, batching):
+    packets = []
+    if not batching:
+        for msg in msgs:
+            packet = Packet()
+            packet.add_message(msg, src, dst, len(packets))
+            packets.append(packet.pack())
+        return packets
+
+    batch = []
+    size = 0
+    for msg in msgs:
+        if batch and size + len(msg) + Packet.batch_overhead(
+                len(batch) + 1) > Gossip.MaximumPacketSize:
+            packet = Packet()
+            packet.add_messages(batch, src, dst, len(packets))
+            packets.append(packet.pack())
+            batch = []
+            size = 0
+        batch.append(msg)
+        size += len(msg)
+    if batch:
+        packet = Packet()
+        packet.add_messages(batch, src, dst, len(packets))
+        packets.append(packet.pack())
+    return packets
+
+
+def receive(sock, count, receiver):
+    received = 0
+    while received < count:
+        data, address = sock.recvfrom(65536)
+        packet = Packet()
+        packet.unpack(data)
+        if packet.IsBatch:
+            entries = packet.unpack_batch()
+        else:
+            entries = [(packet.TimeToLive, packet.Data)]
+        for (_, msgdata) in entries:
+            unpack_message_data(msgdata)
+        received += len(entries)
+        sock.sendto(packet.create_ack(receiver.Identifier).pack(), address)
+
+
+def run(msgs, src, dst, batching, window):
+    packets = make_packets(msgs, src, dst, batching)
+
+    rsock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rsock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    rsock.bind(('127.0.0.1', 0))
+    ssock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    ssock.bind(('127.0.0.1', 0))
+    receiver = threading.Thread(target=receive,
+                                args=(rsock, len(msgs), dst))
+    receiver.start()
+
+    start = time.time()
+    address = rsock.getsockname()
+    acks = 0
+    sent = 0
+    while acks < len(packets):
+        while sent < len(packets) and sent - acks < window:
+            ssock.sendto(packets[sent], address)
+            sent += 1
+        ssock.recvfrom(65536)
+        acks += 1
+    receiver.join()
+    elapsed = time.time() - start
+
+    rsock.close()
+    ssock.close()
+    return (len(packets), elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--size', type=int, default=256,
+                        help='bytes of padding in each message')
+    parser.add_argument('--window', type=int, default=64,
+                        help='maximum number of unacknowledged packets')
+    args = parser.parse_args()
+
+    src = Node(identifier='source', signingkey='source')
+    dst = Node(identifier='destination', signingkey='destination')
+    msgs = []
+    for i in xrange(args.messages):
+        msg = PaddedMessage({'__SIGNATURE__': 'msg{0}'.format(i),
+                             'Padding': 'x' * args.size})
+        msgs.append(msg)
+
+    print 'messages: {0}, message size: {1} bytes'.format(
+        args.messages, len(msgs[0]))
+    for batching in [False, True]:
+        (datagrams, elapsed) = run(msgs, src, dst, batching, args.window)
+        print '{0:>8}: {1:>9.0f} messages/s, {2} datagrams and ' \
+            'acks'.format('batch' if batching else 'single',
+                          args.messages / elapsed, datagrams)
+
+
+if __name__ == '__main__':
+    main()
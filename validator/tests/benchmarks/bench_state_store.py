@@ -0,0 +1,98 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+"""
+Benchmark of block commit and restore latency for the persistent state
+of the GlobalStoreManager on the dbm and lmdb backends.
+
+Run from the validator directory:
+    python tests/benchmarks/bench_state_store.py --blocks 10000
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from journal.database.lmdb_database import RawLMDBDatabase
+from journal.global_store_manager import GlobalStoreManager
+from journal.global_store_manager import KeyValueStore
+
+
+def open_manager(backend, filename, flag):
+    if backend == 'lmdb':
+        gsm = GlobalStoreManager(
+            database=RawLMDBDatabase(filename + '.lmdb', flag))
+    else:
+        gsm = GlobalStoreManager(filename + '.dbm', flag)
+    gsm.add_transaction_store('/Bench', KeyValueStore())
+    return gsm
+
+
+def bench(backend, blocks, updates, interval):
+    GlobalStoreManager.SnapshotInterval = interval
+    path = tempfile.mkdtemp()
+    filename = os.path.join(path, 'state')
+    try:
+        gsm = open_manager(backend, filename, 'n')
+        previd = GlobalStoreManager.RootBlockID
+        start = time.time()
+        for i in xrange(blocks):
+            blockstore = gsm.get_block_store(previd).clone_block()
+            store = blockstore.get_transaction_store('/Bench')
+            for j in xrange(updates):
+                store.set('key{0}'.format((i * updates + j) % 5000),
+                          {'block': i, 'update': j})
+            blockid = 'block{0:08d}'.format(i)
+            gsm.commit_block_store(blockid, blockstore)
+            gsm.flush_block_store(previd)
+            previd = blockid
+        commit_time = (time.time() - start) / blocks
+        gsm.close()
+
+        gsm = open_manager(backend, filename, 'c')
+        start = time.time()
+        gsm.get_block_store(previd)
+        restore_time = time.time() - start
+        gsm.close()
+    finally:
+        shutil.rmtree(path)
+        GlobalStoreManager.SnapshotInterval = 0
+
+    return commit_time, restore_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--blocks', type=int, default=10000)
+    parser.add_argument('--updates', type=int, default=20,
+                        help='keys updated in each block')
+    parser.add_argument('--backends', nargs='+', default=['dbm', 'lmdb'])
+    parser.add_argument('--intervals', type=int, nargs='+', default=[0, 100],
+                        help='snapshot intervals, 0 disables snapshots')
+    args = parser.parse_args()
+
+    print '{0:>8} {1:>9} {2:>14} {3:>12}'.format(
+        'backend', 'interval', 'commit/block', 'restore')
+    for interval in args.intervals:
+        for backend in args.backends:
+            commit_time, restore_time = bench(backend, args.blocks,
+                                              args.updates, interval)
+            print '{0:>8} {1:>9} {2:>12.2f}ms {3:>11.3f}s'.format(
+                backend, interval, commit_time * 1e3, restore_time)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+"""
+Benchmark of the latency between sending a message to a peer and the
+packet arriving at the peer over localhost UDP, with the queued messages
+sent on the heartbeat and with scheduled transmissions.
+
+Messages are sent one at a time from another thread than the reactor, as
+the message handlers do, and the peer acknowledges every packet.
+
+Run from the validator directory:
+    python tests/benchmarks/bench_transmit_latency.py --messages 200
+"""
+
+import argparse
+import os
+import socket
+import threading
+import time
+
+from twisted.internet import reactor
+
+from gossip.gossip_core import Gossip
+from gossip.message import Message
+from gossip.message import Packet
+from gossip.node import Node
+
+
+def run(count, scheduling, policy):
+    Node.DelayPolicy = policy
+    Gossip.TransmitScheduling = scheduling
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    peer = Node(identifier='peer', signingkey='peer',
+                address=sock.getsockname())
+    peer.is_peer = True
+    peer.TokenBucket.Tokens = peer.TokenBucket.Capacity
+
+    local = Node(identifier='local', signingkey='local',
+                 address=('127.0.0.1', 0))
+    result = []
+    ready = threading.Event()
+
+    def _create():
+        result.append(Gossip(local))
+        ready.set()
+
+    reactor.callFromThread(_create)
+    ready.wait()
+    core = result[0]
+    core.add_node(peer)
+
+    latencies = []
+    for i in xrange(count):
+        msg = Message({'__SIGNATURE__': 'msg{0}{1}'.format(scheduling, i)})
+        start = time.time()
+        core.send_message(msg, peer.Identifier, initialize=False)
+        data, address = sock.recvfrom(65536)
+        latencies.append(time.time() - start)
+
+        packet = Packet()
+        packet.unpack(data)
+        sock.sendto(packet.create_ack(peer.Identifier).pack(), address)
+
+    sock.close()
+    latencies.sort()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=200)
+    args = parser.parse_args()
+
+    thread = threading.Thread(target=reactor.run,
+                              kwargs={'installSignalHandlers': False})
+    thread.daemon = True
+    thread.start()
+
+    print 'messages: {0}'.format(args.messages)
+    for (name, scheduling) in [('heartbeat', False), ('scheduled', True)]:
+        latencies = run(args.messages, scheduling, 'none')
+        print '{0:>10}: median {1:>7.2f} ms, 99th {2:>7.2f} ms'.format(
+            name, latencies[len(latencies) // 2] * 1000,
+            latencies[len(latencies) * 99 // 100] * 1000)
+
+    # the dispatcher threads of the gossip instances do not stop
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import threading
+import unittest
+
+from journal.block_validation_worker import BlockValidationWorker
+
+
+class _Block(object):
+    def __init__(self, blockid):
+        self.Identifier = blockid
+
+
+class TestBlockValidationWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.validated = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.done = threading.Event()
+        self.worker = BlockValidationWorker(self._validate)
+
+    def tearDown(self):
+        self.release.set()
+        self.worker.stop(timeout=5.0)
+
+    def _validate(self, block):
+        self.started.set()
+        self.release.wait(5.0)
+        if block.Identifier == 'bad':
+            raise ValueError(block.Identifier)
+        self.validated.append(block.Identifier)
+        if block.Identifier == 'c':
+            self.done.set()
+
+    def test_blocks_are_validated_in_order(self):
+        for blockid in ['a', 'bad', 'b', 'a']:
+            self.worker.submit(_Block(blockid))
+        self.assertEqual(len(self.worker), 3)
+
+        self.worker.start()
+        self.assertTrue(self.worker.running)
+        self.release.set()
+        self.worker.submit(_Block('c'))
+        self.assertTrue(self.done.wait(5.0))
+        self.assertEqual(self.validated, ['a', 'b', 'c'])
+        self.assertEqual(len(self.worker), 0)
+
+        self.worker.stop(timeout=5.0)
+        self.assertFalse(self.worker.running)
+
+    def test_stop_discards_queued_blocks(self):
+        self.worker.start()
+        self.worker.submit(_Block('a'))
+        self.worker.submit(_Block('b'))
+        self.assertTrue(self.started.wait(5.0))
+        thread = self.worker._thread
+        self.worker.stop(timeout=0.1)
+        self.release.set()
+        thread.join(5.0)
+        self.assertEqual(self.validated, ['a'])
@@ -0,0 +1,120 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from gossip.expiry_wheel import BloomFilter
+from gossip.expiry_wheel import ExpiryWheel
+from gossip.expiry_wheel import HandledMessageCache
+
+
+class TestExpiryWheel(unittest.TestCase):
+
+    def test_expire(self):
+        wheel = ExpiryWheel(1.0)
+        wheel.add('a', 10.5)
+        wheel.add('b', 10.9)
+        wheel.add('c', 12.0)
+        self.assertEqual(len(wheel), 3)
+        self.assertIn('a', wheel)
+
+        # keys expire once their slot is over
+        self.assertEqual(wheel.expire(10.99), [])
+        self.assertEqual(sorted(wheel.expire(11.0)), ['a', 'b'])
+        self.assertNotIn('a', wheel)
+        self.assertEqual(len(wheel), 1)
+
+        # moved and discarded keys
+        wheel.add('c', 20.0)
+        wheel.add('d', 13.0)
+        wheel.discard('d')
+        wheel.discard('e')
+        self.assertEqual(wheel.expire(15.0), [])
+        self.assertEqual(wheel.expire(21.0), ['c'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_pop_oldest(self):
+        wheel = ExpiryWheel(0.5)
+        wheel.add('a', 3.2)
+        wheel.add('b', 1.1)
+        wheel.discard('b')
+        wheel.add('c', 2.0)
+        self.assertEqual(wheel.pop_oldest(), (2.5, ['c']))
+        self.assertEqual(wheel.pop_oldest(), (3.5, ['a']))
+        self.assertEqual(wheel.pop_oldest(), (None, []))
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_membership(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in xrange(1000):
+            bloom.add('msg{0}'.format(i))
+        for i in xrange(1000):
+            self.assertIn('msg{0}'.format(i), bloom)
+        self.assertIn(u'msg1', bloom)
+
+        falsepositives = sum(1 for i in xrange(10000)
+                             if 'other{0}'.format(i) in bloom)
+        self.assertLess(falsepositives, 300)
+        self.assertAlmostEqual(bloom.FalsePositiveRate, 0.01, delta=0.005)
+
+
+class TestHandledMessageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = HandledMessageCache()
+        self.cache.MaximumEntries = 10
+        self.cache.MaximumFilters = 2
+
+    def test_bounded(self):
+        for i in xrange(25):
+            self.cache.add('msg{0}'.format(i), 100.0 + i)
+        self.assertEqual(len(self.cache), 10)
+        self.assertEqual(self.cache.FilterCount, 15)
+        self.assertGreater(self.cache.FalsePositiveRate, 0.0)
+
+        # the oldest identifiers are found in the filters
+        for i in xrange(25):
+            self.assertTrue(self.cache.seen('msg{0}'.format(i)))
+        self.assertEqual(self.cache.FilterHits, 15)
+        self.assertFalse(self.cache.seen('other'))
+
+        # checking a message again does not count it again
+        for i in xrange(25):
+            self.assertIn('msg{0}'.format(i), self.cache)
+        self.assertEqual(self.cache.FilterHits, 15)
+
+        # filters are dropped beyond MaximumFilters
+        for i in xrange(25, 35):
+            self.cache.add('msg{0}'.format(i), 100.0 + i)
+        self.assertEqual(self.cache.FilterCount, 15)
+
+    def test_expire(self):
+        for i in xrange(15):
+            self.cache.add('msg{0}'.format(i), 100.0 + i)
+        self.assertEqual(self.cache.expire(103.0), 0)
+        self.assertEqual(self.cache.FilterCount, 5)
+        self.assertIn('msg0', self.cache)
+
+        # the filters are forgotten once their identifiers expired
+        self.assertEqual(self.cache.expire(108.0), 3)
+        self.assertEqual(len(self.cache), 7)
+        self.assertEqual(self.cache.FilterCount, 0)
+        self.assertNotIn('msg0', self.cache)
+        self.assertNotIn('msg5', self.cache)
+
+        self.assertEqual(self.cache.expire(120.0), 7)
+        self.assertEqual(len(self.cache), 0)
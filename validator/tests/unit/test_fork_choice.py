@@ -0,0 +1,84 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from gossip.common import NullIdentifier
+from journal.fork_choice import ForkChoice
+from journal.transaction_block import Status
+from journal.transaction_block import TransactionBlock
+
+
+class _Block(TransactionBlock):
+    def __init__(self, blockid, previd, depth, status=Status.valid):
+        super(_Block, self).__init__({'PreviousBlockID': previd})
+        self._identifier = blockid
+        self.TransactionDepth = depth
+        self.Status = status
+
+    @property
+    def Identifier(self):
+        return self._identifier
+
+
+class _CountingStore(dict):
+    def __init__(self, *args):
+        super(_CountingStore, self).__init__(*args)
+        self.loads = 0
+
+    def __getitem__(self, key):
+        self.loads += 1
+        return super(_CountingStore, self).__getitem__(key)
+
+
+class TestForkChoice(unittest.TestCase):
+
+    def setUp(self):
+        # a chain a <- b <- c with a fork b <- d <- e
+        self.blocks = _CountingStore()
+        for blockid, previd, depth in [('a', NullIdentifier, 1),
+                                       ('b', 'a', 2), ('c', 'b', 3),
+                                       ('d', 'b', 4), ('e', 'd', 5)]:
+            self.blocks[blockid] = _Block(blockid, previd, depth)
+        self.fork_choice = ForkChoice(self.blocks)
+
+    def test_find_fork(self):
+        committed = set(['a', 'b', 'c'])
+        self.assertEqual(
+            self.fork_choice.find_fork('e', committed.__contains__),
+            ('b', ['d', 'e']))
+        self.assertEqual(
+            self.fork_choice.find_fork('c', committed.__contains__),
+            ('c', []))
+        self.assertEqual(
+            self.fork_choice.find_fork('e', lambda blockid: False),
+            (NullIdentifier, ['a', 'b', 'd', 'e']))
+
+    def test_blocks_are_loaded_once(self):
+        self.fork_choice.add_block(self.blocks['e'])
+        self.blocks.loads = 0
+
+        self.assertEqual(self.fork_choice.weight('e', 'TransactionDepth'), 5)
+        self.assertEqual(self.fork_choice.weight('d', 'TransactionDepth'), 4)
+        self.fork_choice.find_fork('e', lambda blockid: blockid == 'a')
+        self.assertEqual(self.blocks.loads, 2)
+        self.assertEqual(len(self.fork_choice), 3)
+        self.assertRaises(KeyError, self.fork_choice.weight,
+                          'e', 'AggregateLocalMean')
+
+    def test_invalid_blocks_are_not_indexed(self):
+        self.blocks['f'] = _Block('f', 'e', 0, Status.complete)
+        self.assertEqual(self.fork_choice.previous_block_id('f'), 'e')
+        self.assertEqual(len(self.fork_choice), 0)
@@ -0,0 +1,125 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from gossip.fragmentation import OutgoingMessage
+from gossip.fragmentation import Reassembler
+from gossip.message import Message
+
+
+class TestOutgoingMessage(unittest.TestCase):
+
+    def test_fragments(self):
+        msg = Message({'__SIGNATURE__': "test"})
+        outgoing = OutgoingMessage(msg, 7, 10)
+        data = repr(msg)
+        self.assertEqual(len(outgoing), (len(data) + 9) // 10)
+        self.assertEqual(outgoing.Length, len(data))
+        self.assertEqual(
+            ''.join(outgoing.fragment(i) for i in xrange(len(outgoing))),
+            data)
+
+        self.assertEqual(outgoing.next_fragment(), 0)
+        self.assertEqual(outgoing.next_fragment(), 1)
+        self.assertEqual(outgoing.Unacknowledged, set([0, 1]))
+
+        # a dropped fragment is sent again first
+        outgoing.requeue(0)
+        outgoing.acknowledged(1)
+        self.assertEqual(outgoing.next_fragment(), 0)
+        self.assertEqual(outgoing.next_fragment(), 2)
+
+        for i in xrange(len(outgoing)):
+            outgoing.acknowledged(i)
+        self.assertTrue(outgoing.Complete)
+        self.assertEqual(outgoing.Unacknowledged, set())
+
+
+class TestReassembler(unittest.TestCase):
+
+    def setUp(self):
+        self.reassembler = Reassembler()
+
+    def test_reassembly(self):
+        key = ('peer', 1)
+        self.assertEqual(self.reassembler.add(key, 1, 3, 6, 'cd', 0.0),
+                         (True, None))
+        self.assertEqual(self.reassembler.add(key, 0, 3, 6, 'ab', 0.0),
+                         (True, None))
+        self.assertEqual(self.reassembler.Reserved, 6)
+        self.assertEqual(self.reassembler.add(key, 2, 3, 6, 'ef', 0.0),
+                         (True, 'abcdef'))
+        self.assertEqual(self.reassembler.Reserved, 0)
+        self.assertEqual(len(self.reassembler), 0)
+
+        # fragments sent again after the message completed are accepted
+        self.assertEqual(self.reassembler.add(key, 1, 3, 6, 'cd', 0.0),
+                         (True, None))
+        self.assertEqual(len(self.reassembler), 0)
+
+    def test_bounds(self):
+        self.reassembler.MaximumMemory = 10
+        self.reassembler.MaximumMessageSize = 8
+
+        self.assertEqual(self.reassembler.add(('p', 1), 0, 2, 9, 'x', 0.0),
+                         (False, None))
+        self.assertEqual(self.reassembler.add(('p', 2), 2, 2, 4, 'x', 0.0),
+                         (False, None))
+        self.assertEqual(self.reassembler.add(('p', 3), 0, 2, 6, 'abc', 0.0),
+                         (True, None))
+
+        # a new message is refused while the memory is reserved
+        self.assertEqual(self.reassembler.add(('p', 4), 0, 2, 6, 'abc', 0.0),
+                         (False, None))
+
+        # fragments that do not match the message are refused
+        self.assertEqual(self.reassembler.add(('p', 3), 1, 3, 6, 'def', 0.0),
+                         (False, None))
+        self.assertEqual(
+            self.reassembler.add(('p', 3), 1, 2, 6, 'defg', 0.0),
+            (False, None))
+        self.assertEqual(self.reassembler.Reserved, 0)
+
+    def test_sender_bounds(self):
+        self.reassembler.MaximumSenderMemory = 10
+
+        self.assertEqual(self.reassembler.add(('p', 1), 0, 2, 6, 'abc', 0.0),
+                         (True, None))
+
+        # a sender cannot reserve more than its share of the memory
+        self.assertEqual(self.reassembler.add(('p', 2), 0, 2, 6, 'abc', 0.0),
+                         (False, None))
+        self.assertEqual(self.reassembler.add(('q', 1), 0, 2, 6, 'abc', 0.0),
+                         (True, None))
+        self.assertEqual(self.reassembler.Reserved, 12)
+
+        # the share is released with the message
+        self.assertEqual(self.reassembler.add(('p', 1), 1, 2, 6, 'def', 0.0),
+                         (True, 'abcdef'))
+        self.assertEqual(self.reassembler.add(('p', 2), 0, 2, 6, 'abc', 0.0),
+                         (True, None))
+
+    def test_expire(self):
+        self.reassembler.Timeout = 10.0
+        self.reassembler.add(('p', 1), 0, 2, 4, 'ab', 0.0)
+        self.reassembler.add(('p', 2), 0, 2, 4, 'ab', 0.0)
+        self.reassembler.add(('p', 2), 1, 2, 4, 'cd', 5.0)
+
+        self.assertEqual(self.reassembler.expire(11.0), 1)
+        self.assertEqual(self.reassembler.Reserved, 0)
+        self.assertEqual(self.reassembler.add(('p', 1), 1, 2, 4, 'cd', 11.0),
+                         (True, None))
+        self.assertEqual(self.reassembler.Reserved, 4)
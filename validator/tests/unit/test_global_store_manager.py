@@ -0,0 +1,457 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+from gossip.common import cbor2dict, dict2cbor
+from journal.copy_on_write import FrozenDict
+from journal.database.lmdb_database import RawLMDBDatabase
+from journal.global_store_manager import GlobalStoreManager
+from journal.global_store_manager import KeyValueStore
+from journal.object_store import ObjectStore
+
+
+class TestKeyValueStoreCopyOnWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.value = {'object-type': 'game',
+                      'count': 3,
+                      'board': [['-', '-'], ['-', '-']],
+                      'players': {'p1': 'alice'}}
+
+    def test_set_isolates_caller(self):
+        store = KeyValueStore()
+        store.set('k', self.value)
+        self.value['board'][0][0] = 'X'
+        self.value['count'] = 4
+
+        self.assertEqual(store.get('k')['board'][0][0], '-')
+        self.assertEqual(store.get('k')['count'], 3)
+
+    def test_get_isolates_store(self):
+        store = KeyValueStore()
+        store.set('k', self.value)
+
+        game = store.get('k')
+        game['count'] += 1
+        game['board'][1][1] = 'O'
+        game['players']['p2'] = 'bob'
+        game['board'].append(['-', '-'])
+
+        self.assertEqual(store.get('k'), self.value)
+
+        store.set('k', game)
+        self.assertEqual(store.get('k')['board'][1][1], 'O')
+        self.assertEqual(len(store.get('k')['board']), 3)
+        self.assertEqual(store.get('k')['players']['p2'], 'bob')
+
+    def test_copy_of_value_is_modifiable(self):
+        store = KeyValueStore()
+        store.set('k', self.value)
+
+        game = store['k'].copy()
+        for row in game['board']:
+            row[0] = 'H'
+        store['k'] = game
+
+        self.assertEqual(store['k']['board'], [['H', '-'], ['H', '-']])
+
+    def test_unmodified_values_are_shared(self):
+        store = KeyValueStore()
+        store.set('k', self.value)
+        frozen = store._store['k']
+
+        game = store.get('k')
+        game['count'] = 10
+        store.set('k', game)
+
+        self.assertIsInstance(store._store['k'], FrozenDict)
+        self.assertIs(dict.__getitem__(store._store['k'], 'board'),
+                      dict.__getitem__(frozen, 'board'))
+
+    def test_concatenated_lists_are_modifiable(self):
+        store = KeyValueStore()
+        store.set('k', self.value)
+        board = store._store['k']['board']
+
+        for rows in (board + [['-', '-']], [['-', '-']] + board, board * 2,
+                     store.get('k')['board'] + [['-', '-']]):
+            for row in rows:
+                row[0] = 'X'
+            rows.append(['-', '-'])
+
+        self.assertEqual(store.get('k'), self.value)
+
+    def test_dict_copies_share_frozen_values(self):
+        store = KeyValueStore()
+        store.set('k', self.value)
+
+        # dict() and update() copy the outer dict without its methods,
+        # the nested values stay read only
+        for value in (store._store['k'], store.get('k')):
+            shallow = dict(value)
+            with self.assertRaises(TypeError):
+                shallow['board'].append(['-', '-'])
+            updated = {}
+            updated.update(value)
+            with self.assertRaises(TypeError):
+                updated['players']['p2'] = 'bob'
+
+            for game in (value.copy(), copy.deepcopy(value)):
+                game['board'].append(['-', '-'])
+                game['players']['p2'] = 'bob'
+
+        self.assertEqual(store.get('k'), self.value)
+
+    def test_frozen_values_are_read_only(self):
+        store = KeyValueStore()
+        store.set('k', self.value)
+
+        with self.assertRaises(TypeError):
+            store._store['k']['count'] = 5
+
+    def test_checkpoints_are_isolated(self):
+        store = KeyValueStore()
+        store.set('k', self.value)
+        store.commit()
+
+        child = store.clone_store()
+        game = child.get('k')
+        game['board'][0][1] = 'X'
+        child.set('k', game)
+
+        self.assertEqual(store.get('k')['board'][0][1], '-')
+        self.assertEqual(child.get('k')['board'][0][1], 'X')
+
+    def test_dump_round_trip(self):
+        store = KeyValueStore()
+        store.set('k', self.value)
+        store.commit()
+
+        storeinfo = cbor2dict(dict2cbor(store.dump(True)))
+        restored = KeyValueStore(storeinfo=storeinfo)
+
+        self.assertEqual(restored.get('k'), self.value)
+        self.assertIsInstance(restored._store['k'], FrozenDict)
+
+    def test_deep_copy_mode(self):
+        try:
+            KeyValueStore.CopyOnWrite = False
+            store = KeyValueStore()
+            store.set('k', self.value)
+            game = store.get('k')
+
+            self.assertIs(type(game), dict)
+            self.assertIs(type(game['board']), list)
+            game['board'][0][0] = 'X'
+            self.assertEqual(store.get('k')['board'][0][0], '-')
+        finally:
+            KeyValueStore.CopyOnWrite = True
+
+
+class TestKeyValueStoreLayers(unittest.TestCase):
+
+    def _build_chain(self, depth):
+        """Builds a chain of committed checkpoints, returning the chain
+        and the expected contents of each checkpoint.
+        """
+        store = KeyValueStore()
+        chain = []
+        expected = []
+        state = {}
+        for i in xrange(depth):
+            store.set('key{0}'.format(i), i)
+            store.set('shared', i)
+            if i % 3 == 0 and i > 0:
+                store.delete('key{0}'.format(i - 1))
+                state.pop('key{0}'.format(i - 1), None)
+            state['key{0}'.format(i)] = i
+            state['shared'] = i
+            store.commit()
+            chain.append(store)
+            expected.append(dict(state))
+            store = store.clone_store()
+        return chain, expected
+
+    def _check(self, store, expected, depth):
+        for i in xrange(depth + 1):
+            key = 'key{0}'.format(i)
+            self.assertEqual(key in store, key in expected)
+            self.assertEqual(store.has_key(key), key in expected)  # noqa
+            self.assertEqual(key in store.keys(), key in expected)
+            if key in expected:
+                self.assertEqual(store.get(key), expected[key])
+            else:
+                self.assertRaises(KeyError, store.get, key)
+
+    def test_lookup_at_depth(self):
+        depth = 120
+        chain, expected = self._build_chain(depth)
+        for store, state in zip(chain, expected):
+            self._check(store, state, depth)
+
+    def test_deleted_key_is_hidden(self):
+        store = KeyValueStore()
+        store.set('k', 1)
+        store.commit()
+        child = store.clone_store()
+        child.delete('k')
+
+        self.assertNotIn('k', child)
+        self.assertFalse(child.has_key('k'))  # noqa
+        self.assertNotIn('k', child.keys())
+        self.assertIn('k', store)
+
+        grandchild = child.clone_store()
+        self.assertNotIn('k', grandchild)
+        grandchild.set('k', 2)
+        self.assertEqual(grandchild.get('k'), 2)
+        self.assertEqual(store.get('k'), 1)
+
+    def test_forks_are_independent(self):
+        chain, expected = self._build_chain(10)
+        base = chain[5]
+        left = base.clone_store()
+        right = base.clone_store()
+        left.set('key1', 'left')
+        right.delete('key1')
+
+        self.assertEqual(left.get('key1'), 'left')
+        self.assertNotIn('key1', right)
+        self.assertEqual(base.get('key1'), expected[5]['key1'])
+
+    def test_flatten_preserves_lookups(self):
+        depth = 60
+        chain, expected = self._build_chain(depth)
+        chain[30].flatten()
+
+        self.assertIsNone(chain[30].PrevStore)
+        for index in (30, 45, depth - 1):
+            self._check(chain[index], expected[index], depth)
+
+    def test_changes_since(self):
+        depth = 20
+        chain, expected = self._build_chain(depth)
+        changes = chain[-1].changes_since(chain[10])
+
+        # applying the changes to the earlier checkpoint gives the later
+        store = chain[10].clone_store()
+        for key in changes['DeletedKeys']:
+            store.delete(key)
+        for key, value in changes['Store'].iteritems():
+            store.set(key, value)
+        self.assertEqual(store.compose(), expected[-1])
+
+        # only the keys changed since the earlier checkpoint are included
+        self.assertEqual(sorted(changes['Store']),
+                         ['key12', 'key13', 'key15', 'key16', 'key18',
+                          'key19', 'shared'])
+        self.assertEqual(sorted(changes['DeletedKeys']),
+                         ['key11', 'key14', 'key17'])
+
+        self.assertEqual(chain[10].changes_since(chain[10]),
+                         {'Store': {}, 'DeletedKeys': []})
+        self.assertIsNone(chain[10].changes_since(chain[-1]))
+
+        # the checkpoints in between are no longer linked once flattened
+        chain[15].flatten()
+        self.assertIsNone(chain[-1].changes_since(chain[10]))
+
+    def test_keys_and_items_at_depth(self):
+        depth = 100
+        chain, expected = self._build_chain(depth)
+        for store, state in zip(chain, expected)[::10]:
+            self.assertEqual(sorted(store.keys()), sorted(state.keys()))
+            self.assertEqual(len(store), len(state))
+            self.assertEqual(dict(store.iteritems()), state)
+            self.assertEqual(dict(store.iteritems_readonly()), state)
+            self.assertEqual(store.compose(), state)
+
+    def test_iteration_is_a_snapshot(self):
+        store = KeyValueStore()
+        for i in xrange(10):
+            store.set(str(i), i)
+
+        for key in store:
+            store.delete(key)
+            store.set(key + 'x', 0)
+
+        self.assertEqual(len(store), 10)
+        self.assertTrue(all(k.endswith('x') for k in store.keys()))
+
+    def test_key_set_follows_writes(self):
+        chain, expected = self._build_chain(10)
+        store = chain[-1].clone_store()
+        self.assertEqual(len(store), len(expected[-1]))
+
+        # writes update the resolved keys rather than resolving the
+        # changes of the checkpoint again on every read
+        store._basemap = None
+        store.set('new', 1)
+        store.delete('key1')
+        store.delete('missing')
+        state = dict(expected[-1], new=1)
+        del state['key1']
+        self.assertEqual(len(store), len(state))
+        self.assertEqual(sorted(store.keys()), sorted(state))
+        self.assertEqual(sorted(store), sorted(state))
+        self.assertEqual(store.compose(), state)
+
+    def test_empty_store_is_truthy(self):
+        store = KeyValueStore()
+        self.assertEqual(len(store), 0)
+        self.assertTrue(store)
+
+    def test_readonly_items_are_shared(self):
+        store = KeyValueStore()
+        store.set('k', {'a': [1, 2]})
+
+        for _, value in store.iteritems_readonly():
+            self.assertIs(value, store._store['k'])
+            self.assertRaises(TypeError, value.__setitem__, 'a', None)
+
+        for _, value in store.iteritems():
+            value['a'].append(3)
+        self.assertEqual(store.get('k'), {'a': [1, 2]})
+
+
+class TestGlobalStoreManagerSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'state.dbm')
+
+    def tearDown(self):
+        GlobalStoreManager.SnapshotInterval = 0
+        GlobalStoreManager.SnapshotsToKeep = 2
+        shutil.rmtree(self.path)
+
+    def _open(self, dbmode='c'):
+        gsm = GlobalStoreManager(self.filename, dbmode)
+        return self._add_stores(gsm)
+
+    def _add_stores(self, gsm):
+        gsm.add_transaction_store('/Values', KeyValueStore())
+        gsm.add_transaction_store('/Objects', ObjectStore())
+        return gsm
+
+    def _commit_chain(self, gsm, count, previd=None, prefix='block'):
+        """Commits a chain of blocks, returning the block ids and the
+        expected values of each block.
+        """
+        previd = previd or GlobalStoreManager.RootBlockID
+        state = dict(gsm.get_block_store(previd).get_transaction_store(
+            '/Values').compose())
+        blockids = []
+        expected = []
+        for i in xrange(count):
+            blockid = '{0}{1:03d}'.format(prefix, i)
+            blockstore = gsm.get_block_store(previd).clone_block()
+            values = blockstore.get_transaction_store('/Values')
+            values.set('count', i)
+            values.set('{0}{1}'.format(prefix, i), i)
+            state['count'] = i
+            state['{0}{1}'.format(prefix, i)] = i
+            if i % 4 == 3:
+                values.delete('{0}{1}'.format(prefix, i - 1))
+                del state['{0}{1}'.format(prefix, i - 1)]
+            objects = blockstore.get_transaction_store('/Objects')
+            objects.set('obj{0}'.format(i),
+                        {'object-type': 'thing', 'name': blockid})
+            objects.lookup('thing:name', blockid)
+
+            gsm.commit_block_store(blockid, blockstore)
+            blockids.append(blockid)
+            expected.append(dict(state))
+            previd = blockid
+        return blockids, expected
+
+    def _check_block(self, gsm, blockid, state):
+        blockstore = gsm.get_block_store(blockid)
+        values = blockstore.get_transaction_store('/Values')
+        self.assertEqual(values.compose(), state)
+        objects = blockstore.get_transaction_store('/Objects')
+        self.assertEqual(objects.lookup('thing:name', blockid)['name'],
+                         blockid)
+
+    def test_delta_only_by_default(self):
+        gsm = self._open('n')
+        self._commit_chain(gsm, 10)
+
+        keys = gsm._persistmap.keys()
+        self.assertEqual(len(keys), 11)
+        self.assertEqual(sorted(gsm.persistmap_keys()), sorted(keys))
+        gsm.close()
+
+    def test_restart_replays_from_snapshot(self):
+        GlobalStoreManager.SnapshotInterval = 5
+        GlobalStoreManager.SnapshotsToKeep = 0
+        gsm = self._open('n')
+        blockids, expected = self._commit_chain(gsm, 23)
+        gsm.close()
+
+        gsm = self._open()
+        self._check_block(gsm, blockids[-1], expected[-1])
+        # blocks 19 through 22 were replayed on top of snapshot 19
+        self.assertEqual(len(gsm._blockmap), 1 + 4)
+        self.assertEqual(gsm._deltadepth[blockids[-1]], 3)
+        # the block restored from the snapshot keeps its previous block
+        self.assertEqual(gsm.get_block_store(blockids[19]).PreviousBlockID,
+                         blockids[18])
+
+        for blockid, state in zip(blockids, expected):
+            self._check_block(gsm, blockid, state)
+        gsm.close()
+
+    def test_compaction_bounds_history(self):
+        GlobalStoreManager.SnapshotInterval = 5
+        GlobalStoreManager.SnapshotsToKeep = 2
+        gsm = self._open('n')
+        blockids, expected = self._commit_chain(gsm, 10)
+        forkids, _ = self._commit_chain(gsm, 3, blockids[6], 'fork')
+        blockids, expected = self._commit_chain(
+            gsm, 30, blockids[-1], 'more')
+
+        keys = gsm.persistmap_keys()
+        self.assertNotIn(forkids[-1], keys)
+        self.assertTrue(len(keys) <= 1 + 2 * 5)
+        gsm.close()
+
+        gsm = self._open()
+        for blockid in gsm.persistmap_keys():
+            gsm.get_block_store(blockid)
+        self._check_block(gsm, blockids[-1], expected[-1])
+
+        # compaction continues from the blocks persisted before the restart
+        # and keeps track of the blocks that remain
+        blockids, expected = self._commit_chain(
+            gsm, 12, blockids[-1], 'last')
+        keys = gsm.persistmap_keys()
+        self.assertTrue(len(keys) <= 1 + 2 * 5)
+        self.assertEqual(sorted(gsm._parents), sorted(
+            k for k in keys if k != GlobalStoreManager.RootBlockID))
+        self._check_block(gsm, blockids[-1], expected[-1])
+        gsm.close()
+
+
+class TestLMDBGlobalStoreManagerSnapshots(TestGlobalStoreManagerSnapshots):
+
+    def _open(self, dbmode='c'):
+        database = RawLMDBDatabase(self.filename, dbmode)
+        return self._add_stores(GlobalStoreManager(database=database))
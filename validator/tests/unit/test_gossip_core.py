@@ -16,9 +16,11 @@
 import unittest
 import time
 import pybitcointools
+from twisted.internet import reactor
 
 import gossip.signed_object as SigObj
 
+from gossip.fragmentation import OutgoingMessage
 from gossip.gossip_core import Gossip, GossipException
 from gossip.message import Packet, Message
 from gossip.node import Node
@@ -181,7 +183,7 @@ class TestGossipCoreDatagram(unittest.TestCase):
         self.assertEquals(pakStats["MessagesAcked"], 1)
         # Test handling of duplicate packets
         msg2 = shutdown_message.ShutdownMessage({'__SIGNATURE__': "test"})
-        core.MessageHandledMap[msg2.Identifier] = time.time()
+        core.MessageHandledMap.add(msg2.Identifier, time.time())
         pak.add_message(msg2, peer, peer2, 1)
         data2 = pak.pack()
         core.datagramReceived(data2, "localhost:9001")
@@ -359,6 +361,297 @@ class TestGossipCoreUtilityAndInterface(unittest.TestCase):
         core._timer_cleanup(now)
         self.assertEqual(core.PendingAckMap, {})
 
+    def test_gossip_timer_batches(self):
+        # Test that the messages for a peer that accepts batches are sent
+        # in one packet and acknowledged together
+        core = self._setup(8860)
+        node1 = self._create_node(8861)
+        node2 = self._create_node(8862)
+        core.add_node(node1)
+        core.add_node(node2)
+        node1.SupportsBatching = True
+
+        now = time.time()
+        for i in xrange(3):
+            node1.enqueue_message(
+                Message({'__SIGNATURE__': "test{0}".format(i)}), now)
+            node2.enqueue_message(
+                Message({'__SIGNATURE__': "test{0}".format(i)}), now)
+        time.sleep(1)
+        core._timer_transmit(time.time())
+        self.assertEquals(len(core.PendingAckMap), 4)
+        batches = [pak for pak in core.PendingAckMap.values()
+                   if pak.DestinationID == node1.Identifier]
+        self.assertEquals(len(batches), 1)
+        self.assertEquals(len(batches[0].Messages), 3)
+        self.assertEquals(node1.MessageQ.Count, 0)
+
+        ack = batches[0].create_ack(node1.Identifier)
+        core._handle_ack(ack)
+        self.assertEquals(len(core.PendingAckMap), 3)
+
+        # the messages of an acknowledged batch are not sent again while
+        # those of a dropped batch are queued again
+        core._timer_cleanup(time.time() + 100)
+        self.assertEquals(len(core.PendingAckMap), 0)
+        self.assertEquals(node1.MessageQ.Count, 0)
+        self.assertEquals(node2.MessageQ.Count, 3)
+
+        node2.SupportsBatching = True
+        core._timer_transmit(time.time() + 200)
+        self.assertEquals(len(core.PendingAckMap), 1)
+        core.NextCleanup = 0
+        core._timer_cleanup(time.time() + 400)
+        self.assertEquals(node2.MessageQ.Count, 3)
+
+    def test_gossip_datagram_received_batch(self):
+        # Test that each message of a batch is handled and the batch is
+        # acknowledged once
+        core = self._setup(8863)
+        peer = self._create_node(8864)
+        core.add_node(peer)
+        msgs = [self._create_msg(),
+                shutdown_message.ShutdownMessage({'__SIGNATURE__': "test"})]
+        pak = Packet()
+        pak.add_messages(msgs, peer, core.LocalNode, 0)
+        core.datagramReceived(pak.pack(), "localhost:9001")
+        msgType = core.MessageStats.get_stats(["MessageType"])
+        self.assertIn('/gossip.Message/MessageBase', msgType["MessageType"])
+        self.assertIn(shutdown_message.ShutdownMessage.MessageType,
+                      msgType["MessageType"])
+        pakStats = core.PacketStats.get_stats(["MessagesAcked"])
+        self.assertEquals(pakStats["MessagesAcked"], 1)
+
+    def test_gossip_timer_fragments(self):
+        # Test that a message larger than a packet is sent in a window of
+        # fragments to a peer that accepts them
+        core = self._setup(8865)
+        node1 = self._create_node(8866)
+        core.add_node(node1)
+        node1.SupportsFragmentation = True
+        node1.TokenBucket.Tokens = 10 ** 9
+        written = []
+        core._do_write = lambda data, peer: written.append(data)
+        core.MaximumPacketSize = 1000
+        core.FragmentWindow = 4
+
+        msg = Message({'__SIGNATURE__': "x" * 10000})
+        node1.enqueue_message(msg, time.time())
+        time.sleep(1)
+        core._timer_transmit(time.time())
+        self.assertEquals(len(written), 4)
+        self.assertEquals(len(core.PendingAckMap), 4)
+        outgoing = core.OutgoingFragments[node1.Identifier][0]
+        self.assertEquals(outgoing.Message, msg)
+        self.assertTrue(len(outgoing) > 10)
+
+        # acknowledged fragments make room in the window
+        packets = sorted(core.PendingAckMap.values(),
+                         key=lambda p: p.SequenceNumber)
+        core._handle_ack(packets[0].create_ack(node1.Identifier))
+        core._timer_transmit(time.time())
+        self.assertEquals(len(written), 5)
+        self.assertEquals(len(core.PendingAckMap), 4)
+
+        # dropped fragments are sent again
+        core._timer_cleanup(time.time() + 100)
+        self.assertEquals(len(core.PendingAckMap), 0)
+        core._timer_transmit(time.time())
+        self.assertEquals(
+            sorted(p.Fragment[1] for p in core.PendingAckMap.values()),
+            [1, 2, 3, 4])
+
+        while core.PendingAckMap:
+            for packet in core.PendingAckMap.values():
+                core._handle_ack(packet.create_ack(node1.Identifier))
+            core._timer_transmit(time.time())
+        self.assertTrue(outgoing.Complete)
+        self.assertEquals(core.OutgoingFragments, {})
+
+        # peers that do not accept fragments are not sent the message
+        node1.SupportsFragmentation = False
+        node1.enqueue_message(msg, time.time())
+        time.sleep(1)
+        core._timer_transmit(time.time())
+        self.assertEquals(core.OutgoingFragments, {})
+        self.assertEquals(node1.MessageQ.Count, 0)
+
+    def test_gossip_datagram_received_fragments(self):
+        # Test that fragments are acknowledged and the message is handled
+        # once every fragment is received
+        core = self._setup(8867)
+        peer = self._create_node(8868)
+        core.add_node(peer)
+        acked = []
+        core._send_ack = lambda packet, peer: acked.append(packet)
+
+        msg = Message({'__SIGNATURE__': "x" * 10000})
+        outgoing = OutgoingMessage(msg, 1, 1000)
+        packets = []
+        for index in xrange(len(outgoing)):
+            packet = Packet()
+            packet.add_fragment(outgoing, index, peer, core.LocalNode,
+                                index)
+            packets.append(packet.pack())
+
+        # fragments are refused while the reassembly memory is full
+        core.Reassembler.MaximumMemory = outgoing.Length - 1
+        core.datagramReceived(packets[0], "localhost:9001")
+        self.assertEquals(acked, [])
+        core.Reassembler.MaximumMemory = outgoing.Length
+
+        for data in reversed(packets):
+            core.datagramReceived(data, "localhost:9001")
+        self.assertEquals(len(acked), len(packets))
+        pakStats = core.PacketStats.get_stats(
+            ["MessagesReassembled", "FragmentsRefused"])
+        self.assertEquals(pakStats["MessagesReassembled"], 1)
+        self.assertEquals(pakStats["FragmentsRefused"], 1)
+        msgType = core.MessageStats.get_stats(["MessageType"])
+        self.assertEquals(
+            msgType["MessageType"]['/gossip.Message/MessageBase'], 1)
+
+    def test_gossip_timer_cleanup_expiration(self):
+        # Test that cleanup only drops the packets past their round trip
+        # estimate and forgets the handled messages that expired
+        core = self._setup(8873)
+        node1 = self._create_node(8874)
+        core.add_node(node1)
+        node1.TokenBucket.Tokens = node1.TokenBucket.Capacity
+        node1.enqueue_message(self._create_msg(), 0)
+        now = time.time()
+        core._timer_transmit(now)
+        self.assertEquals(len(core.PendingAckMap), 1)
+        packet = core.PendingAckMap.values()[0]
+
+        core.NextCleanup = 0
+        core._timer_cleanup(now)
+        self.assertEquals(len(core.PendingAckMap), 1)
+        core.NextCleanup = 0
+        core._timer_cleanup(now + packet.RoundTripEstimate + 1)
+        self.assertEquals(core.PendingAckMap, {})
+        pakStats = core.PacketStats.get_stats(["DroppedPackets"])
+        self.assertEquals(pakStats["DroppedPackets"], 1)
+
+        core.MessageHandledMap.add("msg", now + 5)
+        pakStats = core.PacketStats.get_stats(["HandledMessageCount"])
+        self.assertEquals(pakStats["HandledMessageCount"], 1)
+        core.NextCleanup = 0
+        core._timer_cleanup(now + 10)
+        self.assertNotIn("msg", core.MessageHandledMap)
+
+    def test_gossip_scheduled_transmit(self):
+        # Test that queued messages schedule their transmission and the
+        # transmission returns the time the next message is due
+        core = self._setup(8871)
+        node1 = self._create_node(8872)
+        core.add_node(node1)
+        node1.TokenBucket.Tokens = node1.TokenBucket.Capacity
+        scheduled = []
+        core.TransmitScheduler.schedule = scheduled.append
+
+        msg = Message({'__SIGNATURE__': "test"})
+        now = time.time()
+        core.send_message(msg, node1.Identifier)
+        self.assertEquals(len(scheduled), 1)
+        self.assertGreaterEqual(scheduled[0], now)
+        self.assertEquals(core._scheduled_transmit(scheduled[0] - 0.01),
+                          scheduled[0])
+        self.assertIsNone(core._scheduled_transmit(scheduled[0]))
+        self.assertEquals(node1.MessageQ.Count, 0)
+
+        # a paused stream waits for the stream to resume
+        node1.Stream = type('Stream', (object, ), {'Paused': True})()
+        core.send_message(Message({'__SIGNATURE__': "test1"}),
+                          node1.Identifier)
+        self.assertIsNone(core._scheduled_transmit(time.time() + 1))
+        self.assertEquals(node1.MessageQ.Count, 1)
+
+        # nothing is scheduled when the heartbeat sends messages
+        core.TransmitScheduling = False
+        core.schedule_transmit()
+        self.assertEquals(len(scheduled), 2)
+
+    def test_gossip_heartbeat_transmit(self):
+        # Test that the heartbeat sends the queued messages once
+        # transmissions are no longer scheduled
+        core = self._setup(8875)
+        node1 = self._create_node(8876)
+        core.add_node(node1)
+        node1.TokenBucket.Tokens = node1.TokenBucket.Capacity
+        core.TransmitScheduler.schedule = lambda when: None
+        written = []
+        core._do_write = lambda data, peer: written.append(data)
+
+        core.send_message(Message({'__SIGNATURE__': "test"}),
+                          node1.Identifier)
+        core.dispatcher.on_heartbeat.fire(time.time() + 1)
+        self.assertEquals(written, [])
+
+        core.TransmitScheduling = False
+        core.dispatcher.on_heartbeat.fire(time.time() + 1)
+        self.assertEquals(len(written), 1)
+        self.assertEquals(node1.MessageQ.Count, 0)
+
+    def test_gossip_timer_stream(self):
+        # Test that the messages for a peer with a stream connection are
+        # written to it without acknowledgements until it pauses
+        class _Stream(object):
+            Paused = False
+
+            def __init__(self):
+                self.sent = []
+
+            def send_message(self, msg):
+                self.sent.append(msg)
+                self.Paused = len(self.sent) == 2
+
+        core = self._setup(8869)
+        node1 = self._create_node(8870)
+        core.add_node(node1)
+        node1.Stream = _Stream()
+        node1.TokenBucket.Tokens = 0
+
+        now = time.time()
+        for i in xrange(3):
+            node1.enqueue_message(
+                Message({'__SIGNATURE__': "test{0}".format(i)}), now)
+        time.sleep(1)
+        core._timer_transmit(time.time())
+        self.assertEquals(len(node1.Stream.sent), 2)
+        self.assertEquals(node1.MessageQ.Count, 1)
+        self.assertEquals(core.PendingAckMap, {})
+
+        node1.Stream.Paused = False
+        core._timer_transmit(time.time())
+        self.assertEquals(len(node1.Stream.sent), 3)
+
+        # messages received over the stream are handled
+        msg = node1.Stream.sent[0]
+        core.stream_message_received(repr(msg), 3, node1)
+        msgType = core.MessageStats.get_stats(["MessageType"])
+        self.assertEquals(
+            msgType["MessageType"]['/gossip.Message/MessageBase'], 1)
+
+        # only the node with the lower identifier opens the connection
+        calls = []
+        callFromThread = reactor.callFromThread
+        reactor.callFromThread = lambda *args: calls.append(args)
+        try:
+            core.connect_stream(node1)
+            core.LocalNode.StreamPort = 5501
+            node1.StreamPort = 5502
+            core.connect_stream(node1)
+            node1.Stream = None
+            core.connect_stream(node1)
+        finally:
+            reactor.callFromThread = callFromThread
+        if core.LocalNode.Identifier < node1.Identifier:
+            self.assertEquals(len(calls), 1)
+            self.assertEquals(calls[0][1:3], (node1.NetHost, 5502))
+        else:
+            self.assertEquals(calls, [])
+
     def test_gossip_dispatcher(self):
         # Test _dispatch will not loop if not processing messages
         core = self._setup(8883)
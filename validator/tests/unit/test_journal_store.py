@@ -0,0 +1,318 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import cPickle as pickle
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from gossip import signed_object
+from gossip import stats
+from journal import transaction
+from journal import transaction_block
+from journal.database import record
+from journal.database.database import CachedDatabase
+from journal.database.lmdb_database import LMDBDatabase
+from journal.database.shelf_database import ShelfDatabase
+from journal.journal_store import JournalStore
+
+
+class _CountingDatabase(object):
+    """Wraps a database and counts the writes that reach it.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.writes = 0
+
+    def __getattr__(self, name):
+        return getattr(self.database, name)
+
+    def __contains__(self, key):
+        return key in self.database
+
+    def __len__(self):
+        return len(self.database)
+
+    def __getitem__(self, key):
+        return self.database[key]
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def set(self, key, value):
+        self.writes += 1
+        self.database.set(key, value)
+
+    def set_batch(self, add_pairs, del_keys=None):
+        self.writes += 1
+        self.database.set_batch(add_pairs, del_keys)
+
+
+class TestJournalStoreShelfBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.database = _CountingDatabase(self._open_database(
+            os.path.join(self.path, 'store')))
+        self.store = JournalStore(self.database)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.path)
+
+    def _open_database(self, filename):
+        return ShelfDatabase(filename + '.shelf', 'n')
+
+    def test_batch_writes_once(self):
+        self.store['deleted'] = 'old'
+        self.database.writes = 0
+
+        with self.store.batch():
+            for i in xrange(100):
+                self.store['key{0}'.format(i)] = {'value': i}
+            del self.store['deleted']
+            self.assertNotIn('key0', self.database)
+            self.assertEqual(self.store['key5'], {'value': 5})
+            self.assertNotIn('deleted', self.store)
+            self.assertIsNone(self.store.get('deleted'))
+
+        self.assertEqual(self.database.writes, 1)
+        self.assertEqual(self.store['key99'], {'value': 99})
+        self.assertNotIn('deleted', self.store)
+
+    def test_nested_batches_write_once(self):
+        with self.store.batch():
+            self.store['a'] = 1
+            with self.store.batch():
+                self.store['b'] = 2
+            self.assertNotIn('b', self.database)
+        self.assertEqual(self.database.writes, 1)
+        self.assertEqual((self.store['a'], self.store['b']), (1, 2))
+
+    def test_failed_batch_is_discarded(self):
+        try:
+            with self.store.batch():
+                self.store['a'] = 1
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertNotIn('a', self.store)
+        self.assertEqual(self.database.writes, 0)
+
+    def test_delete_of_key_set_in_batch(self):
+        with self.store.batch():
+            self.store['a'] = 1
+            self.store.delete('a')
+        self.assertNotIn('a', self.store)
+
+    def test_set_many_and_delete_many(self):
+        self.store.set_many([('a', 1), ('b', 2), ('c', 3)])
+        self.store.delete_many(['a', 'b'])
+        self.assertEqual(self.database.writes, 2)
+        self.assertNotIn('a', self.store)
+        self.assertEqual(self.store['c'], 3)
+
+    def test_other_threads_wait_for_batch(self):
+        result = []
+        reader = threading.Thread(
+            target=lambda: result.append(self.store.get('a')))
+        with self.store.batch():
+            self.store['a'] = 1
+            reader.start()
+            reader.join(0.1)
+            self.assertTrue(reader.is_alive())
+        reader.join(5.0)
+        self.assertEqual(result, [1])
+
+
+class TestJournalStoreLMDBBatch(TestJournalStoreShelfBatch):
+
+    def _open_database(self, filename):
+        return LMDBDatabase(filename + '.lmdb', 'n')
+
+
+class TestCachedDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.database = _CountingDatabase(ShelfDatabase(
+            os.path.join(self.path, 'store.shelf'), 'n'))
+
+    def tearDown(self):
+        self.database.close()
+        shutil.rmtree(self.path)
+
+    def test_reads_refresh_recency(self):
+        cache = CachedDatabase(self.database, cache_limit=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache['a'], 1)
+        cache['c'] = 3
+
+        self.assertEqual(list(cache._cache), ['a', 'c'])
+        self.assertEqual(cache.Evictions.Value, 1)
+
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual((cache.Hits.Value, cache.Misses.Value), (1, 1))
+        self.assertEqual(list(cache._cache), ['c', 'b'])
+
+    def test_writes_are_bounded(self):
+        cache = CachedDatabase(self.database, cache_limit=10)
+        for i in xrange(100):
+            cache.set('key{0}'.format(i), i)
+        cache.set_batch([('batch{0}'.format(i), i) for i in xrange(100)])
+
+        self.assertEqual(len(cache._cache), 10)
+        self.assertEqual(cache.Entries.Value, 10)
+        self.assertEqual(cache['key0'], 0)
+        self.assertEqual(len(cache), 200)
+
+    def test_size_limit(self):
+        cache = CachedDatabase(self.database, size_limit=300)
+        for i in xrange(10):
+            cache['key{0}'.format(i)] = 'x' * 100
+
+        self.assertTrue(0 < cache.Bytes.Value <= 300)
+        self.assertEqual(len(cache._cache), 2)
+        del cache['key9']
+        self.assertEqual(cache.Bytes.Value, sum(cache._sizes.values()))
+
+    def test_write_back(self):
+        cache = CachedDatabase(self.database, cache_limit=3,
+                               write_back=True)
+        self.database['old'] = 'value'
+        self.database.writes = 0
+
+        cache['a'] = 1
+        cache['b'] = 2
+        del cache['old']
+        self.assertEqual(self.database.writes, 0)
+        self.assertNotIn('old', cache)
+        self.assertIsNone(cache.get('old'))
+        self.assertRaises(KeyError, cache.delete, 'old')
+
+        # evicting a modified entry writes it
+        cache['c'] = 3
+        self.assertEqual(self.database.writes, 1)
+        self.assertEqual(self.database['a'], 1)
+
+        cache.sync()
+        self.assertEqual(self.database.writes, 2)
+        self.assertEqual(self.database['c'], 3)
+        self.assertNotIn('old', self.database)
+        self.assertEqual(sorted(cache.keys()), ['a', 'b', 'c'])
+
+    def test_metrics_are_registered(self):
+        domain = stats.Stats('node', 'cache')
+        cache = CachedDatabase(self.database, stats_domain=domain,
+                               name='txn')
+        cache['a'] = 1
+        cache.get('a')
+        self.assertEqual(domain.get_stats(['txnCacheHits']),
+                         {'txnCacheHits': 1})
+
+
+class TestJournalRecords(unittest.TestCase):
+
+    def setUp(self):
+        self.signingkey = signed_object.generate_signing_key()
+
+    def _transaction(self):
+        txn = transaction.Transaction({'Nonce': 1.5,
+                                       'Dependencies': ['abc']})
+        txn.sign_object(self.signingkey)
+        return txn
+
+    def test_transaction_round_trip(self):
+        txn = self._transaction()
+        txn.Status = transaction.Status.committed
+        txn.InBlock = 'blockid'
+
+        loaded = record.decode(record.encode(txn))
+
+        self.assertIsInstance(loaded, transaction.Transaction)
+        self.assertEqual(loaded.Identifier, txn.Identifier)
+        self.assertEqual(loaded.Status, transaction.Status.committed)
+        self.assertEqual(loaded.InBlock, 'blockid')
+        self.assertEqual(loaded.OriginatorID, txn.OriginatorID)
+        self.assertTrue(loaded.__dict__.get('_record_lazy'))
+
+        self.assertEqual(loaded.Dependencies, ['abc'])
+        self.assertNotIn('_record_lazy', loaded.__dict__)
+        self.assertEqual(loaded.dump(), txn.dump())
+        self.assertEqual(loaded.Status, transaction.Status.committed)
+        self.assertTrue(loaded.verify_signature())
+
+    def test_status_update_keeps_body(self):
+        txn = self._transaction()
+        data = record.encode(txn)
+
+        loaded = record.decode(data)
+        loaded.Status = transaction.Status.pending
+        updated = record.encode(loaded)
+
+        self.assertTrue(loaded.__dict__.get('_record_lazy'))
+        self.assertTrue(updated.endswith(loaded.__dict__['_record_body']))
+        self.assertEqual(record.decode(updated).Status,
+                         transaction.Status.pending)
+
+        # the updated status survives construction of the object
+        self.assertEqual(loaded.Dependencies, ['abc'])
+        self.assertEqual(loaded.Status, transaction.Status.pending)
+
+    def test_concurrent_construction(self):
+        loaded = record.decode(record.encode(self._transaction()))
+        results = []
+
+        def _read():
+            results.append((loaded.Dependencies, loaded.Nonce))
+
+        threads = [threading.Thread(target=_read) for _ in xrange(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5.0)
+        self.assertEqual(results, [(['abc'], 1.5)] * 8)
+
+    def test_block_round_trip(self):
+        block = transaction_block.TransactionBlock(
+            {'BlockNum': 3, 'TransactionIDs': ['a', 'b']})
+        block.sign_object(self.signingkey)
+        block.Status = transaction_block.Status.invalid
+        block.TransactionDepth = 12
+
+        loaded = record.decode(record.encode(block))
+
+        self.assertEqual(loaded.Status, transaction_block.Status.invalid)
+        self.assertEqual(loaded.TransactionDepth, 12)
+        self.assertEqual(loaded.TransactionIDs, ['a', 'b'])
+        self.assertEqual(loaded.BlockNum, 3)
+
+    def test_other_values_and_pickles(self):
+        self.assertEqual(record.decode(record.encode({'a': [1]})),
+                         {'a': [1]})
+        self.assertEqual(record.decode(pickle.dumps('value')), 'value')
+
+        txn = self._transaction()
+        loaded = record.decode(pickle.dumps(txn))
+        self.assertEqual(loaded.Identifier, txn.Identifier)
+
+    def test_unknown_version(self):
+        data = record.encode(self._transaction())
+        data = data[:3] + chr(99) + data[4:]
+        self.assertRaises(record.RecordVersionError, record.decode, data)
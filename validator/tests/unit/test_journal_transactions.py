@@ -19,9 +19,13 @@ import tempfile
 import pybitcointools
 
 from gossip import signed_object
+from gossip.common import NullIdentifier
 from gossip.gossip_core import Gossip
 from gossip.node import Node
 from journal.consensus.dev_mode.dev_mode_consensus import DevModeConsensus
+from journal.global_store_manager import GlobalStoreManager
+from journal.global_store_manager import KeyValueStore
+from journal.transaction import InvalidTransactionError
 from journal.transaction import Transaction
 from journal.transaction_block import TransactionBlock
 from journal.transaction import Status as tStatus
@@ -29,6 +33,17 @@ from journal.transaction_block import Status as tbStatus
 from journal.journal_core import Journal
 
 
+class _SetTransaction(Transaction):
+    # a transaction that is only valid once, it sets the key of its nonce
+    def check_valid(self, store):
+        super(_SetTransaction, self).check_valid(store)
+        if str(self.Nonce) in store:
+            raise InvalidTransactionError('already set')
+
+    def apply(self, store):
+        store[str(self.Nonce)] = self.Nonce
+
+
 class TestingJournalTransaction(unittest.TestCase):
 
     def test_journal_transaction_init(self):
@@ -110,19 +125,19 @@ class TestingJournalTransactionBlock(unittest.TestCase):
 
     _next_port = 10000
 
-    def _create_node(self):
-        signingkey = signed_object.generate_signing_key()
+    def _create_node(self, signingkey=None):
+        signingkey = signingkey or signed_object.generate_signing_key()
         ident = signed_object.generate_identifier(signingkey)
         node = Node(identifier=ident, signingkey=signingkey,
                     address=("localhost", self._next_port))
         self.__class__._next_port = self._next_port + 1
         return node
 
-    def _create_journal(self, node=None):
+    def _create_journal(self, node=None, path=None):
         node = node or self._create_node()
         gossip = Gossip(node)
         # Takes a journal, create a temporary directory to use with the journal
-        path = tempfile.mkdtemp()
+        path = path or tempfile.mkdtemp()
         journal = Journal(
             gossip.LocalNode,
             gossip,
@@ -320,3 +335,430 @@ class TestingJournalTransactionBlock(unittest.TestCase):
         self.assertEquals(tb_dic["BlockNum"], 0)
         self.assertIsNotNone(tb_dic["Signature"])
         self.assertNotEquals(tb_dic["Signature"], "")
+
+    def _commit_chain(self, journal, node, previd, count):
+        blockids = []
+        for i in xrange(count):
+            block = TransactionBlock({'BlockNum': i,
+                                      'PreviousBlockID': previd})
+            block.sign_from_node(node)
+            block.Status = tbStatus.valid
+            journal.block_store[block.Identifier] = block
+            if previd == journal.most_recent_committed_block_id:
+                journal._commit_block(block)
+            blockids.append(block.Identifier)
+            previd = block.Identifier
+        return blockids
+
+    def test_journal_committed_chain_index(self):
+        # Test the committed chain index through commits, decommits and
+        # fork detection
+        (gossip, journal) = self._create_journal()
+        node = gossip.LocalNode
+        try:
+            blockids = self._commit_chain(
+                journal, node, NullIdentifier, 10)
+            self.assertEquals(journal.committed_block_ids(),
+                              blockids[::-1])
+            self.assertEquals(journal.committed_block_ids(3),
+                              blockids[:-4:-1])
+            self.assertEquals(journal.committed_block_ids_from(8, 100),
+                              blockids[8:])
+            self.assertEquals(journal.committed_block_height(blockids[4]),
+                              4)
+
+            forkids = self._commit_chain(journal, node, blockids[5], 3)
+            fork = journal.block_store[forkids[-1]]
+            self.assertEquals(journal._find_fork(fork), blockids[5])
+            self.assertIsNone(journal.committed_block_height(forkids[0]))
+
+            journal._decommit_block_chain(blockids[5])
+            self.assertEquals(journal.committed_block_ids(),
+                              blockids[5::-1])
+            self.assertIsNone(journal.committed_block_height(blockids[6]))
+            journal._commit_block_chain(forkids[-1], blockids[5])
+            self.assertEquals(journal.committed_block_ids_from(0, 100),
+                              blockids[:6] + forkids)
+        finally:
+            gossip.shutdown()
+
+    def test_journal_flatten_from_chain_index(self):
+        # Test that the state of the block maximum_blocks_to_keep blocks
+        # behind the head is flattened
+        (gossip, journal) = self._create_journal()
+        node = gossip.LocalNode
+        try:
+            flattened = []
+            journal.global_store_map.flatten_block_store = flattened.append
+            journal.maximum_blocks_to_keep = 4
+            blockids = self._commit_chain(
+                journal, node, NullIdentifier, 9)
+            journal._clean_transaction_blocks()
+            self.assertEquals(flattened, [blockids[4]])
+
+            # the stores are flushed for every block, not only for the
+            # blocks whose state is flattened
+            synced = []
+            journal.block_store.sync = lambda: synced.append(True)
+            journal.maximum_blocks_to_keep = 100
+            journal._clean_transaction_blocks()
+            self.assertEquals(flattened, [blockids[4]])
+            self.assertEquals(synced, [True])
+        finally:
+            gossip.shutdown()
+
+    def test_journal_chain_index_restore(self):
+        # Test that the committed chain index is persisted and rebuilt
+        # when it does not match the head of the chain
+        node = self._create_node()
+        path = tempfile.mkdtemp()
+        (gossip, journal) = self._create_journal(node, path)
+        try:
+            blockids = self._commit_chain(
+                journal, node, NullIdentifier, 5)
+            journal.shutdown()
+        finally:
+            gossip.shutdown()
+
+        # reopen the journal as the same node on a new port
+        node = self._create_node(node.SigningKey)
+        (gossip, journal) = self._create_journal(node, path)
+        try:
+            journal._restore_chain_index(blockids[-1])
+            self.assertEquals(journal.committed_block_ids(),
+                              blockids[::-1])
+
+            del journal.chain_store['ChainHeight']
+            journal._restore_chain_index(blockids[2])
+            self.assertEquals(journal.committed_block_ids_from(0, 100),
+                              blockids[:3])
+            self.assertEquals(journal.chain_store['ChainHeight'], 3)
+        finally:
+            gossip.shutdown()
+
+    def test_journal_reuses_prepared_block_store(self):
+        # Test that the state prepared for a block built by the journal
+        # is used when that block is applied
+        (gossip, journal) = self._create_journal()
+        node = gossip.LocalNode
+        try:
+            journal.initializing = False
+            journal.global_store_map.add_transaction_store(
+                '/Transaction', KeyValueStore())
+            for i in xrange(3):
+                txn = Transaction({'Nonce': float(i), 'Dependencies': []})
+                txn.sign_from_node(node)
+                journal.add_pending_transaction(txn, build_block=False)
+
+            txnids = journal._prepare_transaction_list()
+            self.assertEquals(len(txnids), 3)
+            prepared = journal._candidate_store[2]
+
+            # a different block does not use the prepared state
+            block = TransactionBlock({'BlockNum': 0,
+                                      'PreviousBlockID': NullIdentifier,
+                                      'TransactionIDs': txnids[:2]})
+            block.sign_from_node(node)
+            block.Status = tbStatus.complete
+            self.assertIsNot(journal._test_and_apply_block(block), prepared)
+
+            block.TransactionIDs = txnids
+            self.assertIs(journal._test_and_apply_block(block), prepared)
+            self.assertEquals(
+                journal.JournalStats.ReusedBlockStoreCount.Value, 1)
+
+            # the prepared state is used once
+            self.assertIsNone(journal._candidate_store)
+            self.assertIsNot(journal._test_and_apply_block(block), prepared)
+        finally:
+            gossip.shutdown()
+
+    def test_journal_extends_prepared_block_store(self):
+        # Test that the state prepared for a block is extended with the
+        # transactions that arrive before the next block is prepared
+        (gossip, journal) = self._create_journal()
+        node = gossip.LocalNode
+        try:
+            journal.initializing = False
+            journal.global_store_map.add_transaction_store(
+                '/Transaction', KeyValueStore())
+            txns = []
+            for i in xrange(3):
+                txn = Transaction({'Nonce': float(i), 'Dependencies': []})
+                txn.sign_from_node(node)
+                txns.append(txn)
+
+            journal.add_pending_transaction(txns[0], build_block=False)
+            self.assertEquals(journal._prepare_transaction_list(),
+                              [txns[0].Identifier])
+            prepared = journal._candidate_store[2]
+
+            for txn in txns[1:]:
+                journal.add_pending_transaction(txn, build_block=False)
+            self.assertEquals(journal._prepare_transaction_list(),
+                              [t.Identifier for t in txns])
+            self.assertIs(journal._candidate_store[2], prepared)
+        finally:
+            gossip.shutdown()
+
+    def test_journal_prepares_smaller_block_store(self):
+        # Test that preparing fewer transactions than the previous block
+        # candidate builds a fresh state rather than dropping them
+        (gossip, journal) = self._create_journal()
+        node = gossip.LocalNode
+        try:
+            journal.initializing = False
+            journal.global_store_map.add_transaction_store(
+                '/Transaction', KeyValueStore())
+            txns = []
+            for i in xrange(6):
+                txn = _SetTransaction({'Nonce': float(i),
+                                       'Dependencies': []})
+                txn.sign_from_node(node)
+                txns.append(txn)
+                journal.add_pending_transaction(txn, build_block=False)
+
+            self.assertEquals(len(journal._prepare_transaction_list(5)), 5)
+            prepared = journal._candidate_store[2]
+            self.assertEquals(journal._prepare_transaction_list(2),
+                              [t.Identifier for t in txns[:2]])
+            self.assertIsNot(journal._candidate_store[2], prepared)
+            self.assertEquals(len(journal.pending_transactions), 6)
+            self.assertEquals(journal.JournalStats.InvalidTxnCount.Value, 0)
+        finally:
+            gossip.shutdown()
+
+    def test_journal_stored_dependency_is_pending(self):
+        # Test that a dependency in the transaction store that is not
+        # pending is made pending again rather than blocking forever
+        (gossip, journal) = self._create_journal()
+        node = gossip.LocalNode
+        try:
+            journal.initializing = False
+            journal.global_store_map.add_transaction_store(
+                '/Transaction', KeyValueStore())
+            dep = Transaction({'Nonce': 1.0, 'Dependencies': []})
+            dep.sign_from_node(node)
+            dep.InBlock = 'Uncommitted'
+            journal.transaction_store[dep.Identifier] = dep
+
+            txn = Transaction({'Nonce': 2.0,
+                               'Dependencies': [dep.Identifier]})
+            txn.sign_from_node(node)
+            journal.add_pending_transaction(txn, build_block=False)
+
+            self.assertEquals(journal._prepare_transaction_list(),
+                              [dep.Identifier, txn.Identifier])
+            self.assertEquals(journal.pending_transactions.keys(),
+                              [txn.Identifier, dep.Identifier])
+        finally:
+            gossip.shutdown()
+
+    def test_journal_block_waits_for_missing_txn(self):
+        # Test that a block missing a transaction is handled once the
+        # transaction arrives
+        (gossip, journal) = self._create_journal()
+        node = gossip.LocalNode
+        try:
+            journal.initializing = False
+            journal.global_store_map.add_transaction_store(
+                '/Transaction', KeyValueStore())
+            txn = Transaction({'Nonce': 1.0, 'Dependencies': []})
+            txn.sign_from_node(node)
+
+            block = TransactionBlock({'BlockNum': 0,
+                                      'PreviousBlockID': NullIdentifier,
+                                      'TransactionIDs': [txn.Identifier]})
+            block.sign_from_node(node)
+            journal.commit_transaction_block(block)
+            self.assertIn(block.Identifier, journal.pending_block_ids)
+            self.assertEquals(
+                journal.block_store[block.Identifier].Status,
+                tbStatus.incomplete)
+
+            journal.add_pending_transaction(txn, build_block=False)
+            self.assertNotIn(block.Identifier, journal.pending_block_ids)
+            self.assertEquals(journal.most_recent_committed_block_id,
+                              block.Identifier)
+            self.assertNotIn(block.Identifier, journal._pending_blocks)
+        finally:
+            gossip.shutdown()
+
+    def test_journal_batch_request_capability(self):
+        # Test that missing transactions are only requested in batches
+        # from peers that announced they handle batch requests
+        (gossip, journal) = self._create_journal()
+        try:
+            sent = []
+            broadcast = []
+            fetcher = journal.transaction_fetcher
+            fetcher._send_request = \
+                lambda peerid, txnids: sent.append((peerid, txnids))
+            fetcher._broadcast_request = broadcast.append
+
+            peer = self._create_node()
+            peer.is_peer = True
+            gossip.add_node(peer)
+            fetcher.request(['txn1'])
+            journal._request_missing_txns(1.0)
+            self.assertEquals(sent, [])
+            self.assertEquals(broadcast, ['txn1'])
+
+            peer.Capabilities = frozenset(['TransactionBatchRequest'])
+            fetcher.request(['txn2'])
+            journal._request_missing_txns(2.0)
+            self.assertEquals(sent, [(peer.Identifier, ['txn2'])])
+        finally:
+            gossip.shutdown()
+
+    def test_journal_reorganize(self):
+        # Test that a reorganization updates the transactions of both
+        # chains and the pending transactions
+        (gossip, journal) = self._create_journal()
+        node = gossip.LocalNode
+        try:
+            journal.initializing = False
+            txnids = []
+            for i in xrange(4):
+                txn = Transaction({'Nonce': float(i), 'Dependencies': []})
+                txn.sign_from_node(node)
+                journal.add_pending_transaction(txn, build_block=False)
+                txnids.append(txn.Identifier)
+
+            blocks = []
+            for previd, ids in [(NullIdentifier, txnids[:1]),
+                                (0, txnids[1:3]), (0, txnids[2:])]:
+                if previd == 0:
+                    previd = blocks[0].Identifier
+                block = TransactionBlock({'PreviousBlockID': previd,
+                                          'TransactionIDs': ids})
+                block.sign_from_node(node)
+                block.Status = tbStatus.valid
+                journal.block_store[block.Identifier] = block
+                blocks.append(block)
+            journal._commit_block(blocks[0])
+            journal._commit_block(blocks[1])
+
+            txn = Transaction({'Nonce': 4.0, 'Dependencies': [txnids[1]]})
+            txn.sign_from_node(node)
+            journal.add_pending_transaction(txn, build_block=False)
+
+            fork_id, branch = journal.fork_choice.find_fork(
+                blocks[2].Identifier, journal._committed_heights.__contains__)
+            self.assertEquals((fork_id, branch),
+                              (blocks[0].Identifier, [blocks[2].Identifier]))
+            journal._reorganize(fork_id, [blocks[2]])
+
+            self.assertEquals(journal.committed_block_ids(),
+                              [blocks[2].Identifier, blocks[0].Identifier])
+            self.assertEquals(journal.transaction_store[txnids[1]].Status,
+                              tStatus.pending)
+            for txnid in txnids[2:]:
+                self.assertEquals(journal.transaction_store[txnid].InBlock,
+                                  blocks[2].Identifier)
+                self.assertEquals(journal.transaction_store[txnid].Status,
+                                  tStatus.committed)
+            self.assertEquals(journal.pending_transactions.keys(),
+                              [txnids[1], txn.Identifier])
+            self.assertEquals(
+                journal._pending_graph.select(lambda txnid: True)[0],
+                [txnids[1], txn.Identifier])
+        finally:
+            gossip.shutdown()
+
+    def test_journal_evicts_pending_transactions(self):
+        # Test that a full pool evicts its oldest transaction together
+        # with the pending transactions that depend on it
+        (gossip, journal) = self._create_journal()
+        node = gossip.LocalNode
+        try:
+            journal.initializing = False
+            journal.pending_transactions.MaximumSize = 2
+            txns = []
+            for i in xrange(3):
+                deps = [txns[0].Identifier] if i == 1 else []
+                txn = Transaction({'Nonce': float(i), 'Dependencies': deps})
+                txn.sign_from_node(node)
+                journal.add_pending_transaction(txn, build_block=False)
+                txns.append(txn)
+
+            self.assertEquals(journal.pending_transactions.keys(),
+                              [txns[2].Identifier])
+            for txn in txns[:2]:
+                self.assertNotIn(txn.Identifier, journal.transaction_store)
+            self.assertEquals(
+                journal.pending_transactions.Stats.EvictedTxnCount.Value, 1)
+        finally:
+            gossip.shutdown()
+
+    def test_journal_validates_blocks_in_worker(self):
+        # Test that once the journal is initialized a complete block is
+        # validated and committed by the block validation worker
+        node = self._create_node()
+        gossip = Gossip(node)
+        journal = Journal(gossip.LocalNode, gossip, gossip.dispatcher,
+                          consensus=DevModeConsensus(),
+                          data_directory=tempfile.mkdtemp(),
+                          validation_worker=True)
+        try:
+            journal.initialization_complete()
+            self.assertTrue(journal.block_validator.running)
+            journal.global_store_map.add_transaction_store(
+                '/Transaction', KeyValueStore())
+
+            # the block tests run with the journal lock held
+            tested = []
+
+            def _block_test(jrnl, tblock):
+                tested.append(jrnl._txn_lock._is_owned())
+                return True
+
+            journal.on_block_test += _block_test
+            txn = Transaction({'Nonce': 1.0, 'Dependencies': []})
+            txn.sign_from_node(node)
+            journal.add_pending_transaction(txn, build_block=False)
+
+            block = TransactionBlock({'BlockNum': 0,
+                                      'PreviousBlockID': NullIdentifier,
+                                      'TransactionIDs': [txn.Identifier]})
+            block.sign_from_node(node)
+            journal.commit_transaction_block(block)
+
+            timeout = time.time() + 5.0
+            while journal.most_recent_committed_block_id != \
+                    block.Identifier and time.time() < timeout:
+                time.sleep(0.01)
+            self.assertEquals(journal.most_recent_committed_block_id,
+                              block.Identifier)
+            self.assertNotIn(block.Identifier, journal.pending_block_ids)
+            self.assertEquals(tested, [True])
+        finally:
+            journal.block_validator.stop(timeout=5.0)
+            gossip.shutdown()
+
+    def test_journal_lmdb_state_from_dbm(self):
+        # Test that with the lmdb store type the state kept in a dbm file
+        # by earlier versions is copied to the lmdb environment
+        node = self._create_node()
+        path = tempfile.mkdtemp()
+        gsm = GlobalStoreManager(
+            '{0}/{1}_state.dbm'.format(path, node), 'n')
+        gsm.add_transaction_store('/Transaction', KeyValueStore())
+        blockstore = gsm.get_block_store(NullIdentifier).clone_block()
+        blockstore.get_transaction_store('/Transaction').set('key', 1)
+        gsm.commit_block_store('block', blockstore)
+        gsm.close()
+
+        gossip = Gossip(node)
+        try:
+            journal = Journal(gossip.LocalNode, gossip, gossip.dispatcher,
+                              consensus=DevModeConsensus(),
+                              data_directory=path, store_type='lmdb')
+            journal.global_store_map.add_transaction_store(
+                '/Transaction', KeyValueStore())
+            blockstore = journal.global_store_map.get_block_store('block')
+            self.assertEquals(
+                blockstore.get_transaction_store('/Transaction').get('key'),
+                1)
+        finally:
+            gossip.shutdown()
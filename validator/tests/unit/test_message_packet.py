@@ -16,6 +16,7 @@
 import unittest
 import time
 
+from gossip.fragmentation import OutgoingMessage
 from gossip.message import Packet, Message, unpack_message_data
 from gossip.node import Node
 from gossip.common import dict2cbor
@@ -101,6 +102,60 @@ class TestPacket(unittest.TestCase):
         self.assertEquals(original, new)
         self.assertEquals("test the pack", pak.Data)
 
+    def test_add_messages(self):
+        # Add a batch of messages to a packet and unpack them again
+        pak = Packet()
+        srcNode = Node(identifier="source", signingkey="source")
+        desNode = Node(identifier="destination", signingkey="destination")
+        msgs = [Message({'__SIGNATURE__': "MsgTestS"}),
+                Message({'__SIGNATURE__': "MsgTestT"})]
+        msgs[0].IsReliable = False
+        msgs[1].TimeToLive = 7
+        pak.add_messages(msgs, srcNode, desNode, 2)
+        self.assertTrue(pak.IsBatch)
+        self.assertTrue(pak.IsReliable)
+        self.assertEquals(pak.Messages, msgs)
+        self.assertIsNone(pak.Message)
+
+        received = Packet()
+        received.unpack(pak.pack())
+        self.assertTrue(received.IsBatch)
+        self.assertEquals(received.SequenceNumber, 2)
+        self.assertEquals(received.unpack_batch(),
+                          [(msgs[0].TimeToLive, repr(msgs[0])),
+                           (7, repr(msgs[1]))])
+        self.assertEquals(
+            len(pak.pack()),
+            Packet.batch_overhead(2) + len(msgs[0]) + len(msgs[1]))
+
+        # a packet with a single message is not a batch
+        pak.add_message(msgs[0], srcNode, desNode, 3)
+        self.assertFalse(pak.IsBatch)
+        self.assertEquals(pak.Messages, [msgs[0]])
+
+    def test_add_fragment(self):
+        # Add a fragment of a message to a packet and unpack it again
+        pak = Packet()
+        srcNode = Node(identifier="source", signingkey="source")
+        desNode = Node(identifier="destination", signingkey="destination")
+        msg = Message({'__SIGNATURE__': "MsgTestS"})
+        outgoing = OutgoingMessage(msg, 5, 10)
+        pak.add_fragment(outgoing, 1, srcNode, desNode, 3)
+        self.assertTrue(pak.IsFragment)
+        self.assertFalse(pak.IsBatch)
+        self.assertTrue(pak.IsReliable)
+        self.assertEquals(pak.Messages, [])
+        self.assertEquals(pak.Fragment, (outgoing, 1))
+        self.assertEquals(len(pak.pack()),
+                          Packet.fragment_overhead() + 10)
+
+        received = Packet()
+        received.unpack(pak.pack())
+        self.assertTrue(received.IsFragment)
+        self.assertEquals(received.unpack_fragment(),
+                          (5, 1, len(outgoing), len(repr(msg)),
+                           repr(msg)[10:20]))
+
 
 class TestMessage(unittest.TestCase):
 
@@ -71,6 +71,26 @@ class TestNode(unittest.TestCase):
         # The delay _fixeddelay should not change after node is created
         self.assertEquals(fdelay3, fdelay4)
 
+    def test_node_delay_policy(self):
+        # Test the delay policy selects the delay of the node
+        try:
+            Node.DelayPolicy = 'none'
+            node = self._create_node()
+            self.assertEquals(node.Delay(), 0.0)
+            now = time.time()
+            msg = Message({'__SIGNATURE__': "test"})
+            self.assertEquals(node.enqueue_message(msg, now), now)
+            Node.DelayPolicy = 'exponential'
+            self.assertEquals(self._create_node().Delay.__name__,
+                              '_randomdelay')
+            Node.DelayPolicy = 'unknown'
+            with self.assertRaises(ValueError):
+                self._create_node()
+        finally:
+            Node.DelayPolicy = None
+        self.assertEquals(self._create_node().Delay.__name__,
+                          '_fixeddelay')
+
     def test_node_initialize_stats(self):
         # Test Stats are initialized as expected
         node = self._create_node()
@@ -150,6 +170,30 @@ class TestNode(unittest.TestCase):
         # No messages left, should return None
         self.assertEquals(node.get_next_message(now + 5), None)
 
+    def test_node_next_send_time(self):
+        # Test next_send_time waits for the message and for the tokens
+        node = self._create_node()
+        now = time.time()
+        self.assertIsNone(node.next_send_time(now))
+        msg = Message({'__SIGNATURE__': "test"})
+        node.enqueue_message(msg, now)
+        node.TokenBucket.Tokens = node.TokenBucket.Capacity
+        self.assertEquals(node.next_send_time(now),
+                          now + node.FixedRandomDelay)
+
+        node.TokenBucket.Tokens = 0
+        node.TokenBucket.LastDrip = time.time()
+        wait = float(len(msg)) / node.TokenBucket.DripRate
+        self.assertGreaterEqual(node.next_send_time(now + 5), now + 5)
+        self.assertLessEqual(node.next_send_time(now + 5), now + 5 + wait)
+        # longer than the metered size, the message is not limited
+        self.assertEquals(node.next_send_time(now + 5, meteredsize=0),
+                          now + node.FixedRandomDelay)
+
+        # a message that never fits in the bucket
+        node.TokenBucket.Capacity = len(msg) - 1
+        self.assertIsNone(node.next_send_time(now + 5))
+
     def test_node_message_delivered(self):
         # Test behavior if message is "delivered"
         node = self._create_node()
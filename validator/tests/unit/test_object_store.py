@@ -19,6 +19,8 @@ from random import choice
 import string
 import time
 
+from gossip.common import cbor2dict, dict2cbor
+from journal.global_store_manager import BlockStore
 from journal.object_store import ObjectStore, MalformedIndexError, \
     UniqueConstraintError
 
@@ -306,3 +308,107 @@ class TestHeterogeneousStore(unittest.TestCase):
         for c, val in zip(self.index2s, self.obj_type2_values):
             self.assertEqual(objectstore.lookup('type2:index2', c),
                              val, "Can look up any other type2:index2")
+
+
+class TestLayeredIndexes(unittest.TestCase):
+
+    def _obj(self, name, serial):
+        return {'object-type': 'type1', 'name': name, 'serial': serial}
+
+    def _committed_store(self):
+        store = ObjectStore(indexes=['type1:name'])
+        for i in xrange(100):
+            store.set('obj{0}'.format(i), self._obj('name{0}'.format(i), i))
+        store.commit()
+        return store
+
+    def test_clone_shares_indexes(self):
+        store = self._committed_store()
+        child = store.clone_store()
+
+        self.assertIs(child._indexes['type1:name'],
+                      store._indexes['type1:name'])
+
+        child.set('obj5', self._obj('renamed', 5))
+        child.set('new', self._obj('name5', 200))
+        child.delete('obj6')
+
+        self.assertEqual(child.lookup('type1:name', 'renamed')['serial'], 5)
+        self.assertEqual(child.lookup('type1:name', 'name5')['serial'], 200)
+        self.assertRaises(KeyError, child.lookup, 'type1:name', 'name6')
+        self.assertEqual(store.lookup('type1:name', 'name5')['serial'], 5)
+        self.assertEqual(store.lookup('type1:name', 'name6')['serial'], 6)
+        self.assertRaises(KeyError, store.lookup, 'type1:name', 'renamed')
+
+    def test_update_removes_stale_entry(self):
+        store = ObjectStore(indexes=['type1:name'])
+        store.set('obj1', self._obj('before', 1))
+        store.set('obj1', self._obj('after', 1))
+
+        self.assertRaises(KeyError, store.lookup, 'type1:name', 'before')
+        store.set('obj2', self._obj('before', 2))
+        self.assertEqual(store.lookup('type1:name', 'before')['serial'], 2)
+
+    def test_subclass_inherits_indexes(self):
+        class DerivedStore(ObjectStore):
+            def clone_store(self, storeinfo=None, readonly=False):
+                return DerivedStore(self, storeinfo, readonly)
+
+        store = DerivedStore(indexes=['type1:name'])
+        store.set('obj1', self._obj('name1', 1))
+        store.commit()
+        child = store.clone_store()
+
+        self.assertIn('type1:name', child._indexes)
+        self.assertEqual(child.lookup('type1:name', 'name1')['serial'], 1)
+
+    def test_late_index_is_derived_from_parent(self):
+        store = ObjectStore()
+        for i in xrange(10):
+            store.set('obj{0}'.format(i), self._obj('name{0}'.format(i), i))
+        store.commit()
+        child = store.clone_store()
+        child.set('obj3', self._obj('other', 3))
+        child.delete('obj4')
+
+        self.assertEqual(child.lookup('type1:serial', 3)['name'], 'other')
+        self.assertRaises(KeyError, child.lookup, 'type1:serial', 4)
+        self.assertIn('type1:serial', store._indexes)
+        self.assertEqual(store.lookup('type1:serial', 4)['name'], 'name4')
+
+        sibling = store.clone_store()
+        self.assertIs(sibling._indexes['type1:serial'],
+                      store._indexes['type1:serial'])
+
+    def test_indexes_survive_reload(self):
+        root = BlockStore()
+        root.add_transaction_store('/Objects', ObjectStore())
+        root.commit_block('root')
+
+        block1 = root.clone_block()
+        store = block1.get_transaction_store('/Objects')
+        for i in xrange(20):
+            store.set('obj{0}'.format(i), self._obj('name{0}'.format(i), i))
+        store.lookup('type1:name', 'name0')
+        block1.commit_block('block1')
+
+        block2 = block1.clone_block()
+        store = block2.get_transaction_store('/Objects')
+        store.set('obj1', self._obj('renamed', 1))
+        store.delete('obj2')
+        block2.commit_block('block2')
+
+        dumps = [cbor2dict(dict2cbor(b.dump_block(True)))
+                 for b in (block1, block2)]
+
+        reloaded = root
+        for blockinfo in dumps:
+            reloaded = reloaded.clone_block(blockinfo, True)
+            reloaded.commit_block(blockinfo['BlockID'])
+        store = reloaded.get_transaction_store('/Objects')
+
+        self.assertIn('type1:name', store._indexes)
+        self.assertEqual(store.lookup('type1:name', 'renamed')['serial'], 1)
+        self.assertEqual(store.lookup('type1:name', 'name7')['serial'], 7)
+        self.assertRaises(KeyError, store.lookup, 'type1:name', 'name1')
+        self.assertRaises(KeyError, store.lookup, 'type1:name', 'name2')
@@ -0,0 +1,286 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import multiprocessing
+import os
+import time
+import unittest
+
+from journal.global_store_manager import BlockStore
+from journal.global_store_manager import KeyValueStore
+from journal.object_store import ObjectStore
+from journal.parallel_executor import ParallelExecutor
+from journal.transaction import Transaction
+
+
+class _Txn(object):
+    """A transaction whose signature is valid."""
+
+    def verify_signature(self):
+        return True
+
+
+class _Increment(_Txn):
+    """Adds a value to a key, valid while the result is not negative.
+    """
+    TransactionTypeName = '/counter'
+
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+
+    def is_valid(self, store):
+        return store.get(self.key) + self.value >= 0
+
+    def apply(self, store):
+        store[self.key] = store.get(self.key) + self.value
+
+
+class _Total(_Txn):
+    """Stores the sum of all the counters."""
+    TransactionTypeName = '/counter'
+
+    def is_valid(self, store):
+        return True
+
+    def apply(self, store):
+        total = sum(v for k, v in store.iteritems() if k != 'total')
+        store['total'] = total
+
+
+class _Create(_Txn):
+    """Creates an object with a unique name."""
+    TransactionTypeName = '/object'
+
+    def __init__(self, objectid, name):
+        self.objectid = objectid
+        self.name = name
+
+    def is_valid(self, store):
+        try:
+            store.lookup('thing:name', self.name)
+        except KeyError:
+            return True
+        return False
+
+    def apply(self, store):
+        store[self.objectid] = {'object-type': 'thing', 'name': self.name}
+
+
+class _Slow(_Increment):
+    """An increment that does not complete in the worker processes."""
+
+    def is_valid(self, store):
+        if multiprocessing.current_process().name != 'MainProcess':
+            time.sleep(5.0)
+        return super(_Slow, self).is_valid(store)
+
+
+class _Unsigned(_Increment):
+    """An increment whose signature is not valid."""
+
+    def verify_signature(self):
+        return False
+
+
+class _WorkerCheck(_Increment):
+    """An increment that fails in a worker process that verifies the
+    signatures of the transactions.
+    """
+
+    def is_valid(self, store):
+        if multiprocessing.current_process().name != 'MainProcess' and \
+                Transaction.VerifySignature:
+            return False
+        return super(_WorkerCheck, self).is_valid(store)
+
+
+class TestStoreTracking(unittest.TestCase):
+
+    def test_key_value_store(self):
+        store = KeyValueStore()
+        store['a'] = 1
+        store['b'] = 2
+
+        store.start_tracking()
+        store.get('a')
+        self.assertNotIn('c', store)
+        store['d'] = 4
+        del store['b']
+        self.assertEqual(store.stop_tracking(),
+                         (set(['a', 'c']), set(['b', 'd'])))
+
+        store.start_tracking()
+        store.keys()
+        self.assertEqual(store.stop_tracking(), (None, set()))
+
+        # nothing is recorded once tracking stops
+        store.get('a')
+        self.assertIsNone(store._readkeys)
+
+    def test_object_store_indexes(self):
+        store = ObjectStore(indexes=['thing:name'])
+        store.start_tracking()
+        store['x'] = {'object-type': 'thing', 'name': 'one'}
+        self.assertRaises(KeyError, store.lookup, 'thing:name', 'two')
+        readkeys, writtenkeys = store.stop_tracking()
+        self.assertIn(('thing:name', 'one'), readkeys)
+        self.assertIn(('thing:name', 'two'), readkeys)
+        self.assertEqual(writtenkeys, set(['x', ('thing:name', 'one')]))
+
+
+class TestParallelExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.prevblock = BlockStore()
+        counters = KeyValueStore()
+        for i in xrange(10):
+            counters['key{0}'.format(i)] = 0
+        self.prevblock.add_transaction_store('/counter', counters)
+        self.prevblock.add_transaction_store(
+            '/object', ObjectStore(indexes=['thing:name']))
+        self.prevblock.commit_block('prev')
+
+        self.executor = ParallelExecutor(2)
+        self.executor.MinimumTransactions = 1
+
+    def tearDown(self):
+        self.executor.close()
+
+    def _sequential(self, txns):
+        blockstore = self.prevblock.clone_block()
+        for txn in txns:
+            txnstore = blockstore.get_transaction_store(
+                txn.TransactionTypeName)
+            if not txn.is_valid(txnstore):
+                return None
+            txn.apply(txnstore)
+        return blockstore
+
+    def _assert_same_state(self, txns):
+        blockstore = self.executor.execute(self.prevblock, txns)
+        expected = self._sequential(txns)
+        for tname in ('/counter', '/object'):
+            self.assertEqual(
+                blockstore.get_transaction_store(tname).compose(),
+                expected.get_transaction_store(tname).compose())
+
+    def test_disjoint_transactions(self):
+        txns = [_Increment('key{0}'.format(i), i) for i in xrange(10)]
+        self._assert_same_state(txns)
+        self.assertEqual(self.executor.Stats.SpeculatedTxnCount.Value, 10)
+        self.assertEqual(self.executor.Stats.ConflictTxnCount.Value, 0)
+
+    def test_conflicting_transactions(self):
+        txns = [_Increment('key{0}'.format(i % 3), 1) for i in xrange(12)]
+        txns.append(_Total())
+        txns.append(_Increment('key9', 1))
+        self._assert_same_state(txns)
+        self.assertEqual(self.executor.Stats.SpeculatedTxnCount.Value, 4)
+        self.assertEqual(self.executor.Stats.ConflictTxnCount.Value, 10)
+
+    def test_invalid_transaction(self):
+        txns = [_Increment('key0', 1), _Increment('key1', -1)]
+        self.assertIsNone(self.executor.execute(self.prevblock, txns))
+
+        # valid only after the earlier transaction of the block
+        txns.insert(0, _Increment('key1', 1))
+        self._assert_same_state(txns)
+
+    def test_unique_index(self):
+        txns = [_Create('a', 'one'), _Create('b', 'two')]
+        self._assert_same_state(txns)
+
+        txns.append(_Create('c', 'one'))
+        self.assertIsNone(self.executor.execute(self.prevblock, txns))
+
+    def test_timeout(self):
+        # a block that the workers do not execute in time is executed
+        # sequentially, and so are the following blocks
+        self.executor.Timeout = 0.5
+        self._assert_same_state([_Slow('key0', 1), _Increment('key1', 1)])
+        self.assertEqual(self.executor.Stats.SequentialBlockCount.Value, 1)
+        self.assertFalse(self.executor.is_parallel(100))
+
+    def test_detached_state(self):
+        # the workers receive the state of the previous block without
+        # the stores it was built from
+        blockstore = self.prevblock.clone_block()
+        blockstore.get_transaction_store('/counter')['key0'] = 5
+        blockstore.commit_block('next')
+        txns = [_Increment('key0', -5), _Increment('key1', 1)]
+        self.prevblock = blockstore
+        self._assert_same_state(txns)
+        self.assertEqual(self.executor.Stats.SpeculatedTxnCount.Value, 2)
+
+    def _next_block(self, blockid, key, value):
+        blockstore = self.prevblock.clone_block()
+        blockstore.get_transaction_store('/counter')[key] = value
+        blockstore.commit_block(blockid)
+        self.prevblock = blockstore
+
+    def test_changes_since_snapshot(self):
+        # the workers keep the snapshot, the following blocks send only
+        # the changes made to it
+        txns = [_Increment('key{0}'.format(i), 1) for i in xrange(4)]
+        self._assert_same_state(txns)
+        snapshotfile = self.executor._snapshotfile
+        self.assertTrue(os.path.exists(snapshotfile))
+
+        self._next_block('next', 'key0', 5)
+        self.assertEqual(
+            self.executor._changes(self.prevblock, set(['/counter'])),
+            {'/counter': {'Store': {'key0': 5}, 'DeletedKeys': []}})
+        self._assert_same_state(txns)
+        self.assertEqual(self.executor._snapshotfile, snapshotfile)
+        self.assertEqual(self.executor.Stats.SpeculatedTxnCount.Value, 8)
+
+        # a fork of the snapshot sends the changes from the snapshot
+        self._next_block('other', 'key1', 3)
+        self._assert_same_state(txns)
+        self.assertEqual(self.executor._snapshotfile, snapshotfile)
+
+        self.executor.close()
+        self.assertFalse(os.path.exists(snapshotfile))
+
+    def test_new_snapshot(self):
+        txns = [_Increment('key0', 1), _Increment('key1', 1)]
+        self._assert_same_state(txns)
+        epoch = self.executor._epoch
+
+        # too many changes since the snapshot
+        self.executor.MaximumChanges = 1
+        self._next_block('next', 'key0', 5)
+        self._next_block('last', 'key1', 5)
+        self._assert_same_state(txns)
+        self.assertEqual(self.executor._epoch, epoch + 1)
+
+        # the checkpoints since the snapshot were flattened
+        self.executor.MaximumChanges = 100
+        self._next_block('flat', 'key2', 5)
+        self.prevblock.flatten()
+        self._assert_same_state(txns)
+        self.assertEqual(self.executor._epoch, epoch + 2)
+        self.assertEqual(self.executor.Stats.SpeculatedTxnCount.Value, 6)
+
+    def test_signature_verified_once(self):
+        # the signatures are verified by the validator, not the workers
+        self.assertIsNone(self.executor.execute(
+            self.prevblock, [_Increment('key0', 1), _Unsigned('key1', 1)]))
+        self.assertEqual(self.executor.Stats.SpeculatedTxnCount.Value, 0)
+
+        self._assert_same_state([_WorkerCheck('key0', 1)])
+        self.assertEqual(self.executor.Stats.SpeculatedTxnCount.Value, 1)
+        self.assertTrue(Transaction.VerifySignature)
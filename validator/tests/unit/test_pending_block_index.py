@@ -0,0 +1,70 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from journal.pending_block_index import PendingBlockIndex
+
+
+class TestPendingBlockIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PendingBlockIndex()
+
+    def test_children(self):
+        self.index.add('b1', 'a')
+        self.index.add('b2', 'a')
+        self.index.add('c', 'b1')
+        self.assertEqual(sorted(self.index.children('a')), ['b1', 'b2'])
+        self.assertEqual(self.index.children('x'), [])
+
+        self.index.discard('b1')
+        self.assertEqual(self.index.children('a'), ['b2'])
+        self.assertNotIn('b1', self.index)
+        self.assertEqual(len(self.index), 2)
+
+    def test_missing_transactions(self):
+        self.index.add('b1', 'a')
+        self.index.add('b2', 'a')
+        self.index.wait_for_transactions('b1', ['t1', 't2'])
+        self.index.wait_for_transactions('b2', ['t2'])
+
+        self.assertEqual(self.index.transaction_arrived('t1'), [])
+        self.assertEqual(sorted(self.index.transaction_arrived('t2')),
+                         ['b1', 'b2'])
+        self.assertEqual(self.index.transaction_arrived('t2'), [])
+
+        # discarded blocks no longer wait
+        self.index.wait_for_transactions('b1', ['t3'])
+        self.index.discard('b1')
+        self.assertEqual(self.index.transaction_arrived('t3'), [])
+
+    def test_retries(self):
+        self.index.add('b1', 'a')
+        self.index.add('b2', 'a')
+        self.index.add('b3', 'a')
+        self.index.schedule_retry('b1', 20.0)
+        self.index.schedule_retry('b2', 10.0)
+        self.index.schedule_retry('b3', 30.0)
+
+        self.assertEqual(self.index.pop_due_retries(5.0), [])
+        self.assertEqual(self.index.pop_due_retries(20.0), ['b2', 'b1'])
+
+        # a rescheduled or discarded block is returned at most once
+        self.index.schedule_retry('b1', 25.0)
+        self.index.schedule_retry('b1', 40.0)
+        self.index.discard('b3')
+        self.assertEqual(self.index.pop_due_retries(35.0), [])
+        self.assertEqual(self.index.pop_due_retries(40.0), ['b1'])
@@ -0,0 +1,158 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from journal.pending_graph import PendingTransactionGraph
+
+
+class TestPendingTransactionGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.committed = set()
+        self.graph = PendingTransactionGraph(
+            lambda txnid: txnid in self.committed)
+
+    def _add(self, txnid, dependencies=(), prepend=False):
+        self.graph.add(txnid, dependencies, prepend)
+
+    def _select(self, reject=(), maxcount=0):
+        offered = []
+
+        def accept(txnid):
+            offered.append(txnid)
+            return txnid not in reject
+
+        selected, rejected = self.graph.select(accept, maxcount)
+        return selected, rejected, offered
+
+    def test_dependencies_are_selected_first(self):
+        self._add('c', ['b'])
+        self._add('a')
+        self._add('b', ['a'])
+        self._add('d')
+
+        selected, rejected, _ = self._select()
+        self.assertEqual(selected, ['a', 'b', 'c', 'd'])
+        self.assertEqual(rejected, [])
+        self.assertEqual(self.graph.ready_count, 2)
+
+    def test_blocked_transactions_are_not_offered(self):
+        self._add('a', ['x'])
+        self._add('b', ['a'])
+        self._add('c')
+
+        selected, _, offered = self._select()
+        self.assertEqual(selected, ['c'])
+        self.assertEqual(offered, ['c'])
+        self.assertEqual(self.graph.unavailable_dependencies(),
+                         {'x': {'a'}})
+
+        # a dependency that is committed without the graph being told
+        self.committed.add('x')
+        self.assertEqual(self.graph.unavailable_dependencies(), {})
+        self.graph.reset_selection()
+        self.assertEqual(self._select()[0], ['a', 'b', 'c'])
+
+    def test_maxcount(self):
+        for i in xrange(10):
+            self._add(str(i))
+        selected, _, offered = self._select(maxcount=3)
+        self.assertEqual(selected, ['0', '1', '2'])
+        self.assertEqual(offered, selected)
+
+        # a smaller candidate is only selected once the larger one is reset
+        self.assertRaises(ValueError, self._select, maxcount=2)
+        self.graph.reset_selection()
+        self.assertEqual(self._select(maxcount=2)[0], ['0', '1'])
+
+    def test_rejected_dependencies_block(self):
+        self._add('a')
+        self._add('b', ['a'])
+        self._add('c', ['b'])
+        self._add('d')
+
+        selected, rejected, _ = self._select(reject=['a'])
+        self.assertEqual((selected, rejected), (['d'], ['a']))
+        self.assertEqual(sorted(self.graph.discard('a')), ['a', 'b', 'c'])
+        self.assertEqual(len(self.graph), 1)
+
+    def test_commit_and_decommit(self):
+        self._add('a')
+        self._add('b', ['a'])
+
+        self.committed.add('a')
+        self.graph.commit('a')
+        self.assertNotIn('a', self.graph)
+        self.assertEqual(self._select()[0], ['b'])
+
+        self.committed.discard('a')
+        self.graph.decommit('a')
+        self.assertEqual(self._select()[0], [])
+        self.assertEqual(self.graph.unavailable_dependencies(),
+                         {'a': {'b'}})
+
+        self._add('a', prepend=True)
+        self.assertEqual(self._select()[0], ['a', 'b'])
+
+    def test_committed_dependencies(self):
+        self.committed.add('a')
+        self._add('b', ['a'])
+        self.assertEqual(self.graph.ready_count, 1)
+
+        # a transaction that arrives after its dependents
+        self._add('d', ['c'])
+        self._add('c')
+        self.assertEqual(self._select()[0], ['b', 'c', 'd'])
+
+    def test_prepend_keeps_order(self):
+        self._add('x')
+        for txnid in reversed(['a', 'b', 'c']):
+            self._add(txnid, prepend=True)
+        self.assertEqual(self._select()[0], ['a', 'b', 'c', 'x'])
+
+    def test_selection_is_extended(self):
+        self._add('a')
+        self._add('b', ['a'])
+        self.assertEqual(self._select(maxcount=1)[0], ['a'])
+        self.assertTrue(self.graph.selecting)
+
+        # transactions already selected are not offered again
+        self._add('c', ['a'])
+        self._add('d')
+        selected, _, offered = self._select()
+        self.assertEqual(selected, ['a', 'b', 'c', 'd'])
+        self.assertEqual(offered, ['b', 'c', 'd'])
+
+        # discarding a rejected transaction keeps the selection, a
+        # commit resets it
+        self._add('e')
+        self._select(reject=['e'])
+        self.graph.discard('e')
+        self.assertTrue(self.graph.selecting)
+        self.committed.add('a')
+        self.graph.commit('a')
+        self.assertFalse(self.graph.selecting)
+        self.assertEqual(self._select()[2], ['b', 'c', 'd'])
+
+    def test_dependency_that_is_not_pending(self):
+        # a dependency that is neither pending nor committed blocks its
+        # dependents until it is added
+        self._add('b', ['a'])
+        self.assertEqual(self.graph.unavailable_dependencies(),
+                         {'a': {'b'}})
+        self._add('a')
+        self.assertEqual(self.graph.unavailable_dependencies(), {})
+        self.assertEqual(self._select()[0], ['a', 'b'])
@@ -0,0 +1,101 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import time
+import unittest
+
+from twisted.internet import reactor
+
+from gossip import signed_object
+from gossip.signature_verifier import SignatureVerifier
+from gossip.signature_verifier import signed_objects
+from journal.messages.transaction_message import TransactionMessage
+from journal.transaction import Transaction
+
+
+class TestSignatureVerifier(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.verifier = SignatureVerifier(2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.verifier.close()
+
+    def setUp(self):
+        self.signingkey = signed_object.generate_signing_key()
+        self.address = signed_object.generate_identifier(self.signingkey)
+        self.signature_cache = signed_object.SignedObject.signature_cache
+
+    def tearDown(self):
+        signed_object.SignedObject.signature_cache = self.signature_cache
+
+    def _message(self, nonce):
+        txn = Transaction({'Nonce': nonce})
+        txn.sign_object(self.signingkey)
+        msg = TransactionMessage()
+        msg.Transaction = txn
+        msg.sign_object(self.signingkey)
+
+        # start from objects that were received rather than signed
+        signed_object.SignedObject.signature_cache = signed_object.LruCache()
+        for obj in (msg, txn):
+            obj._originator_id = None
+            obj._originator_public_key = None
+        return msg
+
+    def test_signed_objects(self):
+        msg = self._message(1.0)
+        self.assertEqual(signed_objects(msg), [msg, msg.Transaction])
+
+    def test_verify(self):
+        msg = self._message(2.0)
+        recovered = self.verifier.Stats.SignaturesRecovered.Value
+        self.verifier.verify(signed_objects(msg))
+
+        for obj in (msg, msg.Transaction):
+            self.assertEqual(obj._originator_id, self.address)
+            self.assertEqual(obj.signature_cache[obj._signature_digest()],
+                             (self.address, obj._originator_public_key))
+            self.assertTrue(obj.verify_signature(self.address))
+        self.assertEqual(self.verifier.Stats.SignaturesRecovered.Value,
+                         recovered + 2)
+
+    def test_submit(self):
+        messages = [self._message(float(i)) for i in xrange(10, 20)]
+        handled = []
+        for msg in messages:
+            self.verifier.submit(signed_objects(msg),
+                                 lambda m=msg: handled.append(m))
+        self.assertEqual(self.verifier.Stats.QueueDepth.get_metric(), 20)
+
+        timeout = time.time() + 30
+        while len(handled) < len(messages) and time.time() < timeout:
+            reactor.runUntilCurrent()
+            time.sleep(0.01)
+
+        self.assertEqual(handled, messages)
+        self.assertEqual(self.verifier.Stats.QueueDepth.get_metric(), 0)
+        for msg in messages:
+            self.assertEqual(msg.Transaction._originator_id, self.address)
+            self.assertTrue(msg.verify_signature(self.address))
+
+    def test_submit_of_verified_objects(self):
+        msg = self._message(3.0)
+        self.verifier.verify([msg])
+        handled = []
+        self.verifier.submit([msg], lambda: handled.append(msg))
+        self.assertEqual(handled, [msg])
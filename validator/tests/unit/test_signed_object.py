@@ -126,3 +126,64 @@ class TestSignedObject(unittest.TestCase):
         # check that the unserilized serilized dictinary is the same
         # as before serilazation
         self.assertEquals(cbor2dict(cbor), temp.dump())
+
+    def test_cached_signature_is_not_recovered(self):
+        # Test that a copy of a signed object uses the address and key
+        # recovered for the original
+        signkey = SigObj.generate_signing_key()
+        temp = SignedObject({"TestSignatureDictKey": "test"}, "TestSig")
+        temp.sign_object(signkey)
+        copy = SignedObject(temp.dump(), "TestSig")
+
+        recover = SigObj.get_verifying_key
+        try:
+            SigObj.get_verifying_key = None
+            self.assertTrue(copy.verify_signature(temp.OriginatorID))
+            self.assertEquals(copy.originator_public_key,
+                              temp.originator_public_key)
+        finally:
+            SigObj.get_verifying_key = recover
+
+    def test_cached_signature_on_other_content(self):
+        # Test that a signature copied onto different content is not
+        # verified from the cache
+        signkey = SigObj.generate_signing_key()
+        temp = SignedObject({"TestSignatureDictKey": "test"}, "TestSig")
+        temp.sign_object(signkey)
+        minfo = temp.dump()
+        minfo["public_key"] = temp.originator_public_key
+        copy = SignedObject(minfo, "TestSig")
+
+        self.assertFalse(copy.verify_signature(temp.OriginatorID))
+
+
+class TestLruCache(unittest.TestCase):
+
+    def test_get_refreshes_recency(self):
+        cache = SigObj.LruCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEquals(cache['a'], 1)
+        cache['c'] = 3
+
+        self.assertEquals(len(cache), 2)
+        self.assertIsNone(cache['b'])
+        self.assertEquals(cache.get('b', 0), 0)
+        self.assertEquals((cache['a'], cache['c']), (1, 3))
+
+    def test_set_refreshes_recency(self):
+        cache = SigObj.LruCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache['a'] = 4
+        cache['c'] = 3
+        self.assertEquals((cache['a'], cache['b']), (4, None))
+
+    def test_resize(self):
+        cache = SigObj.LruCache(10)
+        for i in xrange(10):
+            cache[i] = i
+        cache.resize(3)
+        self.assertEquals(len(cache), 3)
+        self.assertEquals([cache[i] for i in xrange(6, 10)],
+                          [None, 7, 8, 9])
@@ -0,0 +1,210 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import struct
+import unittest
+
+import pybitcointools
+from twisted.internet.address import IPv4Address
+from twisted.test import proto_helpers
+
+from gossip import signed_object
+from gossip.fragmentation import Reassembler
+from gossip.message import Message
+from gossip.node import Node
+from gossip.stream import StreamProtocol
+
+
+def _create_node(host='127.0.0.1'):
+    signingkey = signed_object.generate_signing_key()
+    ident = signed_object.generate_identifier(signingkey)
+    return Node(identifier=ident, signingkey=signingkey,
+                address=(host, 8800))
+
+
+class _Gossiper(object):
+    def __init__(self):
+        self.LocalNode = _create_node()
+        self.NodeMap = {}
+        self.Reassembler = Reassembler()
+        self.received = []
+        self.scheduled = 0
+
+    def stream_message_received(self, data, ttl, peer):
+        self.received.append((data, ttl, peer))
+
+    def schedule_transmit(self, when=0.0):
+        self.scheduled += 1
+
+
+def _frame(data):
+    return struct.pack('!L', len(data)) + data
+
+
+def _frames(data):
+    frames = []
+    while data:
+        (length, ) = struct.unpack('!L', data[:4])
+        frames.append(data[4:4 + length])
+        data = data[4 + length:]
+    return frames
+
+
+class TestStreamProtocol(unittest.TestCase):
+
+    def setUp(self):
+        self.gossiper = _Gossiper()
+        self.peer = self._add_peer()
+
+    def _add_peer(self, host='localhost'):
+        peer = _create_node(host)
+        peer.is_peer = True
+        self.gossiper.NodeMap[peer.Identifier] = peer
+        return peer
+
+    def _connect(self, expected=None, host='127.0.0.1'):
+        protocol = StreamProtocol(self.gossiper, expected)
+        transport = proto_helpers.StringTransport(
+            peerAddress=IPv4Address('TCP', host, 40000))
+        protocol.makeConnection(transport)
+        hello = self._sent(transport)
+        self.assertEqual(hello.split(' ')[0],
+                         self.gossiper.LocalNode.Identifier)
+        return (protocol, transport)
+
+    def _sent(self, transport):
+        frames = _frames(transport.value())
+        transport.clear()
+        self.assertEqual(len(frames), 1)
+        return frames[0]
+
+    def _hello(self, protocol, transport, node):
+        protocol.dataReceived(_frame(node.Identifier + ' nonce'))
+        if transport.disconnecting:
+            return
+
+        # the local node proves its identity
+        signature = self._sent(transport)
+        signer = pybitcointools.pubtoaddr(
+            signed_object.get_verifying_key('nonce', signature))
+        self.assertEqual(signer, self.gossiper.LocalNode.Identifier)
+
+    def _identify(self, protocol, transport, node, signingkey=None):
+        self._hello(protocol, transport, node)
+        protocol.dataReceived(_frame(pybitcointools.ecdsa_sign(
+            protocol._nonce, signingkey or node.SigningKey)))
+
+    def test_identify_and_receive(self):
+        (protocol, transport) = self._connect()
+        self._identify(protocol, transport, self.peer)
+        self.assertFalse(transport.disconnecting)
+        self.assertIs(protocol.Peer, self.peer)
+        self.assertIs(self.peer.Stream, protocol)
+
+        msg = Message({'__SIGNATURE__': "test"})
+        msg.TimeToLive = 5
+        protocol.send_message(msg)
+        data = transport.value()
+        transport.clear()
+
+        # frames may arrive split across reads
+        protocol.dataReceived(data[:3])
+        protocol.dataReceived(data[3:] + data)
+        self.assertEqual(self.gossiper.received,
+                         [(repr(msg), 5, self.peer)] * 2)
+
+        protocol.connectionLost()
+        self.assertIsNone(self.peer.Stream)
+
+    def test_unexpected_nodes_are_closed(self):
+        (protocol, transport) = self._connect()
+        self._hello(protocol, transport, _create_node())
+        self.assertTrue(transport.disconnecting)
+        self.assertIsNone(protocol.Peer)
+
+        # a node that is not the one connected to
+        other = self._add_peer()
+        (protocol, transport) = self._connect(self.peer)
+        self._hello(protocol, transport, other)
+        self.assertTrue(transport.disconnecting)
+
+        # a second connection from a peer
+        (protocol, transport) = self._connect()
+        self._identify(protocol, transport, self.peer)
+        (second, transport) = self._connect()
+        self._identify(second, transport, self.peer)
+        self.assertTrue(transport.disconnecting)
+        self.assertIs(self.peer.Stream, protocol)
+        second.connectionLost()
+        self.assertIs(self.peer.Stream, protocol)
+
+    def test_peers_are_authenticated(self):
+        # a connection from another address than the one of the peer
+        (protocol, transport) = self._connect(host='10.0.0.1')
+        self._hello(protocol, transport, self.peer)
+        self.assertTrue(transport.disconnecting)
+
+        # a node that does not have the signing key of the peer
+        (protocol, transport) = self._connect()
+        self._identify(protocol, transport, self.peer,
+                       signed_object.generate_signing_key())
+        self.assertTrue(transport.disconnecting)
+        self.assertIsNone(protocol.Peer)
+        self.assertIsNone(self.peer.Stream)
+
+    def test_unacknowledged_messages_are_queued(self):
+        StreamProtocol.AcknowledgementInterval = 2
+        try:
+            (protocol, transport) = self._connect()
+            self._identify(protocol, transport, self.peer)
+            messages = []
+            for i in xrange(3):
+                msg = Message({'__SIGNATURE__': "test{0}".format(i)})
+                msg.IsReliable = i != 1
+                messages.append(msg)
+                protocol.send_message(msg)
+
+            # the messages received by the peer are acknowledged
+            data = transport.value()
+            transport.clear()
+            protocol.dataReceived(data)
+            ack = self._sent(transport)
+            self.assertEqual(struct.unpack('!BL', ack),
+                             (StreamProtocol.AcknowledgementFrame, 2))
+            protocol.dataReceived(_frame(ack))
+
+            protocol.connectionLost()
+            self.assertEqual(self.peer.MessageQ.Messages,
+                             [messages[2].Identifier])
+            self.assertEqual(self.gossiper.scheduled, 1)
+        finally:
+            StreamProtocol.AcknowledgementInterval = 64
+
+    def test_flow_control(self):
+        (protocol, transport) = self._connect()
+        self.assertIs(transport.producer, protocol)
+        self.assertTrue(transport.streaming)
+        protocol.pauseProducing()
+        self.assertTrue(protocol.Paused)
+        protocol.resumeProducing()
+        self.assertFalse(protocol.Paused)
+        self.assertEqual(self.gossiper.scheduled, 1)
+
+    def test_frame_limit(self):
+        self.gossiper.Reassembler.MaximumMessageSize = 10
+        (protocol, transport) = self._connect()
+        self._identify(protocol, transport, self.peer)
+        protocol.dataReceived(struct.pack('!L', 100))
+        self.assertTrue(transport.disconnecting)
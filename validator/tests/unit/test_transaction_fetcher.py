@@ -0,0 +1,96 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from journal.transaction_fetcher import TransactionFetcher
+
+
+class TestTransactionFetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.broadcast = []
+        self.fetcher = TransactionFetcher(
+            lambda peerid, txnids: self.sent.append((peerid, txnids)),
+            self.broadcast.append)
+
+    def _requested(self):
+        requested = {}
+        for peerid, txnids in self.sent:
+            requested.setdefault(peerid, []).extend(txnids)
+        del self.sent[:]
+        return requested
+
+    def test_requests_are_batched(self):
+        self.fetcher.BatchSize = 2
+        self.fetcher.request(['t1', 't2', 't3'])
+        self.fetcher.request(['t2', 't3'])
+        self.assertEqual(len(self.fetcher), 3)
+
+        self.assertEqual(self.fetcher.flush(0.0, ['p']), 2)
+        self.assertEqual(self._requested(), {'p': ['t1', 't2', 't3']})
+        self.assertEqual(self.fetcher.inflight('p'), 3)
+
+        # requested transactions are not requested again
+        self.fetcher.request(['t1'])
+        self.assertEqual(self.fetcher.flush(1.0, ['p']), 0)
+
+        self.fetcher.arrived('t1')
+        self.assertNotIn('t1', self.fetcher)
+        self.assertEqual(self.fetcher.inflight('p'), 2)
+
+    def test_requests_are_spread_across_peers(self):
+        self.fetcher.MaximumInFlight = 2
+        self.fetcher.request(['t1', 't2', 't3', 't4', 't5'])
+        self.fetcher.flush(0.0, ['p1', 'p2'])
+        requested = self._requested()
+        self.assertEqual(len(requested['p1']), 2)
+        self.assertEqual(len(requested['p2']), 2)
+        self.assertIn('t5', self.fetcher)
+
+        self.fetcher.arrived(requested['p1'][0])
+        self.fetcher.flush(1.0, ['p1', 'p2'])
+        self.assertEqual(self._requested(), {'p1': ['t5']})
+
+    def test_missing_transactions_fall_back(self):
+        peerids = ['p1', 'p2', 'p3']
+        self.fetcher.MaximumAttempts = 2
+        self.fetcher.request(['t1'])
+        self.fetcher.flush(0.0, peerids)
+        first = self._requested().keys()[0]
+
+        # a peer without the transaction is replaced by another peer
+        self.fetcher.not_found(first, ['t1'])
+        self.assertEqual(self.fetcher.inflight(first), 0)
+        self.fetcher.flush(1.0, peerids)
+        requested = self._requested()
+        self.assertEqual(requested.values(), [['t1']])
+        second = requested.keys()[0]
+        self.assertNotEqual(second, first)
+
+        # as is a peer that does not answer in time, until the
+        # transaction is broadcast
+        self.fetcher.flush(1.0 + self.fetcher.RequestTimeout, peerids)
+        self.assertEqual(self._requested(), {})
+        self.assertEqual(self.broadcast, ['t1'])
+        self.assertEqual(self.fetcher.inflight(second), 0)
+        self.assertEqual(len(self.fetcher), 0)
+
+    def test_no_peers_broadcasts(self):
+        self.fetcher.request(['t1'])
+        self.assertEqual(self.fetcher.flush(0.0, []), 0)
+        self.assertEqual(self.broadcast, ['t1'])
+        self.assertEqual(len(self.fetcher), 0)
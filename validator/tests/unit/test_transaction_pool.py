@@ -0,0 +1,109 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import copy
+import unittest
+
+from journal.transaction_pool import TransactionPool
+
+
+class TestTransactionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = TransactionPool()
+
+    def test_order(self):
+        self.pool.append('b', 'x')
+        self.pool.append('c', 'x')
+        self.pool.prepend('a', 'y')
+        self.pool.append('b', 'x')
+        self.assertEqual(self.pool.keys(), ['a', 'b', 'c'])
+        self.assertEqual(len(self.pool), 3)
+        self.assertTrue(self.pool.get('a'))
+        self.assertIsNone(self.pool.get('d'))
+
+        self.assertTrue(self.pool.discard('b'))
+        self.assertNotIn('b', self.pool)
+        self.assertFalse(self.pool.discard('b'))
+        self.assertRaises(KeyError, self.pool.__delitem__, 'b')
+        self.assertEqual(list(self.pool.iterkeys()), ['a', 'c'])
+        self.assertEqual(self.pool.originator_count('x'), 1)
+        self.assertEqual(self.pool.Stats.TxnTimeInPool.Count, 1)
+
+        pool = copy.copy(self.pool)
+        pool.discard('a')
+        self.assertEqual(pool.keys(), ['c'])
+        self.assertEqual(self.pool.keys(), ['a', 'c'])
+
+    def test_eviction(self):
+        self.pool.MaximumSize = 2
+        for txnid in ['a', 'b']:
+            self.assertEqual(self.pool.make_room('x'), [])
+            self.pool.append(txnid, 'x')
+        self.pool.append('c', 'y')
+
+        self.assertEqual(self.pool.make_room('x'), ['a', 'b'])
+        self.assertEqual(self.pool.Stats.EvictedTxnCount.Value, 2)
+
+        # transactions added at the front are not evicted
+        self.pool.discard('a')
+        self.pool.prepend('d', 'y')
+        self.assertEqual(self.pool.make_room('x'), ['b', 'c'])
+        self.pool.discard('b')
+        self.pool.discard('c')
+        self.pool.prepend('e', 'y')
+        self.assertIsNone(self.pool.make_room('x'))
+        self.assertEqual(self.pool.Stats.RefusedTxnCount.Value, 1)
+
+        self.pool.EvictionPolicy = 'newest'
+        self.assertIsNone(self.pool.make_room('x'))
+        self.assertEqual(self.pool.Stats.RefusedTxnCount.Value, 2)
+
+    def test_priority_eviction(self):
+        self.pool.MaximumSize = 3
+        self.pool.EvictionPolicy = 'priority'
+        self.pool.append('a', 'x', 2)
+        self.pool.append('b', 'x', 1)
+        self.pool.append('c', 'x', 1)
+        self.pool.prepend('d', 'y')
+
+        # the lowest priority is evicted first, the oldest of it first
+        self.assertEqual(self.pool.make_room('x'), ['b', 'c'])
+        self.assertEqual(self.pool.make_room('x'), ['b', 'c'])
+        self.pool.discard('b')
+        self.pool.append('b', 'x', 3)
+        self.assertEqual(self.pool.make_room('x'), ['c', 'a'])
+
+        # a copy keeps the order of eviction
+        pool = copy.copy(self.pool)
+        pool.MaximumSize = 3
+        pool.EvictionPolicy = 'priority'
+        self.assertEqual(pool.make_room('x'), ['c', 'a'])
+
+        # transactions added at the front are not evicted
+        for txnid in ['a', 'b', 'c']:
+            self.pool.discard(txnid)
+            self.pool.prepend(txnid, 'y')
+        self.assertIsNone(self.pool.make_room('x'))
+
+    def test_originator_quota(self):
+        self.pool.MaximumPerOriginator = 2
+        self.pool.append('a', 'x')
+        self.pool.append('b', 'x')
+        self.assertIsNone(self.pool.make_room('x'))
+        self.assertEqual(self.pool.make_room('y'), [])
+
+        self.pool.discard('a')
+        self.assertEqual(self.pool.make_room('x'), [])
@@ -0,0 +1,90 @@
+# Copyright 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from twisted.internet import task
+
+from gossip.transmit_scheduler import TransmitScheduler
+
+
+class _Clock(task.Clock):
+    def callFromThread(self, f, *args, **kwargs):
+        # pylint: disable=invalid-name
+        f(*args, **kwargs)
+
+
+class TestTransmitScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = _Clock()
+        self.clock.advance(100.0)
+        self.calls = []
+        self.next = []
+        self.scheduler = TransmitScheduler(self._transmit, self.clock)
+
+    def _transmit(self, now):
+        self.calls.append(now)
+        if self.next:
+            return self.next.pop(0)
+        return None
+
+    def test_earliest_due_time(self):
+        self.scheduler.schedule(105.0)
+        self.scheduler.schedule(110.0)
+        self.assertEqual(self.scheduler.Due, 105.0)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+
+        # a message due sooner moves the timer earlier
+        self.scheduler.schedule(102.0)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.clock.advance(2.0)
+        self.assertEqual(self.calls, [102.0])
+        self.assertIsNone(self.scheduler.Due)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_immediate(self):
+        self.scheduler.schedule(0)
+        self.clock.advance(0)
+        self.assertEqual(self.calls, [100.0])
+
+    def test_reschedule(self):
+        # the time returned by the transmission arms the next one
+        self.next = [101.5, None]
+        self.scheduler.schedule(0)
+        self.clock.advance(0)
+        self.assertEqual(self.scheduler.Due, 101.5)
+        self.clock.advance(1.5)
+        self.assertEqual(self.calls, [100.0, 101.5])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_cancel_and_errors(self):
+        self.scheduler.schedule(101.0)
+        self.scheduler.cancel()
+        self.assertIsNone(self.scheduler.Due)
+        self.clock.advance(2.0)
+        self.assertEqual(self.calls, [])
+
+        def _fail(now):
+            raise ValueError()
+
+        # a failed transmission is tried again after a delay
+        scheduler = TransmitScheduler(_fail, self.clock)
+        scheduler.schedule(0)
+        self.clock.advance(0)
+        self.assertEqual(scheduler.Due,
+                         self.clock.seconds() + scheduler.ErrorDelay)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        scheduler.cancel()
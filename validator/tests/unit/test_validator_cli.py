@@ -16,6 +16,7 @@
 import os
 import unittest
 
+from sawtooth.validator_config import parse_listen_directives
 from txnmain.validator_cli import get_configuration
 
 
@@ -130,6 +131,22 @@ class TestValidatorCLI(unittest.TestCase):
         self.assertIn("Listen", cfg)
         self.assertEquals(cfg["Listen"], ['"localhost:5500/UDP gossip"'])
 
+    def test_listen_directives_stream(self):
+        directives = parse_listen_directives(
+            ["localhost:5500 gossip", "localhost:5501/TCP gossip",
+             "8800/TCP http"])
+        self.assertEquals(directives['gossip'], ('localhost', 5500))
+        self.assertEquals(directives['gossip/TCP'], ('localhost', 5501))
+        self.assertEquals(directives['http'], ('0.0.0.0', 8800))
+
+        self.assertRaises(Exception, parse_listen_directives,
+                          ["localhost:5501/TCP gossip"])
+        self.assertRaises(Exception, parse_listen_directives,
+                          ["5500/UDP gossip", "5501/TCP gossip",
+                           "5502/TCP gossip"])
+        self.assertRaises(Exception, parse_listen_directives,
+                          ["5500/UDP gossip", "8800/UDP http"])
+
     def test_options_mapping_peers(self):
         os.environ.clear()
 
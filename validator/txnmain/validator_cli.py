@@ -73,7 +73,9 @@ def local_main(config, windows_service=False, daemonized=False):
         # Gossip parameters
         minimum_retries = config.get("MinimumRetries")
         retry_interval = config.get("RetryInterval")
-        gossip = Gossip(node, minimum_retries, retry_interval, stat_domains)
+        verification_processes = config.get("SignatureVerificationProcesses")
+        gossip = Gossip(node, minimum_retries, retry_interval, stat_domains,
+                        verification_processes)
         # WaitTimer globals
         target_wait_time = config.get("TargetWaitTime")
         initial_wait_time = config.get("InitialWaitTime")
@@ -87,6 +89,9 @@ def local_main(config, windows_service=False, daemonized=False):
         genesis_ledger = config.get("GenesisLedger")
         data_directory = config.get("DataDirectory")
         store_type = config.get("StoreType")
+        store_cache = config.get("StoreCache")
+        execution_processes = config.get("TransactionExecutionProcesses")
+        validation_worker = config.get("BlockValidationWorker")
 
         if consensus_type == 'poet0':
             from journal.consensus.poet0 import poet_consensus
@@ -145,7 +150,10 @@ def local_main(config, windows_service=False, daemonized=False):
             max_txn_age,
             genesis_ledger,
             data_directory,
-            store_type)
+            store_type,
+            store_cache,
+            execution_processes,
+            validation_worker)
 
         validator = Validator(
             gossip,
@@ -27,9 +27,12 @@ from sawtooth.endpoint_client import EndpointClient
 from sawtooth.exceptions import MessageException
 from sawtooth.validator_config import parse_listen_directives
 
-from gossip import node, signed_object, token_bucket
+from gossip import expiry_wheel, fragmentation, gossip_core, node
+from gossip import signed_object, token_bucket
 from gossip.messages import connect_message, shutdown_message
 from gossip.topology import random_walk, barabasi_albert
+from journal import global_store_manager
+from journal import transaction_pool
 from journal.protocol import journal_transfer
 from ledger.transaction import endpoint_registry
 
@@ -100,6 +103,8 @@ def parse_networking_info(config):
                    signingkey=signingkey,
                    name=name,
                    endpoint_address=endpoint_addr)
+    if 'gossip/TCP' in listen_directives:
+        nd.StreamPort = listen_directives['gossip/TCP'].port
     return (nd, endpoint_http_port)
 
 
@@ -234,6 +239,68 @@ class Validator(object):
         if 'UseFixedDelay' in self.config:
             node.Node.UseFixedDelay = self.config['UseFixedDelay']
 
+        if 'NetworkDelayPolicy' in self.config:
+            node.Node.DelayPolicy = self.config['NetworkDelayPolicy']
+
+        if 'TransmitScheduling' in self.config:
+            gossip_core.Gossip.TransmitScheduling = self.config[
+                'TransmitScheduling']
+
+        if 'PacketBatching' in self.config:
+            gossip_core.Gossip.PacketBatching = self.config['PacketBatching']
+
+        if 'PacketFragmentation' in self.config:
+            gossip_core.Gossip.PacketFragmentation = self.config[
+                'PacketFragmentation']
+
+        if 'MaximumMessageSize' in self.config:
+            fragmentation.Reassembler.MaximumMessageSize = self.config[
+                'MaximumMessageSize']
+
+        if 'ReassemblyMemory' in self.config:
+            fragmentation.Reassembler.MaximumMemory = self.config[
+                'ReassemblyMemory']
+
+        if 'ReassemblyTimeout' in self.config:
+            fragmentation.Reassembler.Timeout = self.config[
+                'ReassemblyTimeout']
+
+        if 'DuplicateCacheSize' in self.config:
+            expiry_wheel.HandledMessageCache.MaximumEntries = self.config[
+                'DuplicateCacheSize']
+
+        if 'DuplicateFilterErrorRate' in self.config:
+            expiry_wheel.HandledMessageCache.FilterErrorRate = self.config[
+                'DuplicateFilterErrorRate']
+
+        if 'SignatureCacheSize' in self.config:
+            signed_object.SignedObject.signature_cache.resize(
+                self.config['SignatureCacheSize'])
+
+        if 'StateCopyOnWrite' in self.config:
+            global_store_manager.KeyValueStore.CopyOnWrite = self.config[
+                'StateCopyOnWrite']
+
+        if 'StateSnapshotInterval' in self.config:
+            global_store_manager.GlobalStoreManager.SnapshotInterval = \
+                self.config['StateSnapshotInterval']
+
+        if 'StateSnapshotsToKeep' in self.config:
+            global_store_manager.GlobalStoreManager.SnapshotsToKeep = \
+                self.config['StateSnapshotsToKeep']
+
+        if 'PendingTransactionLimit' in self.config:
+            transaction_pool.TransactionPool.MaximumSize = self.config[
+                'PendingTransactionLimit']
+
+        if 'PendingTransactionsPerOriginator' in self.config:
+            transaction_pool.TransactionPool.MaximumPerOriginator = \
+                self.config['PendingTransactionsPerOriginator']
+
+        if 'PendingTransactionEviction' in self.config:
+            transaction_pool.TransactionPool.EvictionPolicy = self.config[
+                'PendingTransactionEviction']
+
     def initialize_node_map(self):
         self.NodeMap = {}
         for nodedata in self.config.get("Nodes", []):
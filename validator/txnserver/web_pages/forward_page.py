@@ -19,6 +19,7 @@ import traceback
 
 from twisted.web import http
 
+from gossip.signature_verifier import signed_objects
 from sawtooth.exceptions import InvalidTransactionError
 from txnserver.web_pages.base_page import BasePage
 
@@ -38,6 +39,14 @@ class ForwardPage(BasePage):
         """
         data = request.content.getvalue()
         msg = self._get_message(request)
+
+        # recover the signing keys of the objects in the message in the
+        # verifier processes, the message itself is signed again by this
+        # node when it is broadcast
+        verifier = self.validator.gossip.SignatureVerifier
+        if verifier is not None:
+            verifier.verify(signed_objects(msg)[1:])
+
         if self.validator.config.get("LocalValidation", True):
             # determine if the message contains a valid transaction before
             # we send the message to the network